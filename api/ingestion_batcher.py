@@ -0,0 +1,157 @@
+"""
+Regroupement des documents reçus en un seul appel ainsert.
+
+Les messages d'un même prompt_domain (et d'un même user_id, utilisé pour le
+chiffrement des descriptions) sont accumulés jusqu'à INGESTION_BATCH_SIZE
+documents ou INGESTION_BATCH_WAIT_MS millisecondes, puis insérés ensemble :
+chunking, embeddings, extraction, écritures du graphe, _insert_done et le
+nettoyage UNKNOWN / DIRECTED sont amortis sur le lot. Chaque appelant reçoit
+le résultat de son propre document.
+
+Une insertion qui dépasse INGESTION_MESSAGE_TIMEOUT secondes est annulée avant
+que ses appelants n'échouent : un message republié par le worker d'ingestion
+ne tourne jamais en même temps que l'insertion qu'il remplace.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from lightrag.utils import compute_mdhash_id
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingDocument:
+    text: str
+    metadata: dict
+    future: asyncio.Future
+
+
+@dataclass
+class PendingBatch:
+    documents: list = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class IngestionBatcher:
+    """
+    Accumule les documents par (prompt_domain, user_id) et les insère par lot
+    """
+
+    def __init__(
+        self, rag, max_batch_size: int = None, max_wait_ms: float = None, timeout: float = None
+    ):
+        self.rag = rag
+        self.max_batch_size = max_batch_size or int(os.getenv("INGESTION_BATCH_SIZE", 8))
+        self.max_wait_ms = (
+            max_wait_ms
+            if max_wait_ms is not None
+            else float(os.getenv("INGESTION_BATCH_WAIT_MS", 200))
+        )
+        self.timeout = (
+            timeout
+            if timeout is not None
+            else float(os.getenv("INGESTION_MESSAGE_TIMEOUT", 600))
+        )
+        self._batches: dict[tuple, PendingBatch] = {}
+        self._flushes: set[asyncio.Task] = set()
+
+    async def submit(self, text: str, prompt_domain: str = "activity", metadata: dict = None):
+        """
+        Ajoute un document au lot de son domaine et attend son insertion
+
+        Returns:
+            str: Identifiant du document (doc-<hash>)
+        """
+        metadata = metadata or {}
+        key = (prompt_domain, metadata.get("user_id"))
+        future = asyncio.get_running_loop().create_future()
+        batch = self._batches.setdefault(key, PendingBatch())
+        batch.documents.append(PendingDocument(text, metadata, future))
+
+        if len(batch.documents) >= self.max_batch_size:
+            self._flush(key)
+        elif batch.timer is None:
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.max_wait_ms / 1000, self._flush, key
+            )
+        return await future
+
+    def _flush(self, key: tuple):
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._insert(key[0], batch.documents))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _insert(self, prompt_domain: str, documents: list):
+        logger.info(f"📦 Insertion groupée de {len(documents)} documents ({prompt_domain})")
+        try:
+            await asyncio.wait_for(
+                self.rag.ainsert(
+                    [doc.text for doc in documents],
+                    prompt_domain=prompt_domain,
+                    metadata=[doc.metadata for doc in documents],
+                ),
+                self.timeout,
+            )
+        except asyncio.TimeoutError as e:
+            # ainsert est annulé : plus rien ne tourne pour ces documents. Ceux
+            # déjà enregistrés réussissent, les autres échouent sans rejeu ici
+            # (le worker les republie)
+            pending = await self._pending_documents(documents)
+            logger.error(
+                f"⏱️ Insertion annulée après {self.timeout}s "
+                f"({len(pending)}/{len(documents)} documents non enregistrés)"
+            )
+            for doc in documents:
+                self._resolve(doc, error=e if doc in pending else None)
+            return
+        except Exception as e:
+            if len(documents) == 1:
+                self._resolve(documents[0], error=e)
+                return
+            # Un document fautif ne doit pas faire échouer tout le lot : on rejoue
+            # seul chaque document pas encore enregistré (les appels LLM déjà faits
+            # sont en cache, les chunks déjà fusionnés dans le graphe sont ignorés
+            # par ainsert)
+            pending = await self._pending_documents(documents)
+            logger.warning(
+                f"⚠️ Échec du lot ({e}), insertion document par document "
+                f"({len(pending)}/{len(documents)} à rejouer)"
+            )
+            for doc in documents:
+                if doc not in pending:
+                    self._resolve(doc)
+            await asyncio.gather(*[self._insert(prompt_domain, [doc]) for doc in pending])
+            return
+        for doc in documents:
+            self._resolve(doc)
+
+    async def _pending_documents(self, documents: list) -> list:
+        """Documents du lot absents de full_docs (insertion non terminée)"""
+        doc_ids = {compute_mdhash_id(doc.text.strip(), prefix="doc-"): doc for doc in documents}
+        missing = await self.rag.full_docs.filter_keys(list(doc_ids))
+        return [doc for doc_id, doc in doc_ids.items() if doc_id in missing]
+
+    @staticmethod
+    def _resolve(doc: PendingDocument, error: Exception = None):
+        if doc.future.done():
+            return
+        if error is not None:
+            doc.future.set_exception(error)
+        else:
+            doc.future.set_result(compute_mdhash_id(doc.text.strip(), prefix="doc-"))
+
+    async def close(self):
+        """Insère les lots en attente et attend les insertions en cours"""
+        for key in list(self._batches):
+            self._flush(key)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
@@ -1,4 +1,5 @@
 # Imports système et configuration de base
+import os
 from pathlib import Path
 import sys
 import logging
@@ -24,10 +25,12 @@ from lightrag.llm import gpt_4o_mini_complete
 from lightrag.kg.milvus_impl import MilvusVectorDBStorage
 from lightrag.kg.mongo_impl import MongoKVStorage
 from lightrag.kg.neo4j_impl import Neo4JStorage
+from api.ingestion_batcher import IngestionBatcher
 
 class MessageProcessor:
     def __init__(self):
         self.rag = None
+        self.batcher = None
         try:
             # Configuration Milvus
             milvus_config = {
@@ -43,7 +46,8 @@ class MessageProcessor:
 
             # Utiliser MilvusVectorDBStorage explicitement
             self.rag = LightRAG(
-                working_dir=str(Path(__file__).parent.parent / "api"),
+                # LIGHTRAG_WORKING_DIR : caches locaux (embeddings), api/ par défaut
+                working_dir=os.getenv("LIGHTRAG_WORKING_DIR", str(Path(__file__).parent.parent / "api")),
                 llm_model_func=gpt_4o_mini_complete,
                 vector_storage="MilvusVectorDBStorage",
                 kv_storage="MongoKVStorage",
@@ -52,6 +56,8 @@ class MessageProcessor:
                 enable_llm_cache=False,
                 vector_db_storage_cls_kwargs=milvus_config
             )
+            # Les messages concurrents d'un même domaine partagent un seul ainsert
+            self.batcher = IngestionBatcher(self.rag)
             logger.info("LightRAG initialisé avec succès")
         except Exception as e:
             logger.error(f"Erreur d'initialisation de LightRAG : {e}")
@@ -83,6 +89,7 @@ class MessageProcessor:
         except Exception as e:
             logger.error(f"Erreur lors du traitement du message utilisateur: {e}")
             logger.error(traceback.format_exc())
+            raise
 
     async def process_activity_message(self, payload: dict):
         """
@@ -131,6 +138,7 @@ class MessageProcessor:
         except Exception as e:
             logger.error(f"Erreur lors du traitement du message d'activité: {e}")
             logger.error(traceback.format_exc())
+            raise
 
     async def process_event_message(self, payload: dict):
         """
@@ -171,6 +179,7 @@ class MessageProcessor:
         except Exception as e:
             logger.error(f"Erreur lors du traitement du message d'événement: {e}")
             logger.error(traceback.format_exc())
+            raise
 
     async def process_memo_message(self, payload: dict):
         """
@@ -210,6 +219,7 @@ class MessageProcessor:
         except Exception as e:
             logger.error(f"Erreur lors du traitement du message de mémo: {e}")
             logger.error(traceback.format_exc())
+            raise
 
     async def process_query_message(self, payload: dict):
         """
@@ -249,6 +259,7 @@ class MessageProcessor:
         except Exception as e:
             logger.error(f"Erreur lors du traitement du message de query: {e}")
             logger.error(traceback.format_exc())
+            raise
 
     async def process_message(self, payload: Dict[str, Any]):
         """
@@ -310,10 +321,10 @@ class MessageProcessor:
             # Générer un identifiant unique si non fourni
             metadata['id'] = metadata.get('id', str(uuid.uuid4()))
             
-            # Insérer le texte
-            result = await self.rag.ainsert(
-                text, 
-                prompt_domain=prompt_domain, 
+            # Insérer le texte (regroupé avec les messages concurrents du même domaine)
+            result = await self.batcher.submit(
+                text,
+                prompt_domain=prompt_domain,
                 metadata=metadata
             )
             
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Callable, List, Optional
+
+from lightrag.lightrag import LightRAG
+
+logger = logging.getLogger(__name__)
+
+# Taille par défaut : chaque instance ouvre ses propres drivers Neo4j, clients
+# Milvus / Mongo et fichiers SQLite, la concurrence LLM est déjà bornée par le
+# limiteur partagé du processus
+DEFAULT_POOL_SIZE = 2
+
+
+@dataclass
+class PoolStats:
+    """
+    Compteurs d'utilisation du pool d'instances LightRAG
+    """
+    size: int = 0
+    created: int = 0
+    acquired: int = 0
+    released: int = 0
+    in_use: int = 0
+    waiting: int = 0
+    total_wait_time: float = 0.0
+    max_wait_time: float = 0.0
+    total_hold_time: float = 0.0
+
+
+class LightRAGPool:
+    """
+    Pool d'instances LightRAG partagées par le processus.
+
+    Les instances (et donc les drivers Neo4j, clients Milvus et Mongo) sont
+    construites une seule fois au démarrage puis prêtées aux requêtes via
+    acquire(). Chaque prêt est chronométré (attente et durée d'utilisation).
+
+    Taille : size, sinon LIGHTRAG_POOL_SIZE, sinon DEFAULT_POOL_SIZE. Les
+    appels LLM et d'embedding passent par le limiteur partagé du processus :
+    plus d'instances ne donne pas plus de concurrence LLM, seulement plus de
+    connexions aux stockages.
+    """
+
+    def __init__(self, factory: Callable[[], LightRAG], size: int = None):
+        self._factory = factory
+        env_size = os.environ.get("LIGHTRAG_POOL_SIZE")
+        self._size = size or (int(env_size) if env_size else DEFAULT_POOL_SIZE)
+        self._instances: List[LightRAG] = []
+        self._available: Optional[asyncio.Queue] = None
+        self._start_lock = asyncio.Lock()
+        self.stats = PoolStats(size=self._size)
+
+    @property
+    def started(self) -> bool:
+        return self._available is not None
+
+    async def start(self):
+        """
+        Construit les instances du pool (idempotent)
+        """
+        async with self._start_lock:
+            if self.started:
+                return
+            start_time = time.perf_counter()
+            available = asyncio.Queue()
+            while len(self._instances) < self._size:
+                rag = self._factory()
+                await rag.ainitialize()
+                self._instances.append(rag)
+                available.put_nowait(rag)
+                self.stats.created += 1
+            self._available = available
+            logger.info(
+                f"🏊 Pool LightRAG démarré : {self._size} instance(s) en "
+                f"{time.perf_counter() - start_time:.2f}s"
+            )
+
+    async def close(self):
+        """
+        Ferme les clients de stockage de toutes les instances du pool
+        """
+        async with self._start_lock:
+            instances, self._instances = self._instances, []
+            self._available = None
+        for rag in instances:
+            try:
+                await rag.aclose()
+            except Exception as e:
+                logger.error(f"❌ Erreur lors de la fermeture d'une instance LightRAG : {e}")
+        if instances:
+            logger.info(f"🏊 Pool LightRAG fermé : {len(instances)} instance(s)")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Emprunte une instance LightRAG pour la durée du bloc `async with`
+        """
+        if not self.started:
+            await self.start()
+        available = self._available
+
+        wait_start = time.perf_counter()
+        self.stats.waiting += 1
+        try:
+            rag = await available.get()
+        finally:
+            self.stats.waiting -= 1
+        wait_time = time.perf_counter() - wait_start
+
+        self.stats.acquired += 1
+        self.stats.in_use += 1
+        self.stats.total_wait_time += wait_time
+        self.stats.max_wait_time = max(self.stats.max_wait_time, wait_time)
+        logger.debug(
+            f"🔓 Instance LightRAG empruntée (attente {wait_time * 1000:.1f}ms, "
+            f"{self.stats.in_use}/{self._size} utilisées)"
+        )
+
+        hold_start = time.perf_counter()
+        try:
+            yield rag
+        finally:
+            hold_time = time.perf_counter() - hold_start
+            self.stats.in_use -= 1
+            self.stats.released += 1
+            self.stats.total_hold_time += hold_time
+            available.put_nowait(rag)
+            logger.debug(
+                f"🔒 Instance LightRAG rendue après {hold_time * 1000:.1f}ms"
+            )
+
+    def get_stats(self) -> dict:
+        stats = asdict(self.stats)
+        acquired = max(stats["acquired"], 1)
+        stats["avg_wait_time"] = stats["total_wait_time"] / acquired
+        stats["avg_hold_time"] = stats["total_hold_time"] / max(stats["released"], 1)
+        return stats
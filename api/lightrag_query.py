@@ -1,8 +1,10 @@
+import os
 from pathlib import Path
 import sys
 import logging
 import asyncio
 import traceback
+from contextlib import asynccontextmanager
 from typing import Dict, Any, Optional, List
 
 from fastapi import APIRouter, HTTPException, FastAPI
@@ -18,10 +20,14 @@ logger = logging.getLogger(__name__)
 
 # Initialisation de LightRAG
 from lightrag.lightrag import LightRAG, QueryParam
-from lightrag.llm import gpt_4o_mini_complete  # Ajout de cet import
+from lightrag.llm import gpt_4o_mini_complete, aclose_openai_clients  # Ajout de cet import
+from lightrag.rabbitmq_publisher import aclose_query_publisher
+from lightrag.utils import get_call_limiter_stats
+from lightrag.kg.mongo_impl import aclose_mongo_clients
 from lightrag.kg.milvus_impl import MilvusVectorDBStorage
 from lightrag.kg.mongo_impl import MongoKVStorage
 from lightrag.kg.neo4j_impl import Neo4JStorage
+from api.lightrag_pool import LightRAGPool
 
 # Créer un router pour cet API
 router = APIRouter()
@@ -50,7 +56,8 @@ def init_lightrag() -> LightRAG:
         }
 
         rag = LightRAG(
-            working_dir=str(Path(__file__).parent.parent / "api"),
+            # LIGHTRAG_WORKING_DIR : caches locaux (embeddings), api/ par défaut
+            working_dir=os.getenv("LIGHTRAG_WORKING_DIR", str(Path(__file__).parent.parent / "api")),
             llm_model_func=gpt_4o_mini_complete,
             kv_storage="MongoKVStorage",
             vector_storage="MilvusVectorDBStorage",
@@ -64,6 +71,10 @@ def init_lightrag() -> LightRAG:
         logger.error(f"Erreur d'initialisation de LightRAG : {e}")
         raise
 
+# Pool d'instances partagé par le processus (taille via LIGHTRAG_POOL_SIZE,
+# DEFAULT_POOL_SIZE par défaut)
+lightrag_pool = LightRAGPool(init_lightrag)
+
 @router.post("/")
 async def query_messages(query_request: QueryRequest):
     """
@@ -78,19 +89,17 @@ async def query_messages(query_request: QueryRequest):
     try:
         logger.info(f"Requête de recherche reçue : {query_request}")
         
-        # Initialiser LightRAG
-        rag = init_lightrag()
-        
         # Préparer les paramètres de requête
         query_param = QueryParam(mode=query_request.mode)
         
-        # Exécuter la requête
-        response = await rag.aquery(
-            query_request.question, 
-            param=query_param, 
-            vdb_filter=query_request.vdb_filter, 
-            user_id=query_request.user_id
-        )
+        # Emprunter une instance LightRAG déjà initialisée
+        async with lightrag_pool.acquire() as rag:
+            response = await rag.aquery(
+                query_request.question, 
+                param=query_param, 
+                vdb_filter=query_request.vdb_filter, 
+                user_id=query_request.user_id
+            )
         
         return {
             "status": "success",
@@ -104,11 +113,42 @@ async def query_messages(query_request: QueryRequest):
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/pool")
+async def pool_stats():
+    """
+    Statistiques d'utilisation du pool d'instances LightRAG
+    """
+    return lightrag_pool.get_stats()
+
+@router.get("/limiters")
+async def limiter_stats():
+    """
+    Files d'attente des appels LLM / embedding (profondeur par priorité, budget de tokens)
+    """
+    return get_call_limiter_stats()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Construit le pool LightRAG au démarrage et ferme ses clients à l'arrêt
+    """
+    await lightrag_pool.start()
+    try:
+        yield
+    finally:
+        # Publie les réponses encore dans l'outbox avant de fermer
+        await aclose_query_publisher()
+        await lightrag_pool.close()
+        # Clients HTTP OpenAI et Mongo partagés par tout le processus
+        await aclose_openai_clients()
+        await aclose_mongo_clients()
+
 # Créer l'application FastAPI
 app = FastAPI(
     title="LightRAG Query API",
     description="API pour effectuer des requêtes avec LightRAG",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Inclure le router
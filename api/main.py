@@ -4,12 +4,15 @@ from fastapi.middleware.cors import CORSMiddleware
 # Importer les routers depuis vos fichiers d'API
 from api.lightrag_insert import router as insert_router
 from api.lightrag_query import router as query_router
+from api.lightrag_query import lifespan as query_lifespan
 
 # Créer l'application FastAPI principale
+# Le lifespan initialise le pool LightRAG de /query une seule fois par processus
 app = FastAPI(
     title="LightRAG API",
     description="API pour l'insertion et la recherche de données dans LightRAG",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=query_lifespan
 )
 
 # Ajouter les middlewares CORS pour permettre les requêtes cross-origin si nécessaire
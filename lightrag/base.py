@@ -1,3 +1,4 @@
+import asyncio
 from dataclasses import dataclass, field
 from typing import TypedDict, Union, Literal, Generic, TypeVar
 
@@ -50,10 +51,20 @@ class StorageNameSpace:
 class BaseVectorStorage(StorageNameSpace):
     embedding_func: EmbeddingFunc
     meta_fields: set = field(default_factory=set)
+    # True when query() accepts vdb_filter={"custom_id": [...], ...} and filters
+    # on its own scalar fields; otherwise vdb_filter must be resolved to ids
+    # through the graph (get_filtered_ids) before querying
+    supports_scalar_filter = False
 
     async def query(self, query: str, top_k: int) -> list[dict]:
         raise NotImplementedError
 
+    async def query_many(self, queries: list[str], top_k: int, **kwargs) -> list[list[dict]]:
+        """Default fallback: one query per text, override for a single multi-vector search"""
+        return list(
+            await asyncio.gather(*[self.query(q, top_k=top_k, **kwargs) for q in queries])
+        )
+
     async def upsert(self, data: dict[str, dict]):
         """Use 'content' field from value for embedding, use key as id.
         If embedding_func is None, use 'embedding' field from value
@@ -83,6 +94,9 @@ class BaseKVStorage(Generic[T], StorageNameSpace):
     async def upsert(self, data: dict[str, T]):
         raise NotImplementedError
 
+    async def delete(self, ids: list[str]):
+        raise NotImplementedError
+
     async def drop(self):
         raise NotImplementedError
 
@@ -116,6 +130,40 @@ class BaseGraphStorage(StorageNameSpace):
     ) -> Union[list[tuple[str, str]], None]:
         raise NotImplementedError
 
+    async def get_nodes_batch(self, node_ids: list[str]) -> dict[str, Union[dict, None]]:
+        """Default fallback: one get_node per id, override for a single round trip"""
+        node_ids = list(dict.fromkeys(node_ids))
+        nodes = await asyncio.gather(*[self.get_node(n) for n in node_ids])
+        return dict(zip(node_ids, nodes))
+
+    async def node_degrees_batch(self, node_ids: list[str]) -> dict[str, int]:
+        node_ids = list(dict.fromkeys(node_ids))
+        degrees = await asyncio.gather(*[self.node_degree(n) for n in node_ids])
+        return {n: d or 0 for n, d in zip(node_ids, degrees)}
+
+    async def get_edges_batch(
+        self, pairs: list[tuple[str, str]]
+    ) -> dict[tuple[str, str], Union[dict, None]]:
+        pairs = list(dict.fromkeys(tuple(p) for p in pairs))
+        edges = await asyncio.gather(*[self.get_edge(s, t) for s, t in pairs])
+        return dict(zip(pairs, edges))
+
+    async def edge_degrees_batch(
+        self, pairs: list[tuple[str, str]]
+    ) -> dict[tuple[str, str], int]:
+        pairs = list(dict.fromkeys(tuple(p) for p in pairs))
+        node_degrees = await self.node_degrees_batch(
+            [n for pair in pairs for n in pair]
+        )
+        return {(s, t): node_degrees.get(s, 0) + node_degrees.get(t, 0) for s, t in pairs}
+
+    async def get_nodes_edges_batch(
+        self, node_ids: list[str]
+    ) -> dict[str, list[tuple[str, str]]]:
+        node_ids = list(dict.fromkeys(node_ids))
+        edges = await asyncio.gather(*[self.get_node_edges(n) for n in node_ids])
+        return {n: e or [] for n, e in zip(node_ids, edges)}
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         raise NotImplementedError
 
@@ -124,6 +172,18 @@ class BaseGraphStorage(StorageNameSpace):
     ):
         raise NotImplementedError
 
+    async def upsert_nodes_batch(self, nodes: dict[str, dict]):
+        """Default fallback: one upsert_node per node, override for bulk writes"""
+        await asyncio.gather(
+            *[self.upsert_node(node_id, node_data) for node_id, node_data in nodes.items()]
+        )
+
+    async def upsert_edges_batch(self, edges: dict[tuple[str, str], dict]):
+        """Default fallback: one upsert_edge per edge, override for bulk writes"""
+        await asyncio.gather(
+            *[self.upsert_edge(src, tgt, edge_data) for (src, tgt), edge_data in edges.items()]
+        )
+
     async def delete_node(self, node_id: str):
         raise NotImplementedError
 
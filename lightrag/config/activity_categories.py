@@ -1,5 +1,18 @@
+import json
+import re
 from typing import List, Dict, Optional, Any
-from lightrag.utils import logger
+from lightrag.utils import compute_args_hash, locate_json_string_body_from_string, logger
+
+# Nombre maximal d'activités classées par appel LLM
+LLM_CLASSIFICATION_BATCH_SIZE = 50
+
+LLM_CLASSIFICATION_PROMPT = """Classe chaque activité dans exactement une des catégories suivantes :
+{categories}
+
+Activités :
+{activities}
+
+Réponds uniquement avec un objet JSON associant le numéro de chaque activité à sa catégorie, par exemple {{"1": "Restauration", "2": "Unknown"}}."""
 
 class ActivityCategoriesManager:
     def __init__(self):
@@ -38,34 +51,79 @@ class ActivityCategoriesManager:
         
         # Catégorie par défaut si aucune correspondance n'est trouvée
         self._default_category = "Unknown"
-    
+
+        # Un motif compilé par catégorie (ordre de priorité conservé)
+        self._matchers = None
+        # Cache des classifications : hash de la description -> catégorie
+        self._cache: Dict[str, str] = {}
+
+    @staticmethod
+    def description_hash(description: str) -> str:
+        return compute_args_hash(description or "")
+
+    def _compile(self):
+        self._matchers = [
+            (category, re.compile("|".join(re.escape(k) for k in keywords)))
+            for category, keywords in self._categories.items()
+            if category != self._default_category and keywords
+        ]
+
     def get_category(self, description: str) -> str:
         """
         Détermine la catégorie d'une activité en fonction de sa description
         """
-        description_lower = description.lower()
-        
-        logger.info(f"🔍 Recherche de catégorie pour la description : {description_lower}")
-        
-        for category, keywords in self._categories.items():
-            # Ignorer la catégorie "Unknown"
-            if category == "Unknown":
-                continue
-            
-            matching_keywords = [keyword for keyword in keywords if keyword in description_lower]
-            if matching_keywords:
-                logger.info(f"✅ Catégorie trouvée : {category}")
-                logger.debug(f"   Mots-clés correspondants : {matching_keywords}")
-                return category
-        
-        logger.warning(f"❌ Aucune catégorie trouvée, utilisation de la catégorie par défaut : {self._default_category}")
-        return self._default_category
-    
+        key = self.description_hash(description)
+        if key in self._cache:
+            return self._cache[key]
+        if self._matchers is None:
+            self._compile()
+
+        description_lower = (description or "").lower()
+        category = next(
+            (category for category, pattern in self._matchers if pattern.search(description_lower)),
+            self._default_category,
+        )
+        logger.debug(f"🔍 Catégorie {category} pour la description : {description_lower[:80]}")
+        self._cache[key] = category
+        return category
+
+    async def get_categories_with_llm(self, descriptions: List[str], use_model_func) -> List[str]:
+        """
+        Classe plusieurs descriptions par appels LLM groupés ; les réponses
+        invalides retombent sur le classement par mots-clés
+        """
+        categories = [self._cache.get(self.description_hash(d)) for d in descriptions]
+        todo = [i for i, category in enumerate(categories) if category is None]
+        allowed = self.list_categories()
+
+        for start in range(0, len(todo), LLM_CLASSIFICATION_BATCH_SIZE):
+            batch = todo[start : start + LLM_CLASSIFICATION_BATCH_SIZE]
+            prompt = LLM_CLASSIFICATION_PROMPT.format(
+                categories="\n".join(f"- {c}" for c in allowed),
+                activities="\n".join(f"{n}. {descriptions[i]}" for n, i in enumerate(batch, 1)),
+            )
+            answers = {}
+            try:
+                response = await use_model_func(prompt)
+                answers = json.loads(locate_json_string_body_from_string(response) or "{}")
+            except Exception as e:
+                logger.warning(f"⚠️ Classification LLM invalide, repli sur les mots-clés : {e}")
+            for n, i in enumerate(batch, 1):
+                category = answers.get(str(n))
+                if category in allowed:
+                    self._cache[self.description_hash(descriptions[i])] = category
+                else:
+                    category = self.get_category(descriptions[i])
+                categories[i] = category
+        return categories
+
     def add_category(self, category_name: str, keywords: List[str]):
         """
         Permet d'ajouter une nouvelle catégorie personnalisée
         """
         self._categories[category_name] = keywords
+        self._matchers = None
+        self._cache.clear()
     
     def list_categories(self) -> List[str]:
         """
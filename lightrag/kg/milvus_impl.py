@@ -1,26 +1,269 @@
 import asyncio
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from tqdm.asyncio import tqdm as tqdm_async
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 import numpy as np
 from lightrag.utils import logger
 from ..base import BaseVectorStorage
 import traceback
 
-from pymilvus import MilvusClient
+from pymilvus import (
+    AnnSearchRequest,
+    DataType,
+    Function,
+    FunctionType,
+    MilvusClient,
+    RRFRanker,
+    WeightedRanker,
+)
+
+
+# MilvusClient est synchrone (gRPC bloquant) : ses appels passent par un pool de
+# threads partagé par toutes les collections pour ne pas bloquer la boucle
+_milvus_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_milvus_executor() -> ThreadPoolExecutor:
+    global _milvus_executor
+    if _milvus_executor is None:
+        _milvus_executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("MILVUS_EXECUTOR_WORKERS", 8)),
+            thread_name_prefix="milvus",
+        )
+    return _milvus_executor
+
+
+# Paramètres de construction et de recherche par défaut de chaque type d'index
+INDEX_DEFAULTS = {
+    "HNSW": ({"M": 16, "efConstruction": 200}, {"ef": 64}),
+    "IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_SQ8": ({"nlist": 1024}, {"nprobe": 16}),
+    "DISKANN": ({}, {"search_list": 100}),
+    "FLAT": ({}, {}),
+    "AUTOINDEX": ({}, {}),
+}
+
+# Champs scalaires filtrables de chaque namespace (VARCHAR indexés, "" si absent)
+SCALAR_FIELDS = {
+    "entities": ("custom_id", "entity_type", "city", "user_id"),
+    "relationships": ("src_custom_id", "tgt_custom_id", "user_id"),
+    "chunks": (),
+}
+SCALAR_MAX_LENGTH = 512
+
+# Champ propriétaire des données des domaines utilisateur ("" = catalogue
+# partagé), clé de partition des collections en mode user_tenancy
+TENANT_FIELD = "user_id"
+DEFAULT_NUM_PARTITIONS = 64
+
+# Clés de filtre qui portent sur plusieurs champs du namespace (OU) :
+# une relation est retenue si l'une de ses extrémités a le custom_id demandé
+FILTER_ALIASES = {
+    "relationships": {"custom_id": ("src_custom_id", "tgt_custom_id")},
+}
+
+
+@dataclass
+class IndexConfig:
+    """
+    Index du champ vector d'une collection et paramètres de recherche associés.
+    radius : similarité cosinus minimale des résultats (None = pas de seuil)
+    scalar_index_type : index des champs scalaires ("" = défaut du serveur)
+    """
+
+    index_type: str = "HNSW"
+    metric_type: str = "COSINE"
+    params: dict = field(default_factory=dict)
+    search_params: dict = field(default_factory=dict)
+    radius: Optional[float] = 0.2
+    scalar_index_type: str = ""
+
+    @classmethod
+    def for_namespace(cls, namespace: str, storage_kwargs: dict) -> "IndexConfig":
+        """
+        Configuration du namespace dans vector_db_storage_cls_kwargs["index"] :
+        la clé "default" s'applique à tous les namespaces, la clé du namespace
+        (entities, relationships, chunks) la complète ou change le type d'index
+            {"index": {"default": {"index_type": "HNSW", "params": {"M": 32}},
+                       "chunks": {"index_type": "IVF_SQ8", "search_params": {"nprobe": 32}}}}
+        """
+        overrides = (storage_kwargs or {}).get("index", {})
+        default = overrides.get("default", {})
+        specific = overrides.get(namespace, {})
+        merged = {**default, **specific}
+        index_type = merged.get("index_type", cls.index_type).upper()
+        # Les paramètres de "default" ne valent que pour son propre type d'index
+        if default.get("index_type", cls.index_type).upper() != index_type:
+            merged["params"] = specific.get("params", {})
+            merged["search_params"] = specific.get("search_params", {})
+        if index_type not in INDEX_DEFAULTS:
+            raise ValueError(
+                f"Type d'index Milvus inconnu pour {namespace} : {index_type} "
+                f"(attendu : {', '.join(INDEX_DEFAULTS)})"
+            )
+        build_defaults, search_defaults = INDEX_DEFAULTS[index_type]
+        return cls(
+            index_type=index_type,
+            metric_type=merged.get("metric_type", cls.metric_type),
+            params={**build_defaults, **merged.get("params", {})},
+            search_params={**search_defaults, **merged.get("search_params", {})},
+            radius=merged.get("radius", cls.radius),
+            scalar_index_type=merged.get("scalar_index_type", cls.scalar_index_type),
+        )
+
+    def index_params(self, client: MilvusClient, scalar_fields=()):
+        index_params = client.prepare_index_params()
+        index_params.add_index(
+            field_name="vector",
+            index_type=self.index_type,
+            metric_type=self.metric_type,
+            params=self.params,
+        )
+        for scalar_field in scalar_fields:
+            index_params.add_index(
+                field_name=scalar_field, index_type=self.scalar_index_type
+            )
+        return index_params
+
+    def search_param(self) -> dict:
+        params = dict(self.search_params)
+        if self.radius is not None:
+            params["radius"] = self.radius
+        return {"metric_type": self.metric_type, "params": params}
+
+
+# Texte indexé en BM25 (VARCHAR : 65 535 octets au plus)
+TEXT_FIELD = "text"
+SPARSE_FIELD = "sparse"
+TEXT_MAX_BYTES = 65535
+
+
+@dataclass
+class HybridConfig:
+    """
+    Recherche hybride dense + BM25 (vecteurs creux calculés par le serveur à
+    partir du texte, Milvus >= 2.5) fusionnée par RRF ou par pondération.
+    Désactivée par défaut : le serveur de prod (2.3) ne connaît pas BM25.
+    """
+
+    enabled: bool = False
+    ranker: str = "rrf"
+    rrf_k: int = 60
+    # Poids (dense, BM25) du classement pondéré
+    weights: tuple = (0.6, 0.4)
+
+    @classmethod
+    def for_namespace(cls, namespace: str, storage_kwargs: dict) -> "HybridConfig":
+        """
+        Configuration dans vector_db_storage_cls_kwargs["hybrid"], même
+        structure que "index" (clé "default" puis clé du namespace)
+            {"hybrid": {"default": {"enabled": True},
+                        "relationships": {"ranker": "weighted", "weights": [0.7, 0.3]}}}
+        """
+        overrides = (storage_kwargs or {}).get("hybrid", {})
+        merged = {**overrides.get("default", {}), **overrides.get(namespace, {})}
+        config = cls(
+            enabled=bool(merged.get("enabled", cls.enabled)),
+            ranker=merged.get("ranker", cls.ranker).lower(),
+            rrf_k=merged.get("rrf_k", cls.rrf_k),
+            weights=tuple(merged.get("weights", cls.weights)),
+        )
+        if config.ranker not in ("rrf", "weighted"):
+            raise ValueError(
+                f"Classement hybride inconnu pour {namespace} : {config.ranker} "
+                "(attendu : rrf, weighted)"
+            )
+        return config
+
+    def make_ranker(self):
+        if self.ranker == "weighted":
+            return WeightedRanker(*self.weights)
+        return RRFRanker(self.rrf_k)
+
+
+def truncate_utf8(text: str, max_bytes: int = TEXT_MAX_BYTES) -> str:
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", errors="ignore")
 
 
 @dataclass
 class MilvusVectorDBStorage(BaseVectorStorage):
+    supports_scalar_filter = True
+
     @staticmethod
     def create_collection_if_not_exist(
-        client: MilvusClient, collection_name: str, **kwargs
+        client: MilvusClient,
+        collection_name: str,
+        dimension: int,
+        index_config: Optional[IndexConfig] = None,
+        scalar_fields=(),
+        partition_key: Optional[str] = None,
+        num_partitions: int = DEFAULT_NUM_PARTITIONS,
+        hybrid: bool = False,
     ):
+        """
+        Crée la collection avec un schéma et un index explicites (et non les
+        valeurs par défaut du quick setup : AUTOINDEX), puis la charge.
+        Les champs scalaires sont déclarés et indexés pour filtrer côté serveur ;
+        dans une collection plus ancienne ils restent des champs dynamiques
+        (filtrables mais non indexés, recréer la collection pour les indexer).
+        partition_key : champ scalaire servant de clé de partition (les
+        filtres == / in sur ce champ ne parcourent que les partitions visées)
+        hybrid : ajoute le texte analysé et son vecteur creux BM25 (fonction
+        serveur) pour la recherche hybride
+
+        Returns:
+            bool: True si la collection a été créée, False si elle existait
+        """
         if client.has_collection(collection_name):
-            return
+            return False
+        index_config = index_config or IndexConfig()
+        schema = client.create_schema(auto_id=False, enable_dynamic_field=True)
+        schema.add_field("id", DataType.VARCHAR, is_primary=True, max_length=64)
+        schema.add_field("vector", DataType.FLOAT_VECTOR, dim=dimension)
+        for scalar_field in scalar_fields:
+            schema.add_field(
+                scalar_field,
+                DataType.VARCHAR,
+                max_length=SCALAR_MAX_LENGTH,
+                **({"is_partition_key": True} if scalar_field == partition_key else {}),
+            )
+        index_params = index_config.index_params(client, scalar_fields)
+        if hybrid:
+            schema.add_field(
+                TEXT_FIELD, DataType.VARCHAR, max_length=TEXT_MAX_BYTES, enable_analyzer=True
+            )
+            schema.add_field(SPARSE_FIELD, DataType.SPARSE_FLOAT_VECTOR)
+            schema.add_function(
+                Function(
+                    name=f"{collection_name}_bm25",
+                    function_type=FunctionType.BM25,
+                    input_field_names=[TEXT_FIELD],
+                    output_field_names=[SPARSE_FIELD],
+                )
+            )
+            index_params.add_index(
+                field_name=SPARSE_FIELD,
+                index_type="SPARSE_INVERTED_INDEX",
+                metric_type="BM25",
+            )
         client.create_collection(
-            collection_name, max_length=64, id_type="string", **kwargs
+            collection_name,
+            schema=schema,
+            index_params=index_params,
+            **({"num_partitions": num_partitions} if partition_key else {}),
+        )
+        logger.info(
+            f"🧱 Collection {collection_name} créée avec un index {index_config.index_type} "
+            f"{index_config.params}"
         )
+        return True
 
     @staticmethod
     def create_database_if_not_exist(client: MilvusClient, db_name: str):
@@ -49,16 +292,133 @@ class MilvusVectorDBStorage(BaseVectorStorage):
             db_name=os.environ.get("MILVUS_DB_NAME", ""),
         )
         self._max_batch_size = self.global_config["embedding_batch_num"]
-        
-        MilvusVectorDBStorage.create_collection_if_not_exist(
-            self._client,
-            self.namespace,
-            dimension=self.embedding_func.embedding_dim,
+        storage_kwargs = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        self.index_config = IndexConfig.for_namespace(self.namespace, storage_kwargs)
+        self.scalar_fields = SCALAR_FIELDS.get(self.namespace, ())
+        # Mode multi-tenant : user_id clé de partition, recherches limitées au
+        # catalogue partagé et aux données de l'utilisateur de la requête
+        self.tenancy = bool(self.global_config.get("user_tenancy")) and (
+            TENANT_FIELD in self.scalar_fields
+        )
+        self._num_partitions = storage_kwargs.get("num_partitions", DEFAULT_NUM_PARTITIONS)
+        self.hybrid_config = HybridConfig.for_namespace(self.namespace, storage_kwargs)
+        # Existence de la collection vérifiée une seule fois (has_collection)
+        self._collection_ready = False
+        self._collection_lock = asyncio.Lock()
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        Exécute un appel MilvusClient dans le pool de threads dédié
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_milvus_executor(), partial(func, *args, **kwargs)
+        )
+
+    async def _ensure_collection(self):
+        if self._collection_ready:
+            return
+        async with self._collection_lock:
+            if self._collection_ready:
+                return
+            created = await self._run(
+                MilvusVectorDBStorage.create_collection_if_not_exist,
+                self._client,
+                self.namespace,
+                self.embedding_func.embedding_dim,
+                self.index_config,
+                self.scalar_fields,
+                TENANT_FIELD if self.tenancy else None,
+                self._num_partitions,
+                self.hybrid_config.enabled,
+            )
+            if not created:
+                await self._check_scalar_schema()
+            if self.hybrid_config.enabled:
+                await self._check_hybrid_schema()
+            self._collection_ready = True
+
+    async def _check_scalar_schema(self):
+        """
+        Dans une collection antérieure aux champs scalaires, les lignes déjà
+        insérées n'ont ni custom_id ni src_custom_id / tgt_custom_id : un filtre
+        sur ces champs les exclurait toutes. On revient alors au filtrage par
+        identifiants (sous-graphe résolu dans le graphe) jusqu'à la recréation
+        de la collection.
+        """
+        filter_fields = [f for f in self.scalar_fields if f != TENANT_FIELD]
+        if not filter_fields:
+            return
+        description = await self._run(self._client.describe_collection, self.namespace)
+        declared = {f["name"] for f in description.get("fields", [])}
+        missing = [f for f in filter_fields if f not in declared]
+        if missing:
+            logger.warning(
+                f"⚠️ Collection {self.namespace} sans champ(s) {', '.join(missing)} : "
+                "filtrage par identifiants du graphe, recréer la collection pour "
+                "filtrer sur les champs scalaires"
+            )
+            self.supports_scalar_filter = False
+
+    async def _check_hybrid_schema(self):
+        """
+        Une collection créée sans champ BM25 ne peut pas servir la recherche
+        hybride : on revient à la recherche dense (recréer la collection)
+        """
+        description = await self._run(self._client.describe_collection, self.namespace)
+        if SPARSE_FIELD not in {f["name"] for f in description.get("fields", [])}:
+            logger.warning(
+                f"⚠️ Collection {self.namespace} sans champ {SPARSE_FIELD} : "
+                "recherche hybride désactivée, recréer la collection pour l'activer"
+            )
+            self.hybrid_config.enabled = False
+
+    async def initialize(self):
+        await self._ensure_collection()
+
+    async def describe_index(self) -> Optional[dict]:
+        """
+        Index actuel du champ vector de la collection (None s'il n'y en a pas)
+        """
+        names = await self._run(
+            self._client.list_indexes, self.namespace, field_name="vector"
+        )
+        if not names:
+            return None
+        return await self._run(self._client.describe_index, self.namespace, names[0])
+
+    async def rebuild_index(self):
+        """
+        Remplace l'index du champ vector par celui de index_config : libère la
+        collection, supprime l'index existant, le reconstruit puis recharge.
+        La collection n'est pas interrogeable pendant la reconstruction.
+        """
+        await self._ensure_collection()
+        config = self.index_config
+        logger.info(
+            f"🔧 Reconstruction de l'index de {self.namespace} : "
+            f"{config.index_type} {config.params}"
         )
+        await self._run(self._client.release_collection, self.namespace)
+        for name in await self._run(
+            self._client.list_indexes, self.namespace, field_name="vector"
+        ):
+            await self._run(self._client.drop_index, self.namespace, name)
+        # Seul l'index du champ vector change, ceux des champs scalaires restent
+        await self._run(
+            self._client.create_index, self.namespace, config.index_params(self._client)
+        )
+        await self._run(self._client.load_collection, self.namespace)
+        logger.info(f"✅ Index de {self.namespace} reconstruit")
+
+    async def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
 
     async def upsert(self, data: dict[str, dict]):
         logger.debug(f"Inserting {len(data)} vectors to {self.namespace}")
-        MilvusVectorDBStorage.create_collection_if_not_exist(self._client, self.namespace)
+        await self._ensure_collection()
         
         if not len(data):
             logger.warning("You insert an empty data to vector DB")
@@ -67,70 +427,153 @@ class MilvusVectorDBStorage(BaseVectorStorage):
             {
                 "id": k,
                 **{k1: v1 for k1, v1 in v.items() if k1 in self.meta_fields},
+                **{f: str(v.get(f) or "") for f in self.scalar_fields},
+                **(
+                    {TEXT_FIELD: truncate_utf8(v["content"])}
+                    if self.hybrid_config.enabled
+                    else {}
+                ),
             }
             for k, v in data.items()
         ]
         contents = [v["content"] for v in data.values()]
+        # Un embedding_func qui forme lui-même ses lots (EmbeddingBatcher) reçoit tout
+        batch_size = (
+            len(contents)
+            if getattr(self.embedding_func, "packs_batches", False)
+            else self._max_batch_size
+        )
         batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
+            contents[i : i + batch_size] for i in range(0, len(contents), batch_size)
         ]
-        embedding_tasks = [self.embedding_func(batch) for batch in batches]
-        embeddings_list = []
+        # Les lots sont remis dans l'ordre des données (as_completed ne le garantit pas)
+        embeddings_list = [None] * len(batches)
+
+        async def embed_batch(index, batch):
+            embeddings_list[index] = await self.embedding_func(batch)
+
+        embedding_tasks = [embed_batch(i, batch) for i, batch in enumerate(batches)]
         for f in tqdm_async(
             asyncio.as_completed(embedding_tasks),
             total=len(embedding_tasks),
             desc="Generating embeddings",
             unit="batch",
         ):
-            embeddings = await f
-            embeddings_list.append(embeddings)
+            await f
         embeddings = np.concatenate(embeddings_list)
         for i, d in enumerate(list_data):
             d["vector"] = embeddings[i]
-        results = self._client.upsert(collection_name=self.namespace, data=list_data)
+        results = await self._run(
+            self._client.upsert, collection_name=self.namespace, data=list_data
+        )
         return results
 
-    async def query(self, query, top_k=5, vdb_filter=None):
-        embedding = await self.embedding_func([query])
-        
+    def _filter_expr(self, vdb_filter) -> str:
+        """
+        Expression de filtrage Milvus pour vdb_filter :
+        - liste d'identifiants (sous-graphe résolu dans Neo4j) : id in [...]
+        - dict champ scalaire → valeur(s), ex. {"custom_id": [...], "city": "Lyon"} :
+          field in [...] / field == "..." (ET entre champs). Une liste vide
+          ne filtre pas, comme une liste d'identifiants vide.
+        """
+        if not vdb_filter:
+            return ""
+        if not isinstance(vdb_filter, dict):
+            vdb_filter = {"id": vdb_filter}
+        aliases = FILTER_ALIASES.get(self.namespace, {})
+        clauses = []
+        for key, values in vdb_filter.items():
+            if isinstance(values, (list, tuple, set)):
+                if not values:
+                    continue
+                condition = "{} in [" + ", ".join(json.dumps(str(v)) for v in values) + "]"
+            else:
+                condition = "{} == " + json.dumps(str(values))
+            fields = aliases.get(key, (key,))
+            clause = " or ".join(condition.format(f) for f in fields)
+            clauses.append(f"({clause})" if len(fields) > 1 else clause)
+        return " and ".join(clauses)
 
-        # Construire l'expression de filtrage si des IDs de vdb_filter fournis
-        if vdb_filter:
-            filter_expr = 'id in [' + ', '.join(f'"{id}"' for id in vdb_filter) + ']'
-            logger.info(f"🔍 Expression de filtrage : {filter_expr}")
+    def _tenant_filter(self, vdb_filter, user_id: Optional[str]):
+        """
+        Ajoute à vdb_filter la restriction au catalogue partagé ("") et aux
+        données de user_id (mode user_tenancy uniquement)
+        """
+        if not self.tenancy:
+            return vdb_filter
+        if vdb_filter is None or not isinstance(vdb_filter, dict):
+            vdb_filter = {"id": vdb_filter} if vdb_filter else {}
+        tenants = ["", user_id] if user_id else [""]
+        return {**vdb_filter, TENANT_FIELD: tenants}
+
+    async def _hybrid_search(self, queries, embedding, top_k, filter_expr):
+        """
+        Un seul hybrid_search : requête dense sur vector et requête BM25 sur
+        le texte brut des requêtes (noms exacts : plats, établissements),
+        fusionnées par le classement configuré
+        """
+        requests = [
+            AnnSearchRequest(
+                embedding, "vector", self.index_config.search_param(), top_k, expr=filter_expr
+            ),
+            AnnSearchRequest(
+                list(queries), SPARSE_FIELD, {"metric_type": "BM25"}, top_k, expr=filter_expr
+            ),
+        ]
+        return await self._run(
+            self._client.hybrid_search,
+            collection_name=self.namespace,
+            reqs=requests,
+            ranker=self.hybrid_config.make_ranker(),
+            limit=top_k,
+            output_fields=list(self.meta_fields),
+        )
+
+    async def query(self, query, top_k=5, vdb_filter=None, user_id=None):
+        results = await self.query_many(
+            [query], top_k=top_k, vdb_filter=vdb_filter, user_id=user_id
+        )
+        return results[0]
+
+    async def query_many(
+        self, queries: list[str], top_k=5, vdb_filter=None, user_id=None
+    ) -> list[list[dict]]:
+        """
+        Recherche plusieurs requêtes : un seul appel d'embedding et un seul
+        search multi-vecteurs. Résultats dans l'ordre des requêtes.
+        """
+        if not queries:
+            return []
+        await self._ensure_collection()
+        embedding = await self.embedding_func(list(queries))
+
+        filter_expr = self._filter_expr(self._tenant_filter(vdb_filter, user_id))
+        if filter_expr:
+            logger.info(f"🔍 Expression de filtrage : {filter_expr[:200]}")
         else:
-            filter_expr = ""
-            logger.error("🌐 Aucun filtre d'ID spécifié, exportation de toute la collection")
+            logger.info("🌐 Aucun filtre spécifié, recherche sur toute la collection")
 
-        #logger.info(f"Début de la recherche - vdb_filter: {vdb_filter}")
-        
-        if vdb_filter==None:
-            logger.info("Aucun filtre de nœud spécifié, recherche sans filtrage")
-            results = self._client.search(
-                collection_name=self.namespace,
-                data=embedding,
-                limit=top_k,
-                output_fields=list(self.meta_fields),
-                search_params={"metric_type": "COSINE", "params": {"radius": 0.2}},
-            )
+        if self.hybrid_config.enabled:
+            results = await self._hybrid_search(queries, embedding, top_k, filter_expr)
         else:
-            #logger.info(f"Filtrage de nœuds actif - Expression de filtre: {filter_expr}")
-            #logger.info(f"collecion name: {self.namespace}")
-            # Récupérer les données avec l'expression de filtrage
-            
-            results = self._client.search(
+            results = await self._run(
+                self._client.search,
                 collection_name=self.namespace,
                 data=embedding,
-                filter=filter_expr,  # Changement de 'expr' à 'filter'
+                filter=filter_expr,
                 anns_field="vector",
                 output_fields=list(self.meta_fields),
-                #output_fields=["id", "entity_name", "entity_type"],
-                limit=top_k  # Ajustez selon la taille de votre collection
+                limit=top_k,
+                search_params=self.index_config.search_param(),
             )
-        
-        logger.info(f"Résultats de recherche - Nombre de résultats: {len(results[0])}")
+
+        logger.info(
+            f"Résultats de recherche - Nombre de résultats: {[len(hits) for hits in results]}"
+        )
         return [
-            {**dp["entity"], "id": dp["id"], "distance": dp["distance"]}
-            for dp in results[0]
-        ]
\ No newline at end of file
+            [
+                {**dp["entity"], "id": dp["id"], "distance": dp["distance"]}
+                for dp in hits
+            ]
+            for hits in results
+        ]
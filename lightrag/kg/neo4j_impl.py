@@ -4,6 +4,7 @@ import re
 from dataclasses import dataclass
 from typing import Any, Union, Tuple, List, Dict, Optional
 import inspect
+from collections import OrderedDict
 from lightrag.utils import logger
 from ..base import BaseGraphStorage
 from neo4j import (
@@ -29,6 +30,17 @@ logging.getLogger('neo4j.bolt').setLevel(logging.ERROR)
 logging.getLogger('neo4j.notifications').setLevel(logging.ERROR)
 
 
+@dataclass
+class QueryStats:
+    executions: int = 0
+    # exécutions dont le texte exact a déjà été envoyé par ce client
+    repeated_texts: int = 0
+
+    @property
+    def repeat_rate(self) -> float:
+        return self.repeated_texts / self.executions if self.executions else 0.0
+
+
 @dataclass
 class Neo4JStorage(BaseGraphStorage):
     @staticmethod
@@ -46,14 +58,33 @@ class Neo4JStorage(BaseGraphStorage):
         URI = os.environ["NEO4J_URI"]
         USERNAME = os.environ["NEO4J_USERNAME"]
         PASSWORD = os.environ["NEO4J_PASSWORD"]
+        # Résolution forcée de l'hôte (NEO4J_RESOLVER="host:port", vide pour désactiver)
+        RESOLVER = os.environ.get("NEO4J_RESOLVER", "vps-af24e24d.vps.ovh.net:32045")
+        driver_kwargs = {}
+        if RESOLVER:
+            resolver_host, resolver_port = RESOLVER.rsplit(":", 1)
+            driver_kwargs["resolver"] = lambda x: [(resolver_host, int(resolver_port))]
         self._driver: AsyncDriver = AsyncGraphDatabase.driver(
             URI,
             auth=(USERNAME, PASSWORD),
             max_connection_lifetime=3600,
             connection_timeout=10,
             max_connection_pool_size=50,
-            resolver=lambda x: [("vps-af24e24d.vps.ovh.net", 32045)]
+            **driver_kwargs
         )
+        # Identité des nœuds : "label" (un label dynamique par entité, historique,
+        # défaut tant que les graphes existants n'ont pas d'entity_name : textes
+        # et plans Cypher propres à chaque label) ou "property" (label commun
+        # ENTITY_LABEL + propriété entity_name indexée, modèles constants)
+        self.node_identity = os.environ.get("NEO4J_NODE_IDENTITY", "label").lower()
+        if self.node_identity not in ("label", "property"):
+            raise ValueError(
+                f"NEO4J_NODE_IDENTITY invalide : {self.node_identity} (label ou property)"
+            )
+        self._schema_ready = False
+        self._queries_by_identity: Dict[str, Dict[str, str]] = {}
+        self._query_stats: Dict[str, QueryStats] = {}
+        self._seen_query_texts: OrderedDict = OrderedDict()
         return None
 
     def __post_init__(self):
@@ -72,15 +103,242 @@ class Neo4JStorage(BaseGraphStorage):
 
     async def index_done_callback(self):
         print("KG successfully indexed.")
+        stats = self.get_query_stats()
+        logger.info(
+            f"📈 Requêtes Neo4j : {stats['executions']} exécutions, "
+            f"{stats['distinct_query_texts']} textes distincts, "
+            f"textes répétés {stats['repeat_rate']:.0%}"
+        )
+
+    # Label commun des entités en mode d'identité "property"
+    ENTITY_LABEL = "Entity"
+
+    # Contraintes et index créés au démarrage (IF NOT EXISTS : idempotent)
+    SCHEMA_STATEMENTS = [
+        f"CREATE CONSTRAINT entity_name_unique IF NOT EXISTS FOR (n:{ENTITY_LABEL}) REQUIRE n.entity_name IS UNIQUE",
+        f"CREATE INDEX entity_custom_id IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON (n.custom_id)",
+        f"CREATE INDEX entity_entity_id IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON (n.entity_id)",
+        f"CREATE INDEX entity_entity_type IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON (n.entity_type)",
+        # Propriétaire des nœuds des domaines utilisateur (mode user_tenancy)
+        f"CREATE INDEX entity_user_id IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON (n.user_id)",
+        "CREATE INDEX activity_category_name IF NOT EXISTS FOR (n:ActivityCategory) ON (n.name)",
+        "CREATE INDEX city_name IF NOT EXISTS FOR (n:City) ON (n.name)",
+        "CREATE INDEX date_name IF NOT EXISTS FOR (n:Date) ON (n.name)",
+    ]
+
+    async def initialize(self):
+        await self.ensure_schema()
+
+    async def ensure_schema(self):
+        """
+        Crée la contrainte d'unicité sur entity_name et les index de plage
+        (custom_id, entity_id, entity_type, user_id, noms des catégories), une fois par
+        instance. Un échec (doublons d'entity_name avant migration, droits)
+        est journalisé sans bloquer le démarrage.
+        """
+        if self._schema_ready:
+            return
+        async with self.driver.session() as session:
+            for statement in self.SCHEMA_STATEMENTS:
+                try:
+                    result = await session.run(statement)
+                    await result.consume()
+                except neo4jExceptions.Neo4jError as e:
+                    logger.error(f"❌ Schéma Neo4j non appliqué ({statement}) : {e}")
+        self._schema_ready = True
+        logger.info(f"🗂️ Schéma Neo4j vérifié (identité des nœuds : {self.node_identity})")
+        if self.node_identity == "label":
+            logger.warning(
+                "⚠️ Identité des nœuds « label » : le label de l'entité est écrit dans "
+                "le texte des requêtes, un plan Cypher par label ; "
+                "NEO4J_NODE_IDENTITY=property pour des modèles constants"
+            )
+
+    @property
+    def _entity_label(self) -> str:
+        """
+        Label à ajouter aux motifs sur custom_id / entity_type (index utilisables)
+        """
+        return f":{self.ENTITY_LABEL}" if self.node_identity == "property" else ""
+
+    # Emplacement d'un label d'entité dans un modèle de requête (mode "label")
+    _LABEL_SLOT = re.compile(r"«(\w+)»")
+
+    # Nombre de textes de requête distincts mémorisés pour les statistiques
+    # (ordre de grandeur du cache de plans du serveur, server.db.query_cache_size)
+    QUERY_TEXTS_TRACKED = 1000
+
+    def _node_pattern(self, var: str, param: str) -> str:
+        """
+        Motif Cypher d'un nœud désigné par son nom d'entité : paramètre $param
+        en mode "property", label «param» substitué à l'exécution en mode "label"
+        """
+        if self.node_identity == "property":
+            return f"({var}:{self.ENTITY_LABEL} {{entity_name: ${param}}})"
+        return f"({var}:`«{param}»`)"
+
+    def _node_name(self, var: str) -> str:
+        """
+        Expression Cypher du nom d'entité d'un nœud (label ou entity_name)
+        """
+        if self.node_identity == "property":
+            return f"coalesce({var}.entity_name, head(labels({var})))"
+        return f"head(labels({var}))"
+
+    def _build_queries(self) -> Dict[str, str]:
+        """
+        Modèles de requêtes du mode d'identité courant, construits une fois.
+        Les types de relation ne pouvant pas être paramétrés, chaque type de
+        RELATION_TYPE_MAPPING (et DIRECTED) a ses propres modèles.
+        """
+        node = self._node_pattern
+        entity = self.ENTITY_LABEL
+        queries = {
+            "has_node": f"MATCH {node('n', 'name')} RETURN count(n) > 0 AS node_exists",
+            "has_edge": (
+                f"MATCH {node('a', 'source_name')}-[r]-{node('b', 'target_name')} "
+                "RETURN COUNT(r) > 0 AS edgeExists"
+            ),
+            "get_node": f"MATCH {node('n', 'name')} RETURN n",
+            "node_degree": (
+                f"MATCH {node('n', 'name')} RETURN COUNT {{ (n)--() }} AS totalEdgeCount"
+            ),
+            "get_edge": (
+                f"MATCH {node('start', 'source_name')}-[r]->{node('end', 'target_name')} "
+                "RETURN properties(r) AS edge_properties LIMIT 1"
+            ),
+            "get_node_edges": (
+                f"MATCH {node('n', 'name')} OPTIONAL MATCH (n)-[r]-(connected) "
+                f"RETURN {self._node_name('n')} AS source, {self._node_name('connected')} AS target"
+            ),
+            "upsert_node": f"MERGE {node('n', 'name')} SET n = $properties RETURN n",
+            "edge_endpoint_types": (
+                f"MATCH {node('source', 'source_name')}, {node('target', 'target_name')} "
+                "RETURN source.entity_type AS source_type, target.entity_type AS target_type"
+            ),
+            "delete_nodes_by_type": (
+                f"MATCH (n{self._entity_label} {{entity_type: $entity_type}}) DETACH DELETE n"
+            ),
+            # Lectures / écritures groupées du mode "property"
+            "get_nodes_batch": (
+                f"UNWIND $rows AS row MATCH (n:{entity} {{entity_name: row.name}}) "
+                "RETURN row.idx AS idx, properties(n) AS props"
+            ),
+            "node_degrees_batch": (
+                f"UNWIND $rows AS row MATCH (n:{entity} {{entity_name: row.name}}) "
+                "RETURN row.idx AS idx, COUNT { (n)--() } AS degree"
+            ),
+            "get_edges_batch": (
+                f"UNWIND $rows AS row "
+                f"MATCH (start:{entity} {{entity_name: row.src}}) "
+                f"MATCH (end:{entity} {{entity_name: row.tgt}}) "
+                "CALL { WITH start, end MATCH (start)-[r]->(end) RETURN r LIMIT 1 } "
+                "RETURN row.idx AS idx, properties(r) AS props"
+            ),
+            "get_nodes_edges_batch": (
+                f"UNWIND $rows AS row MATCH (n:{entity} {{entity_name: row.name}}) "
+                "OPTIONAL MATCH (n)-[r]-(connected) "
+                f"RETURN row.idx AS idx, {self._node_name('n')} AS source, "
+                f"{self._node_name('connected')} AS target"
+            ),
+            "upsert_nodes_batch": (
+                f"UNWIND $rows AS row MERGE (n:{entity} {{entity_name: row.name}}) "
+                "SET n = row.properties"
+            ),
+        }
+        for relation_type in sorted(set(self.RELATION_TYPE_MAPPING.values()) | {"DIRECTED"}):
+            queries[f"upsert_edge:{relation_type}"] = (
+                f"MATCH {node('source', 'source_name')} WITH source "
+                f"MATCH {node('target', 'target_name')} "
+                f"MERGE (source)-[r:{relation_type}]->(target) "
+                "ON CREATE SET r = $properties ON MATCH SET r += $properties RETURN r"
+            )
+            queries[f"upsert_edges_batch:{relation_type}"] = (
+                f"UNWIND $rows AS row "
+                f"MATCH (source:{entity} {{entity_name: row.src}}) "
+                f"MATCH (target:{entity} {{entity_name: row.tgt}}) "
+                f"MERGE (source)-[r:{relation_type}]->(target) "
+                "ON CREATE SET r = row.properties ON MATCH SET r += row.properties"
+            )
+            queries[f"delete_relations:{relation_type}"] = (
+                f"MATCH ()-[r:{relation_type}]->() DELETE r"
+            )
+        return queries
+
+    @property
+    def _queries(self) -> Dict[str, str]:
+        queries = self._queries_by_identity.get(self.node_identity)
+        if queries is None:
+            queries = self._queries_by_identity[self.node_identity] = self._build_queries()
+        return queries
+
+    def _prepare(self, name: str, params: Optional[dict] = None, /, **entity_names) -> Tuple[str, dict]:
+        """
+        Texte et paramètres d'une requête nommée.
+
+        En mode "property", les noms d'entité passent en paramètres : le texte
+        est constant et son plan reste en cache. En mode "label", ils sont
+        substitués (échappés) dans le texte, un label ne pouvant être paramétré :
+        le modèle n'est plus constant, chaque entité a son texte et son plan.
+        """
+        query = self._queries[name]
+        params = dict(params or {})
+        if self.node_identity == "property":
+            params.update({key: value.strip('"') for key, value in entity_names.items()})
+        elif entity_names:
+            query = self._LABEL_SLOT.sub(
+                lambda match: self._escape_label(entity_names[match.group(1)]), query
+            )
+        self._record_query(name, query)
+        return query, params
+
+    def _record_query(self, name: str, query: str):
+        """
+        Compte les exécutions et celles dont le texte exact a déjà été envoyé
+        (parmi les QUERY_TEXTS_TRACKED derniers textes distincts).
+
+        Statistique côté client : elle indique si les textes sont assez stables
+        pour que le cache de plans du serveur serve, pas ses hits réels. Les
+        modèles ne sont constants qu'en mode "property" ; en mode "label", le
+        label substitué rend chaque entité distincte.
+        """
+        stats = self._query_stats.setdefault(name, QueryStats())
+        stats.executions += 1
+        key = hash(query)
+        if key in self._seen_query_texts:
+            self._seen_query_texts.move_to_end(key)
+            stats.repeated_texts += 1
+        else:
+            self._seen_query_texts[key] = None
+            if len(self._seen_query_texts) > self.QUERY_TEXTS_TRACKED:
+                self._seen_query_texts.popitem(last=False)
+
+    def get_query_stats(self) -> Dict[str, Any]:
+        """
+        Exécutions et part des textes de requête répétés, global et par requête
+        """
+        executions = sum(stats.executions for stats in self._query_stats.values())
+        repeated = sum(stats.repeated_texts for stats in self._query_stats.values())
+        return {
+            "executions": executions,
+            "repeated_query_texts": repeated,
+            "repeat_rate": repeated / executions if executions else 0.0,
+            "distinct_query_texts": len(self._seen_query_texts),
+            "by_query": {
+                name: {**stats.__dict__, "repeat_rate": stats.repeat_rate}
+                for name, stats in sorted(self._query_stats.items())
+            },
+        }
+
+    def reset_query_stats(self):
+        self._query_stats.clear()
+        self._seen_query_texts.clear()
 
     async def has_node(self, node_id: str) -> bool:
-        entity_name_label = node_id.strip('"')
+        query, params = self._prepare("has_node", name=node_id)
 
         async with self.driver.session() as session:
-            query = (
-                f"MATCH (n:`{entity_name_label}`) RETURN count(n) > 0 AS node_exists"
-            )
-            result = await session.run(query)
+            result = await session.run(query, params)
             single_result = await result.single()
             logger.debug(
                 f'{inspect.currentframe().f_code.co_name}:query:{query}:result:{single_result["node_exists"]}'
@@ -88,15 +346,12 @@ class Neo4JStorage(BaseGraphStorage):
             return single_result["node_exists"]
 
     async def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
-        entity_name_label_source = source_node_id.strip('"')
-        entity_name_label_target = target_node_id.strip('"')
+        query, params = self._prepare(
+            "has_edge", source_name=source_node_id, target_name=target_node_id
+        )
 
         async with self.driver.session() as session:
-            query = (
-                f"MATCH (a:`{entity_name_label_source}`)-[r]-(b:`{entity_name_label_target}`) "
-                "RETURN COUNT(r) > 0 AS edgeExists"
-            )
-            result = await session.run(query)
+            result = await session.run(query, params)
             single_result = await result.single()
             logger.debug(
                 f'{inspect.currentframe().f_code.co_name}:query:{query}:result:{single_result["edgeExists"]}'
@@ -105,9 +360,8 @@ class Neo4JStorage(BaseGraphStorage):
 
     async def get_node(self, node_id: str) -> Union[dict, None]:
         async with self.driver.session() as session:
-            entity_name_label = node_id.strip('"')
-            query = f"MATCH (n:`{entity_name_label}`) RETURN n"
-            result = await session.run(query)
+            query, params = self._prepare("get_node", name=node_id)
+            result = await session.run(query, params)
             record = await result.single()
             if record:
                 node = record["n"]
@@ -119,14 +373,10 @@ class Neo4JStorage(BaseGraphStorage):
             return None
 
     async def node_degree(self, node_id: str) -> int:
-        entity_name_label = node_id.strip('"')
+        query, params = self._prepare("node_degree", name=node_id)
 
         async with self.driver.session() as session:
-            query = f"""
-                MATCH (n:`{entity_name_label}`)
-                RETURN COUNT{{ (n)--() }} AS totalEdgeCount
-            """
-            result = await session.run(query)
+            result = await session.run(query, params)
             record = await result.single()
             if record:
                 edge_count = record["totalEdgeCount"]
@@ -156,8 +406,6 @@ class Neo4JStorage(BaseGraphStorage):
     async def get_edge(
         self, source_node_id: str, target_node_id: str
     ) -> Union[dict, None]:
-        entity_name_label_source = source_node_id.strip('"')
-        entity_name_label_target = target_node_id.strip('"')
         """
         Find all edges between nodes of two given labels
 
@@ -168,17 +416,11 @@ class Neo4JStorage(BaseGraphStorage):
         Returns:
             list: List of all relationships/edges found
         """
+        query, params = self._prepare(
+            "get_edge", source_name=source_node_id, target_name=target_node_id
+        )
         async with self.driver.session() as session:
-            query = f"""
-            MATCH (start:`{entity_name_label_source}`)-[r]->(end:`{entity_name_label_target}`)
-            RETURN properties(r) as edge_properties
-            LIMIT 1
-            """.format(
-                entity_name_label_source=entity_name_label_source,
-                entity_name_label_target=entity_name_label_target,
-            )
-
-            result = await session.run(query)
+            result = await session.run(query, params)
             record = await result.single()
             if record:
                 result = dict(record["edge_properties"])
@@ -190,35 +432,158 @@ class Neo4JStorage(BaseGraphStorage):
                 return None
 
     async def get_node_edges(self, source_node_id: str) -> List[Tuple[str, str]]:
-        node_label = source_node_id.strip('"')
-
         """
         Retrieves all edges (relationships) for a particular node identified by its label.
         :return: List of dictionaries containing edge information
         """
-        query = f"""MATCH (n:`{node_label}`)
-                OPTIONAL MATCH (n)-[r]-(connected)
-                RETURN n, r, connected"""
+        query, params = self._prepare("get_node_edges", name=source_node_id)
         async with self.driver.session() as session:
-            results = await session.run(query)
+            results = await session.run(query, params)
             edges = []
             async for record in results:
-                source_node = record["n"]
-                connected_node = record["connected"]
+                if record["source"] and record["target"]:
+                    edges.append((record["source"], record["target"]))
 
-                source_label = (
-                    list(source_node.labels)[0] if source_node.labels else None
-                )
-                target_label = (
-                    list(connected_node.labels)[0]
-                    if connected_node and connected_node.labels
-                    else None
+            return edges
+
+    # Nombre maximal de branches par requête de lecture groupée
+    BATCH_READ_SIZE = 200
+
+    @staticmethod
+    def _escape_label(node_id: str) -> str:
+        """
+        Nom d'entité -> label Cypher utilisable entre backticks
+        """
+        return node_id.strip('"').replace("`", "``")
+
+    async def _run_label_batch(self, name: str, branches: List[str], returns: str) -> List[Any]:
+        """
+        Exécute des branches MATCH (une par label) en une seule requête par
+        paquet de BATCH_READ_SIZE.
+
+        Les labels ne pouvant pas être paramétrés en Cypher, chaque entité
+        garde sa propre branche `MATCH (n:`label`)` (lookup par label indexé),
+        réunies par UNION ALL dans un CALL unique.
+        """
+        records = []
+        if not branches:
+            return records
+        async with self.driver.session() as session:
+            for i in range(0, len(branches), self.BATCH_READ_SIZE):
+                query = (
+                    "CALL {\n"
+                    + "\nUNION ALL\n".join(branches[i : i + self.BATCH_READ_SIZE])
+                    + f"\n}}\nRETURN {returns}"
                 )
+                self._record_query(name, query)
+                result = await session.run(query)
+                records.extend([record async for record in result])
+        return records
 
-                if source_label and target_label:
-                    edges.append((source_label, target_label))
+    async def _run_unwind_batch(self, name: str, rows: List[dict]) -> List[Any]:
+        """
+        Exécute la requête UNWIND $rows nommée par paquet de BATCH_READ_SIZE
+        lignes (mode "property" : lookup par l'index unique sur entity_name)
+        """
+        records = []
+        if not rows:
+            return records
+        async with self.driver.session() as session:
+            for i in range(0, len(rows), self.BATCH_READ_SIZE):
+                query, params = self._prepare(name, {"rows": rows[i : i + self.BATCH_READ_SIZE]})
+                result = await session.run(query, params)
+                records.extend([record async for record in result])
+        return records
+
+    async def get_nodes_batch(self, node_ids: List[str]) -> Dict[str, Union[dict, None]]:
+        node_ids = list(dict.fromkeys(node_ids))
+        nodes = dict.fromkeys(node_ids)
+        if self.node_identity == "property":
+            records = await self._run_unwind_batch(
+                "get_nodes_batch",
+                [{"idx": i, "name": node_id.strip('"')} for i, node_id in enumerate(node_ids)],
+            )
+        else:
+            branches = [
+                f"MATCH (n:`{self._escape_label(node_id)}`) RETURN {i} AS idx, properties(n) AS props LIMIT 1"
+                for i, node_id in enumerate(node_ids)
+            ]
+            records = await self._run_label_batch("get_nodes_batch", branches, "idx, props")
+        for record in records:
+            nodes[node_ids[record["idx"]]] = dict(record["props"])
+        logger.debug(f"get_nodes_batch: {len(node_ids)} nœuds demandés")
+        return nodes
+
+    async def node_degrees_batch(self, node_ids: List[str]) -> Dict[str, int]:
+        node_ids = list(dict.fromkeys(node_ids))
+        degrees = dict.fromkeys(node_ids, 0)
+        if self.node_identity == "property":
+            records = await self._run_unwind_batch(
+                "node_degrees_batch",
+                [{"idx": i, "name": node_id.strip('"')} for i, node_id in enumerate(node_ids)],
+            )
+        else:
+            branches = [
+                f"MATCH (n:`{self._escape_label(node_id)}`) RETURN {i} AS idx, COUNT {{ (n)--() }} AS degree LIMIT 1"
+                for i, node_id in enumerate(node_ids)
+            ]
+            records = await self._run_label_batch("node_degrees_batch", branches, "idx, degree")
+        for record in records:
+            degrees[node_ids[record["idx"]]] = record["degree"]
+        return degrees
 
-            return edges
+    async def get_edges_batch(
+        self, pairs: List[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], Union[dict, None]]:
+        pairs = list(dict.fromkeys(tuple(p) for p in pairs))
+        edges = dict.fromkeys(pairs)
+        if self.node_identity == "property":
+            records = await self._run_unwind_batch(
+                "get_edges_batch",
+                [
+                    {"idx": i, "src": src.strip('"'), "tgt": tgt.strip('"')}
+                    for i, (src, tgt) in enumerate(pairs)
+                ],
+            )
+        else:
+            branches = [
+                f"MATCH (start:`{self._escape_label(src)}`)-[r]->(end:`{self._escape_label(tgt)}`) "
+                f"RETURN {i} AS idx, properties(r) AS props LIMIT 1"
+                for i, (src, tgt) in enumerate(pairs)
+            ]
+            records = await self._run_label_batch("get_edges_batch", branches, "idx, props")
+        for record in records:
+            edges[pairs[record["idx"]]] = dict(record["props"])
+        return edges
+
+    async def edge_degrees_batch(
+        self, pairs: List[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], int]:
+        pairs = list(dict.fromkeys(tuple(p) for p in pairs))
+        degrees = await self.node_degrees_batch([n for pair in pairs for n in pair])
+        return {(src, tgt): degrees[src] + degrees[tgt] for src, tgt in pairs}
+
+    async def get_nodes_edges_batch(
+        self, node_ids: List[str]
+    ) -> Dict[str, List[Tuple[str, str]]]:
+        node_ids = list(dict.fromkeys(node_ids))
+        edges = {node_id: [] for node_id in node_ids}
+        if self.node_identity == "property":
+            records = await self._run_unwind_batch(
+                "get_nodes_edges_batch",
+                [{"idx": i, "name": node_id.strip('"')} for i, node_id in enumerate(node_ids)],
+            )
+        else:
+            branches = [
+                f"MATCH (n:`{self._escape_label(node_id)}`) OPTIONAL MATCH (n)-[r]-(connected) "
+                f"RETURN {i} AS idx, head(labels(n)) AS source, head(labels(connected)) AS target"
+                for i, node_id in enumerate(node_ids)
+            ]
+            records = await self._run_label_batch("get_nodes_edges_batch", branches, "idx, source, target")
+        for record in records:
+            if record["source"] and record["target"]:
+                edges[node_ids[record["idx"]]].append((record["source"], record["target"]))
+        return edges
 
     RELATION_TYPE_MAPPING = {
         # Structure : (source_type, target_type) : new_label
@@ -309,6 +674,8 @@ class Neo4JStorage(BaseGraphStorage):
         logger.debug(f"🏷️ Label du nœud : {label}")
 
         properties = node_data
+        if self.node_identity == "property":
+            properties = {**node_data, "entity_name": label}
 
         async def _do_upsert(tx: AsyncManagedTransaction):
             try:
@@ -324,12 +691,10 @@ class Neo4JStorage(BaseGraphStorage):
                 logger.debug(f"🧹 clean_properties avant insertion: {clean_properties}")
                 logger.debug(f"🧹 clean_properties keys: {list(clean_properties.keys())}")
 
-                query = f"""
-                MERGE (n:`{label}`)
-                SET n = $properties
-                RETURN n
-                """
-                result = await tx.run(query, properties=clean_properties)
+                query, params = self._prepare(
+                    "upsert_node", {"properties": clean_properties}, name=node_id
+                )
+                result = await tx.run(query, params)
                 record = await result.single()
 
                 if record:
@@ -374,19 +739,15 @@ class Neo4JStorage(BaseGraphStorage):
         """
         source_node_label = source_node_id.strip('"')
         target_node_label = target_node_id.strip('"')
+        endpoints = {"source_name": source_node_id, "target_name": target_node_id}
         edge_properties = edge_data
 
         async def _do_upsert_edge(tx: AsyncManagedTransaction):
             # Récupérer les types de nœuds source et target
-            type_query = f"""
-            MATCH (source:`{source_node_label}`), (target:`{target_node_label}`)
-            RETURN 
-                source.entity_type as source_type, 
-                target.entity_type as target_type
-            """
+            type_query, params = self._prepare("edge_endpoint_types", **endpoints)
             
             logger.debug(f"Type query: {type_query}")
-            result = await tx.run(type_query)
+            result = await tx.run(type_query, params)
             type_record = await result.single()
             logger.debug(f"Type record: {type_record}")
 
@@ -405,18 +766,12 @@ class Neo4JStorage(BaseGraphStorage):
             # Ajouter le type de relation aux propriétés
             edge_properties['type'] = new_label
 
-            query = f"""
-            MATCH (source:`{source_node_label}`)
-            WITH source
-            MATCH (target:`{target_node_label}`)
-            MERGE (source)-[r:{new_label}]->(target)
-            ON CREATE SET r = $properties
-            ON MATCH SET r += $properties
-            RETURN r
-            """
+            query, params = self._prepare(
+                f"upsert_edge:{new_label}", {"properties": edge_properties}, **endpoints
+            )
             logger.debug(f"Cypher query for relation upsert: {query}")
             logger.debug(f"Properties to set: {edge_properties}")
-            await tx.run(query, properties=edge_properties)
+            await tx.run(query, params)
             logger.debug(
                 f"Upserted edge from '{source_node_label}' to '{target_node_label}' with type: {new_label}, properties: {edge_properties}"
             )
@@ -428,107 +783,278 @@ class Neo4JStorage(BaseGraphStorage):
             logger.error(f"Error during edge upsert: {str(e)}")
             raise
 
+    # Nombre maximal de nœuds/relations par requête d'écriture groupée
+    BATCH_WRITE_SIZE = 200
+
+    @staticmethod
+    def _clean_properties(properties: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convertit les propriétés non supportées par Neo4j en str (comme upsert_node)
+        """
+        return {
+            key: value if isinstance(value, (str, int, float, bool)) else str(value)
+            for key, value in properties.items()
+        }
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+        retry=retry_if_exception_type(
+            (
+                neo4jExceptions.ServiceUnavailable,
+                neo4jExceptions.TransientError,
+                neo4jExceptions.WriteServiceUnavailable,
+            )
+        ),
+    )
+    async def upsert_nodes_batch(self, nodes: Dict[str, Dict[str, Any]]):
+        """
+        Upsert groupé de nœuds dans une seule transaction.
+
+        En mode "label", chaque nœud garde sa clause MERGE sur son propre
+        label (non paramétrable), isolée dans un CALL unitaire ; en mode
+        "property", un seul UNWIND par paquet. Les propriétés passent en
+        paramètres. Une requête par paquet de BATCH_WRITE_SIZE nœuds.
+        """
+        if not nodes:
+            return
+        items = list(nodes.items())
+
+        async def _do_upsert_nodes(tx: AsyncManagedTransaction):
+            for i in range(0, len(items), self.BATCH_WRITE_SIZE):
+                if self.node_identity == "property":
+                    rows = [
+                        {
+                            "name": node_id.strip('"'),
+                            "properties": {
+                                **self._clean_properties(node_data),
+                                "entity_name": node_id.strip('"'),
+                            },
+                        }
+                        for node_id, node_data in items[i : i + self.BATCH_WRITE_SIZE]
+                    ]
+                    result = await tx.run(*self._prepare("upsert_nodes_batch", {"rows": rows}))
+                    await result.consume()
+                    continue
+                clauses = []
+                params = {}
+                for j, (node_id, node_data) in enumerate(items[i : i + self.BATCH_WRITE_SIZE]):
+                    clauses.append(
+                        f"CALL {{ MERGE (n:`{self._escape_label(node_id)}`) SET n = $p{j} }}"
+                    )
+                    params[f"p{j}"] = self._clean_properties(node_data)
+                query = "\n".join(clauses)
+                self._record_query("upsert_nodes_batch", query)
+                result = await tx.run(query, params)
+                await result.consume()
+
+        try:
+            async with self.driver.session() as session:
+                await session.execute_write(_do_upsert_nodes)
+            logger.debug(f"✅ {len(items)} nœuds créés/mis à jour en une transaction")
+        except Exception as e:
+            logger.error(f"❌ Erreur lors de l'upsert groupé des nœuds : {e}")
+            raise
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+        retry=retry_if_exception_type(
+            (
+                neo4jExceptions.ServiceUnavailable,
+                neo4jExceptions.TransientError,
+                neo4jExceptions.WriteServiceUnavailable,
+            )
+        ),
+    )
+    async def upsert_edges_batch(self, edges: Dict[Tuple[str, str], Dict[str, Any]]):
+        """
+        Upsert groupé de relations : une transaction par type de relation.
+
+        Les types des extrémités sont lus en une requête puis traduits via
+        RELATION_TYPE_MAPPING (DIRECTED par défaut), comme dans upsert_edge.
+        """
+        if not edges:
+            return
+        endpoints = await self.get_nodes_batch([n for pair in edges for n in pair])
+        entity_types = {
+            node_id: (node or {}).get("entity_type") for node_id, node in endpoints.items()
+        }
+
+        rows_by_relation = {}
+        for (src_id, tgt_id), edge_data in edges.items():
+            relation_key = (entity_types.get(src_id), entity_types.get(tgt_id))
+            new_label = self.RELATION_TYPE_MAPPING.get(relation_key, 'DIRECTED')
+            rows_by_relation.setdefault(new_label, []).append(
+                (src_id, tgt_id, {**edge_data, "type": new_label})
+            )
+
+        async def _do_upsert_edges(tx: AsyncManagedTransaction, new_label: str, rows: list):
+            for i in range(0, len(rows), self.BATCH_WRITE_SIZE):
+                if self.node_identity == "property":
+                    batch = [
+                        {"src": src_id.strip('"'), "tgt": tgt_id.strip('"'), "properties": properties}
+                        for src_id, tgt_id, properties in rows[i : i + self.BATCH_WRITE_SIZE]
+                    ]
+                    result = await tx.run(
+                        *self._prepare(f"upsert_edges_batch:{new_label}", {"rows": batch})
+                    )
+                    await result.consume()
+                    continue
+                clauses = []
+                params = {}
+                for j, (src_id, tgt_id, properties) in enumerate(rows[i : i + self.BATCH_WRITE_SIZE]):
+                    clauses.append(
+                        f"CALL {{ MATCH (source:`{self._escape_label(src_id)}`) "
+                        f"MATCH (target:`{self._escape_label(tgt_id)}`) "
+                        f"MERGE (source)-[r:{new_label}]->(target) "
+                        f"ON CREATE SET r = $p{j} ON MATCH SET r += $p{j} }}"
+                    )
+                    params[f"p{j}"] = properties
+                query = "\n".join(clauses)
+                self._record_query(f"upsert_edges_batch:{new_label}", query)
+                result = await tx.run(query, params)
+                await result.consume()
+
+        try:
+            async with self.driver.session() as session:
+                for new_label, rows in rows_by_relation.items():
+                    await session.execute_write(_do_upsert_edges, new_label, rows)
+                    logger.debug(f"✅ {len(rows)} relations {new_label} créées/mises à jour")
+        except Exception as e:
+            logger.error(f"Error during batch edge upsert: {str(e)}")
+            raise
+
     async def _node2vec_embed(self):
         print("Implemented but never called.")
 
+    # Catégories prédéfinies (nom, custom_id), créées une fois par instance
+    ACTIVITY_CATEGORIES = [
+        ('Restauration', 'restauration'),
+        ('Culture et Loisirs', 'culture_loisirs'),
+        ('Sport et Fitness', 'sport_fitness'),
+        ('Voyage et Tourisme', 'voyage_tourisme'),
+        ('Formation et Éducation', 'formation_education'),
+        ('Bien-être et Santé', 'bien_etre_sante'),
+        ('Événements Professionnels', 'evenements'),
+        ('Unknown', 'unknown'),
+    ]
+
     async def categorize_activities(
         self, 
         activity_categories_manager, 
         use_model_func=None, 
-        session=None
+        session=None,
+        custom_ids: Optional[List[str]] = None,
     ) -> Dict[str, int]:
         """
         Catégorise les activités dans la base de données Neo4j.
+
+        Seules sont traitées les activités sans relation CLASSIFIED_AS et celles
+        de l'insertion (custom_ids) dont la description a changé depuis leur
+        classement (hash conservé sur la relation). Les classements sont faits
+        par lot (LLM ou mots-clés) puis écrits en un seul UNWIND.
         
         Args:
             activity_categories_manager: Gestionnaire des catégories d'activités
             use_model_func: Fonction optionnelle pour générer des catégories via LLM
             session: Session Neo4j optionnelle
+            custom_ids: custom_id des activités de l'insertion courante
         
         Returns:
             Dictionnaire avec les compteurs de catégorisation
         """
-        # Relation type mapping
-        RELATION_TYPE_MAPPING = {
-            ('activity', 'ActivityCategory'): 'CLASSIFIED_AS',
-        }
-        
         # Utiliser la session existante ou en créer une nouvelle
         if session is None:
             session = self.driver.session()
         
         async with session:
-            # Initialiser les catégories prédéfinies
-            init_query = """
-            MERGE (restauration:ActivityCategory {name: 'Restauration', custom_id: 'restauration'})
-            MERGE (culture:ActivityCategory {name: 'Culture et Loisirs', custom_id: 'culture_loisirs'})
-            MERGE (sport:ActivityCategory {name: 'Sport et Fitness', custom_id: 'sport_fitness'})
-            MERGE (voyage:ActivityCategory {name: 'Voyage et Tourisme', custom_id: 'voyage_tourisme'})
-            MERGE (formation:ActivityCategory {name: 'Formation et Éducation', custom_id: 'formation_education'})
-            MERGE (bienetre:ActivityCategory {name: 'Bien-être et Santé', custom_id: 'bien_etre_sante'})
-            MERGE (pro:ActivityCategory {name: 'Événements Professionnels', custom_id: 'evenements'})
-            MERGE (unknown:ActivityCategory {name: 'Unknown', custom_id: 'unknown'})
-
-            // Requête pour récupérer les activités sans catégorie
-            WITH 1 as dummy
-            MATCH (n {entity_type: 'activity'})
+            if not getattr(self, "_activity_categories_ready", False):
+                init_query = """
+                UNWIND $categories AS category
+                MERGE (cat:ActivityCategory {name: category.name, custom_id: category.custom_id})
+                """
+                await session.run(
+                    init_query,
+                    categories=[
+                        {"name": name, "custom_id": custom_id}
+                        for name, custom_id in self.ACTIVITY_CATEGORIES
+                    ],
+                )
+                self._activity_categories_ready = True
+
+            # Activités à (re)classer
+            select_query = f"""
+            MATCH (n{self._entity_label} {{entity_type: 'activity'}})
             WHERE NOT (n)-[:CLASSIFIED_AS]->(:ActivityCategory)
-            RETURN n.description as description, elementId(n) as node_id, labels(n) as node_labels
+               OR ($custom_ids IS NOT NULL AND n.custom_id IN $custom_ids)
+            OPTIONAL MATCH (n)-[r:CLASSIFIED_AS]->(:ActivityCategory)
+            WITH n, collect(r.description_hash) AS hashes
+            RETURN n.description AS description, elementId(n) AS node_id, hashes
             """
-            
-            # Exécuter l'initialisation et récupérer les activités
-            result = await session.run(init_query)
-            activities = await result.data()
+            result = await session.run(
+                select_query,
+                custom_ids=custom_ids,
+            )
+            activities = [
+                activity for activity in await result.data()
+                if not activity['hashes']
+                or activity_categories_manager.description_hash(activity['description'])
+                not in activity['hashes']
+            ]
             
             # Compteurs de catégorisation
             categorization_counts = {
-                'total': 0,
+                'total': len(activities),
                 'categorized': 0,
                 'uncategorized': 0
             }
-            
-            for activity in activities:
-                description = activity['description']
-                node_id = activity['node_id']
-                node_labels = activity['node_labels']
-                
+            if not activities:
+                return categorization_counts
+
+            descriptions = [activity['description'] or '' for activity in activities]
+            if use_model_func:
+                logger.debug("Utilisation de use_model_func pour déterminer les catégories")
+                categories = await activity_categories_manager.get_categories_with_llm(
+                    descriptions, use_model_func
+                )
+            else:
+                logger.debug("Utilisation de activity_categories_manager pour déterminer les catégories")
+                categories = [activity_categories_manager.get_category(d) for d in descriptions]
 
-                if use_model_func:
-                    logger.debug("Utilisation de use_model_func pour déterminer la catégorie")
-                    category = await use_model_func(description)
-                else:
-                    logger.debug("Utilisation de activity_categories_manager pour déterminer la catégorie")
-                    category = activity_categories_manager.get_category(description)
-                
-                logger.debug(f"Catégorie déterminée : {category}")
-                
+            rows = []
+            for activity, description, category in zip(activities, descriptions, categories):
                 # Catégorisation par défaut si aucune catégorie n'est trouvée
-                if not category:
+                if not category or category == 'Unknown':
                     category = 'Unknown'
                     categorization_counts['uncategorized'] += 1
                 else:
                     categorization_counts['categorized'] += 1
-                
-                categorization_counts['total'] += 1
-                
-                # Requête pour créer la relation de catégorisation
-                categorize_query = """
-                MATCH (activity) WHERE elementId(activity) = $node_id
-                WITH activity
-                MATCH (cat:ActivityCategory {name: $category_name})
-                MERGE (activity)-[r:CLASSIFIED_AS]->(cat)
-                RETURN activity, cat
-                """
-                
-                try:
-                    await session.run(
-                        categorize_query, 
-                        node_id=node_id, 
-                        category_name=category
-                    )
-                    logger.debug(f"🏷️ Catégorisation de l'activité {node_id} dans la catégorie {category}")
-                except Exception as e:
-                    logger.error(f"❌ Erreur lors de la catégorisation de l'activité {node_id} : {e}")
+                rows.append({
+                    "node_id": activity['node_id'],
+                    "category": category,
+                    "description_hash": activity_categories_manager.description_hash(description),
+                })
+
+            # Une seule requête : remplace un éventuel ancien classement
+            categorize_query = """
+            UNWIND $rows AS row
+            MATCH (activity) WHERE elementId(activity) = row.node_id
+            MERGE (cat:ActivityCategory {name: row.category})
+            WITH activity, cat, row
+            OPTIONAL MATCH (activity)-[old:CLASSIFIED_AS]->(previous:ActivityCategory)
+            WHERE previous <> cat
+            DELETE old
+            WITH DISTINCT activity, cat, row
+            MERGE (activity)-[r:CLASSIFIED_AS]->(cat)
+            SET r.description_hash = row.description_hash
+            """
+            try:
+                result = await session.run(categorize_query, rows=rows)
+                await result.consume()
+                logger.debug(f"🏷️ {len(rows)} activités catégorisées")
+            except Exception as e:
+                logger.error(f"❌ Erreur lors de la catégorisation des activités : {e}")
             
             logger.debug("📊 Résumé de la catégorisation :")
             logger.debug(f"   - Total d'activités : {categorization_counts['total']}")
@@ -553,8 +1079,7 @@ class Neo4JStorage(BaseGraphStorage):
         Returns:
             Dict[str, Any]: Les informations de l'activité et de la ville
         """
-        query = """
-        MATCH (activity {custom_id: $custom_id})
+        query = f"MATCH (activity{self._entity_label} {{custom_id: $custom_id}})" + """
         WITH activity
 
         // Vérifier s'il existe déjà une relation LOCATED_IN
@@ -632,8 +1157,7 @@ class Neo4JStorage(BaseGraphStorage):
             custom_id (str): Identifiant personnalisé de l'événement
             date_label (str): Étiquette de la date (format YYYY-MM-DD)
         """
-        query = """
-        MATCH (event {custom_id: $custom_id})
+        query = f"MATCH (event{self._entity_label} {{custom_id: $custom_id}})" + """
         WITH event
 
         // Vérifier s'il existe déjà une relation OCCURS_ON
@@ -736,9 +1260,9 @@ class Neo4JStorage(BaseGraphStorage):
                 logger.debug(f"Requête Cypher avec custom_id: {custom_id}, user_id: {user_id}")
                 
                 # Vérifier l'existence des nœuds
-                check_memo_query = "MATCH (memo {custom_id: $custom_id, entity_type: 'memo'}) RETURN memo"
-                check_user_query = """
-                MATCH (user) 
+                check_memo_query = f"MATCH (memo{self._entity_label} {{custom_id: $custom_id, entity_type: 'memo'}}) RETURN memo"
+                check_user_query = f"""
+                MATCH (user{self._entity_label}) 
                 WHERE user.entity_type = 'user' AND 
                 (
                     user.custom_id = $user_id OR 
@@ -763,12 +1287,12 @@ class Neo4JStorage(BaseGraphStorage):
                 logger.debug(f"Utilisateurs trouvés : {user_records}")
                 
                 # Exécution de la requête Cypher
-                query = """
-                MATCH (memo {custom_id: $custom_id})
-                OPTIONAL MATCH (user {
+                query = f"""
+                MATCH (memo{self._entity_label} {{custom_id: $custom_id}})
+                OPTIONAL MATCH (user{self._entity_label} {{
                     custom_id: $normalized_user_id, 
                     entity_type: 'user'
-                })
+                }})
                 OPTIONAL MATCH (user)-[existing_relation:HAS_MEMO]->(memo)
                 WITH memo, user, existing_relation
                 WHERE user IS NOT NULL AND existing_relation IS NULL
@@ -850,9 +1374,9 @@ class Neo4JStorage(BaseGraphStorage):
                 # logger.info(f"Utilisateurs trouvés : {user_records}")
                 
                 # Exécution de la requête Cypher pour créer la relation
-                query = """
-                MERGE (query {custom_id: $custom_id, entity_type: 'query'})
-                MERGE (user {custom_id: $user_id, entity_type: 'user'})
+                query = f"""
+                MERGE (query{self._entity_label} {{custom_id: $custom_id, entity_type: 'query'}})
+                MERGE (user{self._entity_label} {{custom_id: $user_id, entity_type: 'user'}})
                 MERGE (query)-[r:USER_QUERY]->(user)
                 ON CREATE SET 
                     r.created_at = timestamp(),
@@ -970,8 +1494,8 @@ class Neo4JStorage(BaseGraphStorage):
             dict: Un dictionnaire structuré similaire à chunk_entity_relation_graph
         """
         async with self.driver.session() as session:
-            query = """
-            MATCH (n)
+            query = f"""
+            MATCH (n{self._entity_label})
             WHERE n.custom_id IN $custom_ids
             MATCH (n)-[r]-(connected)
             RETURN 
@@ -1053,9 +1577,9 @@ class Neo4JStorage(BaseGraphStorage):
             list: Liste des nœuds et relations filtrés
         """
         async with self.driver.session() as session:
-            query = """
+            query = f"""
             // Trouver les nœuds par leur custom_id
-            MATCH (n)
+            MATCH (n{self._entity_label})
             WHERE n.custom_id IN $node_ids
             
             // Récupérer les nœuds et leurs relations
@@ -1182,12 +1706,14 @@ class Neo4JStorage(BaseGraphStorage):
         
         :param label: Le label de la relation à supprimer
         """
-        query = f"""
-        MATCH ()-[r:{label}]->()
-        DELETE r
-        """
+        name = f"delete_relations:{label}"
+        if name not in self._queries:
+            # Type hors RELATION_TYPE_MAPPING : modèle échappé, mémorisé
+            self._queries[name] = f"MATCH ()-[r:`{label.replace('`', '``')}`]->() DELETE r"
+        query, params = self._prepare(name)
         async with self._driver.session() as session:
-            await session.run(query)
+            result = await session.run(query, params)
+            await result.consume()
 
     async def delete_nodes_by_type(self, entity_type: str):
         """
@@ -1195,9 +1721,7 @@ class Neo4JStorage(BaseGraphStorage):
         
         :param entity_type: Le type d'entité à supprimer
         """
-        query = f"""
-        MATCH (n {{entity_type: '{entity_type}'}})
-        DETACH DELETE n
-        """
+        query, params = self._prepare("delete_nodes_by_type", {"entity_type": entity_type})
         async with self._driver.session() as session:
-            await session.run(query)
\ No newline at end of file
+            result = await session.run(query, params)
+            await result.consume()
\ No newline at end of file
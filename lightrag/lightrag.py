@@ -4,7 +4,7 @@ from tqdm.asyncio import tqdm as tqdm_async
 from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from functools import partial
-from typing import Type, cast, Optional, List, Dict, Any
+from typing import Type, cast, Optional, List, Dict, Any, Union
 
 from lightrag.llm import (
     gpt_4o_mini_complete,
@@ -13,16 +13,29 @@ from lightrag.llm import (
 from lightrag.operate import (
     chunking_by_token_size,
     extract_entities,
+    get_gleaning_stats,
     # local_query,global_query,hybrid_query,
     kg_query,
     naive_query,
 )
 
 from lightrag.utils import (
+    CompletionCache,
+    EmbeddingBatcher,
+    EmbeddingCache,
     EmbeddingFunc,
+    embedding_model_name,
     compute_mdhash_id,
-    limit_async_func_call,
+    PRIORITY_INTERACTIVE,
+    cache_completions,
+    call_priority,
     convert_response_to_json,
+    encode_string_by_tiktoken,
+    get_call_limiter,
+    get_tiktoken_encoding,
+    llm_call_tokens,
+    llm_func_identity,
+    flush_semantic_cache_indexes,
     logger,
     set_logger,
 )
@@ -34,6 +47,7 @@ from lightrag.base import (
     QueryParam,
 )
 
+from lightrag.rabbitmq_publisher import aclose_query_publisher, flush_query_publisher
 from lightrag.storage import (
     JsonKVStorage,
     NanoVectorDBStorage,
@@ -91,6 +105,9 @@ class LightRAG:
             "enabled": False,
             "similarity_threshold": 0.95,
             "use_llm_check": False,
+            # index matriciel du cache sémantique (éviction LRU au-delà)
+            "max_entries": 100_000,
+            "search_dtype": "float32",
         }
     )
     kv_storage: str = field(default="JsonKVStorage")
@@ -107,7 +124,23 @@ class LightRAG:
 
     # entity extraction
     entity_extract_max_gleaning: int = 1
+    # Gleaning sauté quand la première extraction dépasse skip_density
+    # enregistrements par 100 tokens de chunk, historique borné en tokens
+    entity_extract_gleaning_config: dict = field(
+        default_factory=lambda: {
+            "skip_density": 1.0,
+            "history_max_tokens": 6000,
+        }
+    )
     entity_summary_to_max_tokens: int = 500
+    # Résumés des descriptions trop longues d'une insertion regroupés par
+    # requête LLM (dédupliqués par contenu, mis en cache)
+    entity_summary_batch_config: dict = field(
+        default_factory=lambda: {
+            "max_items_per_request": 8,
+            "max_input_tokens_per_request": 12_000,
+        }
+    )
 
     # node embedding
     node_embedding_algorithm: str = "node2vec"
@@ -126,18 +159,85 @@ class LightRAG:
     embedding_func: EmbeddingFunc = field(default_factory=lambda: openai_embedding)
     embedding_batch_num: int = 32
     embedding_func_max_async: int = 16
+    # Budget de tokens par minute du fournisseur d'embedding (0 = illimité)
+    embedding_func_tokens_per_minute: int = 0
 
     # LLM
     llm_model_func: callable = gpt_4o_mini_complete  # hf_model_complete#
     llm_model_name: str = "meta-llama/Llama-3.2-1B-Instruct"  #'meta-llama/Llama-3.2-1B'#'google/gemma-2-2b-it'
     llm_model_max_token_size: int = 32768
     llm_model_max_async: int = 16
+    # Budget de tokens par minute du fournisseur LLM (0 = illimité) ; limite,
+    # budget et file d'attente sont partagés par les instances du processus
+    # (pool) qui utilisent le même modèle
+    llm_model_tokens_per_minute: int = 0
     llm_model_kwargs: dict = field(default_factory=dict)
 
     # storage
     vector_db_storage_cls_kwargs: dict = field(default_factory=dict)
+    # Multi-tenant : données des domaines utilisateur (user, memo, query)
+    # rattachées à leur user_id (clé de partition Milvus, propriété indexée
+    # dans Neo4j), requêtes limitées au catalogue partagé + utilisateur courant.
+    # Leurs entités sont nommées (user_id, nom), sauf celles déjà présentes dans
+    # le catalogue partagé, auxquelles elles se relient sans les modifier
+    user_tenancy: bool = False
 
     enable_llm_cache: bool = True
+    # Cache des complétions d'extraction, de gleaning et de résumé (pas des
+    # réponses aux requêtes) devant llm_model_func, actif seulement avec
+    # enable_llm_cache. Clé : fonction LLM réelle et llm_model_kwargs
+    llm_completion_cache_config: dict = field(
+        default_factory=lambda: {
+            "enabled": True,
+            "ttl": 30 * 24 * 3600,
+            "hot_size": 2048,
+            # entrées expirées puis plus anciennes supprimées au-delà de
+            # max_entries, au plus une fois par prune_interval secondes
+            "max_entries": 100_000,
+            "prune_interval": 3600,
+        }
+    )
+
+    # Regroupement des textes à embedder par nombre de tokens (limites par
+    # requête du fournisseur), troncature à embedding_func.max_token_size,
+    # concurrence bornée par embedding_func_max_async
+    embedding_batcher_config: dict = field(
+        default_factory=lambda: {
+            "enabled": True,
+            "max_tokens_per_request": 300_000,
+            # embedding_batch_num si absent ; réduit automatiquement si le
+            # fournisseur refuse une requête pour son nombre d'entrées (400/413)
+            "max_items_per_request": None,
+            # encodage des modèles d'embedding OpenAI (text-embedding-3-*, ada-002)
+            "tiktoken_encoding": "cl100k_base",
+        }
+    )
+
+    # Cache des embeddings par (modèle, md5 du texte) devant embedding_func,
+    # partagé par les stockages vectoriels et le cache de réponses
+    embedding_func_cache_config: dict = field(
+        default_factory=lambda: {
+            "enabled": True,
+            "hot_size": 10_000,
+            # nom du modèle dans la clé (déduit de embedding_func si absent)
+            "model_name": None,
+            # fichier SQLite (working_dir/embedding_cache.sqlite si absent,
+            # ":memory:" pour un cache limité au processus)
+            "path": None,
+        }
+    )
+
+    # Ingestion en flux : extractions concurrentes bornées, résultats regroupés
+    # au fil de l'eau, puis une seule fusion du graphe et un upsert vectoriel
+    # pour tout le lot (désactivée par défaut)
+    ingestion_pipeline_config: dict = field(
+        default_factory=lambda: {
+            "enabled": False,
+            # extractions concurrentes (llm_model_max_async si absent)
+            "extract_workers": None,
+            "queue_size": 64,
+        }
+    )
 
     # extension
     addon_params: dict = field(default_factory=dict)
@@ -174,6 +274,67 @@ class LightRAG:
             logger.debug(f"Creating working directory {self.working_dir}")
             os.makedirs(self.working_dir)
 
+        def count_tokens(text: str) -> int:
+            return len(encode_string_by_tiktoken(text, model_name=self.tiktoken_model_name))
+
+        # Textes à embedder comptés avec l'encodage du modèle d'embedding
+        embedding_encoding = self.embedding_batcher_config.get("tiktoken_encoding", "cl100k_base")
+
+        def count_embedding_tokens(text: str) -> int:
+            return len(get_tiktoken_encoding(embedding_encoding).encode(text))
+
+        # Seuls les textes absents du cache passent par le regroupement et la
+        # limite de concurrence
+        embedding_name = embedding_model_name(self.embedding_func)
+        self.embedding_limiter = get_call_limiter(
+            f"embedding:{embedding_name}",
+            self.embedding_func_max_async,
+            self.embedding_func_tokens_per_minute,
+        )
+        if self.embedding_batcher_config.get("enabled", False):
+            self.embedding_batcher = EmbeddingBatcher(
+                self.embedding_func,
+                max_token_size=self.embedding_func.max_token_size,
+                max_tokens_per_request=self.embedding_batcher_config.get(
+                    "max_tokens_per_request", 300_000
+                ),
+                max_items_per_request=self.embedding_batcher_config.get(
+                    "max_items_per_request"
+                )
+                or self.embedding_batch_num,
+                tiktoken_encoding=embedding_encoding,
+                limiter=self.embedding_limiter,
+            )
+            limited_embedding = self.embedding_batcher.wrap(self.embedding_func)
+        else:
+            self.embedding_batcher = None
+            limited_embedding = EmbeddingFunc(
+                embedding_dim=self.embedding_func.embedding_dim,
+                max_token_size=self.embedding_func.max_token_size,
+                func=self.embedding_limiter.wrap(
+                    self.embedding_func,
+                    cost=(lambda texts, *args, **kwargs: sum(count_embedding_tokens(t) for t in texts))
+                    if self.embedding_func_tokens_per_minute > 0
+                    else None,
+                ),
+            )
+        self.embedding_cache = (
+            EmbeddingCache(
+                self.embedding_func_cache_config.get("path")
+                or os.path.join(self.working_dir, "embedding_cache.sqlite"),
+                model_name=self.embedding_func_cache_config.get("model_name")
+                or embedding_name,
+                hot_size=self.embedding_func_cache_config.get("hot_size", 10_000),
+            )
+            if self.embedding_func_cache_config.get("enabled", False)
+            else None
+        )
+        self.embedding_func = (
+            self.embedding_cache.wrap(self.embedding_func, limited_embedding)
+            if self.embedding_cache is not None
+            else limited_embedding
+        )
+
         self.llm_response_cache = (
             self.key_string_value_json_storage_cls(
                 namespace="llm_response_cache",
@@ -183,8 +344,21 @@ class LightRAG:
             if self.enable_llm_cache
             else None
         )
-        self.embedding_func = limit_async_func_call(self.embedding_func_max_async)(
-            self.embedding_func
+        self.llm_completion_cache = (
+            CompletionCache(
+                self.key_string_value_json_storage_cls(
+                    namespace="llm_completion_cache",
+                    global_config=asdict(self),
+                    embedding_func=None,
+                ),
+                model_name=llm_func_identity(self.llm_model_func, self.llm_model_kwargs),
+                ttl=self.llm_completion_cache_config.get("ttl"),
+                hot_size=self.llm_completion_cache_config.get("hot_size", 2048),
+                max_entries=self.llm_completion_cache_config.get("max_entries"),
+                prune_interval=self.llm_completion_cache_config.get("prune_interval", 3600),
+            )
+            if self.enable_llm_cache and self.llm_completion_cache_config.get("enabled", False)
+            else None
         )
 
         ####
@@ -227,13 +401,31 @@ class LightRAG:
             embedding_func=self.embedding_func,
         )
 
-        self.llm_model_func = limit_async_func_call(self.llm_model_max_async)(
+        # Appels admis par priorité : les requêtes (aquery) passent devant
+        # l'extraction en masse
+        self.llm_limiter = get_call_limiter(
+            f"llm:{self.llm_model_name}",
+            self.llm_model_max_async,
+            self.llm_model_tokens_per_minute,
+        )
+        budgeted = self.llm_model_tokens_per_minute > 0
+        self.llm_model_func = self.llm_limiter.wrap(
             partial(
                 self.llm_model_func,
                 hashing_kv=self.llm_response_cache,
                 **self.llm_model_kwargs,
-            )
+            ),
+            cost=partial(llm_call_tokens, count_tokens) if budgeted else None,
+            result_cost=(lambda result: count_tokens(result) if isinstance(result, str) else 0)
+            if budgeted
+            else None,
         )
+        if self.llm_completion_cache is not None:
+            # Hors du limiteur : un hit ne consomme pas de slot d'appel LLM
+            self.llm_model_func = self.llm_completion_cache.wrap(self.llm_model_func)
+
+        # Compteurs par étape du pipeline d'ingestion de la dernière insertion
+        self.last_ingestion_stats = {}
 
     def _get_storage_class(self) -> Type[BaseGraphStorage]:
         return {
@@ -270,20 +462,34 @@ class LightRAG:
             )
         )
 
-    async def ainsert(self, string_or_strings, prompt_domain: str = None, metadata: dict = None):
+    async def ainsert(self, string_or_strings, prompt_domain: str = None, metadata: Union[dict, List[dict]] = None):
         """
         Insertion asynchrone de texte avec support de prompt_domain et metadata
         
         Args:
             string_or_strings (str or List[str]): Texte(s) à insérer
             prompt_domain (str, optional): Domaine du prompt. Defaults to None.
-            metadata (dict, optional): Métadonnées associées. Defaults to None.
+            metadata (dict or List[dict], optional): Métadonnées associées, communes
+                à tous les textes ou une par texte (insertion par lot). Defaults to None.
         """
         # Utiliser le prompt_domain par défaut si non spécifié
         if prompt_domain is None:
             prompt_domain = self.prompt_domain
 
-        # Traitement des métadonnées
+        # Traitement des métadonnées : une liste alignée sur les textes est indexée
+        # par full_doc_id, les valeurs identiques pour tous (user_id) restent communes
+        doc_metadata = None
+        if isinstance(metadata, list):
+            texts = [string_or_strings] if isinstance(string_or_strings, str) else string_or_strings
+            doc_metadata = {
+                compute_mdhash_id(text.strip(), prefix="doc-"): doc_meta or {}
+                for text, doc_meta in zip(texts, metadata)
+            }
+            first_meta = (metadata[0] or {}) if metadata else {}
+            metadata = {
+                k: v for k, v in first_meta.items()
+                if all((m or {}).get(k) == v for m in metadata)
+            }
         metadata = metadata or {}
         
         # Log du domaine de prompt utilisé
@@ -330,27 +536,35 @@ class LightRAG:
                 k: v for k, v in inserting_chunks.items() if k in _add_chunk_keys
             }
             if not len(inserting_chunks):
+                # reprise d'une insertion interrompue : graphe et vecteurs de tous
+                # les chunks déjà écrits, restent full_docs et la catégorisation
                 logger.warning("All chunks are already in the storage")
-                return
-            logger.debug(f"[New Chunks] inserting {len(inserting_chunks)} chunks")
-
-            await self.chunks_vdb.upsert(inserting_chunks)
-            
-            logger.debug("[Entity Extraction]...")
-            maybe_new_kg = await extract_entities(
-                inserting_chunks,
-                knowledge_graph_inst=self.chunk_entity_relation_graph,
-                entity_vdb=self.entities_vdb,
-                relationships_vdb=self.relationships_vdb,
-                global_config=asdict(self),
-                prompt_domain=prompt_domain,
-                metadata=metadata,
-                text_chunks=self.text_chunks
-            )
-            if maybe_new_kg is None:
-                logger.warning("No new entities and relationships found")
-                return
-            self.chunk_entity_relation_graph = maybe_new_kg
+            else:
+                logger.debug(f"[New Chunks] inserting {len(inserting_chunks)} chunks")
+
+                await self.chunks_vdb.upsert(inserting_chunks)
+
+                logger.debug("[Entity Extraction]...")
+                self.last_ingestion_stats = {}
+                # extraction, gleaning et résumés servis par le cache des complétions
+                with cache_completions():
+                    maybe_new_kg = await extract_entities(
+                        inserting_chunks,
+                        knowledge_graph_inst=self.chunk_entity_relation_graph,
+                        entity_vdb=self.entities_vdb,
+                        relationships_vdb=self.relationships_vdb,
+                        global_config=asdict(self),
+                        prompt_domain=prompt_domain,
+                        metadata=metadata,
+                        doc_metadata=doc_metadata,
+                        text_chunks=self.text_chunks,
+                        pipeline_stats=self.last_ingestion_stats,
+                    )
+                logger.info(f"🔁 Gleaning ({prompt_domain}) : {get_gleaning_stats(prompt_domain)}")
+                if maybe_new_kg is None:
+                    logger.warning("No new entities and relationships found")
+                    return
+                self.chunk_entity_relation_graph = maybe_new_kg
 
             await self.full_docs.upsert(new_docs)
             await self.text_chunks.upsert(inserting_chunks)
@@ -359,6 +573,9 @@ class LightRAG:
             if update_storage and self.chunk_entity_relation_graph is not None:
                 from .config.activity_categories import activity_categories_manager
             
+                # Métadonnées de chaque document du lot (memo, query)
+                per_doc_metadata = list(doc_metadata.values()) if doc_metadata else [metadata]
+
                 # Catégorisation des activités
                 if prompt_domain in ['activity']:
                     # Log du début du processus de catégorisation
@@ -371,7 +588,11 @@ class LightRAG:
                             use_model_func = self.global_config.get("llm_model_func") if hasattr(self, 'global_config') else None
                             await self.chunk_entity_relation_graph.categorize_activities(
                                 activity_categories_manager, 
-                                use_model_func=use_model_func
+                                use_model_func=use_model_func,
+                                custom_ids=[
+                                    doc_meta.get('cid') for doc_meta in per_doc_metadata
+                                    if doc_meta.get('cid') is not None
+                                ],
                             )
                         except Exception as e:
                             logger.error(f"❌ Erreur lors de l'appel de categorize_activities : {e}")
@@ -453,24 +674,25 @@ class LightRAG:
                     
                     if hasattr(self.chunk_entity_relation_graph, 'categorize_memos') and callable(getattr(self.chunk_entity_relation_graph, 'categorize_memos')):
                         logger.debug("✅ Méthode categorize_memos trouvée")
-                        try:
-                            # Extraire l'ID du mémo des métadonnées
-                            custom_id = metadata.get('custom_id')
+                        for doc_meta in per_doc_metadata:
+                            try:
+                                # Extraire l'ID du mémo des métadonnées
+                                custom_id = doc_meta.get('custom_id')
                             
-                            if custom_id:
-                                # Extraire l'ID de l'utilisateur des métadonnées si disponible
-                                user_id = metadata.get('user_id')
+                                if custom_id:
+                                    # Extraire l'ID de l'utilisateur des métadonnées si disponible
+                                    user_id = doc_meta.get('user_id')
                                 
-                                await self.chunk_entity_relation_graph.categorize_memos(
-                                    custom_id=custom_id, 
-                                    user_id=user_id
-                                )
-                                logger.info(f"✅ Mémo {custom_id} associé")
-                            else:
-                                logger.warning("❌ custom_id manquant pour la catégorisation du mémo")
+                                    await self.chunk_entity_relation_graph.categorize_memos(
+                                        custom_id=custom_id, 
+                                        user_id=user_id
+                                    )
+                                    logger.info(f"✅ Mémo {custom_id} associé")
+                                else:
+                                    logger.warning("❌ custom_id manquant pour la catégorisation du mémo")
                         
-                        except Exception as e:
-                            logger.error(f"❌ Erreur lors de l'appel de categorize_memos : {e}")
+                            except Exception as e:
+                                logger.error(f"❌ Erreur lors de l'appel de categorize_memos : {e}")
                     else:
                         logger.warning("❌ Méthode categorize_memos non trouvée")
 
@@ -480,26 +702,27 @@ class LightRAG:
                     
                     if hasattr(self.chunk_entity_relation_graph, 'categorize_query') and callable(getattr(self.chunk_entity_relation_graph, 'categorize_query')):
                         logger.info("✅ Méthode categorize_query trouvée")
-                        try:
-                            # Extraire l'ID du mémo des métadonnées
-                            custom_id = metadata.get('custom_id')
-                            logger.info(f"custom_id : {custom_id}") 
+                        for doc_meta in per_doc_metadata:
+                            try:
+                                # Extraire l'ID du mémo des métadonnées
+                                custom_id = doc_meta.get('custom_id')
+                                logger.info(f"custom_id : {custom_id}") 
                             
-                            if custom_id:
-                                # Extraire l'ID de l'utilisateur des métadonnées si disponible
-                                user_id = metadata.get('user_id')
-                                logger.info(f"user_id : {user_id}")
+                                if custom_id:
+                                    # Extraire l'ID de l'utilisateur des métadonnées si disponible
+                                    user_id = doc_meta.get('user_id')
+                                    logger.info(f"user_id : {user_id}")
                                 
-                                await self.chunk_entity_relation_graph.categorize_query(
-                                    custom_id=custom_id, 
-                                    user_id=user_id
-                                )
-                                logger.info(f"✅ Query {custom_id} associé")
-                            else:
-                                logger.warning("❌ custom_id manquant pour la catégorisation de la query")
+                                    await self.chunk_entity_relation_graph.categorize_query(
+                                        custom_id=custom_id, 
+                                        user_id=user_id
+                                    )
+                                    logger.info(f"✅ Query {custom_id} associé")
+                                else:
+                                    logger.warning("❌ custom_id manquant pour la catégorisation de la query")
                         
-                        except Exception as e:
-                            logger.error(f"❌ Erreur lors de l'appel de categorize_query : {e}")
+                            except Exception as e:
+                                logger.error(f"❌ Erreur lors de l'appel de categorize_query : {e}")
                     else:
                         logger.warning("❌ Méthode categorize_query non trouvée")                        
         finally:
@@ -513,11 +736,15 @@ class LightRAG:
                 logger.info("✅ Suppression des relations DIRECTED réussie")
 
     async def _insert_done(self):
+        if self.llm_completion_cache is not None:
+            # avant index_done_callback, qui persiste les suppressions
+            await self.llm_completion_cache.prune()
         tasks = []
         for storage_inst in [
             self.full_docs,
             self.text_chunks,
             self.llm_response_cache,
+            self.llm_completion_cache and self.llm_completion_cache.kv,
             self.entities_vdb,
             self.relationships_vdb,
             self.chunks_vdb,
@@ -527,6 +754,8 @@ class LightRAG:
                 continue
             tasks.append(cast(StorageNameSpace, storage_inst).index_done_callback())
         await asyncio.gather(*tasks)
+        if self.llm_completion_cache is not None:
+            logger.info(f"📦 Cache LLM : {self.llm_completion_cache.get_stats()}")
 
     def insert_custom_kg(self, custom_kg: dict):
         loop = always_get_an_event_loop()
@@ -694,36 +923,40 @@ class LightRAG:
 
     def query(self, query: str, param: QueryParam = QueryParam()):
         loop = always_get_an_event_loop()
-        return loop.run_until_complete(self.aquery(query, param))
+        response = loop.run_until_complete(self.aquery(query, param))
+        # la boucle ne tourne plus entre deux appels : publier la réponse maintenant
+        loop.run_until_complete(flush_query_publisher())
+        return response
 
     async def aquery(self, query: str, param: QueryParam = QueryParam(), vdb_filter: Optional[Dict[str, Any]] = None, user_id: Optional[str] = None):
-        if param.mode in ["local", "global", "hybrid"]:
-            response = await kg_query(
-                query,
-                self.chunk_entity_relation_graph,
-                self.entities_vdb,
-                self.relationships_vdb,
-                self.text_chunks,
-                param,
-                asdict(self),
-                hashing_kv=self.llm_response_cache,
-                vdb_filter=vdb_filter,
-                user_id=user_id,
-            )
-        elif param.mode == "naive":
-            response = await naive_query(
-                query,
-                self.chunks_vdb,
-                self.text_chunks,
-                param,
-                asdict(self),
-                hashing_kv=self.llm_response_cache,
-                user_id=user_id
-            )
-        else:
-            raise ValueError(f"Unknown mode {param.mode}")
-        await self._query_done()
-        return response
+        with call_priority(PRIORITY_INTERACTIVE):
+            if param.mode in ["local", "global", "hybrid"]:
+                response = await kg_query(
+                    query,
+                    self.chunk_entity_relation_graph,
+                    self.entities_vdb,
+                    self.relationships_vdb,
+                    self.text_chunks,
+                    param,
+                    asdict(self),
+                    hashing_kv=self.llm_response_cache,
+                    vdb_filter=vdb_filter,
+                    user_id=user_id,
+                )
+            elif param.mode == "naive":
+                response = await naive_query(
+                    query,
+                    self.chunks_vdb,
+                    self.text_chunks,
+                    param,
+                    asdict(self),
+                    hashing_kv=self.llm_response_cache,
+                    user_id=user_id
+                )
+            else:
+                raise ValueError(f"Unknown mode {param.mode}")
+            await self._query_done()
+            return response
 
     async def _query_done(self):
         tasks = []
@@ -732,6 +965,55 @@ class LightRAG:
                 continue
             tasks.append(cast(StorageNameSpace, storage_inst).index_done_callback())
         await asyncio.gather(*tasks)
+        flush_semantic_cache_indexes()
+
+    async def ainitialize(self):
+        """
+        Prépare les stockages au démarrage (schéma, index) avant la première requête
+        """
+        tasks = []
+        for storage_inst in [
+            self.full_docs,
+            self.text_chunks,
+            self.llm_response_cache,
+            self.entities_vdb,
+            self.relationships_vdb,
+            self.chunks_vdb,
+            self.chunk_entity_relation_graph,
+        ]:
+            initialize = getattr(storage_inst, "initialize", None)
+            if storage_inst is None or initialize is None:
+                continue
+            tasks.append(initialize())
+        await asyncio.gather(*tasks)
+
+    async def aclose(self):
+        """
+        Ferme les clients (drivers, connexions) des stockages de l'instance,
+        sa connexion au cache d'embeddings et l'éditeur RabbitMQ de la boucle,
+        après publication de son outbox.
+        Les scripts `asyncio.run(rag.aquery(...))` doivent l'attendre avant de
+        rendre la main, sinon les réponses encore en outbox sont perdues.
+        """
+        await aclose_query_publisher()
+        tasks = []
+        for storage_inst in [
+            self.full_docs,
+            self.text_chunks,
+            self.llm_response_cache,
+            self.llm_completion_cache and self.llm_completion_cache.kv,
+            self.entities_vdb,
+            self.relationships_vdb,
+            self.chunks_vdb,
+            self.chunk_entity_relation_graph,
+        ]:
+            close = getattr(storage_inst, "close", None)
+            if storage_inst is None or close is None:
+                continue
+            tasks.append(close())
+        await asyncio.gather(*tasks)
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
 
     def delete_by_entity(self, entity_name: str):
         loop = always_get_an_event_loop()
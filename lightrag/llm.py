@@ -1,12 +1,18 @@
+import asyncio
 import base64
 import copy
 import json
 import os
+import re
 import struct
-from functools import lru_cache
-from typing import List, Dict, Callable, Any, Union
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from typing import List, Dict, Callable, Any, Optional, Union
 import aioboto3
 import aiohttp
+import httpx
 import numpy as np
 #import ollama
 #import torch
@@ -29,6 +35,9 @@ from tenacity import (
 from .utils import (
     wrap_embedding_func_with_attrs,
     locate_json_string_body_from_string,
+    is_rate_limit_error,
+    is_transient_error,
+    logger,
 )
 
 import sys
@@ -75,6 +84,124 @@ def get_api_key_from_kubernetes_secret(secret_name='openai-api-key', secret_key=
         return ''
 
 
+# Shared AsyncOpenAI clients, one per (base_url, api_key, event loop)
+_openai_async_clients: Dict[tuple, AsyncOpenAI] = {}
+
+# Last rate-limit headers returned to the shared clients, per (base_url, api_key)
+_openai_rate_limits: Dict[tuple, dict] = {}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value: str) -> Optional[float]:
+    """
+    Seconds of an x-ratelimit-reset-* value ("20ms", "1.5s", "6m0s") or of Retry-After.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    parts = _DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_rate_limit_headers(headers) -> dict:
+    """
+    Remaining budget announced by an OpenAI-compatible response, with reset
+    times converted to absolute time.monotonic() deadlines.
+    """
+    now = time.monotonic()
+    limits = {}
+    for kind in ("requests", "tokens"):
+        for field in ("limit", "remaining"):
+            value = headers.get(f"x-ratelimit-{field}-{kind}")
+            if value is not None and value.isdigit():
+                limits[f"{field}_{kind}"] = int(value)
+        reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+        if reset is not None:
+            limits[f"reset_{kind}_at"] = now + reset
+    retry_after = parse_reset_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        limits["retry_after_at"] = now + retry_after
+    if limits:
+        limits["updated_at"] = now
+    return limits
+
+
+def get_openai_rate_limits(base_url: str = None, api_key: str = None) -> dict:
+    """
+    Last rate-limit headers seen for (base_url, api_key) ({} before the first call).
+    """
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    return _openai_rate_limits.get((base_url, api_key), {})
+
+
+async def _record_rate_limits(key: tuple, response: httpx.Response):
+    limits = parse_rate_limit_headers(response.headers)
+    if limits:
+        _openai_rate_limits[key] = limits
+
+
+def openai_http_client_config() -> dict:
+    """
+    HTTP pooling settings of the shared OpenAI clients, read from the environment.
+    """
+    return {
+        "max_connections": int(os.environ.get("OPENAI_HTTP_MAX_CONNECTIONS", 100)),
+        "max_keepalive_connections": int(os.environ.get("OPENAI_HTTP_MAX_KEEPALIVE", 20)),
+        "keepalive_expiry": float(os.environ.get("OPENAI_HTTP_KEEPALIVE_EXPIRY", 60)),
+        "timeout": float(os.environ.get("OPENAI_HTTP_TIMEOUT", 600)),
+        "connect_timeout": float(os.environ.get("OPENAI_HTTP_CONNECT_TIMEOUT", 10)),
+    }
+
+
+def get_openai_async_client(base_url: str = None, api_key: str = None) -> AsyncOpenAI:
+    """
+    Return the pooled AsyncOpenAI client for (base_url, api_key).
+
+    Clients are kept for the whole process so that TLS sessions and keep-alive
+    connections are reused across calls. An httpx pool is bound to the event
+    loop that created it, so the running loop is part of the registry key.
+    """
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    loop = asyncio.get_running_loop()
+    key = (base_url, api_key, loop)
+    client = _openai_async_clients.get(key)
+    if client is not None and not client.is_closed():
+        return client
+
+    # Drop clients whose event loop is gone (e.g. successive asyncio.run calls)
+    for stale_key in [k for k in _openai_async_clients if k[2].is_closed()]:
+        del _openai_async_clients[stale_key]
+
+    config = openai_http_client_config()
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config["max_connections"],
+            max_keepalive_connections=config["max_keepalive_connections"],
+            keepalive_expiry=config["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(config["timeout"], connect=config["connect_timeout"]),
+        follow_redirects=True,
+        event_hooks={"response": [partial(_record_rate_limits, (base_url, api_key))]},
+    )
+    client = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
+    _openai_async_clients[key] = client
+    return client
+
+
+async def aclose_openai_clients():
+    """
+    Close the shared OpenAI clients of the running event loop (call on shutdown).
+    """
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _openai_async_clients if k[2] is loop]:
+        await _openai_async_clients.pop(key).close()
+
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -96,9 +223,7 @@ async def openai_complete_if_cache(
     if not os.environ.get("OPENAI_API_KEY"):
         os.environ["OPENAI_API_KEY"] = get_api_key_from_kubernetes_secret()
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = get_openai_async_client(base_url, api_key)
     kwargs.pop("hashing_kv", None)
     messages = []
     if system_prompt:
@@ -622,9 +747,7 @@ async def openai_embedding(
     if not os.environ.get("OPENAI_API_KEY"):
         os.environ["OPENAI_API_KEY"] = get_api_key_from_kubernetes_secret()
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = get_openai_async_client(base_url, api_key)
     response = await openai_async_client.embeddings.create(
         model=model, input=texts, encoding_format="float"
     )
@@ -688,9 +811,7 @@ async def nvidia_openai_embedding(
     if not os.environ.get("OPENAI_API_KEY"):
         os.environ["OPENAI_API_KEY"] = get_api_key_from_kubernetes_secret()
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = get_openai_async_client(base_url, api_key)
     response = await openai_async_client.embeddings.create(
         model=model, input=texts, encoding_format=encode, extra_body={"input_type": input_type, "truncate": trunc}
     )
@@ -909,11 +1030,57 @@ class Model(BaseModel):
         arbitrary_types_allowed = True
 
 
+@dataclass
+class ModelHealth:
+    """
+    Running statistics of one Model behind a MultiModel.
+    """
+
+    requests: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    in_flight: int = 0
+    latency_ewma: Optional[float] = None
+    error_rate: float = 0.0
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=256))
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+def _without_retries(func: Callable) -> Callable:
+    """The same function with its tenacity @retry limited to a single attempt"""
+    if isinstance(func, partial):
+        return partial(_without_retries(func.func), *func.args, **func.keywords)
+    retry_with = getattr(func, "retry_with", None)
+    if retry_with is None:
+        return func
+    return retry_with(stop=stop_after_attempt(1), reraise=True)
+
+
 class MultiModel:
     """
     Distributes the load across multiple language models. Useful for circumventing low rate limits with certain api providers especially if you are on the free tier.
     Could also be used for spliting across diffrent models or providers.
 
+    Each call goes to the healthy model with the lowest expected wait:
+    (in-flight calls + 1) x latency EWMA, penalised by its recent error rate and
+    by the share of its rate-limit budget already used (x-ratelimit-* headers
+    recorded by the shared OpenAI clients). A model that is rate limited, or
+    fails failure_threshold times in a row, is put on cooldown (until the
+    announced reset, else cooldown seconds doubling up to max_cooldown). A call
+    slower than the hedge_percentile latency of its model is duplicated on a
+    second model and the first answer wins. A call failing with a transient
+    error (rate limit, connection, timeout, HTTP 5xx) is retried once on each
+    other model; any other error (e.g. a 400) is raised at once and does not
+    count against the model. The tenacity retries of the gen_funcs are turned
+    off, the failover takes their place.
+
     Attributes:
         models (List[Model]): A list of language models to be used.
 
@@ -934,28 +1101,217 @@ class MultiModel:
         ```
     """
 
-    def __init__(self, models: List[Model]):
+    def __init__(
+        self,
+        models: List[Model],
+        ewma_alpha: float = 0.2,
+        hedge_percentile: Optional[float] = 0.95,
+        hedge_min_samples: int = 20,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+    ):
         self._models = models
+        self._gen_funcs = [_without_retries(model.gen_func) for model in models]
         self._current_model = 0
+        self._health = [ModelHealth() for _ in models]
+        self.ewma_alpha = ewma_alpha
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.stats = {"routed": [0] * len(models), "hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    def _rate_limits(self, index: int) -> dict:
+        kwargs = self._models[index].kwargs
+        return get_openai_rate_limits(kwargs.get("base_url"), kwargs.get("api_key"))
+
+    def _headroom(self, index: int, now: float) -> float:
+        """Share of the announced request / token budget still available (1 if unknown)"""
+        limits = self._rate_limits(index)
+        headroom = 1.0
+        for kind in ("requests", "tokens"):
+            limit = limits.get(f"limit_{kind}")
+            remaining = limits.get(f"remaining_{kind}")
+            if not limit or remaining is None:
+                continue
+            if limits.get(f"reset_{kind}_at", 0) <= now:
+                continue  # window already reset
+            headroom = min(headroom, remaining / limit)
+        return headroom
+
+    def _score(self, index: int, now: float) -> float:
+        health = self._health[index]
+        known = [h.latency_ewma for h in self._health if h.latency_ewma is not None]
+        latency = health.latency_ewma or (sum(known) / len(known) if known else 1.0)
+        penalty = 1 + 4 * health.error_rate
+        return (health.in_flight + 1) * latency * penalty / max(self._headroom(index, now), 0.05)
+
+    def _pick_model(self, exclude=()) -> Optional[int]:
+        now = time.monotonic()
+        candidates = [i for i in range(len(self._models)) if i not in exclude]
+        if not candidates:
+            return None
+        healthy = [i for i in candidates if self._health[i].cooldown_until <= now]
+        if not healthy:
+            # everything is cooling down: the model back first
+            return min(candidates, key=lambda i: self._health[i].cooldown_until)
+        # rotate the starting point so that equal scores (cold start) alternate
+        self._current_model = (self._current_model + 1) % len(self._models)
+        healthy.sort(key=lambda i: (i - self._current_model) % len(self._models))
+        return min(healthy, key=lambda i: self._score(i, now))
 
     def _next_model(self):
-        self._current_model = (self._current_model + 1) % len(self._models)
-        return self._models[self._current_model]
+        return self._models[self._pick_model()]
+
+    def _record_success(self, index: int, latency: float):
+        health = self._health[index]
+        alpha = self.ewma_alpha
+        health.latency_ewma = (
+            latency if health.latency_ewma is None else alpha * latency + (1 - alpha) * health.latency_ewma
+        )
+        health.latencies.append(latency)
+        health.error_rate *= 1 - alpha
+        health.consecutive_failures = 0
+
+    def _record_failure(self, index: int, error: Exception):
+        health = self._health[index]
+        health.errors += 1
+        health.error_rate = self.ewma_alpha + (1 - self.ewma_alpha) * health.error_rate
+        health.consecutive_failures += 1
+        now = time.monotonic()
+        if is_rate_limit_error(error):
+            health.rate_limited += 1
+            limits = self._rate_limits(index)
+            resets = [
+                limits[key]
+                for key in ("retry_after_at", "reset_requests_at", "reset_tokens_at")
+                if limits.get(key, 0) > now
+            ]
+            health.cooldown_until = max(resets) if resets else now + self.cooldown
+        elif health.consecutive_failures >= self.failure_threshold:
+            excess = health.consecutive_failures - self.failure_threshold
+            health.cooldown_until = now + min(self.max_cooldown, self.cooldown * 2**excess)
+        else:
+            return
+        logger.warning(
+            f"LLM model #{index} ({self._models[index].kwargs.get('model')}) cooling down "
+            f"for {health.cooldown_until - now:.1f}s after {type(error).__name__}"
+        )
+
+    async def _call(self, index: int, args: dict) -> str:
+        health = self._health[index]
+        health.requests += 1
+        health.in_flight += 1
+        self.stats["routed"][index] += 1
+        start = time.monotonic()
+        try:
+            result = await self._gen_funcs[index](**args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if is_transient_error(e):
+                self._record_failure(index, e)
+            raise
+        else:
+            self._record_success(index, time.monotonic() - start)
+            return result
+        finally:
+            health.in_flight -= 1
+
+    def _hedge_delay(self, index: int) -> Optional[float]:
+        health = self._health[index]
+        if self.hedge_percentile is None or len(self._models) < 2:
+            return None
+        if len(health.latencies) < self.hedge_min_samples:
+            return None
+        return health.latency_percentile(self.hedge_percentile)
+
+    async def _hedged_call(self, index: int, build_args, tried: set) -> str:
+        tasks = [asyncio.create_task(self._call(index, build_args(index)))]
+        try:
+            delay = self._hedge_delay(index)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                backup = None if done else self._pick_model(exclude=tried)
+                if backup is not None and self._health[backup].cooldown_until <= time.monotonic():
+                    tried.add(backup)
+                    self.stats["hedged"] += 1
+                    tasks.append(asyncio.create_task(self._call(backup, build_args(backup))))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                errors = [task.exception() for task in done if task.exception() is not None]
+                error = error or (errors[0] if errors else None)
+                winners = [task for task in done if task.exception() is None]
+                if winners:
+                    if winners[0] is not tasks[0]:
+                        self.stats["hedge_wins"] += 1
+                    return winners[0].result()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
 
     async def llm_model_func(
         self, prompt, system_prompt=None, history_messages=[], **kwargs
     ) -> str:
         kwargs.pop("model", None)  # stop from overwriting the custom model name
-        next_model = self._next_model()
-        args = dict(
-            prompt=prompt,
-            system_prompt=system_prompt,
-            history_messages=history_messages,
-            **kwargs,
-            **next_model.kwargs,
-        )
 
-        return await next_model.gen_func(**args)
+        def build_args(index):
+            return dict(
+                prompt=prompt,
+                system_prompt=system_prompt,
+                history_messages=history_messages,
+                **kwargs,
+                **self._models[index].kwargs,
+            )
+
+        tried = set()
+        index = self._pick_model()
+        while True:
+            tried.add(index)
+            try:
+                return await self._hedged_call(index, build_args, tried)
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                index = self._pick_model(exclude=tried)
+                if index is None:
+                    raise
+                self.stats["failovers"] += 1
+                logger.warning(f"LLM call failed ({type(e).__name__}), retrying on model #{index}")
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        models = []
+        for index, (model, health) in enumerate(zip(self._models, self._health)):
+            limits = self._rate_limits(index)
+            models.append(
+                {
+                    "index": index,
+                    "model": model.kwargs.get("model"),
+                    "base_url": model.kwargs.get("base_url"),
+                    "routed": self.stats["routed"][index],
+                    "requests": health.requests,
+                    "errors": health.errors,
+                    "rate_limited": health.rate_limited,
+                    "in_flight": health.in_flight,
+                    "latency_ewma": health.latency_ewma,
+                    "latency_p95": health.latency_percentile(0.95),
+                    "error_rate": health.error_rate,
+                    "cooldown_remaining": max(0.0, health.cooldown_until - now),
+                    "remaining_requests": limits.get("remaining_requests"),
+                    "remaining_tokens": limits.get("remaining_tokens"),
+                }
+            )
+        return {
+            "models": models,
+            "hedged": self.stats["hedged"],
+            "hedge_wins": self.stats["hedge_wins"],
+            "failovers": self.stats["failovers"],
+        }
 
 
 if __name__ == "__main__":
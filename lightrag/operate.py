@@ -3,10 +3,12 @@ import json
 import os
 from lightrag.secu import SecurityManager
 import re
+import time
+from dataclasses import asdict, dataclass
 from typing import Optional, Dict, Any
 from tqdm.asyncio import tqdm as tqdm_async
 from typing import Union
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
 import warnings
 from .utils import (
     logger,
@@ -21,6 +23,7 @@ from .utils import (
     truncate_list_by_token_size,
     process_combine_contexts,
     compute_args_hash,
+    llm_func_identity,
     handle_cache,
     save_to_cache,
     CacheData,
@@ -34,8 +37,7 @@ from .base import (
 )
 from .prompt import GRAPH_FIELD_SEP, PROMPTS
 
-# Ajouter les imports nécessaires pour RabbitMQ
-import pika
+from .rabbitmq_publisher import get_query_publisher
 from dotenv import load_dotenv
 from datetime import datetime
 import uuid
@@ -43,6 +45,28 @@ import uuid
 # Charger les variables d'environnement
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
+def _publish_query_response(user_id, response):
+    """
+    Publie la réponse d'une requête sur la queue RabbitMQ sans bloquer
+
+    Args:
+        user_id (str): Identifiant de l'utilisateur
+        response (str): Réponse générée
+    """
+    try:
+        get_query_publisher().publish_nowait(
+            {
+                "type": "query",
+                "user_id": user_id,
+                "custom_id": str(uuid.uuid4()),  # Génération d'un identifiant unique
+                "response": response,
+                "timestamp": datetime.now().isoformat(),
+            }
+        )
+    except Exception as e:
+        logger.error(f"Erreur lors de l'envoi à RabbitMQ : {e}", exc_info=True)
+
+
 def chunking_by_token_size(
     content: str, overlap_token_size=128, max_token_size=1024, tiktoken_model="gpt-4o"
 ):
@@ -68,6 +92,7 @@ async def _handle_entity_relation_summary(
     entity_or_relation_name: str,
     description: str,
     global_config: dict,
+    tokens: list[int] = None,
 ) -> str:
     use_llm_func: callable = global_config["llm_model_func"]
     llm_max_tokens = global_config["llm_model_max_token_size"]
@@ -77,7 +102,8 @@ async def _handle_entity_relation_summary(
         "language", PROMPTS["DEFAULT_LANGUAGE"]
     )
 
-    tokens = encode_string_by_tiktoken(description, model_name=tiktoken_model_name)
+    if tokens is None:
+        tokens = encode_string_by_tiktoken(description, model_name=tiktoken_model_name)
     if len(tokens) < summary_max_tokens:  # No need for summary
         return description
     prompt_template = PROMPTS["summarize_entity_descriptions"]
@@ -95,6 +121,141 @@ async def _handle_entity_relation_summary(
     return summary
 
 
+# Résumés déjà produits, par hash (modèle, langue, nom, description) : le
+# prompt de résumé cite le nom de l'entité ou de la relation
+_description_summaries: OrderedDict = OrderedDict()
+DESCRIPTION_SUMMARY_CACHE_SIZE = 10_000
+
+
+class DescriptionSummarizer:
+    """
+    Résumé groupé des descriptions d'une insertion.
+
+    Les descriptions sous entity_summary_to_max_tokens sont gardées telles
+    quelles (sans tokenisation si leur taille en octets suffit à le montrer).
+    Les autres sont dédupliquées par hash (modèle, langue, nom, description),
+    servies depuis le cache
+    si possible, puis regroupées par requêtes LLM multi-éléments (réponse
+    JSON) de max_items_per_request descriptions et max_input_tokens_per_request
+    tokens au plus. Un élément absent ou illisible dans la réponse repasse
+    seul par _handle_entity_relation_summary.
+    """
+
+    def __init__(self, global_config: dict):
+        config = global_config.get("entity_summary_batch_config") or {}
+        self.global_config = global_config
+        self.use_llm_func = global_config.get("llm_model_func")
+        self.tiktoken_model_name = global_config.get("tiktoken_model_name", "gpt-4o-mini")
+        self.llm_max_tokens = global_config.get("llm_model_max_token_size", 32768)
+        self.summary_max_tokens = global_config.get("entity_summary_to_max_tokens", 500)
+        self.language = (global_config.get("addon_params") or {}).get(
+            "language", PROMPTS["DEFAULT_LANGUAGE"]
+        )
+        self.model_identity = llm_func_identity(self.use_llm_func) if self.use_llm_func else ""
+        self.max_items_per_request = config.get("max_items_per_request", 8)
+        self.max_input_tokens_per_request = config.get("max_input_tokens_per_request", 12_000)
+        self.stats = Counter()
+
+    def _tokens(self, description: str) -> Optional[list[int]]:
+        """Tokens d'une description à résumer (None si assez courte)"""
+        # un token fait au moins un octet : inutile de tokeniser en dessous
+        if len(description.encode("utf-8")) < self.summary_max_tokens:
+            return None
+        tokens = encode_string_by_tiktoken(description, model_name=self.tiktoken_model_name)
+        return tokens if len(tokens) >= self.summary_max_tokens else None
+
+    def _pack(self, pending: list[tuple[str, str, list[int]]]) -> list[list]:
+        batches, batch, batch_tokens = [], [], 0
+        for item in pending:
+            size = min(len(item[2]), self.llm_max_tokens)
+            if batch and (
+                len(batch) >= self.max_items_per_request
+                or batch_tokens + size > self.max_input_tokens_per_request
+            ):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(item)
+            batch_tokens += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _summarize_batch(self, batch: list[tuple[str, str, list[int]]]) -> dict[str, str]:
+        """{hash: résumé} des éléments d'un lot"""
+        if len(batch) == 1:
+            key, name, tokens = batch[0]
+            self.stats["single_requests"] += 1
+            description = decode_tokens_by_tiktoken(tokens, model_name=self.tiktoken_model_name)
+            return {key: await _handle_entity_relation_summary(name, description, self.global_config, tokens)}
+
+        items = []
+        for index, (_, name, tokens) in enumerate(batch, start=1):
+            description = decode_tokens_by_tiktoken(
+                tokens[: self.llm_max_tokens], model_name=self.tiktoken_model_name
+            )
+            items.append(
+                f"Item {index}\nEntities: {name}\nDescription List: {description.split(GRAPH_FIELD_SEP)}"
+            )
+        prompt = PROMPTS["summarize_entity_descriptions_batch"].format(
+            max_words=self.summary_max_tokens * 3 // 4,
+            language=self.language,
+            items="\n\n".join(items),
+        )
+        self.stats["batch_requests"] += 1
+        response = await self.use_llm_func(prompt, max_tokens=self.summary_max_tokens * len(batch))
+
+        summaries = {}
+        try:
+            body = re.search(r"\{.*\}", response, re.DOTALL)
+            for entry in json.loads(body.group(0))["summaries"]:
+                index = int(entry["id"])
+                if 1 <= index <= len(batch) and str(entry.get("summary") or "").strip():
+                    summaries[batch[index - 1][0]] = str(entry["summary"]).strip()
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ Réponse de résumé groupé illisible ({e}), résumés un par un")
+
+        missing = [item for item in batch if item[0] not in summaries]
+        self.stats["fallbacks"] += len(missing)
+        for item, summary in zip(
+            missing, await asyncio.gather(*[self._summarize_batch([item]) for item in missing])
+        ):
+            summaries.update(summary)
+        return summaries
+
+    async def summarize_many(self, items: list[tuple[str, str]]) -> list[str]:
+        """Descriptions de (nom, description), résumées si elles dépassent le budget"""
+        results = [description for _, description in items]
+        pending, positions = {}, defaultdict(list)
+        for position, (name, description) in enumerate(items):
+            self.stats["descriptions"] += 1
+            tokens = self._tokens(description)
+            if tokens is None:
+                continue
+            self.stats["over_budget"] += 1
+            key = compute_args_hash(self.model_identity, self.language, name, description)
+            positions[key].append(position)
+            if key in _description_summaries:
+                _description_summaries.move_to_end(key)
+                self.stats["cache_hits"] += 1
+            elif key not in pending:
+                pending[key] = (key, name, tokens)
+
+        batches = self._pack(list(pending.values()))
+        for summaries in await asyncio.gather(*[self._summarize_batch(batch) for batch in batches]):
+            for key, summary in summaries.items():
+                _description_summaries[key] = summary
+                _description_summaries.move_to_end(key)
+        while len(_description_summaries) > DESCRIPTION_SUMMARY_CACHE_SIZE:
+            _description_summaries.popitem(last=False)
+
+        for key, key_positions in positions.items():
+            for position in key_positions:
+                results[position] = _description_summaries.get(key, results[position])
+        if self.stats["over_budget"]:
+            logger.info(f"📝 Résumés de descriptions : {dict(self.stats)}")
+        return results
+
+
 async def _handle_single_entity_extraction(
     record_attributes: list[str],
     chunk_key: str,
@@ -179,98 +340,84 @@ async def _handle_single_relationship_extraction(
     return result
 
 
-async def _merge_nodes_then_upsert(
+def _load_user_keys(user_id: str, sec_manager: SecurityManager) -> tuple:
+    """Charge (ou génère) la paire de clés RSA de l'utilisateur"""
+    security_keys_path = '/Users/vinh/Documents/LightRAG/security/security_keys.json'
+
+    # Charger les clés existantes, initialiser un dict vide si le fichier est vide
+    try:
+        with open(security_keys_path, 'r') as f:
+            security_keys = json.load(f) or {}
+    except json.JSONDecodeError:
+        security_keys = {}
+
+    # Générer des clés si l'utilisateur n'existe pas
+    if user_id not in security_keys:
+        sec_manager.generate_rsa_key_pair(user_id)
+        logger.debug(f"Nouvelles clés générées pour l'utilisateur {user_id}")
+        # Recharger les clés après génération
+        with open(security_keys_path, 'r') as f:
+            security_keys = json.load(f)
+            logger.debug(f"Clés utilisées pour l'utilisateur {user_id}")
+
+    # Récupérer les clés
+    user_public_key = security_keys.get(user_id, {}).get('public_key')
+    user_private_key = security_keys.get(user_id, {}).get('private_key')
+
+    if user_public_key and user_private_key:
+        logger.debug(f"Clés récupérées pour l'utilisateur {user_id}")
+        return user_public_key, user_private_key
+    logger.error(f"Impossible de récupérer les clés pour {user_id}")
+    return None, None
+
+
+async def _merge_node_data(
     entity_name: str,
     nodes_data: list[dict],
-    knowledge_graph_inst: BaseGraphStorage,
+    already_node: Union[dict, None],
     global_config: dict,
-    prompt_domain: str = "not_specified",
-    user_id: str = None
+    prompt_domain: str = "prompt_domain_not_specified",
+    user_id: str = None,
+    user_keys: tuple = (None, None),
+    sec_manager: SecurityManager = None,
 ):
-    """Fusionne et met à jour les nœuds dans le graphe de connaissances"""
-    # Initialiser le gestionnaire de sécurité
-    sec_manager = SecurityManager()
-    security_keys_path = '/Users/vinh/Documents/LightRAG/security/security_keys.json'
+    """Fusionne en mémoire les nœuds extraits avec le nœud existant (sans écriture)"""
+    user_public_key, user_private_key = user_keys
 
     # Normaliser les noms d'entités
     nodes_data = [
-        {**node, 
+        {**node,
          'entity_name': node['entity_name'].replace(" ", "_").lower(),
          # Ajouter custom_id si prompt_domain est memo et entity_type est user
-         **(({'custom_id': node['entity_name'].replace(" ", "_").lower()} 
-             if prompt_domain == 'memo' and node.get('entity_type') == 'user' 
+         **(({'custom_id': node['entity_name'].replace(" ", "_").lower()}
+             if prompt_domain == 'memo' and node.get('entity_type') == 'user'
              else {}))
-        } 
+        }
         for node in nodes_data
     ]
-    
 
     logger.debug(f"prompt_domain : {prompt_domain}")
     logger.debug(f"nodes_data : {nodes_data}")
 
     try:
-        # S'assurer d'utiliser la même boucle d'événements
-        loop = asyncio.get_event_loop()
-        if loop.is_closed():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        # Gestion des clés utilisateur si prompt_domain est 'user'
-        user_public_key = None
-        user_private_key = None
-
-        
-        if prompt_domain == 'user':
-            # Charger les clés existantes, initialiser un dict vide si le fichier est vide
-            try:
-                with open(security_keys_path, 'r') as f:
-                    security_keys = json.load(f) or {}
-            except json.JSONDecodeError:
-                security_keys = {}
-            
-            
-            # Générer des clés si l'utilisateur n'existe pas
-            if user_id not in security_keys:
-                sec_manager.generate_rsa_key_pair(user_id)
-                logger.debug(f"Nouvelles clés générées pour l'utilisateur {user_id}")
-                # Recharger les clés après génération
-                with open(security_keys_path, 'r') as f:
-                    security_keys = json.load(f)
-                    logger.debug(f"Clés utilisées pour l'utilisateur {user_id}")
-            
-            # Récupérer les clés
-            user_public_key = security_keys.get(user_id, {}).get('public_key')
-            user_private_key = security_keys.get(user_id, {}).get('private_key')
-            
-            if user_public_key and user_private_key:
-                logger.debug(f"Clés récupérées pour l'utilisateur {user_id}")
-            else:
-                logger.error(f"Impossible de récupérer les clés pour {user_id}")
-                user_public_key = None
-                user_private_key = None
-        
-        # Vérifier si le nœud existe déjà
-        already_node = await knowledge_graph_inst.get_node(entity_name)
         if already_node is not None:
             already_entitiy_types = [already_node["entity_type"]]
             already_source_ids = split_string_by_multi_markers(already_node["source_id"], [GRAPH_FIELD_SEP])
             already_description = [already_node["description"]]
-            
+
             # Récupérer les metadata existantes
-            already_metadata = {k: v for k, v in already_node.items() 
+            already_metadata = {k: v for k, v in already_node.items()
                               if k not in ["entity_type", "description", "source_id", "entity_name"]}
-            
+
             # Si c'est un utilisateur et qu'on a une clé privée, décrypter la description
             if prompt_domain == 'user' and user_private_key and 'description' in already_node:
                 try:
-                    # Ne décrypter que si une description existe
-                    if already_node and 'description' in already_node:
-                        decrypted_description = sec_manager.decrypt_data(
-                            already_node['description'], 
-                            user_private_key
-                        )
-                        already_description = [decrypted_description]
-                        logger.debug(f"Description déchiffrée pour {user_id}")
+                    decrypted_description = sec_manager.decrypt_data(
+                        already_node['description'],
+                        user_private_key
+                    )
+                    already_description = [decrypted_description]
+                    logger.debug(f"Description déchiffrée pour {user_id}")
                 except Exception as e:
                     logger.error(f"Erreur lors du déchiffrement : {e}")
         else:
@@ -282,23 +429,23 @@ async def _merge_nodes_then_upsert(
         # Fusionner les metadata de tous les nœuds
         metadata = {}
         for node in nodes_data:
-            node_metadata = {k: v for k, v in node.items() 
+            node_metadata = {k: v for k, v in node.items()
                            if k not in ["entity_type", "description", "source_id", "entity_name"]}
-            
+
             # Si c'est un utilisateur et qu'on a une clé publique, chiffrer la description
             if prompt_domain == 'user' and user_public_key and 'description' in node:
                 try:
                     encrypted_description = sec_manager.encrypt_data(
-                        node['description'], 
+                        node['description'],
                         user_public_key
                     )
                     node['description'] = encrypted_description
                     logger.debug(f"Description chiffrée pour {user_id}")
                 except Exception as e:
                     logger.error(f"Erreur lors du chiffrement : {e}")
-            
+
             metadata.update(node_metadata)
-        
+
         # Combiner avec les metadata existantes
         metadata.update(already_metadata)
 
@@ -315,101 +462,45 @@ async def _merge_nodes_then_upsert(
         source_id = GRAPH_FIELD_SEP.join(
             set([dp["source_id"] for dp in nodes_data] + already_source_ids)
         )
-        description = await _handle_entity_relation_summary(
-            entity_name, description, global_config
-        )
-        node_data = dict(
+        # Résumé fait ensuite pour toute l'insertion (DescriptionSummarizer)
+        return dict(
             entity_type=entity_type,
             description=description,
             source_id=source_id,
             **metadata  # Ajouter les metadata au nœud
         )
-
-        
-        await knowledge_graph_inst.upsert_node(
-            entity_name,
-            node_data=node_data,
-        )
-        node_data["entity_name"] = entity_name
-        return node_data
     except Exception as e:
         logger.error(f"Erreur lors de la fusion des nœuds : {e}")
         return None
 
 
-async def _merge_edges_then_upsert(
-    src_id: str,
-    tgt_id: str,
-    edges_data: list[dict],
-    knowledge_graph_inst: BaseGraphStorage,
-    global_config: dict,
-    prompt_domain: str = "not_specified",
-    user_id: str = None
-):
-    already_weights = []
-    already_source_ids = []
-    already_description = []
-    already_keywords = []
-
-
-    # Initialiser le gestionnaire de sécurité
-    sec_manager = SecurityManager()
-    security_keys_path = '/Users/vinh/Documents/LightRAG/security/security_keys.json'
-
-    if await knowledge_graph_inst.has_edge(src_id, tgt_id):
-        already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
-        already_weights = [already_edge.get("weight", 0)] if already_edge else [0]
-        already_source_ids = (
-            split_string_by_multi_markers(already_edge["source_id"], [GRAPH_FIELD_SEP]) 
-            if already_edge else []
-        )
-        already_description = [already_edge["description"]] if already_edge else []
-        already_keywords = (
-            split_string_by_multi_markers(already_edge["keywords"], [GRAPH_FIELD_SEP])
-            if already_edge else []
-        )
-
-
-    # Gestion des clés utilisateur si prompt_domain est 'user'
-    user_public_key = None
-    user_private_key = None
-
-    if prompt_domain == 'query':
-        # Initialiser query_text avec une liste vide par défaut
-        query_text = []
-        
-        # Récupérer la description si possible
-        try:
-            already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
-            if already_edge and 'description' in already_edge:
-                query_text = [already_edge["description"]]
-        except Exception as e:
-            logger.warning(f"Impossible de récupérer l'arête existante : {e}")
-        
-        query_prompt="""
+QUERY_RECOMMENDATION_PROMPT = """
             Analyse détaillée de recommandation
 
             Contexte:
-            Tu es un assistant qui doit lire un texte et en déduire si le texte recommande ou pas une activité. 
+            Tu es un assistant expert en analyse de recommandations de restaurants.
+            Tu dois évaluer précisément si un établissement est recommandable ou non.
 
             Texte à analyser:
             {text}
 
             Instructions d'analyse:
-            1. Identifie clairement si le texte recommande ou pas une activité 
+            1. Évalue rigoureusement les critères de recommandation
+            2. Analyse chaque section du texte (Offre de Menu, Ambiance et Service)
+            3. Détermine clairement si le restaurant est recommandé
+            4. Justifie ta décision de manière objective et nuancée
 
-            CRUCIAL INSTRUCTIONS:  
-            - ABSOLUTE PROHIBITION of creating, inventing, or extrapolating information not present in the original text.  
-            - Use ONLY information explicitly mentioned in the source text.  
-            - If information is not clearly indicated, do NOT attempt to guess or complete it.  
-            - Your goal is to be a precise and faithful extractor, not an information generator.  
-            - In case of doubt about any information, prefer NOT to include it rather than risk inaccuracy.   
+            Format de réponse:
+            [Recommandé / Non Recommandé]
 
 
-           ######################  
-            -Examples 1 -  
-           ######################  
-        
+            Exemple de réponse:
+            Non Recommandé
+
+           ######################
+            -Examples-
+           ######################
+
             ### Le Coquemar
             - **custom_id**: 3091293945615310311
             - **Résultat**: **Non recommandé**
@@ -417,103 +508,79 @@ async def _merge_edges_then_upsert(
             - **Offre de Menu**: Le Coquemar est principalement un restaurant français, célèbre pour sa cuisine traditionnelle et les plats faits maison. Cependant, aucune mention explicite du homard dans son menu n'a été trouvée dans les données.
             - **Ambiance et Service**: Le restaurant est apprécié pour son ambiance chaleureuse et décontractée ainsi que pour son service amical et efficace. Bien qu'il soit un bon choix pour une sortie, il ne répond pas à votre critère spécifique sur le homard.
             - **Justification de son élimination**: En l'absence d'informations concernant l'offre de homard, le Coquemar ne peut pas être recommandé pour votre recherche.
-                    
+
             réponse:
             Non Recommandé
 
-           ######################  
-            -Examples 2 -  
-           ######################  
-        
-            ### Christian Tetedoie
-            - **custom_id**: 3359024717080459809
-            - **Résultat**: **Recommandé**
-            - **Évaluation**:
-            - **Offre de Menu**: Christian Tetedoie est un restaurant gastronomique de renom à Lyon et est ici mentionné comme offrant du homard, ce qui répond exactement à votre critère.
-            - **Qualité de la Cuisine**: Réputé pour sa haute gastronomie, les plats sont souvent décrits comme "divins", et Christian Tetedoie est connu pour utiliser des ingrédients locaux, garantissant la qualité des plats proposés.
-            - **Service**: Le service est également salué, et le restaurant offre une expérience culinaire haut de gamme, y compris une sélection de vins raffinés.
-            - **Justification de sa conservation**: Christian Tetedoie est le meilleur choix pour répondre à votre demande spécifique de homard, tout en offrant un cadre gastronomique prestigieux et un cadre exquis.
-                
-            réponse:
-            Recommandé
+        """
 
 
-        """
+async def _merge_edge_data(
+    src_id: str,
+    tgt_id: str,
+    edges_data: list[dict],
+    already_edge: Union[dict, None],
+    global_config: dict,
+    prompt_domain: str = "prompt_domain_not_specified",
+    user_id: str = None,
+    user_keys: tuple = (None, None),
+    sec_manager: SecurityManager = None,
+):
+    """
+    Fusionne en mémoire les relations extraites avec la relation existante.
+
+    Retourne (edge_properties, placeholder_description) : la description
+    (pas encore résumée) sert aux nœuds UNKNOWN créés pour les extrémités absentes.
+    """
+    user_public_key, user_private_key = user_keys
+
+    response = None
+    if prompt_domain == 'query':
+        # Initialiser query_text avec la description existante si possible
+        query_text = []
+        if already_edge and 'description' in already_edge:
+            query_text = [already_edge["description"]]
 
         use_model_func = global_config["llm_model_func"]
         response = await use_model_func(
             query_text,
-            system_prompt=query_prompt.format(text=query_text),
+            system_prompt=QUERY_RECOMMENDATION_PROMPT.format(text=query_text),
             stream=False,
         )
 
-    
-    if prompt_domain == "user":
-        # Charger les clés existantes, initialiser un dict vide si le fichier est vide
-        try:
-            with open(security_keys_path, 'r') as f:
-                security_keys = json.load(f) or {}
-        except json.JSONDecodeError:
-            security_keys = {}
-        
-        # Générer des clés si l'utilisateur n'existe pas
-        if user_id not in security_keys:
-            sec_manager.generate_rsa_key_pair(user_id)
-            logger.debug(f"Nouvelles clés générées pour l'utilisateur {user_id}")
-            # Recharger les clés après génération
-            with open(security_keys_path, 'r') as f:
-                security_keys = json.load(f)
-                logger.debug(f"Clés utilisées pour l'utilisateur {user_id}")
-        
-        # Récupérer les clés
-        user_public_key = security_keys.get(user_id, {}).get('public_key')
-        user_private_key = security_keys.get(user_id, {}).get('private_key')
-        
-        if user_public_key and user_private_key:
-            logger.debug(f"Clés récupérées pour l'utilisateur {user_id}")
-        else:
-            logger.error(f"Impossible de récupérer les clés pour {user_id}")
-            user_public_key = None
-            user_private_key = None
-
-    # Traitement du chiffrement pour les relations existantes
-    already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
     already_weights = [already_edge.get("weight", 0)] if already_edge else [0]
     already_source_ids = (
-        split_string_by_multi_markers(already_edge["source_id"], [GRAPH_FIELD_SEP]) 
+        split_string_by_multi_markers(already_edge["source_id"], [GRAPH_FIELD_SEP])
         if already_edge else []
-    )    
+    )
     already_description = [already_edge["description"]] if already_edge else []
     already_keywords = (
         split_string_by_multi_markers(already_edge["keywords"], [GRAPH_FIELD_SEP])
         if already_edge else []
     )
 
-    if prompt_domain == "user" and user_private_key:
+    if user_id and user_private_key:
         try:
             # Ne décrypter que si une description existe
             if already_edge and 'description' in already_edge:
                 decrypted_description = sec_manager.decrypt_data(
-                    already_edge['description'], 
+                    already_edge['description'],
                     user_private_key
                 )
                 already_description = [decrypted_description]
                 logger.debug(f"Description de relation déchiffrée pour target {tgt_id} et source {src_id}")
         except Exception as e:
             logger.error(f"Erreur lors du déchiffrement de la relation : {e}")
-    else:
-        already_description = [already_edge["description"]] if already_edge else []
 
     weight = sum([dp["weight"] for dp in edges_data] + already_weights)
     description = GRAPH_FIELD_SEP.join(
         sorted(set([dp["description"] for dp in edges_data] + already_description))
     )
 
-
-    if prompt_domain == "user" and user_public_key:  
+    if user_id and user_public_key:
         try:
             encrypted_description = sec_manager.encrypt_data(
-                description, 
+                description,
                 user_public_key
             )
             description= encrypted_description
@@ -521,7 +588,6 @@ async def _merge_edges_then_upsert(
         except Exception as e:
             logger.error(f"Erreur lors du chiffrement de la relation : {e}")
 
-
     keywords = GRAPH_FIELD_SEP.join(
         sorted(set([dp["keywords"] for dp in edges_data] + already_keywords))
     )
@@ -529,41 +595,316 @@ async def _merge_edges_then_upsert(
     source_id = GRAPH_FIELD_SEP.join(
         set([dp["source_id"] for dp in edges_data] + already_source_ids)
     )
-    for need_insert_id in [src_id, tgt_id]:
-        if not (await knowledge_graph_inst.has_node(need_insert_id)):
-            await knowledge_graph_inst.upsert_node(
-                need_insert_id,
-                node_data={
-                    "source_id": source_id,
-                    "description": description,
-                    "entity_type": '"UNKNOWN"',
-                },
-            )
-    
+    placeholder_description = description
 
-    description = await _handle_entity_relation_summary(
-        f"({src_id}, {tgt_id})", description, global_config
+    # Résumé fait ensuite pour toute l'insertion (DescriptionSummarizer)
+    edge_data = dict(
+        weight=weight,
+        description=description,
+        keywords=keywords,
+        source_id=source_id,
+        query_result=response if prompt_domain == 'query' else None,
     )
-    await knowledge_graph_inst.upsert_edge(
-        src_id,
-        tgt_id,
-        edge_data=dict(
-            weight=weight,
-            description=description,
-            keywords=keywords,
-            source_id=source_id,
-            query_result=response if prompt_domain == 'query' else None,
+    return edge_data, placeholder_description
+
+
+# Domaines dont les données appartiennent à un utilisateur (mode user_tenancy)
+USER_SCOPED_DOMAINS = ("user", "memo", "query")
+
+
+def _tenant_owner(global_config: dict, prompt_domain: str, user_id: str) -> str:
+    """user_id propriétaire des données insérées ("" = catalogue partagé)"""
+    if global_config.get("user_tenancy") and prompt_domain in USER_SCOPED_DOMAINS:
+        return user_id or ""
+    return ""
+
+
+# Séparateur entre user_id et nom d'entité dans le nom d'un nœud utilisateur
+USER_SCOPE_SEP = "::"
+
+
+def _user_scoped_name(entity_name: str, owner: str) -> str:
+    """Nom du nœud propre à owner : (user_id, nom), dans les guillemets éventuels"""
+    quoted = len(entity_name) >= 2 and entity_name[0] == entity_name[-1] == '"'
+    bare = entity_name[1:-1] if quoted else entity_name
+    scoped = f"{owner}{USER_SCOPE_SEP}{bare}"
+    return f'"{scoped}"' if quoted else scoped
+
+
+def _visible_to_user(data: dict, user_id: Optional[str]) -> bool:
+    """Nœud ou relation du catalogue partagé, ou de l'utilisateur de la requête"""
+    owner = data.get("user_id") or ""
+    return not owner or owner == (user_id or "").lower()
+
+
+async def _scope_user_entities(
+    maybe_nodes: dict[str, list[dict]],
+    maybe_edges: dict[tuple[str, str], list[dict]],
+    knowledge_graph_inst: BaseGraphStorage,
+    owner: str,
+) -> tuple[dict, dict]:
+    """
+    Identité par utilisateur des entités d'un domaine utilisateur (user_tenancy).
+
+    Une entité déjà présente dans le catalogue partagé (nœud sans user_id) garde
+    son nom : les relations de l'utilisateur s'y rattachent sans modifier le
+    nœud partagé, ni sa description ni son vecteur. Les autres sont nommées
+    (user_id, nom) et n'appartiennent qu'à owner. Une relation entre deux
+    nœuds partagés est ignorée.
+    """
+    names = set(maybe_nodes) | {name for pair in maybe_edges for name in pair}
+    existing = await knowledge_graph_inst.get_nodes_batch(sorted(names))
+    shared = {
+        name for name, node in existing.items()
+        if node is not None and not node.get("user_id")
+    }
+    scoped = {
+        name: name if name in shared else _user_scoped_name(name, owner) for name in names
+    }
+    nodes = {
+        scoped[name]: nodes_data
+        for name, nodes_data in maybe_nodes.items()
+        if name not in shared
+    }
+    edges = defaultdict(list)
+    for (src_id, tgt_id), edges_data in maybe_edges.items():
+        if src_id in shared and tgt_id in shared:
+            logger.debug(f"Relation ({src_id}, {tgt_id}) du catalogue partagé ignorée")
+            continue
+        edges[tuple(sorted((scoped[src_id], scoped[tgt_id])))].extend(
+            {**edge, "src_id": scoped[edge["src_id"]], "tgt_id": scoped[edge["tgt_id"]]}
+            for edge in edges_data
+        )
+    return nodes, dict(edges)
+
+
+def _node_custom_id(entity_name: str, *sources: dict) -> str:
+    """custom_id du nœud dans la première source qui le connaît ("" sinon)"""
+    for source in sources:
+        node = source.get(entity_name)
+        if node is not None:
+            return node.get("custom_id", "")
+    return ""
+
+
+async def _merge_then_upsert_graph(
+    maybe_nodes: dict[str, list[dict]],
+    maybe_edges: dict[tuple[str, str], list[dict]],
+    knowledge_graph_inst: BaseGraphStorage,
+    global_config: dict,
+    prompt_domain: str = "prompt_domain_not_specified",
+    user_id: str = None,
+) -> tuple[list[dict], list[dict]]:
+    """
+    Étape de fusion groupée des nœuds et relations d'une insertion.
+
+    1. préchargement des nœuds et relations existants (lectures groupées)
+    2. fusion en mémoire, puis résumé groupé des descriptions trop longues
+    3. écriture groupée, entity_id et relation_id inclus dans la même passe
+    """
+    sec_manager = SecurityManager()
+    user_keys = (None, None)
+    if prompt_domain == 'user':
+        user_keys = _load_user_keys(user_id, sec_manager)
+
+    # Données d'un domaine utilisateur : nœuds propres à leur propriétaire
+    owner = _tenant_owner(global_config, prompt_domain, user_id)
+    if owner:
+        maybe_nodes, maybe_edges = await _scope_user_entities(
+            maybe_nodes, maybe_edges, knowledge_graph_inst, owner
+        )
+
+    # 1. Préchargement
+    edge_pairs = list(maybe_edges.keys())
+    endpoint_names = {name for pair in edge_pairs for name in pair}
+    already_nodes, already_edges = await asyncio.gather(
+        knowledge_graph_inst.get_nodes_batch(
+            list(maybe_nodes.keys()) + sorted(endpoint_names - set(maybe_nodes))
         ),
+        knowledge_graph_inst.get_edges_batch(edge_pairs),
     )
 
-    edge_data = dict(
-        src_id=src_id,
-        tgt_id=tgt_id,
-        description=description,
-        keywords=keywords,
+    # 2. Fusion en mémoire
+    merge_kwargs = dict(
+        prompt_domain=prompt_domain,
+        user_id=user_id,
+        user_keys=user_keys,
+        sec_manager=sec_manager,
+    )
+    merged_nodes = await tqdm_async.gather(
+        *[
+            _merge_node_data(k, v, already_nodes.get(k), global_config, **merge_kwargs)
+            for k, v in maybe_nodes.items()
+        ],
+        desc="Merging entities",
+        unit="entity",
     )
+    merged_edges = await tqdm_async.gather(
+        *[
+            _merge_edge_data(k[0], k[1], v, already_edges.get(k), global_config, **merge_kwargs)
+            for k, v in maybe_edges.items()
+        ],
+        desc="Merging relationships",
+        unit="relationship",
+    )
+
+    # Résumés des descriptions trop longues, groupés pour toute l'insertion
+    summarized_nodes = [node for node in merged_nodes if node is not None]
+    summarized_edges = [edge_data for edge_data, _ in merged_edges]
+    summaries = await DescriptionSummarizer(global_config).summarize_many(
+        [(name, node["description"]) for name, node in zip(maybe_nodes.keys(), merged_nodes) if node is not None]
+        + [(f"({src_id}, {tgt_id})", edge_data["description"]) for (src_id, tgt_id), edge_data in zip(edge_pairs, summarized_edges)]
+    )
+    for data, summary in zip(summarized_nodes + summarized_edges, summaries):
+        data["description"] = summary
+
+    # Nœuds et relations d'un domaine utilisateur marqués de leur propriétaire
+    nodes_to_upsert = {}
+    all_entities_data = []
+    for entity_name, node_data in zip(maybe_nodes.keys(), merged_nodes):
+        if node_data is None:
+            continue
+        if owner:
+            node_data["user_id"] = owner
+        node_data["entity_id"] = compute_mdhash_id(entity_name, prefix="ent-")
+        nodes_to_upsert[entity_name] = node_data
+        all_entities_data.append({**node_data, "entity_name": entity_name})
+
+    edges_to_upsert = {}
+    all_relationships_data = []
+    for (src_id, tgt_id), (edge_data, placeholder_description) in zip(edge_pairs, merged_edges):
+        # Nœuds UNKNOWN pour les extrémités absentes du graphe
+        for need_insert_id in [src_id, tgt_id]:
+            if need_insert_id in nodes_to_upsert or already_nodes.get(need_insert_id) is not None:
+                continue
+            nodes_to_upsert[need_insert_id] = {
+                "source_id": edge_data["source_id"],
+                "description": placeholder_description,
+                "entity_type": '"UNKNOWN"',
+                **({"user_id": owner} if owner else {}),
+            }
+        if owner:
+            edge_data["user_id"] = owner
+        edge_data["relation_id"] = compute_mdhash_id(src_id + tgt_id, prefix="rel-")
+        edges_to_upsert[(src_id, tgt_id)] = edge_data
+        all_relationships_data.append(
+            dict(
+                src_id=src_id,
+                tgt_id=tgt_id,
+                relation_id=edge_data["relation_id"],
+                user_id=owner,
+                description=edge_data["description"],
+                keywords=edge_data["keywords"],
+                # custom_id des extrémités : filtre scalaire des relations
+                src_custom_id=_node_custom_id(src_id, nodes_to_upsert, already_nodes),
+                tgt_custom_id=_node_custom_id(tgt_id, nodes_to_upsert, already_nodes),
+            )
+        )
+
+    # 3. Écriture groupée (les nœuds d'abord : le type de relation en dépend)
+    await knowledge_graph_inst.upsert_nodes_batch(nodes_to_upsert)
+    await knowledge_graph_inst.upsert_edges_batch(edges_to_upsert)
+    logger.info(
+        f"🧩 Fusion groupée : {len(nodes_to_upsert)} nœuds, {len(edges_to_upsert)} relations écrits"
+    )
+    return all_entities_data, all_relationships_data
+
 
-    return edge_data
+@dataclass
+class GleaningStrategy:
+    """
+    Stratégie de gleaning d'un chunk : passes supplémentaires seulement si la
+    première extraction est peu dense, historique envoyé borné en tokens.
+    """
+    max_gleaning: int = 1
+    # enregistrements par 100 tokens de chunk au-delà desquels on ne glane pas (0 = toujours)
+    skip_density: float = 1.0
+    # tokens d'historique envoyés à chaque passe (0 = illimité)
+    history_max_tokens: int = 6000
+    tiktoken_model_name: str = "gpt-4o-mini"
+
+    @classmethod
+    def from_config(cls, global_config: dict) -> "GleaningStrategy":
+        config = global_config.get("entity_extract_gleaning_config") or {}
+        return cls(
+            max_gleaning=global_config["entity_extract_max_gleaning"],
+            skip_density=config.get("skip_density", 1.0),
+            history_max_tokens=config.get("history_max_tokens", 6000),
+            tiktoken_model_name=global_config.get("tiktoken_model_name", "gpt-4o-mini"),
+        )
+
+    def count_tokens(self, text: str) -> int:
+        return len(encode_string_by_tiktoken(text, model_name=self.tiktoken_model_name))
+
+    def should_glean(self, record_count: int, content_tokens: int) -> bool:
+        if self.max_gleaning <= 0:
+            return False
+        if self.skip_density <= 0:
+            return True
+        return record_count * 100 / max(content_tokens, 1) < self.skip_density
+
+    def needs_if_loop(self, glean_index: int) -> bool:
+        """Pas de question « encore des entités ? » après la dernière passe"""
+        return glean_index < self.max_gleaning - 1
+
+    def trim_history(self, history: list[dict], compact_prompt: callable) -> tuple[list[dict], bool]:
+        """
+        Historique ramené sous history_max_tokens : prompt initial sans les
+        exemples, puis retrait des plus anciens tours de gleaning (la première
+        extraction est toujours conservée).
+        """
+        if self.history_max_tokens <= 0:
+            return history, False
+        sizes = [self.count_tokens(message["content"]) for message in history]
+        if sum(sizes) <= self.history_max_tokens:
+            return history, False
+        history = [{**history[0], "content": compact_prompt()}] + history[1:]
+        sizes[0] = self.count_tokens(history[0]["content"])
+        while sum(sizes) > self.history_max_tokens and len(history) > 2:
+            del history[2:4]
+            del sizes[2:4]
+        return history, True
+
+
+GLEANING_COUNTERS = (
+    "chunks",
+    "extraction_calls",
+    "glean_calls",
+    "if_loop_calls",
+    "skipped_dense",
+    "stopped_by_if_loop",
+    "history_trimmed",
+    "records_first_pass",
+    "records_gleaned",
+)
+
+# Compteurs coût / qualité du gleaning par domaine de prompt
+_gleaning_stats: dict[str, Counter] = defaultdict(Counter)
+
+
+def get_gleaning_stats(prompt_domain: str = None) -> dict:
+    """
+    Compteurs du gleaning d'un domaine (tous les domaines si None) ;
+    records_per_glean_call mesure ce que rapporte chaque appel de gleaning.
+    """
+    domains = [prompt_domain] if prompt_domain is not None else list(_gleaning_stats)
+    stats = {}
+    for domain in domains:
+        counters = _gleaning_stats[domain]
+        domain_stats = {name: counters[name] for name in GLEANING_COUNTERS}
+        domain_stats["llm_calls_per_chunk"] = (
+            counters["extraction_calls"] + counters["glean_calls"] + counters["if_loop_calls"]
+        ) / max(counters["chunks"], 1)
+        domain_stats["records_per_glean_call"] = counters["records_gleaned"] / max(counters["glean_calls"], 1)
+        stats[domain] = domain_stats
+    return stats[prompt_domain] if prompt_domain is not None else stats
+
+
+def _count_extraction_records(result: str, context_base: dict) -> int:
+    records = split_string_by_multi_markers(
+        result, [context_base["record_delimiter"], context_base["completion_delimiter"]]
+    )
+    return sum(1 for record in records if re.search(r"\((.*)\)", record))
 
 
 async def extract_entities(
@@ -574,7 +915,9 @@ async def extract_entities(
     global_config: dict,
     text_chunks: BaseKVStorage[TextChunkSchema],
     prompt_domain: str = "default",
-    metadata: dict = None
+    metadata: dict = None,
+    doc_metadata: dict[str, dict] = None,
+    pipeline_stats: Optional[dict] = None,
 ) -> Union[BaseGraphStorage, None]:
     """
     Extract entities from text chunks and process them.
@@ -587,6 +930,10 @@ async def extract_entities(
         global_config: Global configuration dictionary
         prompt_domain: Prompt domain for extraction
         metadata: Additional metadata
+        doc_metadata: Per-document metadata keyed by full_doc_id, overrides
+            metadata for the chunks of that document (batched inserts)
+        pipeline_stats: Filled with per-stage counters when the streaming
+            pipeline (ingestion_pipeline_config) is enabled
     
     Returns:
         BaseGraphStorage: Updated knowledge graph instance
@@ -646,6 +993,8 @@ async def extract_entities(
 
     continue_prompt = PROMPTS["entiti_continue_extraction"].format(**context_base)
     if_loop_prompt = PROMPTS["entiti_if_loop_extraction"].format(**context_base)
+    gleaning = GleaningStrategy.from_config(global_config)
+    gleaning_stats = _gleaning_stats[prompt_domain]
 
     already_processed = 0
     already_entities = 0
@@ -660,6 +1009,11 @@ async def extract_entities(
         logger.debug(f"DEBUG: Chunk content: {chunk_dp.get('content', 'NO CONTENT')}")
 
         content = chunk_dp["content"]
+        chunk_metadata = (
+            doc_metadata.get(chunk_dp.get("full_doc_id"), metadata)
+            if doc_metadata
+            else metadata
+        )
         
         logger.debug(f"Processing content for chunk_key: {chunk_key}")
         logger.debug(f"Content to process: {content[:500]}...")  # Log first 500 chars of content
@@ -682,24 +1036,48 @@ async def extract_entities(
         
         final_result = await use_llm_func(hint_prompt)
         logger.debug(f"Initial LLM Response (first 1000 chars): {final_result[:1000]}...")
-        
+        gleaning_stats["chunks"] += 1
+        gleaning_stats["extraction_calls"] += 1
+
+        # Gleaning seulement si la première passe est peu dense
+        first_records = _count_extraction_records(final_result, context_base)
+        gleaning_stats["records_first_pass"] += first_records
+        content_tokens = chunk_dp.get("tokens") or gleaning.count_tokens(content)
+        glean_rounds = entity_extract_max_gleaning
+        if not gleaning.should_glean(first_records, content_tokens):
+            if entity_extract_max_gleaning > 0:
+                gleaning_stats["skipped_dense"] += 1
+            glean_rounds = 0
+
+        def compact_prompt():
+            # prompt initial sans les exemples, pour borner l'historique
+            return entity_extract_prompt.format(
+                **{**context_base, "examples": ""}, input_text="{input_text}"
+            ).format(**context_base, input_text=content)
+
         history = pack_user_ass_to_openai_messages(hint_prompt, final_result)
-        for now_glean_index in range(entity_extract_max_gleaning):
+        for now_glean_index in range(glean_rounds):
+            history, trimmed = gleaning.trim_history(history, compact_prompt)
+            gleaning_stats["history_trimmed"] += int(trimmed)
             glean_result = await use_llm_func(continue_prompt, history_messages=history)
             logger.debug(f"Gleaning iteration {now_glean_index + 1} result (first 500 chars): {glean_result[:500]}...")
+            gleaning_stats["glean_calls"] += 1
+            gleaning_stats["records_gleaned"] += _count_extraction_records(glean_result, context_base)
 
             history += pack_user_ass_to_openai_messages(continue_prompt, glean_result)
             final_result += glean_result
             
-            if now_glean_index == entity_extract_max_gleaning - 1:
+            if not gleaning.needs_if_loop(now_glean_index):
                 break
 
             if_loop_result: str = await use_llm_func(
                 if_loop_prompt, history_messages=history
             )
+            gleaning_stats["if_loop_calls"] += 1
             if_loop_result = if_loop_result.strip().strip('"').strip("'").lower()
             logger.debug(f"Should continue gleaning? Answer: {if_loop_result}")
             if if_loop_result != "yes":
+                gleaning_stats["stopped_by_if_loop"] += 1
                 break
 
         logger.debug(f"Final Complete Result (first 1000 chars): {final_result[:1000]}...")
@@ -749,39 +1127,39 @@ async def extract_entities(
                 
                 # Récupérer les metadata spécifiques au type d'entité
                 entity_metadata = {}
-                if metadata:
+                if chunk_metadata:
                     if prompt_domain == "activity":
                         # Vérifier la présence de cid
-                        if "cid" not in metadata:
+                        if "cid" not in chunk_metadata:
                             logger.warning("No 'cid' found in activity metadata")
                         else:
-                            entity_metadata["custom_id"] = metadata["cid"]
+                            entity_metadata["custom_id"] = chunk_metadata["cid"]
                         
                         # Ajouter les coordonnées géographiques si disponibles
-                        if "lat" in metadata:
-                            entity_metadata["lat"] = metadata["lat"]
+                        if "lat" in chunk_metadata:
+                            entity_metadata["lat"] = chunk_metadata["lat"]
                         
                         else:
                             logger.warning("No 'lat' found in activity metadata")
                         
-                        if "lng" in metadata:
-                            entity_metadata["lng"] = metadata["lng"]
+                        if "lng" in chunk_metadata:
+                            entity_metadata["lng"] = chunk_metadata["lng"]
                         else:
                             logger.warning("No 'lng' found in activity metadata")
 
-                        if "city" in metadata:
-                            entity_metadata["city"] = metadata["city"]
+                        if "city" in chunk_metadata:
+                            entity_metadata["city"] = chunk_metadata["city"]
                         else:
                             logger.warning("No 'city' found in activity metadata")
 
-                    elif prompt_domain == "user" and "user_id" in metadata:
-                        entity_metadata["custom_id"] = metadata["user_id"]
-                    elif prompt_domain == "event" and "event_id" in metadata:
-                        entity_metadata["custom_id"] = metadata["event_id"]
-                    elif prompt_domain == "memo" and "custom_id" in metadata:
-                        entity_metadata["custom_id"] = metadata["custom_id"]
-                    elif prompt_domain == "query" and "custom_id" in metadata:
-                        entity_metadata["custom_id"] = metadata["custom_id"]
+                    elif prompt_domain == "user" and "user_id" in chunk_metadata:
+                        entity_metadata["custom_id"] = chunk_metadata["user_id"]
+                    elif prompt_domain == "event" and "event_id" in chunk_metadata:
+                        entity_metadata["custom_id"] = chunk_metadata["event_id"]
+                    elif prompt_domain == "memo" and "custom_id" in chunk_metadata:
+                        entity_metadata["custom_id"] = chunk_metadata["custom_id"]
+                    elif prompt_domain == "query" and "custom_id" in chunk_metadata:
+                        entity_metadata["custom_id"] = chunk_metadata["custom_id"]
                 
                 # Ajouter les metadata à l'entité si disponibles
                 if entity_metadata and if_entities["entity_type"] == prompt_domain:
@@ -858,6 +1236,33 @@ async def extract_entities(
 
 
 
+    user_id = metadata.get('user_id', '').lower() if metadata else None
+
+    pipeline_config = global_config.get("ingestion_pipeline_config") or {}
+    if pipeline_config.get("enabled", False):
+        extracted_entities, extracted_relationships = await _run_ingestion_pipeline(
+            ordered_chunks,
+            _process_single_content,
+            knowledge_graph_inst,
+            entity_vdb,
+            relationships_vdb,
+            text_chunks,
+            global_config,
+            prompt_domain,
+            user_id,
+            pipeline_stats,
+        )
+        if not extracted_entities and not extracted_relationships:
+            logger.warning(
+                "Didn't extract any entities and relationships, maybe your LLM is not working"
+            )
+            return None
+        if not extracted_entities:
+            logger.warning("Didn't extract any entities")
+        if not extracted_relationships:
+            logger.warning("Didn't extract any relationships")
+        return knowledge_graph_inst
+
     results = []
     for result in tqdm_async(
         asyncio.as_completed([_process_single_content(c) for c in ordered_chunks]),
@@ -867,100 +1272,28 @@ async def extract_entities(
     ):
         results.append(await result)
 
-
-
-    maybe_nodes = defaultdict(list)
-    maybe_edges = defaultdict(list)
-    for m_nodes, m_edges in results:
-        for k, v in m_nodes.items():
-            maybe_nodes[k].extend(v)
-        for k, v in m_edges.items():
-            maybe_edges[tuple(sorted(k))].extend(v)
+    maybe_nodes, maybe_edges = _combine_extraction_results(results)
 
     logger.debug("Inserting entities into storage...")
     logger.debug(f"Total maybe_nodes before processing: {len(maybe_nodes)}")
-    logger.debug(f"maybe_nodes keys: {list(maybe_nodes.keys())}")
+    logger.debug(f"Nombre total de relations potentielles : {len(maybe_edges)}")
 
-    all_entities_data = []
-    for result in tqdm_async(
-        asyncio.as_completed(
-            [
-                _merge_nodes_then_upsert(
-                    k, 
-                    v, 
-                    knowledge_graph_inst, 
-                    global_config, 
-                    prompt_domain,
-                    user_id=metadata.get('user_id', '').lower() if metadata else None
-                ) for k, v in maybe_nodes.items()
-            ]
-        ),
-        total=len(maybe_nodes),
-        desc="Inserting entities",
-        unit="entity",
-    ):
-        entity_result = await result
-        logger.debug(f"Entity merge result: {entity_result}")
-        all_entities_data.append(entity_result)
+    all_entities_data, all_relationships_data = await _merge_then_upsert_graph(
+        maybe_nodes,
+        maybe_edges,
+        knowledge_graph_inst,
+        global_config,
+        prompt_domain,
+        user_id=user_id,
+    )
 
     logger.debug(f"Total entities processed: {len(all_entities_data)}")
-    #logger.info(f"All entities data: {all_entities_data}")
-    
-    # Structurer le log avec des couleurs pour plus de lisibilité
-    from colorama import Fore, Style
-    
-    for entity_data in all_entities_data:
-        if entity_data:
-            entity_type = entity_data.get('entity_type', 'Unknown')
-            entity_name = entity_data.get('entity_name', 'N/A')
-            
-            # Choisir une couleur en fonction du type d'entité
-            color = Fore.WHITE
-            if entity_type == 'activity':
-                color = Fore.GREEN
-            elif entity_type == 'user':
-                color = Fore.BLUE
-            elif entity_type == 'event':
-                color = Fore.YELLOW
-            elif entity_type == 'user_preference':
-                color = Fore.MAGENTA
-            
-            logger.debug(
-                f"{color}📦 Entité traitée: "
-                f"{Style.BRIGHT}{entity_type}{Style.RESET_ALL} "
-                f"{color}→ {Style.BRIGHT}{entity_name}{Style.RESET_ALL}"
-            )
-
-    logger.debug("Inserting relationships into storage...")
-    logger.debug(f"Nombre total de relations potentielles : {len(maybe_edges)}")
-    for (src, tgt), relations in maybe_edges.items():
-        logger.debug(f"Relation potentielle - Source: {src}, Cible: {tgt}")
-        logger.debug(f"Détails des relations : {relations}")
-    
-    all_relationships_data = []
-    for result in tqdm_async(
-        asyncio.as_completed(
-            [
-                _merge_edges_then_upsert(
-                    k[0], k[1], v, knowledge_graph_inst, global_config, prompt_domain,
-                    user_id=metadata.get('user_id', '').lower() if metadata else None
-                ) for k, v in maybe_edges.items()
-            ]
-        ),
-        total=len(maybe_edges),
-        desc="Inserting relationships",
-        unit="relationship",
-    ):
-        # Log détaillé sur les relations avant insertion
-        logger.debug(f"Relations à insérer - Source: {k[0]}, Cible: {k[1]}")
-        logger.debug(f"Détails des relations : {v}")
-        
-        all_relationships_data.append(await result)
 
     if not len(all_entities_data) and not len(all_relationships_data):
         logger.warning(
             "Didn't extract any entities and relationships, maybe your LLM is not working"
         )
+        await _mark_chunks_merged(text_chunks, ordered_chunks)
         return None
 
     if not len(all_entities_data):
@@ -968,68 +1301,109 @@ async def extract_entities(
     if not len(all_relationships_data):
         logger.warning("Didn't extract any relationships")
 
-    if entity_vdb is not None:
-        data_for_vdb = {
-            compute_mdhash_id(dp["entity_name"], prefix="ent-"): {
-                "content": dp["description"],
+    await _upsert_extraction_vectors(
+        all_entities_data,
+        all_relationships_data,
+        entity_vdb,
+        relationships_vdb,
+        text_chunks,
+    )
+    await _mark_chunks_merged(text_chunks, ordered_chunks)
+    return knowledge_graph_inst
+
+
+async def _mark_chunks_merged(
+    text_chunks: BaseKVStorage, chunks: list[tuple[str, TextChunkSchema]]
+):
+    """
+    Enregistre dans text_chunks les chunks dont la fusion dans le graphe et
+    l'upsert des vecteurs d'entités et de relations ont abouti.
+
+    La fusion n'est pas idempotente (poids additionnés, descriptions concaténées) :
+    ainsert ignore les chunks déjà présents, un document rejoué après un échec
+    ne refusionne donc que les chunks dont les écritures n'ont pas eu lieu. Un
+    chunk n'est marqué qu'une fois ses vecteurs écrits : un échec de l'upsert
+    vectoriel rejoue le chunk au lieu de perdre ses vecteurs.
+    """
+    if text_chunks is not None and chunks:
+        await text_chunks.upsert(dict(chunks))
+
+
+def _combine_extraction_results(results: list[tuple[dict, dict]]) -> tuple[dict, dict]:
+    """Regroupe les nœuds et relations extraits de plusieurs chunks"""
+    maybe_nodes = defaultdict(list)
+    maybe_edges = defaultdict(list)
+    for m_nodes, m_edges in results:
+        for k, v in m_nodes.items():
+            maybe_nodes[k].extend(v)
+        for k, v in m_edges.items():
+            maybe_edges[tuple(sorted(k))].extend(v)
+    return maybe_nodes, maybe_edges
+
+
+async def _upsert_extraction_vectors(
+    all_entities_data: list[dict],
+    all_relationships_data: list[dict],
+    entity_vdb: BaseVectorStorage,
+    relationships_vdb: BaseVectorStorage,
+    text_chunks: BaseKVStorage,
+):
+    """
+    Écriture des entités et relations fusionnées dans les bases vectorielles
+    et des descriptions d'entités dans text_chunks. Les vecteurs reprennent
+    l'identifiant et le propriétaire (user_id) de leur nœud ou relation.
+    """
+    # Structurer le log avec des couleurs pour plus de lisibilité
+    from colorama import Fore, Style
+
+    for entity_data in all_entities_data:
+        entity_type = entity_data.get('entity_type', 'Unknown')
+        entity_name = entity_data.get('entity_name', 'N/A')
+
+        # Choisir une couleur en fonction du type d'entité
+        color = Fore.WHITE
+        if entity_type == 'activity':
+            color = Fore.GREEN
+        elif entity_type == 'user':
+            color = Fore.BLUE
+        elif entity_type == 'event':
+            color = Fore.YELLOW
+        elif entity_type == 'user_preference':
+            color = Fore.MAGENTA
+
+        logger.debug(
+            f"{color}📦 Entité traitée: "
+            f"{Style.BRIGHT}{entity_type}{Style.RESET_ALL} "
+            f"{color}→ {Style.BRIGHT}{entity_name}{Style.RESET_ALL}"
+        )
+
+    entities_with_description = []
+    if entity_vdb is not None:
+        # entity_id et entity_type sont déjà écrits dans le graphe par la fusion groupée
+        data_for_vdb = {
+            dp["entity_id"]: {
+                "content": dp["description"],
                 "entity_name": dp["entity_name"],
-                "entity_type": dp.get("entity_type", "Unknown")
+                "entity_type": dp.get("entity_type", "Unknown"),
+                # Champs scalaires filtrables côté base vectorielle
+                "custom_id": dp.get("custom_id", ""),
+                "city": dp.get("city", ""),
+                "user_id": dp.get("user_id", ""),
             }
             for dp in all_entities_data
         }
-        
-        # Log détaillé avant l'insertion dans Milvus
-        logger.debug(" Préparation de l'insertion dans Milvus (Entités)")
-        logger.debug(f" Nombre d'entités à insérer : {len(data_for_vdb)}")
-
-        # Créer une nouvelle liste pour stocker les entités
-        entities_with_description = []
-
-        for entity_id, entity_data in data_for_vdb.items():
-            logger.debug(f" ID Entité : {entity_id}")
-            logger.debug(f" Données Entité : {entity_data}")
-            
-            # Récupérer le nœud existant
-            existing_node = await knowledge_graph_inst.get_node(entity_data["entity_name"])
-            
-            # Préparer les données du nœud
-            if existing_node is None:
-                node_data = {
-                    "entity_id": entity_id,
-                    "entity_type": entity_data.get("entity_type", "Unknown")
-                }
-            else:
-                # Copier toutes les données existantes et ajouter entity_id et entity_type
-                node_data = dict(existing_node)
-                node_data["entity_id"] = entity_id
-                node_data["entity_type"] = existing_node.get("entity_type", entity_data.get("entity_type", "Unknown"))
-                node_data["description"] = existing_node.get("description", entity_data.get("description", "Unknown"))
-            
-            # Log pour vérification
-            logger.debug(f"Données du nœud apres mise à jour : {node_data}")
-            
-            # Mettre à jour le nœud Neo4j
-            await knowledge_graph_inst.upsert_node(
-                entity_data["entity_name"], 
-                node_data=node_data
-            )
-            
-            # Mettre à jour les données pour Milvus avec entity_type
-            entity_data_for_vdb = entity_data.copy()
-            entity_data_for_vdb["entity_type"] = node_data["entity_type"]
-            data_for_vdb[entity_id] = entity_data_for_vdb
-
-            # Ajouter à la liste des entités avec descriptions
-            entity_info = {
-                "entity_id": entity_id,
-                "content": node_data.get("description", "Pas de description"),
-                "entity_name": entity_data["entity_name"],
-                "entity_type": node_data["entity_type"]
+        entities_with_description = [
+            {
+                "entity_id": dp["entity_id"],
+                "content": dp.get("description", "Pas de description"),
+                "entity_name": dp["entity_name"],
+                "entity_type": dp.get("entity_type", "Unknown"),
             }
-            entities_with_description.append(entity_info)
+            for dp in all_entities_data
+        ]
 
-        # Logger la liste complète
-        logger.debug(f"Entités avec descriptions : {entities_with_description}")
+        logger.debug(" Préparation de l'insertion dans Milvus (Entités)")
+        logger.debug(f" Nombre d'entités à insérer : {len(data_for_vdb)}")
 
         await entity_vdb.upsert(data_for_vdb)
 
@@ -1050,62 +1424,155 @@ async def extract_entities(
         logger.debug(" Préparation de l'insertion des entités dans MongoDB")
         logger.debug(f" Nombre d'entités à insérer : {len(entity_chunks_for_mongodb)}")
 
-        # Afficher les détails de chaque entité
-        # for entity_id, entity_data in entity_chunks_for_mongodb.items():
-        #     logger.info(f"🔍 Détails de l'entité : {entity_id}")
-        #     logger.info(f"   📋 Nom : {entity_data.get('entity_name', 'N/A')}")
-        #     logger.info(f"   🏷️  Type : {entity_data.get('entity_type', 'N/A')}")
-        #     logger.info(f"   📝 Contenu : {entity_data.get('content', 'N/A')[:100]}{'...' if len(entity_data.get('content', '')) > 100 else ''}")
-        #     logger.info(f"   📦 Source : {entity_data.get('source', 'N/A')}")
-        #     logger.info("   " + "-"*50)  # Séparateur visuel
-        
         await text_chunks.upsert(entity_chunks_for_mongodb)
 
     if relationships_vdb is not None:
+        # relation_id est déjà écrit dans le graphe par la fusion groupée
         data_for_vdb = {
-            compute_mdhash_id(dp["src_id"] + dp["tgt_id"], prefix="rel-"): {
+            dp["relation_id"]: {
                 "src_id": dp["src_id"],
                 "tgt_id": dp["tgt_id"],
                 "content": dp["keywords"]
                 + dp["src_id"]
                 + dp["tgt_id"]
                 + dp["description"],
+                "src_custom_id": dp["src_custom_id"],
+                "tgt_custom_id": dp["tgt_custom_id"],
+                "user_id": dp.get("user_id", ""),
             }
             for dp in all_relationships_data
         }
-        
-        # Mise à jour de Neo4j avec relation_id
-        for relation_id, relation_data in data_for_vdb.items():
-            logger.debug(f" ID Relation : {relation_id}")
-            logger.debug(f" Données Relation : {relation_data}")
-            
-            # Récupérer l'arête existante
-            existing_edge = await knowledge_graph_inst.get_edge(
-                relation_data["src_id"], 
-                relation_data["tgt_id"]
-            )
-            
-            # Préparer les données de la relation
-            if existing_edge is None:
-                edge_data = {"relation_id": relation_id}
-            else:
-                # Copier toutes les données existantes et ajouter relation_id
-                edge_data = dict(existing_edge)
-                edge_data["relation_id"] = relation_id
-            
-            # Log pour vérification
-            logger.debug(f"Données de la relation avant mise à jour : {edge_data}")
-            
-            # Mettre à jour la relation Neo4j
-            await knowledge_graph_inst.upsert_edge(
-                relation_data["src_id"], 
-                relation_data["tgt_id"], 
-                edge_data=edge_data
-            )
-        
         await relationships_vdb.upsert(data_for_vdb)
-    
-    return knowledge_graph_inst
+
+
+@dataclass
+class StageStats:
+    """
+    Compteurs d'une étape du pipeline d'ingestion en flux
+    """
+    items: int = 0
+    batches: int = 0
+    busy_time: float = 0.0
+    wait_time: float = 0.0
+    max_queue_depth: int = 0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        stats["items_per_second"] = self.items / self.busy_time if self.busy_time else 0.0
+        return stats
+
+
+async def _run_ingestion_pipeline(
+    ordered_chunks: list[tuple[str, TextChunkSchema]],
+    process_chunk: callable,
+    knowledge_graph_inst: BaseGraphStorage,
+    entity_vdb: BaseVectorStorage,
+    relationships_vdb: BaseVectorStorage,
+    text_chunks: BaseKVStorage,
+    global_config: dict,
+    prompt_domain: str,
+    user_id: str,
+    pipeline_stats: Optional[dict] = None,
+) -> tuple[int, int]:
+    """
+    Ingestion en flux : extraction → regroupement → fusion/écriture du graphe → upsert vectoriel.
+
+    Les chunks passent par une file bornée (queue_size) vers extract_workers
+    extractions concurrentes, dont les résultats sont regroupés au fil de
+    l'eau pendant que l'extraction continue. La fusion a lieu une seule fois
+    pour tout le lot de documents : chaque entité et relation est relue,
+    fusionnée et résumée une fois, comme sur le chemin sans pipeline. Les
+    chunks ne sont marqués qu'après l'upsert de leurs vecteurs.
+
+    Retourne le nombre d'entités et de relations écrites. pipeline_stats
+    reçoit les compteurs par étape (extract, merge, vector).
+    """
+    config = global_config.get("ingestion_pipeline_config") or {}
+    extract_workers = config.get("extract_workers") or global_config.get("llm_model_max_async", 16)
+    queue_size = config.get("queue_size", 64)
+
+    stats = {name: StageStats() for name in ("extract", "merge", "vector")}
+    chunk_queue = asyncio.Queue(maxsize=queue_size)
+    extracted_queue = asyncio.Queue(maxsize=queue_size)
+    maybe_nodes, maybe_edges = defaultdict(list), defaultdict(list)
+    progress = tqdm_async(total=len(ordered_chunks), desc="Extracting entities from chunks", unit="chunk")
+
+    async def timed_get(queue: asyncio.Queue, stage: StageStats):
+        stage.max_queue_depth = max(stage.max_queue_depth, queue.qsize())
+        start = time.perf_counter()
+        item = await queue.get()
+        stage.wait_time += time.perf_counter() - start
+        return item
+
+    async def feed_chunks():
+        for chunk in ordered_chunks:
+            await chunk_queue.put(chunk)
+        for _ in range(extract_workers):
+            await chunk_queue.put(None)
+
+    async def extract_worker():
+        while (chunk := await timed_get(chunk_queue, stats["extract"])) is not None:
+            start = time.perf_counter()
+            result = await process_chunk(chunk)
+            stats["extract"].busy_time += time.perf_counter() - start
+            stats["extract"].items += 1
+            progress.update(1)
+            await extracted_queue.put(result)
+
+    async def extract_stage():
+        await asyncio.gather(*[extract_worker() for _ in range(extract_workers)])
+        await extracted_queue.put(None)
+
+    async def combine_stage():
+        while (result := await timed_get(extracted_queue, stats["merge"])) is not None:
+            combined_nodes, combined_edges = _combine_extraction_results([result])
+            for name, nodes in combined_nodes.items():
+                maybe_nodes[name].extend(nodes)
+            for pair, edges in combined_edges.items():
+                maybe_edges[pair].extend(edges)
+            stats["merge"].items += 1
+
+    tasks = [asyncio.create_task(stage()) for stage in (feed_chunks, extract_stage, combine_stage)]
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        progress.close()
+
+    merge_start = time.perf_counter()
+    entities, relationships = await _merge_then_upsert_graph(
+        maybe_nodes,
+        maybe_edges,
+        knowledge_graph_inst,
+        global_config,
+        prompt_domain,
+        user_id=user_id,
+    )
+    stats["merge"].busy_time += time.perf_counter() - merge_start
+    stats["merge"].batches += 1
+
+    vector_start = time.perf_counter()
+    if entities or relationships:
+        await _upsert_extraction_vectors(
+            entities, relationships, entity_vdb, relationships_vdb, text_chunks
+        )
+        stats["vector"].items += len(entities) + len(relationships)
+        stats["vector"].batches += 1
+    await _mark_chunks_merged(text_chunks, ordered_chunks)
+    stats["vector"].busy_time += time.perf_counter() - vector_start
+
+    stage_stats = {name: stage.as_dict() for name, stage in stats.items()}
+    stage_stats["total_time"] = time.perf_counter() - start
+    if pipeline_stats is not None:
+        pipeline_stats.update(stage_stats)
+    logger.info(
+        f"🚰 Pipeline d'ingestion : {len(ordered_chunks)} chunks, "
+        f"{len(entities)} entités, {len(relationships)} relations "
+        f"en {stage_stats['total_time']:.2f}s"
+    )
+    return len(entities), len(relationships)
 
 
 async def kg_query(
@@ -1195,6 +1662,7 @@ async def kg_query(
         text_chunks_db,
         query_param,
         vdb_filter,
+        user_id=user_id,
     )
 
     if query_param.only_need_context:
@@ -1232,51 +1700,8 @@ async def kg_query(
             .strip()
         )
 
-    # Envoi de la réponse à RabbitMQ
-    try:
-        # Récupérer les variables d'environnement
-        RABBITMQ_HOST = '51.77.200.196'
-        RABBITMQ_PORT = 30645
-        RABBITMQ_USER = 'rabbitmq'
-        RABBITMQ_PASSWORD = 'mypassword'
-        RABBITMQ_QUEUE = 'queue_vinh_test'
-        
-
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-        parameters = pika.ConnectionParameters(
-            host=RABBITMQ_HOST, 
-            port=RABBITMQ_PORT, 
-            credentials=credentials
-        )
-        
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-        
-        channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-        
-        message = {
-            "type": "query", 
-            "user_id": user_id, 
-            "custom_id": str(uuid.uuid4()),  # Génération d'un identifiant unique
-            "response": response,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        message_body = json.dumps(message, ensure_ascii=False)
-        
-        channel.basic_publish(
-            exchange='',
-            routing_key=RABBITMQ_QUEUE,
-            body=message_body,
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # Rendre le message persistant
-            )
-        )
-        
-        connection.close()
-        
-    except Exception as e:
-        logger.error(f"Erreur lors de l'envoi à RabbitMQ : {e}", exc_info=True)
+    # Envoi de la réponse à RabbitMQ (outbox en tâche de fond, sans I/O ici)
+    _publish_query_response(user_id, response)
 
     # Save to cache
     await save_to_cache(
@@ -1294,6 +1719,27 @@ async def kg_query(
     return response
 
 
+def _scalar_vdb_filter(vdb_filter) -> Optional[dict]:
+    """
+    vdb_filter en filtre sur champs scalaires : une liste de custom_id devient
+    {"custom_id": [...]}, un dict (ex. {"city": "Lyon"}) est transmis tel quel
+    """
+    if vdb_filter is None or isinstance(vdb_filter, dict):
+        return vdb_filter
+    return {"custom_id": list(vdb_filter)}
+
+
+async def _supports_scalar_filter(vdb: BaseVectorStorage) -> bool:
+    """
+    Le stockage filtre-t-il sur ses champs scalaires ? Le schéma d'une
+    collection existante n'est vérifié qu'à son initialisation (idempotente).
+    """
+    initialize = getattr(vdb, "initialize", None)
+    if initialize is not None:
+        await initialize()
+    return getattr(vdb, "supports_scalar_filter", False)
+
+
 async def _build_query_context(
     query: list,
     knowledge_graph_inst: BaseGraphStorage,
@@ -1302,8 +1748,58 @@ async def _build_query_context(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     vdb_filter: Optional[Dict[str, Any]] = None,
+    user_id: Optional[str] = None,
 ):
     ll_kewwords, hl_keywrds = query[0], query[1]
+
+    # Filtre évalué par les stockages vectoriels (champs scalaires) quand ils le
+    # permettent, sinon sous-graphe filtré calculé une seule fois dans le graphe
+    scalar_filter = all(
+        [await _supports_scalar_filter(vdb) for vdb in (entities_vdb, relationships_vdb)]
+    )
+    filtered_ids = (
+        await knowledge_graph_inst.get_filtered_ids(vdb_filter)
+        if vdb_filter is not None and not scalar_filter
+        else None
+    )
+
+    def node_search():
+        return _get_node_data(
+            ll_kewwords,
+            knowledge_graph_inst,
+            entities_vdb,
+            text_chunks_db,
+            query_param,
+            vdb_filter,
+            filtered_ids,
+            user_id,
+        )
+
+    def edge_search():
+        return _get_edge_data(
+            hl_keywrds,
+            knowledge_graph_inst,
+            relationships_vdb,
+            text_chunks_db,
+            query_param,
+            vdb_filter,
+            filtered_ids,
+            user_id,
+        )
+
+    async def not_needed():
+        return None
+
+    # Recherches entités (bas niveau) et relations (haut niveau) en parallèle
+    ll_data, hl_data = await asyncio.gather(
+        node_search()
+        if query_param.mode in ["local", "hybrid"] and ll_kewwords != ""
+        else not_needed(),
+        edge_search()
+        if query_param.mode in ["global", "hybrid"] and hl_keywrds != ""
+        else not_needed(),
+    )
+
     if query_param.mode in ["local", "hybrid"]:
         if ll_kewwords == "":
             ll_entities_context, ll_relations_context, ll_text_units_context = (
@@ -1321,14 +1817,7 @@ async def _build_query_context(
                 ll_relations_context,
                 ll_text_units_context,
                 activity_entity_custom_id, # Ajout de la variable activity_entity_custom_id pour stocker l'ID de l'entité activité
-            ) = await _get_node_data(
-                ll_kewwords,
-                knowledge_graph_inst,
-                entities_vdb,
-                text_chunks_db,
-                query_param,
-                vdb_filter,
-            )
+            ) = ll_data
     if query_param.mode in ["global", "hybrid"]:
         if hl_keywrds == "":
             hl_entities_context, hl_relations_context, hl_text_units_context = (
@@ -1345,14 +1834,7 @@ async def _build_query_context(
                 hl_entities_context,
                 hl_relations_context,
                 hl_text_units_context,
-            ) = await _get_edge_data(
-                hl_keywrds,
-                knowledge_graph_inst,
-                relationships_vdb,
-                text_chunks_db,
-                query_param,
-                vdb_filter,    
-            )
+            ) = hl_data if hl_data is not None else await edge_search()
             if (
                 hl_entities_context == ""
                 and hl_relations_context == ""
@@ -1408,21 +1890,30 @@ async def _get_node_data(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     vdb_filter: Optional[Dict[str, Any]] = None,
+    filtered_ids: Optional[Dict[str, list]] = None,
+    user_id: Optional[str] = None,
 ):
     
 
     # get similar entities
-    filtered_node_ids = await knowledge_graph_inst.get_filtered_ids(vdb_filter)
-    
-    # Extraction des node_ids
-    filtered_node_ids = filtered_node_ids.get('node_ids', [])
+    if await _supports_scalar_filter(entities_vdb):
+        results = await entities_vdb.query(
+            query,
+            top_k=query_param.top_k,
+            vdb_filter=_scalar_vdb_filter(vdb_filter),
+            user_id=user_id,
+        )
+    elif vdb_filter is not None:
+        if filtered_ids is None:
+            filtered_ids = await knowledge_graph_inst.get_filtered_ids(vdb_filter)
 
-    # Logs pour visualiser filtered_node_ids
-    logger.debug(f"Type de filtered_node_ids : {type(filtered_node_ids)}")
-    logger.debug(f"Contenu de filtered_node_ids : {filtered_node_ids}")
+        # Extraction des node_ids
+        filtered_node_ids = filtered_ids.get('node_ids', [])
 
+        # Logs pour visualiser filtered_node_ids
+        logger.debug(f"Type de filtered_node_ids : {type(filtered_node_ids)}")
+        logger.debug(f"Contenu de filtered_node_ids : {filtered_node_ids}")
 
-    if vdb_filter is not None:
         results = await entities_vdb.query(query, top_k=query_param.top_k, vdb_filter=filtered_node_ids)
     else:
         results = await entities_vdb.query(query, top_k=query_param.top_k)
@@ -1442,32 +1933,31 @@ async def _get_node_data(
 
     if not len(results):
         return None
-    # get entity information
-    node_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(r["entity_name"]) for r in results]
+    # get entity information and degree (requêtes groupées)
+    entity_names = [r["entity_name"] for r in results]
+    nodes_by_name, degrees_by_name = await asyncio.gather(
+        knowledge_graph_inst.get_nodes_batch(entity_names),
+        knowledge_graph_inst.node_degrees_batch(entity_names),
     )
+    node_datas = [nodes_by_name.get(name) for name in entity_names]
 
     if not all([n is not None for n in node_datas]):
         logger.warning("Some nodes are missing, maybe the storage is damaged")
 
-    # get entity degree
-    node_degrees = await asyncio.gather(
-        *[knowledge_graph_inst.node_degree(r["entity_name"]) for r in results]
-    )
     node_datas = [
-        {**n, "entity_name": k["entity_name"], "rank": d}
-        for k, n, d in zip(results, node_datas, node_degrees)
-        if n is not None
+        {**n, "entity_name": k["entity_name"], "rank": degrees_by_name.get(k["entity_name"], 0)}
+        for k, n in zip(results, node_datas)
+        if n is not None and _visible_to_user(n, user_id)
     ]  # what is this text_chunks_db doing.  dont remember it in airvx.  check the diagram.
     
 
     # get entitytext chunk
     use_text_units = await _find_most_related_text_unit_from_entities(
-        node_datas, query_param, text_chunks_db, knowledge_graph_inst
+        node_datas, query_param, text_chunks_db, knowledge_graph_inst, user_id
     )
     # get relate edges
     use_relations = await _find_most_related_edges_from_entities(
-        node_datas, query_param, knowledge_graph_inst
+        node_datas, query_param, knowledge_graph_inst, user_id
     )
 
     # Logs pour tracer l'origine de l'erreur
@@ -1540,14 +2030,16 @@ async def _find_most_related_text_unit_from_entities(
     query_param: QueryParam,
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     knowledge_graph_inst: BaseGraphStorage,
+    user_id: Optional[str] = None,
 ):
     text_units = [
         split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
         for dp in node_datas
     ]
-    edges = await asyncio.gather(
-        *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
+    edges_by_name = await knowledge_graph_inst.get_nodes_edges_batch(
+        [dp["entity_name"] for dp in node_datas]
     )
+    edges = [edges_by_name.get(dp["entity_name"], []) for dp in node_datas]
     all_one_hop_nodes = set()
     for this_edges in edges:
         if not this_edges:
@@ -1555,23 +2047,25 @@ async def _find_most_related_text_unit_from_entities(
         all_one_hop_nodes.update([e[1] for e in this_edges])
 
     all_one_hop_nodes = list(all_one_hop_nodes)
-    all_one_hop_nodes_data = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(e) for e in all_one_hop_nodes]
-    )
+    one_hop_nodes_by_name = await knowledge_graph_inst.get_nodes_batch(all_one_hop_nodes)
+    all_one_hop_nodes_data = [one_hop_nodes_by_name.get(e) for e in all_one_hop_nodes]
 
-    # Add null check for node data
+    # Add null check for node data (voisins d'autres utilisateurs exclus)
     all_one_hop_text_units_lookup = {
         k: set(split_string_by_multi_markers(v["source_id"], [GRAPH_FIELD_SEP]))
         for k, v in zip(all_one_hop_nodes, all_one_hop_nodes_data)
-        if v is not None and "source_id" in v  # Add source_id check
+        if v is not None and "source_id" in v and _visible_to_user(v, user_id)
     }
 
+    chunk_ids = list(dict.fromkeys(c_id for units in text_units for c_id in units))
+    chunks_by_id = dict(zip(chunk_ids, await text_chunks_db.get_by_ids(chunk_ids)))
+
     all_text_units_lookup = {}
     for index, (this_text_units, this_edges) in enumerate(zip(text_units, edges)):
         for c_id in this_text_units:
             if c_id not in all_text_units_lookup:
                 all_text_units_lookup[c_id] = {
-                    "data": await text_chunks_db.get_by_id(c_id),
+                    "data": chunks_by_id.get(c_id),
                     "order": index,
                     "relation_counts": 0,
                 }
@@ -1613,30 +2107,29 @@ async def _find_most_related_edges_from_entities(
     node_datas: list[dict],
     query_param: QueryParam,
     knowledge_graph_inst: BaseGraphStorage,
+    user_id: Optional[str] = None,
 ):
-    all_related_edges = await asyncio.gather(
-        *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
+    all_related_edges = await knowledge_graph_inst.get_nodes_edges_batch(
+        [dp["entity_name"] for dp in node_datas]
     )
     all_edges = []
     seen = set()
 
-    for this_edges in all_related_edges:
+    for this_edges in all_related_edges.values():
         for e in this_edges:
             sorted_edge = tuple(sorted(e))
             if sorted_edge not in seen:
                 seen.add(sorted_edge)
                 all_edges.append(sorted_edge)
 
-    all_edges_pack = await asyncio.gather(
-        *[knowledge_graph_inst.get_edge(e[0], e[1]) for e in all_edges]
-    )
-    all_edges_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(e[0], e[1]) for e in all_edges]
+    all_edges_pack, all_edges_degree = await asyncio.gather(
+        knowledge_graph_inst.get_edges_batch(all_edges),
+        knowledge_graph_inst.edge_degrees_batch(all_edges),
     )
     all_edges_data = [
-        {"src_tgt": k, "rank": d, **v}
-        for k, v, d in zip(all_edges, all_edges_pack, all_edges_degree)
-        if v is not None
+        {"src_tgt": k, "rank": all_edges_degree.get(k, 0), **all_edges_pack[k]}
+        for k in all_edges
+        if all_edges_pack.get(k) is not None and _visible_to_user(all_edges_pack[k], user_id)
     ]
     all_edges_data = sorted(
         all_edges_data, key=lambda x: (x["rank"], x["weight"]), reverse=True
@@ -1656,22 +2149,27 @@ async def _get_edge_data(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     vdb_filter: Optional[Dict[str, Any]] = None,
+    filtered_ids: Optional[Dict[str, list]] = None,
+    user_id: Optional[str] = None,
 ):
 
 
 
     # get similar entities
-    filtered_edge_ids = await knowledge_graph_inst.get_filtered_ids(vdb_filter)
-    
-    # Extraction des node_ids
-    filtered_edge_ids = filtered_edge_ids.get('relation_ids', [])
-
-    # Logs pour visualiser filtered_node_ids
-    #logger.info(f"Type de filtered_node_ids : {type(filtered_node_ids)}")
-    #logger.info(f"Contenu de filtered_edge_ids : {filtered_edge_ids}")
+    if await _supports_scalar_filter(relationships_vdb):
+        results = await relationships_vdb.query(
+            keywords,
+            top_k=query_param.top_k,
+            vdb_filter=_scalar_vdb_filter(vdb_filter),
+            user_id=user_id,
+        )
+    elif vdb_filter is not None:
+        if filtered_ids is None:
+            filtered_ids = await knowledge_graph_inst.get_filtered_ids(vdb_filter)
 
+        # Extraction des relation_ids
+        filtered_edge_ids = filtered_ids.get('relation_ids', [])
 
-    if vdb_filter is not None:
         results = await relationships_vdb.query(keywords, top_k=query_param.top_k, vdb_filter=filtered_edge_ids)
     else:
         results = await relationships_vdb.query(keywords, top_k=query_param.top_k)
@@ -1681,21 +2179,21 @@ async def _get_edge_data(
 
     logger.debug(f"Results: {results[0]}")
 
-    edge_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_edge(r["src_id"], r["tgt_id"]) for r in results]
+    edge_pairs = [(r["src_id"], r["tgt_id"]) for r in results]
+    edges_by_pair, degrees_by_pair = await asyncio.gather(
+        knowledge_graph_inst.get_edges_batch(edge_pairs),
+        knowledge_graph_inst.edge_degrees_batch(edge_pairs),
     )
-    
+    edge_datas = [edges_by_pair.get(pair) for pair in edge_pairs]
 
     # Identifier les arêtes manquantes dans edge_datas
     if not all([n is not None for n in edge_datas]):
         logger.warning("Some edges are missing, maybe the storage is damaged")
 
-    edge_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(r["src_id"], r["tgt_id"]) for r in results]
-    )
     edge_datas = [
-        {"src_id": k["src_id"], "tgt_id": k["tgt_id"], "rank": d, **v}
-        for k, v, d in zip(results, edge_datas, edge_degree)
+        {"src_id": k["src_id"], "tgt_id": k["tgt_id"], "rank": degrees_by_pair.get(pair, 0), **v}
+        for k, pair, v in zip(results, edge_pairs, edge_datas)
+        if v is not None and _visible_to_user(v, user_id)
     ]
     edge_datas = sorted(
         edge_datas, key=lambda x: (x["rank"], x["weight"]), reverse=True
@@ -1707,7 +2205,7 @@ async def _get_edge_data(
     )
 
     use_entities = await _find_most_related_entities_from_relationships(
-        edge_datas, query_param, knowledge_graph_inst
+        edge_datas, query_param, knowledge_graph_inst, user_id
     )
     use_text_units = await _find_related_text_unit_from_relationships(
         edge_datas, query_param, text_chunks_db, knowledge_graph_inst
@@ -1757,6 +2255,7 @@ async def _find_most_related_entities_from_relationships(
     edge_datas: list[dict],
     query_param: QueryParam,
     knowledge_graph_inst: BaseGraphStorage,
+    user_id: Optional[str] = None,
 ):
     entity_names = []
     seen = set()
@@ -1769,16 +2268,14 @@ async def _find_most_related_entities_from_relationships(
             entity_names.append(e["tgt_id"])
             seen.add(e["tgt_id"])
 
-    node_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(entity_name) for entity_name in entity_names]
-    )
-
-    node_degrees = await asyncio.gather(
-        *[knowledge_graph_inst.node_degree(entity_name) for entity_name in entity_names]
+    nodes_by_name, degrees_by_name = await asyncio.gather(
+        knowledge_graph_inst.get_nodes_batch(entity_names),
+        knowledge_graph_inst.node_degrees_batch(entity_names),
     )
     node_datas = [
-        {**n, "entity_name": k, "rank": d}
-        for k, n, d in zip(entity_names, node_datas, node_degrees)
+        {**nodes_by_name[k], "entity_name": k, "rank": degrees_by_name.get(k, 0)}
+        for k in entity_names
+        if nodes_by_name.get(k) is not None and _visible_to_user(nodes_by_name[k], user_id)
     ]
 
     node_datas = truncate_list_by_token_size(
@@ -1800,12 +2297,14 @@ async def _find_related_text_unit_from_relationships(
         split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
         for dp in edge_datas
     ]
+    chunk_ids = list(dict.fromkeys(c_id for units in text_units for c_id in units))
+    chunks_by_id = dict(zip(chunk_ids, await text_chunks_db.get_by_ids(chunk_ids)))
     all_text_units_lookup = {}
 
     for index, unit_list in enumerate(text_units):
         for c_id in unit_list:
             if c_id not in all_text_units_lookup:
-                chunk_data = await text_chunks_db.get_by_id(c_id)
+                chunk_data = chunks_by_id.get(c_id)
                 # Only store valid data
                 if chunk_data is not None and "content" in chunk_data:
                     all_text_units_lookup[c_id] = {
@@ -1936,52 +2435,8 @@ async def naive_query(
             .strip()
         )
 
-    # Envoi de la réponse à RabbitMQ
-    try:
-        # Récupérer les variables d'environnement
-        # Récupérer les variables d'environnement
-        RABBITMQ_HOST = '51.77.200.196'
-        RABBITMQ_PORT = 30645
-        RABBITMQ_USER = 'rabbitmq'
-        RABBITMQ_PASSWORD = 'mypassword'
-        RABBITMQ_QUEUE = 'queue_vinh_test'
-        
-
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-        parameters = pika.ConnectionParameters(
-            host=RABBITMQ_HOST, 
-            port=RABBITMQ_PORT, 
-            credentials=credentials
-        )
-        
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-        
-        channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-        
-        message = {
-            "type": "query", 
-            "user_id": user_id, 
-            "custom_id": str(uuid.uuid4()),  # Génération d'un identifiant unique
-            "response": response,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        message_body = json.dumps(message, ensure_ascii=False)
-        
-        channel.basic_publish(
-            exchange='',
-            routing_key=RABBITMQ_QUEUE,
-            body=message_body,
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # Rendre le message persistant
-            )
-        )
-        
-        connection.close()
-        
-    except Exception as e:
-        logger.error(f"Erreur lors de l'envoi à RabbitMQ : {e}")
+    # Envoi de la réponse à RabbitMQ (outbox en tâche de fond, sans I/O ici)
+    _publish_query_response(user_id, response)
 
     # Save to cache
     await save_to_cache(
@@ -2053,380 +2508,3 @@ async def _decrypt_description(description, user_id=None):
     except Exception as e:
         logger.warning(f"Erreur lors du déchiffrement : {e}")
         return description
-
-
-async def _merge_nodes_then_upsert(
-    entity_name: str,
-    nodes_data: list[dict],
-    knowledge_graph_inst: BaseGraphStorage,
-    global_config: dict,
-    prompt_domain: str = "prompt_domain_not_specified",
-    user_id: str = None
-):
-    """Fusionne et met à jour les nœuds dans le graphe de connaissances"""
-    # Initialiser le gestionnaire de sécurité
-    sec_manager = SecurityManager()
-    security_keys_path = '/Users/vinh/Documents/LightRAG/security/security_keys.json'
-
-    # Normaliser les noms d'entités
-    nodes_data = [
-        {**node, 
-         'entity_name': node['entity_name'].replace(" ", "_").lower(),
-         # Ajouter custom_id si prompt_domain est memo et entity_type est user
-         **(({'custom_id': node['entity_name'].replace(" ", "_").lower()} 
-             if prompt_domain == 'memo' and node.get('entity_type') == 'user' 
-             else {}))
-        } 
-        for node in nodes_data
-    ]
-    
-
-    logger.debug(f"prompt_domain : {prompt_domain}")
-    logger.debug(f"nodes_data : {nodes_data}")
-
-    try:
-        # S'assurer d'utiliser la même boucle d'événements
-        loop = asyncio.get_event_loop()
-        if loop.is_closed():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        # Gestion des clés utilisateur si prompt_domain est 'user'
-        user_public_key = None
-        user_private_key = None
-
-        
-        if prompt_domain == 'user':
-            # Charger les clés existantes, initialiser un dict vide si le fichier est vide
-            try:
-                with open(security_keys_path, 'r') as f:
-                    security_keys = json.load(f) or {}
-            except json.JSONDecodeError:
-                security_keys = {}
-            
-            
-            # Générer des clés si l'utilisateur n'existe pas
-            if user_id not in security_keys:
-                sec_manager.generate_rsa_key_pair(user_id)
-                logger.debug(f"Nouvelles clés générées pour l'utilisateur {user_id}")
-                # Recharger les clés après génération
-                with open(security_keys_path, 'r') as f:
-                    security_keys = json.load(f)
-                    logger.debug(f"Clés utilisées pour l'utilisateur {user_id}")
-            
-            # Récupérer les clés
-            user_public_key = security_keys.get(user_id, {}).get('public_key')
-            user_private_key = security_keys.get(user_id, {}).get('private_key')
-            
-            if user_public_key and user_private_key:
-                logger.debug(f"Clés récupérées pour l'utilisateur {user_id}")
-            else:
-                logger.error(f"Impossible de récupérer les clés pour {user_id}")
-                user_public_key = None
-                user_private_key = None
-        
-        # Vérifier si le nœud existe déjà
-        already_node = await knowledge_graph_inst.get_node(entity_name)
-        if already_node is not None:
-            already_entitiy_types = [already_node["entity_type"]]
-            already_source_ids = split_string_by_multi_markers(already_node["source_id"], [GRAPH_FIELD_SEP])
-            already_description = [already_node["description"]]
-            
-            # Récupérer les metadata existantes
-            already_metadata = {k: v for k, v in already_node.items() 
-                              if k not in ["entity_type", "description", "source_id", "entity_name"]}
-            
-            # Si c'est un utilisateur et qu'on a une clé privée, décrypter la description
-            if prompt_domain == 'user' and user_private_key and 'description' in already_node:
-                try:
-                    # Ne décrypter que si une description existe
-                    if already_node and 'description' in already_node:
-                        decrypted_description = sec_manager.decrypt_data(
-                            already_node['description'], 
-                            user_private_key
-                        )
-                        already_description = [decrypted_description]
-                        logger.debug(f"Description déchiffrée pour {user_id}")
-                except Exception as e:
-                    logger.error(f"Erreur lors du déchiffrement : {e}")
-        else:
-            already_entitiy_types = []
-            already_source_ids = []
-            already_description = []
-            already_metadata = {}
-
-        # Fusionner les metadata de tous les nœuds
-        metadata = {}
-        for node in nodes_data:
-            node_metadata = {k: v for k, v in node.items() 
-                           if k not in ["entity_type", "description", "source_id", "entity_name"]}
-            
-            # Si c'est un utilisateur et qu'on a une clé publique, chiffrer la description
-            if prompt_domain == 'user' and user_public_key and 'description' in node:
-                try:
-                    encrypted_description = sec_manager.encrypt_data(
-                        node['description'], 
-                        user_public_key
-                    )
-                    node['description'] = encrypted_description
-                    logger.debug(f"Description chiffrée pour {user_id}")
-                except Exception as e:
-                    logger.error(f"Erreur lors du chiffrement : {e}")
-            
-            metadata.update(node_metadata)
-        
-        # Combiner avec les metadata existantes
-        metadata.update(already_metadata)
-
-        entity_type = sorted(
-            Counter(
-                [dp["entity_type"] for dp in nodes_data] + already_entitiy_types
-            ).items(),
-            key=lambda x: x[1],
-            reverse=True,
-        )[0][0]
-        description = GRAPH_FIELD_SEP.join(
-            sorted(set([dp["description"] for dp in nodes_data] + already_description))
-        )
-        source_id = GRAPH_FIELD_SEP.join(
-            set([dp["source_id"] for dp in nodes_data] + already_source_ids)
-        )
-        description = await _handle_entity_relation_summary(
-            entity_name, description, global_config
-        )
-        await knowledge_graph_inst.upsert_node(
-            entity_name,
-            node_data=dict(
-                entity_type=entity_type,
-                description=description,
-                source_id=source_id,
-                **metadata  # Ajouter les metadata au nœud
-            ),
-        )
-        node_data = dict(
-            entity_type=entity_type,
-            description=description,
-            source_id=source_id,
-            **metadata  # Ajouter les metadata au nœud
-        )
-
-        node_data["entity_name"] = entity_name
-        return node_data
-    except Exception as e:
-        logger.error(f"Erreur lors de la fusion des nœuds : {e}")
-        return None
-
-
-async def _merge_edges_then_upsert(
-    src_id: str,
-    tgt_id: str,
-    edges_data: list[dict],
-    knowledge_graph_inst: BaseGraphStorage,
-    global_config: dict,
-    prompt_domain: str = "prompt_domain_not_specified",
-    user_id: str = None
-):
-    already_weights = []
-    already_source_ids = []
-    already_description = []
-    already_keywords = []
-
-
-    # Initialiser le gestionnaire de sécurité
-    sec_manager = SecurityManager()
-    security_keys_path = '/Users/vinh/Documents/LightRAG/security/security_keys.json'
-
-    if await knowledge_graph_inst.has_edge(src_id, tgt_id):
-        already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
-        already_weights = [already_edge.get("weight", 0)] if already_edge else [0]
-        already_source_ids = (
-            split_string_by_multi_markers(already_edge["source_id"], [GRAPH_FIELD_SEP]) 
-            if already_edge else []
-        )
-        already_description = [already_edge["description"]] if already_edge else []
-        already_keywords = (
-            split_string_by_multi_markers(already_edge["keywords"], [GRAPH_FIELD_SEP])
-            if already_edge else []
-        )
-
-
-    # Gestion des clés utilisateur si prompt_domain est 'user'
-    user_public_key = None
-    user_private_key = None
-
-    if prompt_domain == 'query':
-        # Initialiser query_text avec une liste vide par défaut
-        query_text = []
-        
-        # Récupérer la description si possible
-        try:
-            already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
-            if already_edge and 'description' in already_edge:
-                query_text = [already_edge["description"]]
-        except Exception as e:
-            logger.warning(f"Impossible de récupérer l'arête existante : {e}")
-        
-        query_prompt="""
-            Analyse détaillée de recommandation
-
-            Contexte:
-            Tu es un assistant expert en analyse de recommandations de restaurants. 
-            Tu dois évaluer précisément si un établissement est recommandable ou non.
-
-            Texte à analyser:
-            {text}
-
-            Instructions d'analyse:
-            1. Évalue rigoureusement les critères de recommandation
-            2. Analyse chaque section du texte (Offre de Menu, Ambiance et Service)
-            3. Détermine clairement si le restaurant est recommandé
-            4. Justifie ta décision de manière objective et nuancée
-
-            Format de réponse:
-            [Recommandé / Non Recommandé]
-
-
-            Exemple de réponse:
-            Non Recommandé
-
-           ######################  
-            -Examples-  
-           ######################  
-        
-            ### Le Coquemar
-            - **custom_id**: 3091293945615310311
-            - **Résultat**: **Non recommandé**
-            - **Évaluation**:
-            - **Offre de Menu**: Le Coquemar est principalement un restaurant français, célèbre pour sa cuisine traditionnelle et les plats faits maison. Cependant, aucune mention explicite du homard dans son menu n'a été trouvée dans les données.
-            - **Ambiance et Service**: Le restaurant est apprécié pour son ambiance chaleureuse et décontractée ainsi que pour son service amical et efficace. Bien qu'il soit un bon choix pour une sortie, il ne répond pas à votre critère spécifique sur le homard.
-            - **Justification de son élimination**: En l'absence d'informations concernant l'offre de homard, le Coquemar ne peut pas être recommandé pour votre recherche.
-                    
-            réponse:
-            Non Recommandé
-
-        """
-
-        use_model_func = global_config["llm_model_func"]
-        response = await use_model_func(
-            query_text,
-            system_prompt=query_prompt.format(text=query_text),
-            stream=False,
-        )
-
-    
-    if prompt_domain == "user":
-        # Charger les clés existantes, initialiser un dict vide si le fichier est vide
-        try:
-            with open(security_keys_path, 'r') as f:
-                security_keys = json.load(f) or {}
-        except json.JSONDecodeError:
-            security_keys = {}
-        
-        # Générer des clés si l'utilisateur n'existe pas
-        if user_id not in security_keys:
-            sec_manager.generate_rsa_key_pair(user_id)
-            logger.debug(f"Nouvelles clés générées pour l'utilisateur {user_id}")
-            # Recharger les clés après génération
-            with open(security_keys_path, 'r') as f:
-                security_keys = json.load(f)
-                logger.debug(f"Clés utilisé pour l'utilisateur {user_id}")
-        
-        # Récupérer les clés
-        user_public_key = security_keys.get(user_id, {}).get('public_key')
-        user_private_key = security_keys.get(user_id, {}).get('private_key')
-        
-        if user_public_key and user_private_key:
-            logger.debug(f"Clés récupérées pour l'utilisateur {user_id}")
-        else:
-            logger.error(f"Impossible de récupérer les clés pour {user_id}")
-            user_public_key = None
-            user_private_key = None
-
-    # Traitement du chiffrement pour les relations existantes
-    already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
-    already_weights = [already_edge.get("weight", 0)] if already_edge else [0]
-    already_source_ids = (
-        split_string_by_multi_markers(already_edge["source_id"], [GRAPH_FIELD_SEP]) 
-        if already_edge else []
-    )    
-    already_description = [already_edge["description"]] if already_edge else []
-    already_keywords = (
-        split_string_by_multi_markers(already_edge["keywords"], [GRAPH_FIELD_SEP])
-        if already_edge else []
-    )
-
-    if user_id and user_private_key:
-        try:
-            # Ne décrypter que si une description existe
-            if already_edge and 'description' in already_edge:
-                decrypted_description = sec_manager.decrypt_data(
-                    already_edge['description'], 
-                    user_private_key
-                )
-                already_description = [decrypted_description]
-                logger.debug(f"Description de relation déchiffrée pour target {tgt_id} et source {src_id}")
-        except Exception as e:
-            logger.error(f"Erreur lors du déchiffrement de la relation : {e}")
-    else:
-        already_description = [already_edge["description"]] if already_edge else []
-
-    weight = sum([dp["weight"] for dp in edges_data] + already_weights)
-    description = GRAPH_FIELD_SEP.join(
-        sorted(set([dp["description"] for dp in edges_data] + already_description))
-    )
-
-
-    if user_id and user_public_key:  
-        try:
-            encrypted_description = sec_manager.encrypt_data(
-                description, 
-                user_public_key
-            )
-            description= encrypted_description
-            logger.debug(f"Description de relation chiffrée pour target {tgt_id} et source {src_id}")
-        except Exception as e:
-            logger.error(f"Erreur lors du chiffrement de la relation : {e}")
-
-
-    keywords = GRAPH_FIELD_SEP.join(
-        sorted(set([dp["keywords"] for dp in edges_data] + already_keywords))
-    )
-    keywords = keywords.replace("<SEP>", ", ") if "<SEP>" in keywords else keywords
-    source_id = GRAPH_FIELD_SEP.join(
-        set([dp["source_id"] for dp in edges_data] + already_source_ids)
-    )
-    for need_insert_id in [src_id, tgt_id]:
-        if not (await knowledge_graph_inst.has_node(need_insert_id)):
-            await knowledge_graph_inst.upsert_node(
-                need_insert_id,
-                node_data={
-                    "source_id": source_id,
-                    "description": description,
-                    "entity_type": '"UNKNOWN"',
-                },
-            )
-    
-
-    description = await _handle_entity_relation_summary(
-        f"({src_id}, {tgt_id})", description, global_config
-    )
-    await knowledge_graph_inst.upsert_edge(
-        src_id,
-        tgt_id,
-        edge_data=dict(
-            weight=weight,
-            description=description,
-            keywords=keywords,
-            source_id=source_id,
-            query_result=response if prompt_domain == 'query' else None,
-        ),
-    )
-
-    edge_data = dict(
-        src_id=src_id,
-        tgt_id=tgt_id,
-        description=description,
-        keywords=keywords,
-    )
-
-    return edge_data
@@ -711,6 +711,25 @@ Description List: {description_list}
 Output:
 """
 
+PROMPTS["summarize_entity_descriptions_batch"] = """You are a helpful assistant responsible for generating comprehensive summaries of the data provided below.
+Each item gives one or two entities, and a list of descriptions, all related to the same entity or group of entities.
+For each item, please concatenate all of its descriptions into a single, comprehensive description. Make sure to include information collected from all the descriptions of that item, and only of that item.
+If the provided descriptions are contradictory, please resolve the contradictions and provide a single, coherent summary.
+Make sure each summary is written in third person, and include the entity names so we the have full context.
+Keep each summary under {max_words} words.
+Use {language} as output language.
+
+Return only a JSON object of the form:
+{{"summaries": [{{"id": <item id>, "summary": "<summary>"}}]}}
+with exactly one summary per item.
+
+#######
+-Data-
+{items}
+#######
+Output:
+"""
+
 PROMPTS[
     "entiti_continue_extraction"
 ] = """MANY entities were missed in the last extraction.  Add them below using the same format:
@@ -0,0 +1,209 @@
+"""
+Publication asynchrone des réponses de requêtes vers RabbitMQ.
+
+Une connexion aio_pika robuste et un pool de canaux (confirmations éditeur)
+sont partagés par boucle d'événements. Les messages passent par une outbox
+bornée en mémoire vidée par lots en tâche de fond : kg_query / naive_query
+n'attendent plus aucune I/O broker.
+"""
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import aio_pika
+from aio_pika.pool import Pool
+
+from .utils import logger
+
+
+def rabbitmq_publisher_config() -> dict:
+    """Configuration lue dans l'environnement (valeurs historiques par défaut)"""
+    return {
+        "host": os.getenv("RABBITMQ_HOST", "51.77.200.196"),
+        "port": int(os.getenv("RABBITMQ_PORT", 30645)),
+        "user": os.getenv("RABBITMQ_USER", "rabbitmq"),
+        "password": os.getenv("RABBITMQ_PASSWORD", "mypassword"),
+        "queue": os.getenv("RABBITMQ_QUERY_QUEUE", "queue_vinh_test"),
+        "channels": int(os.getenv("RABBITMQ_PUBLISH_CHANNELS", 2)),
+        "outbox_size": int(os.getenv("RABBITMQ_OUTBOX_SIZE", 10000)),
+        "batch_size": int(os.getenv("RABBITMQ_PUBLISH_BATCH", 100)),
+        "max_retries": int(os.getenv("RABBITMQ_PUBLISH_RETRIES", 5)),
+        "retry_backoff": float(os.getenv("RABBITMQ_PUBLISH_BACKOFF", 1.0)),
+    }
+
+
+@dataclass
+class PublisherStats:
+    queued: int = 0
+    published: int = 0
+    dropped: int = 0
+    failed: int = 0
+    batches: int = 0
+
+
+class RabbitMQPublisher:
+    """
+    Éditeur non bloquant : publish_nowait() dépose le message dans l'outbox,
+    une tâche de fond le publie avec confirmation du broker.
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        self.config = {**rabbitmq_publisher_config(), **(config or {})}
+        self.stats = PublisherStats()
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=self.config["outbox_size"])
+        self._connection = None
+        self._channel_pool: Optional[Pool] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def publish_nowait(self, message: dict) -> bool:
+        """
+        Met un message en file sans attendre le broker
+
+        Returns:
+            bool: False si l'outbox est pleine (message abandonné)
+        """
+        if self._closing:
+            self.stats.dropped += 1
+            return False
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            self._outbox.put_nowait(message)
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            logger.warning(
+                f"⚠️ Outbox RabbitMQ pleine ({self._outbox.maxsize}), message abandonné"
+            )
+            return False
+        self.stats.queued += 1
+        return True
+
+    async def _connect(self):
+        config = self.config
+        self._connection = await aio_pika.connect_robust(
+            host=config["host"],
+            port=config["port"],
+            login=config["user"],
+            password=config["password"],
+        )
+
+        async def get_channel():
+            return await self._connection.channel(publisher_confirms=True)
+
+        self._channel_pool = Pool(get_channel, max_size=config["channels"])
+        async with self._channel_pool.acquire() as channel:
+            await channel.declare_queue(config["queue"], durable=True)
+        logger.info(
+            f"✅ Éditeur RabbitMQ connecté à {config['host']}:{config['port']} "
+            f"(queue {config['queue']})"
+        )
+
+    async def _publish_one(self, message: dict):
+        body = json.dumps(message, ensure_ascii=False).encode()
+        async with self._channel_pool.acquire() as channel:
+            await channel.default_exchange.publish(
+                aio_pika.Message(body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                routing_key=self.config["queue"],
+            )
+
+    async def _publish_batch(self, batch: list[dict]):
+        for attempt in range(self.config["max_retries"]):
+            try:
+                if self._connection is None:
+                    await self._connect()
+                results = await asyncio.gather(
+                    *[self._publish_one(message) for message in batch],
+                    return_exceptions=True,
+                )
+                batch = [m for m, r in zip(batch, results) if isinstance(r, Exception)]
+                self.stats.published += len(results) - len(batch)
+                if not batch:
+                    return
+                raise next(r for r in results if isinstance(r, Exception))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = min(self.config["retry_backoff"] * 2**attempt, 30)
+                logger.warning(
+                    f"⚠️ Publication RabbitMQ échouée ({len(batch)} messages, "
+                    f"tentative {attempt + 1}) : {e}, nouvel essai dans {delay}s"
+                )
+                await asyncio.sleep(delay)
+        self.stats.failed += len(batch)
+        logger.error(f"❌ {len(batch)} messages RabbitMQ abandonnés après {self.config['max_retries']} tentatives")
+
+    async def _run(self):
+        while True:
+            batch = [await self._outbox.get()]
+            while len(batch) < self.config["batch_size"] and not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            try:
+                await self._publish_batch(batch)
+                self.stats.batches += 1
+            finally:
+                for _ in batch:
+                    self._outbox.task_done()
+
+    async def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Attend que l'outbox soit publiée (dans la limite de timeout), sans fermer
+
+        Returns:
+            bool: False si des messages restent en attente
+        """
+        if self._task is None:
+            return True
+        try:
+            await asyncio.wait_for(self._outbox.join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"⚠️ {self._outbox.qsize()} messages RabbitMQ toujours en attente après {timeout}s"
+            )
+            return False
+
+    async def close(self, timeout: float = 10.0):
+        """Vide l'outbox (dans la limite de timeout) puis ferme la connexion"""
+        self._closing = True
+        if self._task is not None:
+            await self.flush(timeout)
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._channel_pool is not None:
+            await self._channel_pool.close()
+        if self._connection is not None:
+            await self._connection.close()
+
+    def get_stats(self) -> dict:
+        return {**self.stats.__dict__, "pending": self._outbox.qsize()}
+
+
+# Un éditeur par boucle d'événements (connexions aio_pika liées à la boucle)
+_publishers: dict[asyncio.AbstractEventLoop, RabbitMQPublisher] = {}
+
+
+def get_query_publisher() -> RabbitMQPublisher:
+    loop = asyncio.get_running_loop()
+    for closed_loop in [l for l in _publishers if l.is_closed()]:
+        del _publishers[closed_loop]
+    publisher = _publishers.get(loop)
+    if publisher is None:
+        publisher = _publishers[loop] = RabbitMQPublisher()
+    return publisher
+
+
+async def aclose_query_publisher():
+    """Ferme l'éditeur de la boucle courante (arrêt de l'application)"""
+    publisher = _publishers.pop(asyncio.get_running_loop(), None)
+    if publisher is not None:
+        await publisher.close()
+
+
+async def flush_query_publisher(timeout: float = 10.0):
+    """Publie l'outbox de l'éditeur de la boucle courante sans le fermer"""
+    publisher = _publishers.get(asyncio.get_running_loop())
+    if publisher is not None:
+        await publisher.flush(timeout)
@@ -59,6 +59,10 @@ class JsonKVStorage(BaseKVStorage):
         self._data.update(left_data)
         return left_data
 
+    async def delete(self, ids: list[str]):
+        for id in ids:
+            self._data.pop(id, None)
+
     async def drop(self):
         self._data = {}
 
@@ -92,9 +96,14 @@ class NanoVectorDBStorage(BaseVectorStorage):
             for k, v in data.items()
         ]
         contents = [v["content"] for v in data.values()]
+        # an embedding_func that packs its own requests (EmbeddingBatcher) gets everything
+        batch_size = (
+            len(contents)
+            if getattr(self.embedding_func, "packs_batches", False)
+            else self._max_batch_size
+        )
         batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
+            contents[i : i + batch_size] for i in range(0, len(contents), batch_size)
         ]
         embedding_tasks = [self.embedding_func(batch) for batch in batches]
         embeddings_list = []
@@ -1,13 +1,21 @@
 import asyncio
+import heapq
 import html
 import io
 import csv
+import itertools
 import json
 import logging
 import os
 import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
-from functools import wraps
+from functools import lru_cache, partial, wraps
 from hashlib import md5
 from typing import Any, Union, List, Optional
 import xml.etree.ElementTree as ET
@@ -92,24 +100,255 @@ def compute_mdhash_id(content, prefix: str = ""):
     return prefix + md5(content.encode()).hexdigest()
 
 
-def limit_async_func_call(max_size: int, waitting_time: float = 0.0001):
-    """Add restriction of maximum async calling times for a async func"""
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
 
-    def final_decro(func):
-        """Not using async.Semaphore to aovid use nest-asyncio"""
-        __current_size = 0
+# Priority class of the LLM / embedding calls made from the current task
+# (inherited by the tasks it spawns)
+_call_priority: ContextVar[int] = ContextVar("lightrag_call_priority", default=PRIORITY_BULK)
+
+
+@contextmanager
+def call_priority(priority: int):
+    """Run the calls made inside the block with the given priority class"""
+    token = _call_priority.set(priority)
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+# Set while extraction, gleaning and description summaries run: only these
+# completions are served from / written to the CompletionCache
+_cache_completions: ContextVar[bool] = ContextVar("lightrag_cache_completions", default=False)
+
+
+@contextmanager
+def cache_completions():
+    """Let the CompletionCache serve the completions requested inside the block"""
+    token = _cache_completions.set(True)
+    try:
+        yield
+    finally:
+        _cache_completions.reset(token)
+
+
+# Call kwargs left out of llm_func_identity (credentials, storage handles)
+_IDENTITY_EXCLUDED_KWARGS = ("api_key", "hashing_kv")
+
+
+def llm_func_identity(func: callable, model_kwargs: Optional[dict] = None) -> str:
+    """Description of the model behind an LLM completion function: qualified
+    name of the underlying function (through partials and @wraps wrappers such
+    as the limiter and the completion cache) with its partial args and the
+    model kwargs (model, base_url...), credentials excluded"""
+    bound = []
+    while True:
+        if isinstance(func, partial):
+            bound.append((func.args, func.keywords))
+            func = func.func
+        elif getattr(func, "__wrapped__", None) is not None:
+            func = func.__wrapped__
+        else:
+            break
+    name = f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+    kwargs = {}
+    for _, keywords in reversed(bound):
+        kwargs.update(keywords)
+    kwargs.update(model_kwargs or {})
+    relevant = sorted(
+        (k, repr(v)) for k, v in kwargs.items() if k not in _IDENTITY_EXCLUDED_KWARGS
+    )
+    args = [arg for args, _ in bound for arg in args]
+    return name + (f"{args}" if args else "") + (f"{relevant}" if relevant else "")
+
+
+class PriorityLimiter:
+    """Bounded concurrency for LLM and embedding calls, admitted by priority class.
+
+    Waiting calls are queued by (priority, arrival order); a slot is released
+    when the call returns or raises and goes to the head of the queue, so
+    interactive calls overtake queued bulk ones. With tokens_per_minute > 0,
+    admission also draws the call's estimated cost from a token bucket that
+    refills at tokens_per_minute / 60 per second, up to one minute of budget.
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int = 0, name: str = ""):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self._running = 0
+        self._queue: list = []
+        self._arrivals = itertools.count()
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._timer = None
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "max_queue_depth": 0,
+            "total_wait_time": 0.0,
+            "max_wait_time": 0.0,
+            "tokens": 0,
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60,
+        )
+        self._refilled_at = now
+
+    def _budget_wait(self, cost: int) -> float:
+        """Seconds until the bucket can pay for cost (0 without budget)"""
+        if self.tokens_per_minute <= 0:
+            return 0.0
+        self._refill()
+        # a call larger than the whole budget waits for a full bucket
+        missing = min(cost, self.tokens_per_minute) - self._tokens
+        return max(0.0, missing * 60 / self.tokens_per_minute)
+
+    def _admit(self, cost: int):
+        self._running += 1
+        self.stats["admitted"] += 1
+        self.stats["tokens"] += cost
+        if self.tokens_per_minute > 0:
+            self._tokens -= cost
+
+    def _dispatch(self):
+        while self._queue and self._running < self.max_concurrency:
+            _, _, cost, future = self._queue[0]
+            if future.done() or future.get_loop().is_closed():
+                heapq.heappop(self._queue)
+                continue
+            wait = self._budget_wait(cost)
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = future.get_loop().call_later(wait, self._on_timer)
+                return
+            heapq.heappop(self._queue)
+            self._admit(cost)
+            future.set_result(None)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def charge(self, tokens: int):
+        """Draw tokens known only after the call (e.g. the completion)"""
+        self.stats["tokens"] += tokens
+        if self.tokens_per_minute > 0:
+            self._refill()
+            self._tokens -= tokens
+
+    async def acquire(self, cost: int = 0, priority: Optional[int] = None):
+        if priority is None:
+            priority = _call_priority.get()
+        if not self._queue and self._running < self.max_concurrency and self._budget_wait(cost) == 0:
+            self._admit(cost)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._arrivals), cost, future))
+        self.stats["queued"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._queue))
+        self._dispatch()
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # admitted right before the cancellation: give the slot back
+                self.release()
+            raise
+        wait_time = time.perf_counter() - start
+        self.stats["total_wait_time"] += wait_time
+        self.stats["max_wait_time"] = max(self.stats["max_wait_time"], wait_time)
+
+    def release(self):
+        self._running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, cost: int = 0, priority: Optional[int] = None):
+        await self.acquire(cost, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def wrap(self, func: callable, cost: Optional[callable] = None, result_cost: Optional[callable] = None):
+        """Limit func; cost(*args, **kwargs) and result_cost(result) estimate its tokens"""
 
         @wraps(func)
-        async def wait_func(*args, **kwargs):
-            nonlocal __current_size
-            while __current_size >= max_size:
-                await asyncio.sleep(waitting_time)
-            __current_size += 1
-            result = await func(*args, **kwargs)
-            __current_size -= 1
+        async def limited_func(*args, **kwargs):
+            async with self.slot(cost(*args, **kwargs) if cost else 0):
+                result = await func(*args, **kwargs)
+            if result_cost is not None:
+                self.charge(result_cost(result))
             return result
 
-        return wait_func
+        limited_func.limiter = self
+        return limited_func
+
+    def queue_depth(self) -> dict:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+        return depth
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats.update(
+            name=self.name,
+            max_concurrency=self.max_concurrency,
+            tokens_per_minute=self.tokens_per_minute,
+            running=self._running,
+            queue_depth=self.queue_depth(),
+            avg_wait_time=stats["total_wait_time"] / max(stats["queued"], 1),
+        )
+        if self.tokens_per_minute > 0:
+            self._refill()
+            stats["tokens_available"] = int(self._tokens)
+        return stats
+
+
+# Limiters shared by every LightRAG instance of the process, one per provider
+_call_limiters: dict[str, PriorityLimiter] = {}
+
+
+def get_call_limiter(name: str, max_concurrency: int, tokens_per_minute: int = 0) -> PriorityLimiter:
+    """Process-wide limiter of a provider (created on first use, settings kept)"""
+    limiter = _call_limiters.get(name)
+    if limiter is None:
+        limiter = _call_limiters[name] = PriorityLimiter(max_concurrency, tokens_per_minute, name)
+    return limiter
+
+
+def get_call_limiter_stats() -> list[dict]:
+    return [limiter.get_stats() for limiter in _call_limiters.values()]
+
+
+def llm_call_tokens(count_tokens: callable, prompt: str, system_prompt: str = None, history_messages=None, **kwargs) -> int:
+    """Prompt tokens of an llm_model_func call"""
+    texts = [prompt, system_prompt or ""]
+    texts += [message.get("content") or "" for message in history_messages or []]
+    return sum(count_tokens(text) for text in texts if text)
+
+
+def limit_async_func_call(max_size: int, waitting_time: float = 0.0001):
+    """Add restriction of maximum async calling times for a async func
+
+    Kept for compatibility: a private PriorityLimiter per decorated function,
+    waitting_time is no longer used (no polling).
+    """
+
+    def final_decro(func):
+        return PriorityLimiter(max_size).wrap(func)
 
     return final_decro
 
@@ -152,6 +391,12 @@ def decode_tokens_by_tiktoken(tokens: list[int], model_name: str = "gpt-4o"):
     return content
 
 
+@lru_cache(maxsize=None)
+def get_tiktoken_encoding(encoding_name: str) -> "tiktoken.Encoding":
+    """tiktoken encoding by name, independent of the global ENCODER"""
+    return tiktoken.get_encoding(encoding_name)
+
+
 def pack_user_ass_to_openai_messages(*args: str):
     roles = ["user", "assistant"]
     return [
@@ -311,6 +556,244 @@ def process_combine_contexts(hl, ll):
     return combined_sources_result
 
 
+class SemanticCacheIndex:
+    """Contiguous embedding matrix backing the semantic query cache.
+
+    Vectors are L2-normalised on insert so a lookup is a single matrix-vector
+    product followed by argmax. The float16 copy is memory-mapped on disk next
+    to a JSON sidecar holding row ids and LRU clocks; the search matrix is kept
+    in memory as float32 (BLAS) or float16 (half the memory, slower).
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        dim: int,
+        max_entries: int = 100_000,
+        search_dtype: str = "float32",
+        initial_capacity: int = 1024,
+    ):
+        self.path = path
+        self.dim = dim
+        self.max_entries = max_entries
+        self.search_dtype = np.dtype(search_dtype)
+        self.ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._clock = 0
+        self._dirty = False
+        self._disk = None
+        capacity = min(initial_capacity, max_entries)
+        if path and os.path.exists(path + ".json"):
+            self._load()
+        else:
+            self._allocate(capacity)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, entry_id: str):
+        return entry_id in self._rows
+
+    def _allocate(self, capacity: int):
+        matrix = np.zeros((capacity, self.dim), dtype=self.search_dtype)
+        last_used = np.zeros(capacity, dtype=np.int64)
+        n = len(self.ids)
+        if n:
+            matrix[:n] = self._matrix[:n]
+            last_used[:n] = self._last_used[:n]
+        self._matrix, self._last_used = matrix, last_used
+        if self.path:
+            if self._disk is not None:
+                self._disk.flush()
+            # r+ extends the file when the requested shape is larger
+            mode = "r+" if os.path.exists(self.path + ".f16") else "w+"
+            self._disk = np.memmap(
+                self.path + ".f16", dtype=np.float16, mode=mode, shape=(capacity, self.dim)
+            )
+
+    def _load(self):
+        meta = load_json(self.path + ".json")
+        if meta.get("dim") != self.dim:
+            raise ValueError(
+                f"Semantic cache index {self.path} has dim {meta.get('dim')}, expected {self.dim}"
+            )
+        n = len(meta["ids"])
+        self._allocate(max(n, min(1024, self.max_entries)))
+        self.ids = meta["ids"]
+        self._rows = {entry_id: row for row, entry_id in enumerate(self.ids)}
+        self._clock = meta.get("clock", n)
+        self._matrix[:n] = self._disk[:n]
+        self._last_used[:n] = meta.get("last_used", list(range(n)))
+
+    def _touch(self, row: int):
+        self._clock += 1
+        self._last_used[row] = self._clock
+        self._dirty = True
+
+    def search(
+        self, embedding: np.ndarray, min_similarity: Optional[float] = None
+    ) -> tuple[Union[str, None], float]:
+        """Return (entry id, cosine similarity) of the closest cached embedding.
+
+        The entry is only marked as recently used when its similarity is above
+        min_similarity, so misses do not keep cold entries away from eviction.
+        """
+        n = len(self.ids)
+        if n == 0:
+            return None, -1.0
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        if self.search_dtype == np.float32:
+            scores = self._matrix[:n] @ query
+        else:
+            # no BLAS kernel for float16: upcast block by block
+            scores = np.empty(n, dtype=np.float32)
+            for start in range(0, n, 8192):
+                block = self._matrix[start : min(start + 8192, n)]
+                scores[start : start + len(block)] = block.astype(np.float32) @ query
+        row = int(np.argmax(scores))
+        similarity = float(scores[row])
+        if min_similarity is None or similarity > min_similarity:
+            self._touch(row)
+        return self.ids[row], similarity
+
+    def add(self, entry_id: str, embedding: np.ndarray) -> Union[str, None]:
+        """Insert or replace a vector, return the id evicted to make room if any"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        evicted = None
+        row = self._rows.get(entry_id)
+        if row is None:
+            n = len(self.ids)
+            if n >= self.max_entries:
+                row = int(np.argmin(self._last_used[:n]))
+                evicted = self.ids[row]
+                del self._rows[evicted]
+                self.ids[row] = entry_id
+            else:
+                if n >= len(self._matrix):
+                    self._allocate(min(len(self._matrix) * 2, self.max_entries))
+                row = n
+                self.ids.append(entry_id)
+            self._rows[entry_id] = row
+        self._matrix[row] = vector
+        if self._disk is not None:
+            self._disk[row] = vector
+        self._touch(row)
+        return evicted
+
+    def remove(self, entry_id: str):
+        row = self._rows.pop(entry_id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        if row != last:
+            # move the last row into the hole to keep the matrix contiguous
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self._rows[moved] = row
+            self._matrix[row] = self._matrix[last]
+            self._last_used[row] = self._last_used[last]
+            if self._disk is not None:
+                self._disk[row] = self._disk[last]
+        self.ids.pop()
+        self._dirty = True
+
+    def flush(self):
+        if not self.path or not self._dirty:
+            return
+        self._disk.flush()
+        n = len(self.ids)
+        tmp_file = self.path + ".json.tmp"
+        write_json(
+            {
+                "dim": self.dim,
+                "ids": self.ids,
+                "clock": self._clock,
+                "last_used": self._last_used[:n].tolist(),
+            },
+            tmp_file,
+        )
+        os.replace(tmp_file, self.path + ".json")
+        self._dirty = False
+
+
+_semantic_cache_indexes: dict[tuple, SemanticCacheIndex] = {}
+_semantic_cache_locks: dict[tuple, asyncio.Lock] = {}
+
+
+def semantic_cache_entry_id(mode: str, args_hash: str) -> str:
+    return f"sem-{mode}-{args_hash}"
+
+
+async def get_semantic_cache_index(hashing_kv, mode: str, dim: int) -> SemanticCacheIndex:
+    """Shared index per (working_dir, namespace, mode), built on first use.
+
+    A fresh index imports the legacy entries of the mode cache, whose embeddings
+    were stored as hex strings, and moves their payloads to one KV key each.
+    """
+    working_dir = hashing_kv.global_config.get("working_dir")
+    key = (working_dir, hashing_kv.namespace, mode)
+    index = _semantic_cache_indexes.get(key)
+    if index is not None:
+        return index
+
+    lock = _semantic_cache_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        index = _semantic_cache_indexes.get(key)
+        if index is not None:
+            return index
+        config = hashing_kv.global_config.get("embedding_cache_config", {})
+        path = (
+            os.path.join(working_dir, f"semantic_cache_{hashing_kv.namespace}_{mode}")
+            if working_dir
+            else None
+        )
+        is_new = path is None or not os.path.exists(path + ".json")
+        index = SemanticCacheIndex(
+            path,
+            dim,
+            max_entries=config.get("max_entries", 100_000),
+            search_dtype=config.get("search_dtype", "float32"),
+        )
+        if is_new:
+            mode_cache = await hashing_kv.get_by_id(mode) or {}
+            migrated = {}
+            for args_hash, cache_data in mode_cache.items():
+                if not isinstance(cache_data, dict) or cache_data.get("embedding") is None:
+                    continue
+                cached_quantized = np.frombuffer(
+                    bytes.fromhex(cache_data["embedding"]), dtype=np.uint8
+                ).reshape(cache_data["embedding_shape"])
+                entry_id = semantic_cache_entry_id(mode, args_hash)
+                index.add(
+                    entry_id,
+                    dequantize_embedding(
+                        cached_quantized,
+                        cache_data["embedding_min"],
+                        cache_data["embedding_max"],
+                    ),
+                )
+                migrated[entry_id] = {
+                    "return": cache_data["return"],
+                    "original_prompt": cache_data["original_prompt"],
+                    "mode": mode,
+                }
+            if migrated:
+                await hashing_kv.upsert(migrated)
+                index.flush()
+                logger.info(
+                    f"Semantic cache: migrated {len(migrated)} {mode} entries to the matrix index"
+                )
+        _semantic_cache_indexes[key] = index
+        return index
+
+
+def flush_semantic_cache_indexes():
+    for index in _semantic_cache_indexes.values():
+        index.flush()
+
+
 async def get_best_cached_response(
     hashing_kv,
     current_embedding,
@@ -320,83 +803,62 @@ async def get_best_cached_response(
     llm_func=None,
     original_prompt=None,
 ) -> Union[str, None]:
-    # Get mode-specific cache
-    mode_cache = await hashing_kv.get_by_id(mode)
-    if not mode_cache:
+    index = await get_semantic_cache_index(hashing_kv, mode, len(current_embedding))
+    best_cache_id, best_similarity = index.search(current_embedding, similarity_threshold)
+    if best_cache_id is None or best_similarity <= similarity_threshold:
         return None
 
-    best_similarity = -1
-    best_response = None
-    best_prompt = None
-    best_cache_id = None
-
-    # Only iterate through cache entries for this mode
-    for cache_id, cache_data in mode_cache.items():
-        if cache_data["embedding"] is None:
-            continue
-
-        # Convert cached embedding list to ndarray
-        cached_quantized = np.frombuffer(
-            bytes.fromhex(cache_data["embedding"]), dtype=np.uint8
-        ).reshape(cache_data["embedding_shape"])
-        cached_embedding = dequantize_embedding(
-            cached_quantized,
-            cache_data["embedding_min"],
-            cache_data["embedding_max"],
-        )
-
-        similarity = cosine_similarity(current_embedding, cached_embedding)
-        if similarity > best_similarity:
-            best_similarity = similarity
-            best_response = cache_data["return"]
-            best_prompt = cache_data["original_prompt"]
-            best_cache_id = cache_id
-
-    if best_similarity > similarity_threshold:
-        # If LLM check is enabled and all required parameters are provided
-        if use_llm_check and llm_func and original_prompt and best_prompt:
-            compare_prompt = PROMPTS["similarity_check"].format(
-                original_prompt=original_prompt, cached_prompt=best_prompt
-            )
+    cache_data = await hashing_kv.get_by_id(best_cache_id)
+    if cache_data is None:
+        # payload gone from the KV (dropped or evicted by another process)
+        index.remove(best_cache_id)
+        return None
+    best_response = cache_data["return"]
+    best_prompt = cache_data["original_prompt"]
 
-            try:
-                llm_result = await llm_func(compare_prompt)
-                llm_result = llm_result.strip()
-                llm_similarity = float(llm_result)
-
-                # Replace vector similarity with LLM similarity score
-                best_similarity = llm_similarity
-                if best_similarity < similarity_threshold:
-                    log_data = {
-                        "event": "llm_check_cache_rejected",
-                        "original_question": original_prompt[:100] + "..."
-                        if len(original_prompt) > 100
-                        else original_prompt,
-                        "cached_question": best_prompt[:100] + "..."
-                        if len(best_prompt) > 100
-                        else best_prompt,
-                        "similarity_score": round(best_similarity, 4),
-                        "threshold": similarity_threshold,
-                    }
-                    logger.info(json.dumps(log_data, ensure_ascii=False))
-                    return None
-            except Exception as e:  # Catch all possible exceptions
-                logger.warning(f"LLM similarity check failed: {e}")
-                return None  # Return None directly when LLM check fails
-
-        prompt_display = (
-            best_prompt[:50] + "..." if len(best_prompt) > 50 else best_prompt
+    # If LLM check is enabled and all required parameters are provided
+    if use_llm_check and llm_func and original_prompt and best_prompt:
+        compare_prompt = PROMPTS["similarity_check"].format(
+            original_prompt=original_prompt, cached_prompt=best_prompt
         )
-        log_data = {
-            "event": "cache_hit",
-            "mode": mode,
-            "similarity": round(best_similarity, 4),
-            "cache_id": best_cache_id,
-            "original_prompt": prompt_display,
-        }
-        logger.info(json.dumps(log_data, ensure_ascii=False))
-        return best_response
-    return None
+
+        try:
+            llm_result = await llm_func(compare_prompt)
+            llm_result = llm_result.strip()
+            llm_similarity = float(llm_result)
+
+            # Replace vector similarity with LLM similarity score
+            best_similarity = llm_similarity
+            if best_similarity < similarity_threshold:
+                log_data = {
+                    "event": "llm_check_cache_rejected",
+                    "original_question": original_prompt[:100] + "..."
+                    if len(original_prompt) > 100
+                    else original_prompt,
+                    "cached_question": best_prompt[:100] + "..."
+                    if len(best_prompt) > 100
+                    else best_prompt,
+                    "similarity_score": round(best_similarity, 4),
+                    "threshold": similarity_threshold,
+                }
+                logger.info(json.dumps(log_data, ensure_ascii=False))
+                return None
+        except Exception as e:  # Catch all possible exceptions
+            logger.warning(f"LLM similarity check failed: {e}")
+            return None  # Return None directly when LLM check fails
+
+    prompt_display = (
+        best_prompt[:50] + "..." if len(best_prompt) > 50 else best_prompt
+    )
+    log_data = {
+        "event": "cache_hit",
+        "mode": mode,
+        "similarity": round(best_similarity, 4),
+        "cache_id": best_cache_id,
+        "original_prompt": prompt_display,
+    }
+    logger.info(json.dumps(log_data, ensure_ascii=False))
+    return best_response
 
 
 def cosine_similarity(v1, v2):
@@ -491,19 +953,609 @@ async def save_to_cache(hashing_kv, cache_data: CacheData):
     if hashing_kv is None:
         return
 
+    if cache_data.quantized is not None:
+        # Semantic cache: vector in the matrix index, payload under its own key
+        embedding = dequantize_embedding(
+            cache_data.quantized, cache_data.min_val, cache_data.max_val
+        )
+        index = await get_semantic_cache_index(
+            hashing_kv, cache_data.mode, len(embedding)
+        )
+        entry_id = semantic_cache_entry_id(cache_data.mode, cache_data.args_hash)
+        await hashing_kv.upsert(
+            {
+                entry_id: {
+                    "return": cache_data.content,
+                    "original_prompt": cache_data.prompt,
+                    "mode": cache_data.mode,
+                }
+            }
+        )
+        evicted = index.add(entry_id, embedding)
+        if evicted is not None:
+            await hashing_kv.delete([evicted])
+        return
+
     mode_cache = await hashing_kv.get_by_id(cache_data.mode) or {}
 
     mode_cache[cache_data.args_hash] = {
         "return": cache_data.content,
-        "embedding": cache_data.quantized.tobytes().hex()
-        if cache_data.quantized is not None
-        else None,
-        "embedding_shape": cache_data.quantized.shape
-        if cache_data.quantized is not None
-        else None,
-        "embedding_min": cache_data.min_val,
-        "embedding_max": cache_data.max_val,
         "original_prompt": cache_data.prompt,
     }
 
-    await hashing_kv.upsert({cache_data.mode: mode_cache})
\ No newline at end of file
+    await hashing_kv.upsert({cache_data.mode: mode_cache})
+
+
+# handed to callers sharing a cancelled in-flight call, they retry on their own
+_RETRY_INFLIGHT = object()
+
+
+class CompletionCache:
+    """Content-addressed cache in front of an LLM completion function.
+
+    Entries are stored through a BaseKVStorage under "llm-<hash>" keys, the hash
+    covering the model (model_name, see llm_func_identity), system prompt,
+    history, prompt and call kwargs. Only calls made inside a cache_completions()
+    block go through the cache. Expired entries are dropped on read and by
+    prune(), which also keeps at most max_entries entries; recent entries are
+    kept in an in-process LRU tier, and identical concurrent calls share a
+    single LLM request.
+    """
+
+    def __init__(
+        self,
+        kv_storage,
+        model_name: str = "",
+        ttl: Optional[float] = None,
+        hot_size: int = 1024,
+        max_entries: Optional[int] = None,
+        prune_interval: float = 3600.0,
+    ):
+        self.kv = kv_storage
+        self.model_name = model_name
+        self.ttl = ttl
+        self.hot_size = hot_size
+        self.max_entries = max_entries
+        self.prune_interval = prune_interval
+        self._last_prune: Optional[float] = None
+        self._hot: OrderedDict = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.stats = {
+            "hot_hits": 0, "kv_hits": 0, "misses": 0, "expired": 0, "writes": 0, "pruned": 0, "bypassed": 0
+        }
+
+    def make_key(self, prompt, system_prompt=None, history_messages=None, **kwargs) -> str:
+        relevant = sorted(
+            (k, v) for k, v in kwargs.items() if k not in ("hashing_kv", "stream")
+        )
+        return "llm-" + compute_args_hash(
+            self.model_name, system_prompt, history_messages or [], prompt, relevant
+        )
+
+    def _remember(self, key: str, entry: dict):
+        self._hot[key] = entry
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def _is_expired(self, entry: dict) -> bool:
+        expires_at = entry.get("expires_at")
+        return expires_at is not None and expires_at <= time.time()
+
+    async def get(self, key: str) -> Union[str, None]:
+        entry = self._hot.get(key)
+        if entry is not None and not self._is_expired(entry):
+            self._hot.move_to_end(key)
+            self.stats["hot_hits"] += 1
+            return entry["return"]
+        self._hot.pop(key, None)
+
+        entry = await self.kv.get_by_id(key)
+        if entry is not None and self._is_expired(entry):
+            self.stats["expired"] += 1
+            await self.kv.delete([key])
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["kv_hits"] += 1
+        self._remember(key, entry)
+        return entry["return"]
+
+    async def set(self, key: str, content: str):
+        now = time.time()
+        entry = {
+            "return": content,
+            "model": self.model_name,
+            "created_at": now,
+            "expires_at": now + self.ttl if self.ttl else None,
+        }
+        # JsonKVStorage.upsert never overwrites an existing key
+        await self.kv.delete([key])
+        await self.kv.upsert({key: entry})
+        self._remember(key, entry)
+        self.stats["writes"] += 1
+
+    async def prune(self, force: bool = False) -> int:
+        """Delete expired entries, then the oldest ones beyond max_entries.
+        Runs at most once per prune_interval seconds unless forced."""
+        now = time.monotonic()
+        if not force and self._last_prune is not None and now - self._last_prune < self.prune_interval:
+            return 0
+        self._last_prune = now
+        keys = [key for key in await self.kv.all_keys() if key.startswith("llm-")]
+        entries = await self.kv.get_by_ids(keys)
+        expired, kept = [], []
+        for key, entry in zip(keys, entries):
+            if entry is None:
+                continue
+            if self._is_expired(entry):
+                expired.append(key)
+            else:
+                kept.append((entry.get("created_at") or 0, key))
+        if self.max_entries is not None and len(kept) > self.max_entries:
+            kept.sort()
+            expired.extend(key for _, key in kept[: len(kept) - self.max_entries])
+        if expired:
+            await self.kv.delete(expired)
+            for key in expired:
+                self._hot.pop(key, None)
+        self.stats["pruned"] += len(expired)
+        return len(expired)
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hot_hits"] + self.stats["kv_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hot_size": len(self._hot),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def wrap(self, func: callable) -> callable:
+        """Wrap an async completion function; calls outside cache_completions()
+        and streamed calls bypass the cache"""
+
+        @wraps(func)
+        async def cached_func(prompt, system_prompt=None, history_messages=[], **kwargs):
+            if kwargs.get("stream") or not _cache_completions.get():
+                self.stats["bypassed"] += 1
+                return await func(
+                    prompt, system_prompt=system_prompt, history_messages=history_messages, **kwargs
+                )
+            key = self.make_key(prompt, system_prompt, history_messages, **kwargs)
+            while True:
+                content = await self.get(key)
+                if content is not None:
+                    return content
+
+                pending = self._inflight.get(key)
+                if pending is None:
+                    break
+                content = await asyncio.shield(pending)
+                # the owner was cancelled: its cancellation is not ours, issue the call again
+                if content is not _RETRY_INFLIGHT:
+                    return content
+
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            try:
+                content = await func(
+                    prompt, system_prompt=system_prompt, history_messages=history_messages, **kwargs
+                )
+                if isinstance(content, str):
+                    await self.set(key, content)
+                future.set_result(content)
+                return content
+            except asyncio.CancelledError:
+                self._inflight.pop(key, None)
+                future.set_result(_RETRY_INFLIGHT)
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                # mark the exception as retrieved when no concurrent caller is waiting
+                future.exception()
+                raise
+            finally:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+        cached_func.completion_cache = self
+        return cached_func
+
+
+# SQLite connections of the embedding caches, shared per file by the caches
+# of the process (LightRAG pool instances): path -> [connection, lock, users]
+_sqlite_connections: dict[str, list] = {}
+_sqlite_connections_lock = threading.Lock()
+
+
+def _open_sqlite(path: str) -> tuple[sqlite3.Connection, threading.Lock]:
+    """Shared connection to a SQLite file, in WAL mode with a busy timeout so
+    that other processes (API, ingestion worker) can use the same file"""
+    if path == ":memory:":
+        return sqlite3.connect(path, check_same_thread=False), threading.Lock()
+    with _sqlite_connections_lock:
+        shared = _sqlite_connections.get(path)
+        if shared is None:
+            db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA busy_timeout=30000")
+            shared = _sqlite_connections[path] = [db, threading.Lock(), 0]
+        shared[2] += 1
+        return shared[0], shared[1]
+
+
+def _close_sqlite(path: str, db: sqlite3.Connection):
+    """Release a connection from _open_sqlite, closed with its last user"""
+    with _sqlite_connections_lock:
+        shared = _sqlite_connections.get(path)
+        if shared is None or shared[0] is not db:
+            db.close()
+            return
+        shared[2] -= 1
+        if shared[2] <= 0:
+            del _sqlite_connections[path]
+            db.close()
+
+
+class EmbeddingCache:
+    """Content-addressed cache in front of an embedding function.
+
+    Vectors are keyed by (model, md5 of the text) and stored as float16 blobs
+    in a SQLite file, with the most recent ones kept in an in-process LRU tier.
+    Caches of the process on the same file share one connection (WAL mode,
+    busy timeout), released by close().
+    Each call embeds only its cache misses, deduplicated, in a single provider
+    call. Returned vectors are always the float16-rounded values, so a text
+    gets the same vector whether it was a hit or a miss.
+    """
+
+    def __init__(self, path: Optional[str], model_name: str, hot_size: int = 10_000):
+        self.model_name = model_name
+        self.hot_size = hot_size
+        self._hot: OrderedDict = OrderedDict()
+        path = path or ":memory:"
+        self.path = path if path == ":memory:" else os.path.abspath(path)
+        self._db, self._lock = _open_sqlite(self.path)
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+            )
+            self._db.commit()
+        self.stats = {"hot_hits": 0, "db_hits": 0, "misses": 0, "provider_calls": 0}
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return md5(text.encode()).hexdigest()
+
+    def close(self):
+        """Release the SQLite connection (idempotent)"""
+        if self._db is not None:
+            db, self._db = self._db, None
+            _close_sqlite(self.path, db)
+
+    def _remember(self, text_hash: str, vector: np.ndarray):
+        self._hot[text_hash] = vector
+        self._hot.move_to_end(text_hash)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def _read(self, hashes: list[str]) -> dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            # SQLite caps bound parameters, query in chunks
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i : i + 500]
+                rows = self._db.execute(
+                    "SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN "
+                    f"({','.join('?' * len(chunk))})",
+                    [self.model_name, *chunk],
+                ).fetchall()
+                found.update(
+                    {h: np.frombuffer(blob, dtype=np.float16) for h, blob in rows}
+                )
+        return found
+
+    def _write(self, vectors: dict[str, np.ndarray]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(self.model_name, h, v.tobytes()) for h, v in vectors.items()],
+            )
+            self._db.commit()
+
+    async def embed(self, texts: list[str], func: callable) -> np.ndarray:
+        hashes = [self.text_hash(t) for t in texts]
+        vectors: dict[str, np.ndarray] = {}
+        for h in hashes:
+            if h in self._hot and h not in vectors:
+                self._hot.move_to_end(h)
+                vectors[h] = self._hot[h]
+                self.stats["hot_hits"] += 1
+
+        cold = list(dict.fromkeys(h for h in hashes if h not in vectors))
+        if cold:
+            stored = await asyncio.to_thread(self._read, cold)
+            self.stats["db_hits"] += len(stored)
+            for h, v in stored.items():
+                self._remember(h, v)
+            vectors.update(stored)
+
+        misses = {h: t for h, t in zip(hashes, texts) if h not in vectors}
+        if misses:
+            self.stats["misses"] += len(misses)
+            self.stats["provider_calls"] += 1
+            fresh = np.asarray(await func(list(misses.values())), dtype=np.float16)
+            fresh_vectors = dict(zip(misses, fresh))
+            await asyncio.to_thread(self._write, fresh_vectors)
+            for h, v in fresh_vectors.items():
+                self._remember(h, v)
+            vectors.update(fresh_vectors)
+
+        return np.stack([vectors[h] for h in hashes]).astype(np.float32)
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hot_hits"] + self.stats["db_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hot_size": len(self._hot),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def wrap(self, embedding_func: "EmbeddingFunc", func: Optional[callable] = None) -> "EmbeddingFunc":
+        """Cached EmbeddingFunc with the same attributes; misses go to func
+        (defaults to embedding_func itself, e.g. pass a rate-limited variant)"""
+        provider = func or embedding_func
+
+        async def cached_embedding(texts: list[str]) -> np.ndarray:
+            if not texts:
+                return await provider(texts)
+            return await self.embed(list(texts), provider)
+
+        cached_embedding.embedding_cache = self
+        wrapped = EmbeddingFunc(
+            embedding_dim=embedding_func.embedding_dim,
+            max_token_size=embedding_func.max_token_size,
+            func=cached_embedding,
+        )
+        wrapped.packs_batches = getattr(provider, "packs_batches", False)
+        return wrapped
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for HTTP 429 / RateLimitError, also once wrapped by tenacity retries"""
+    last_attempt = getattr(error, "last_attempt", None)
+    if last_attempt is not None and last_attempt.failed:
+        error = last_attempt.exception()
+    return (
+        getattr(error, "status_code", None) == 429
+        or getattr(getattr(error, "response", None), "status_code", None) == 429
+        or type(error).__name__ == "RateLimitError"
+    )
+
+
+# Connection / timeout errors of the openai, httpx and aiohttp clients, matched by
+# class name (along the MRO) so that none of them has to be imported here
+CONNECTION_ERROR_NAMES = (
+    "APIConnectionError",
+    "APITimeoutError",
+    "TransportError",
+    "TimeoutException",
+    "ClientConnectionError",
+    "ServerTimeoutError",
+)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """True for errors worth retrying elsewhere: rate limits, connection
+    failures, timeouts and HTTP 5xx, also once wrapped by tenacity retries"""
+    last_attempt = getattr(error, "last_attempt", None)
+    if last_attempt is not None and last_attempt.failed:
+        error = last_attempt.exception()
+    if is_rate_limit_error(error):
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    if any(cls.__name__ in CONNECTION_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "status_code", None) or getattr(
+        getattr(error, "response", None), "status_code", None
+    )
+    return isinstance(status, int) and status >= 500
+
+
+# Messages of 400 / 413 responses refusing a request for its number of inputs
+BATCH_SIZE_ERROR_MARKERS = (
+    "too many inputs",
+    "too many input",
+    "batch size",
+    "maximum number of inputs",
+    "max_batch_size",
+)
+
+
+def is_batch_size_error(error: BaseException) -> bool:
+    """True for HTTP 413, or a 400 whose message complains about the number of inputs"""
+    last_attempt = getattr(error, "last_attempt", None)
+    if last_attempt is not None and last_attempt.failed:
+        error = last_attempt.exception()
+    status = getattr(error, "status_code", None) or getattr(
+        getattr(error, "response", None), "status_code", None
+    )
+    if status == 413:
+        return True
+    message = str(error).lower()
+    return status == 400 and any(marker in message for marker in BATCH_SIZE_ERROR_MARKERS)
+
+
+class EmbeddingBatcher:
+    """Token-aware batching with bounded concurrency in front of an embedding function.
+
+    Inputs longer than max_token_size tokens, counted with the embedding
+    model's tiktoken encoding, are cut to their first max_token_size tokens.
+    Texts are packed in order into requests of at most max_tokens_per_request
+    tokens and item_limit texts. item_limit starts at max_items_per_request;
+    on a rate-limit error it is halved, the failed request is split
+    accordingly and retried after an exponential backoff, then it grows back
+    by a tenth after each successful request. A request refused for its
+    number of inputs (413, or 400 "too many inputs") is split the same way
+    without backoff, and the halved limit becomes the new ceiling. Requests
+    are admitted by limiter (private unless a shared one is given), which
+    charges their token count to its budget.
+    """
+
+    def __init__(
+        self,
+        func: callable,
+        max_token_size: int = 8192,
+        max_tokens_per_request: int = 300_000,
+        max_items_per_request: int = 2048,
+        max_concurrency: int = 16,
+        max_retries: int = 6,
+        backoff: float = 1.0,
+        tiktoken_encoding: str = "cl100k_base",
+        encode: Optional[callable] = None,
+        decode: Optional[callable] = None,
+        limiter: Optional[PriorityLimiter] = None,
+    ):
+        self.func = func
+        self.max_token_size = max_token_size
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_items_per_request = max_items_per_request
+        self.item_limit = max_items_per_request
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.tiktoken_encoding = tiktoken_encoding
+        self._encode = encode or (lambda text: get_tiktoken_encoding(self.tiktoken_encoding).encode(text))
+        self._decode = decode or (lambda tokens: get_tiktoken_encoding(self.tiktoken_encoding).decode(tokens))
+        self.limiter = limiter or PriorityLimiter(max_concurrency)
+        self.stats = {
+            "requests": 0,
+            "texts": 0,
+            "tokens": 0,
+            "truncated": 0,
+            "rate_limited": 0,
+            "too_many_inputs": 0,
+        }
+
+    def truncate(self, text: str) -> tuple[str, int]:
+        tokens = self._encode(text)
+        if len(tokens) <= self.max_token_size:
+            return text, len(tokens)
+        self.stats["truncated"] += 1
+        return self._decode(tokens[: self.max_token_size]), self.max_token_size
+
+    def pack(self, token_counts: list[int]) -> list[tuple[int, int]]:
+        """(start, end) slices of consecutive texts within the request limits"""
+        slices, start, tokens = [], 0, 0
+        for i, count in enumerate(token_counts):
+            if i > start and (
+                tokens + count > self.max_tokens_per_request or i - start >= self.item_limit
+            ):
+                slices.append((start, i))
+                start, tokens = i, 0
+            tokens += count
+        if start < len(token_counts):
+            slices.append((start, len(token_counts)))
+        return slices
+
+    async def _request(self, texts: list[str], token_counts: list[int], attempt: int = 0) -> np.ndarray:
+        oversized = None
+        async with self.limiter.slot(cost=sum(token_counts)):
+            try:
+                result = await self.func(texts)
+            except Exception as e:
+                if len(texts) > 1 and is_batch_size_error(e):
+                    oversized = e
+                elif not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                else:
+                    rate_limited = e
+            else:
+                self.item_limit = min(
+                    self.max_items_per_request, self.item_limit + max(1, self.item_limit // 10)
+                )
+                self.stats["requests"] += 1
+                self.stats["texts"] += len(texts)
+                self.stats["tokens"] += sum(token_counts)
+                return np.asarray(result)
+
+        # split outside the slot: the halves need slots of their own
+        if oversized is not None:
+            return await self._split_oversized(texts, token_counts, oversized, attempt)
+        self.stats["rate_limited"] += 1
+        # concurrent requests rejected together only halve the limit once
+        self.item_limit = max(1, min(self.item_limit, len(texts) // 2))
+        logger.warning(
+            f"Embedding rate limited ({type(rate_limited).__name__}), "
+            f"retrying with at most {self.item_limit} texts per request"
+        )
+        await asyncio.sleep(self.backoff * 2**attempt)
+        parts = [
+            self._request(texts[i : i + self.item_limit], token_counts[i : i + self.item_limit], attempt + 1)
+            for i in range(0, len(texts), self.item_limit)
+        ]
+        return np.concatenate(await asyncio.gather(*parts))
+
+    async def _split_oversized(
+        self, texts: list[str], token_counts: list[int], error: Exception, attempt: int
+    ) -> np.ndarray:
+        """Retry a request refused for its number of inputs as two halves"""
+        self.stats["too_many_inputs"] += 1
+        half = (len(texts) + 1) // 2
+        # a hard provider limit: never grow back above it
+        self.max_items_per_request = min(self.max_items_per_request, half)
+        self.item_limit = min(self.item_limit, half)
+        logger.warning(
+            f"Embedding request of {len(texts)} texts refused ({error}), "
+            f"retrying with at most {self.max_items_per_request} texts per request"
+        )
+        parts = [
+            self._request(texts[i : i + half], token_counts[i : i + half], attempt)
+            for i in range(0, len(texts), half)
+        ]
+        return np.concatenate(await asyncio.gather(*parts))
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        truncated = [self.truncate(t) for t in texts]
+        texts = [t for t, _ in truncated]
+        token_counts = [n for _, n in truncated]
+        results = await asyncio.gather(
+            *[
+                self._request(texts[start:end], token_counts[start:end])
+                for start, end in self.pack(token_counts)
+            ]
+        )
+        return np.concatenate(results)
+
+    def wrap(self, embedding_func: "EmbeddingFunc") -> "EmbeddingFunc":
+        """EmbeddingFunc with the same attributes; callers can pass every text at once"""
+
+        async def batched_embedding(texts: list[str]) -> np.ndarray:
+            if not texts:
+                return await self.func(texts)
+            return await self.embed(list(texts))
+
+        batched_embedding.embedding_batcher = self
+        wrapped = EmbeddingFunc(
+            embedding_dim=embedding_func.embedding_dim,
+            max_token_size=embedding_func.max_token_size,
+            func=batched_embedding,
+        )
+        wrapped.packs_batches = True
+        return wrapped
+
+
+def embedding_model_name(embedding_func: "EmbeddingFunc") -> str:
+    """Cache namespace for an EmbeddingFunc: function name, bound model and dimension"""
+    func = embedding_func.func
+    keywords = getattr(func, "keywords", None) or {}
+    name = getattr(func, "__name__", None) or getattr(
+        getattr(func, "func", None), "__name__", repr(func)
+    )
+    model = keywords.get("model") or keywords.get("embed_model") or ""
+    return f"{name}:{model}:{embedding_func.embedding_dim}"
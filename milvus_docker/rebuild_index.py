@@ -0,0 +1,73 @@
+"""
+Reconstruit l'index du champ vector des collections LightRAG (entities,
+relationships, chunks) avec le type et les paramètres donnés, par exemple
+après un changement de vector_db_storage_cls_kwargs["index"] : les
+collections existantes gardent l'index de leur création.
+
+    MILVUS_URI=http://localhost:19530 MILVUS_DB_NAME=lightrag \\
+    python milvus_docker/rebuild_index.py --index-type HNSW --params '{"M": 32, "efConstruction": 256}'
+
+    # Un seul namespace, sans rien modifier (affiche l'index actuel)
+    python milvus_docker/rebuild_index.py --namespaces chunks --index-type IVF_SQ8 --dry-run
+
+La collection est libérée pendant la reconstruction : les requêtes échouent
+jusqu'au rechargement.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.kg.milvus_impl import INDEX_DEFAULTS, MilvusVectorDBStorage
+
+NAMESPACES = ["entities", "relationships", "chunks"]
+
+
+async def rebuild(namespace: str, index: dict, dry_run: bool):
+    storage = MilvusVectorDBStorage(
+        namespace=namespace,
+        global_config={
+            "working_dir": str(Path(__file__).parent),
+            "embedding_batch_num": 32,
+            "vector_db_storage_cls_kwargs": {"index": {namespace: index}},
+        },
+        embedding_func=None,
+    )
+    try:
+        if not storage._client.has_collection(namespace):
+            print(f"⚠️  {namespace} : collection absente, ignorée")
+            return
+        # La collection existe : inutile de connaître la dimension des vecteurs
+        storage._collection_ready = True
+        current = await storage.describe_index()
+        config = storage.index_config
+        print(f"📋 {namespace} : index actuel {current}")
+        print(f"🎯 {namespace} : index cible {config.index_type} {config.params}")
+        if not dry_run:
+            await storage.rebuild_index()
+            print(f"✅ {namespace} : index reconstruit")
+    finally:
+        await storage.close()
+
+
+async def main(args):
+    index = {
+        "index_type": args.index_type,
+        "metric_type": args.metric_type,
+        "params": json.loads(args.params),
+    }
+    for namespace in args.namespaces:
+        await rebuild(namespace, index, args.dry_run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--namespaces", nargs="+", default=NAMESPACES)
+    parser.add_argument("--index-type", choices=list(INDEX_DEFAULTS), default="HNSW")
+    parser.add_argument("--metric-type", default="COSINE")
+    parser.add_argument("--params", default="{}", help="paramètres de construction (JSON)")
+    parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,152 @@
+"""
+Migration de l'identité des nœuds : un label dynamique par entité
+(MERGE (n:`Nom`)) -> label commun Entity + propriété entity_name indexée.
+
+Étapes :
+    1. détection des noms en double (la contrainte d'unicité échouerait)
+    2. ajout du label Entity et de entity_name par lots (label conservé,
+       sauf --drop-labels, ce qui permet de revenir au mode "label")
+    3. création des contraintes et index de Neo4JStorage.SCHEMA_STATEMENTS
+
+Une fois la migration faite, passer NEO4J_NODE_IDENTITY=property.
+
+Usage :
+    python neo4j_microk8s/migrate_node_identity.py --dry-run
+    python neo4j_microk8s/migrate_node_identity.py --batch-size 5000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.kg.neo4j_impl import Neo4JStorage
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Charger les variables d'environnement
+load_dotenv()
+
+ENTITY_LABEL = Neo4JStorage.ENTITY_LABEL
+
+# Nœuds créés par les catégorisations (label fixe, pas un nom d'entité)
+RESERVED_LABELS = ["ActivityCategory", "City", "Date"]
+
+CANDIDATES = f"""
+MATCH (n)
+WHERE NOT n:{ENTITY_LABEL}
+  AND n.entity_type IS NOT NULL
+  AND NOT any(l IN labels(n) WHERE l IN $reserved)
+"""
+
+DUPLICATES_QUERY = CANDIDATES + f"""
+WITH head(labels(n)) AS name, count(n) AS nodes
+WHERE name IS NOT NULL
+OPTIONAL MATCH (existing:{ENTITY_LABEL} {{entity_name: name}})
+WITH name, nodes + count(existing) AS total
+WHERE total > 1
+RETURN name, total
+ORDER BY total DESC
+"""
+
+MIGRATE_QUERY = CANDIDATES + f"""
+WITH n, head(labels(n)) AS name
+LIMIT $batch_size
+SET n:{ENTITY_LABEL}, n.entity_name = name
+RETURN count(n) AS migrated
+"""
+
+DROP_LABELS_QUERY = f"""
+MATCH (n:{ENTITY_LABEL})
+WHERE n.entity_name IS NOT NULL AND n.entity_name IN labels(n)
+WITH n LIMIT $batch_size
+CALL apoc.create.removeLabels(n, [n.entity_name]) YIELD node
+RETURN count(node) AS migrated
+"""
+
+
+def run_batches(session, query, batch_size):
+    """Répète une requête de migration par lots jusqu'à épuisement"""
+    total = 0
+    while True:
+        migrated = session.run(
+            query, reserved=RESERVED_LABELS, batch_size=batch_size
+        ).single()["migrated"]
+        total += migrated
+        if migrated:
+            logger.info(f"   ... {total} nœuds traités")
+        if migrated < batch_size:
+            return total
+
+
+def migrate(driver, batch_size, dry_run=False, drop_labels=False, force=False):
+    with driver.session() as session:
+        pending = session.run(
+            CANDIDATES + "RETURN count(n) AS pending", reserved=RESERVED_LABELS
+        ).single()["pending"]
+        logger.info(f"🔎 {pending} nœuds à migrer vers :{ENTITY_LABEL}")
+
+        duplicates = session.run(DUPLICATES_QUERY, reserved=RESERVED_LABELS).data()
+        for duplicate in duplicates[:20]:
+            logger.warning(f"⚠️ Nom d'entité en double : {duplicate['name']} ({duplicate['total']} nœuds)")
+        if duplicates and not force:
+            logger.error(
+                f"❌ {len(duplicates)} noms en double : fusionner les nœuds avant la "
+                "migration (ou --force, la contrainte d'unicité ne sera pas créée)"
+            )
+            return False
+        if dry_run:
+            return True
+
+        start = time.perf_counter()
+        migrated = run_batches(session, MIGRATE_QUERY, batch_size)
+        logger.info(f"✅ {migrated} nœuds migrés en {time.perf_counter() - start:.1f}s")
+
+        if drop_labels:
+            dropped = run_batches(session, DROP_LABELS_QUERY, batch_size)
+            logger.info(f"🧹 Label dynamique supprimé sur {dropped} nœuds")
+
+        for statement in Neo4JStorage.SCHEMA_STATEMENTS:
+            try:
+                session.run(statement).consume()
+                logger.info(f"🗂️ {statement}")
+            except Exception as e:
+                logger.error(f"❌ Échec de {statement} : {e}")
+        session.run("CALL db.awaitIndexes(600)").consume()
+    logger.info("🏁 Migration terminée : définir NEO4J_NODE_IDENTITY=property")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=os.getenv("NEO4J_URI"))
+    parser.add_argument("--username", default=os.getenv("NEO4J_USERNAME"))
+    parser.add_argument("--password", default=os.getenv("NEO4J_PASSWORD"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Compte les nœuds et les doublons sans rien modifier")
+    parser.add_argument("--drop-labels", action="store_true", help="Supprime les labels dynamiques après migration (APOC)")
+    parser.add_argument("--force", action="store_true", help="Migre malgré les noms en double")
+    args = parser.parse_args()
+
+    if not all([args.uri, args.username, args.password]):
+        raise ValueError("Informations de connexion Neo4j manquantes. Vérifiez vos variables d'environnement.")
+
+    driver = GraphDatabase.driver(args.uri, auth=(args.username, args.password))
+    try:
+        ok = migrate(driver, args.batch_size, args.dry_run, args.drop_labels, args.force)
+    finally:
+        driver.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
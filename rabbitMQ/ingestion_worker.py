@@ -0,0 +1,200 @@
+"""
+Worker d'ingestion RabbitMQ asynchrone (aio_pika).
+
+Remplace rabbitmq_consumer.py (un sous-processus Python par message) et le
+listener HTTP : un seul processus garde une instance LightRAG chaude et traite
+jusqu'à INGESTION_CONCURRENCY messages en parallèle.
+
+- ack uniquement après l'insertion (stockages commités par ainsert)
+- en cas d'échec, le message est republié avec l'en-tête x-retry-count ;
+  au-delà de INGESTION_MAX_RETRIES, ou s'il n'est pas un JSON valide, il part
+  dans la dead-letter queue "<queue>.dlq"
+- le délai par message (INGESTION_MESSAGE_TIMEOUT) est appliqué par
+  l'IngestionBatcher, qui annule l'insertion avant l'échec du message : la
+  republication ne tourne pas en parallèle de l'insertion d'origine
+- SIGTERM / SIGINT : arrêt de la consommation, fin des messages en cours,
+  fermeture des clients LightRAG puis de la connexion
+- RABBITMQ_HOST, RABBITMQ_USER et RABBITMQ_PASSWORD sont obligatoires
+
+Usage :
+    python rabbitMQ/ingestion_worker.py
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import traceback
+from pathlib import Path
+from typing import Optional
+
+import aio_pika
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s: %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+RETRY_HEADER = "x-retry-count"
+
+
+def ingestion_worker_config() -> dict:
+    """Configuration lue dans l'environnement (accès RabbitMQ sans valeur par défaut)"""
+    prefetch = int(os.getenv("INGESTION_PREFETCH", 8))
+    return {
+        "host": os.getenv("RABBITMQ_HOST"),
+        "port": int(os.getenv("RABBITMQ_PORT", 5672)),
+        "user": os.getenv("RABBITMQ_USER"),
+        "password": os.getenv("RABBITMQ_PASSWORD"),
+        "queue": os.getenv("RABBITMQ_QUEUE", "queue_vinh_test"),
+        "prefetch": prefetch,
+        "concurrency": int(os.getenv("INGESTION_CONCURRENCY", prefetch)),
+        "max_retries": int(os.getenv("INGESTION_MAX_RETRIES", 3)),
+        "shutdown_timeout": float(os.getenv("INGESTION_SHUTDOWN_TIMEOUT", 120)),
+    }
+
+
+class IngestionWorker:
+    """
+    Consomme la queue d'ingestion et délègue chaque message à un processeur
+    exposant `async process_message(payload)` (MessageProcessor de l'API)
+    """
+
+    def __init__(self, processor, config: Optional[dict] = None):
+        self.processor = processor
+        self.config = {**ingestion_worker_config(), **(config or {})}
+        self.dead_letter_queue = f"{self.config['queue']}.dlq"
+        self.stats = {"acked": 0, "retried": 0, "dead_lettered": 0}
+        self._semaphore = asyncio.Semaphore(self.config["concurrency"])
+        self._in_flight: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+        self._connection = None
+        self._channel = None
+
+    async def publish(self, routing_key: str, body: bytes, headers: dict):
+        await self._channel.default_exchange.publish(
+            aio_pika.Message(
+                body,
+                headers=headers,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=routing_key,
+        )
+
+    async def handle(self, message):
+        """
+        Traite un message (body, headers, ack()) : ack après succès,
+        republication ou dead-letter après échec
+        """
+        async with self._semaphore:
+            headers = dict(message.headers or {})
+            retries = int(headers.get(RETRY_HEADER, 0))
+            try:
+                payload = json.loads(message.body)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                await self._dead_letter(message, headers, f"JSON invalide : {e}")
+                return
+
+            try:
+                await self.processor.process_message(payload)
+            except Exception as e:
+                logger.error(f"❌ Échec du traitement ({payload.get('type', 'activity')}) : {e}")
+                logger.debug(traceback.format_exc())
+                if retries >= self.config["max_retries"]:
+                    await self._dead_letter(message, headers, repr(e))
+                else:
+                    await self.publish(
+                        self.config["queue"], message.body, {**headers, RETRY_HEADER: retries + 1}
+                    )
+                    await message.ack()
+                    self.stats["retried"] += 1
+                return
+
+            await message.ack()
+            self.stats["acked"] += 1
+
+    async def _dead_letter(self, message, headers: dict, reason: str):
+        logger.warning(f"☠️ Message envoyé dans {self.dead_letter_queue} : {reason}")
+        await self.publish(
+            self.dead_letter_queue, message.body, {**headers, "x-death-reason": reason}
+        )
+        await message.ack()
+        self.stats["dead_lettered"] += 1
+
+    async def on_message(self, message):
+        task = asyncio.current_task()
+        self._in_flight.add(task)
+        try:
+            await self.handle(message)
+        finally:
+            self._in_flight.discard(task)
+
+    async def run(self):
+        config = self.config
+        missing = [
+            f"RABBITMQ_{key.upper()}" for key in ("host", "user", "password") if not config.get(key)
+        ]
+        if missing:
+            raise RuntimeError(f"Variables d'environnement manquantes : {', '.join(missing)}")
+        self._connection = await aio_pika.connect_robust(
+            host=config["host"],
+            port=config["port"],
+            login=config["user"],
+            password=config["password"],
+        )
+        self._channel = await self._connection.channel(publisher_confirms=True)
+        await self._channel.set_qos(prefetch_count=config["prefetch"])
+        queue = await self._channel.declare_queue(config["queue"], durable=True)
+        await self._channel.declare_queue(self.dead_letter_queue, durable=True)
+        consumer_tag = await queue.consume(self.on_message)
+        logger.info(
+            f"🚀 Worker d'ingestion à l'écoute sur '{config['queue']}' "
+            f"(prefetch={config['prefetch']}, concurrence={config['concurrency']})"
+        )
+
+        await self._stopping.wait()
+
+        logger.info(f"🛑 Arrêt demandé, {len(self._in_flight)} messages en cours")
+        await queue.cancel(consumer_tag)
+        if self._in_flight:
+            # Les messages non terminés restent non acquittés : redistribués par le broker
+            await asyncio.wait(set(self._in_flight), timeout=config["shutdown_timeout"])
+        await self._connection.close()
+        logger.info(f"✅ Worker arrêté : {self.stats}")
+
+    def stop(self):
+        self._stopping.set()
+
+
+async def main():
+    from api.lightrag_insert import message_processor
+    from lightrag.llm import aclose_openai_clients
+    from lightrag.kg.mongo_impl import aclose_mongo_clients
+
+    if message_processor.rag is None:
+        raise RuntimeError("LightRAG n'a pas pu être initialisé")
+
+    await message_processor.rag.ainitialize()
+    worker = IngestionWorker(message_processor)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await message_processor.batcher.close()
+        await message_processor.rag.aclose()
+        await aclose_openai_clients()
+        await aclose_mongo_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,144 @@
+"""
+Benchmark : écritures Neo4j de l'étape de fusion de extract_entities,
+ancien chemin unitaire (get/upsert par entité et par relation, puis seconde
+passe entity_id/relation_id) contre la fusion groupée _merge_then_upsert_graph.
+
+À lancer contre un Neo4j local (neo4j_microk8s/docker-compose.yml) :
+    NEO4J_URI=bolt://localhost:7687 NEO4J_USERNAME=neo4j NEO4J_PASSWORD=... \\
+    NEO4J_RESOLVER= python tests/bench_bulk_upsert.py --chunks 1 5 20 50
+
+ATTENTION : la base est vidée entre chaque mesure.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from neo4j import AsyncSession
+
+from lightrag.kg.neo4j_impl import Neo4JStorage
+from lightrag.operate import _merge_then_upsert_graph
+from lightrag.utils import compute_mdhash_id
+
+GLOBAL_CONFIG = {
+    "llm_model_func": None,
+    "llm_model_max_token_size": 32768,
+    "tiktoken_model_name": "gpt-4o-mini",
+    "entity_summary_to_max_tokens": 500,
+    "addon_params": {},
+}
+
+COUNTS = defaultdict(int)
+
+
+def instrument_session():
+    """Compte les requêtes et transactions d'écriture envoyées par le driver"""
+    original_run = AsyncSession.run
+    original_execute_write = AsyncSession.execute_write
+
+    async def run(self, *args, **kwargs):
+        COUNTS["queries"] += 1
+        return await original_run(self, *args, **kwargs)
+
+    async def execute_write(self, *args, **kwargs):
+        COUNTS["write_transactions"] += 1
+        return await original_execute_write(self, *args, **kwargs)
+
+    AsyncSession.run = run
+    AsyncSession.execute_write = execute_write
+
+
+def synthetic_extraction(chunk_count: int, entities_per_chunk: int = 8):
+    """Résultat d'extraction type d'une fiche activité, découpée en chunks"""
+    maybe_nodes = defaultdict(list)
+    maybe_edges = defaultdict(list)
+    for c in range(chunk_count):
+        chunk_key = f"chunk-{c}"
+        activity = f"bench_activity_{c // 4}"
+        maybe_nodes[activity].append(
+            dict(entity_name=activity, entity_type="activity", description=f"activité {c}", source_id=chunk_key)
+        )
+        for e in range(entities_per_chunk):
+            name = f"bench_point_{c}_{e}"
+            maybe_nodes[name].append(
+                dict(entity_name=name, entity_type="positive_point", description=f"point {e}", source_id=chunk_key)
+            )
+            maybe_edges[tuple(sorted((activity, name)))].append(
+                dict(src_id=activity, tgt_id=name, description="a", keywords="k", weight=1.0, source_id=chunk_key)
+            )
+        city = f"bench_city_{c % 3}"
+        maybe_nodes[city].append(
+            dict(entity_name=city, entity_type="city", description="ville", source_id=chunk_key)
+        )
+        maybe_edges[tuple(sorted((activity, city)))].append(
+            dict(src_id=activity, tgt_id=city, description="située", keywords="k", weight=1.0, source_id=chunk_key)
+        )
+    return dict(maybe_nodes), dict(maybe_edges)
+
+
+async def legacy_upsert(graph: Neo4JStorage, maybe_nodes, maybe_edges):
+    """Reproduit la séquence d'appels unitaires de l'ancien extract_entities"""
+    async def merge_node(name, nodes):
+        await graph.get_node(name)
+        await graph.upsert_node(name, dict(entity_type=nodes[0]["entity_type"], description="d", source_id="s"))
+
+    async def merge_edge(src, tgt, edges):
+        await graph.has_edge(src, tgt)
+        await graph.get_edge(src, tgt)
+        await graph.get_edge(src, tgt)
+        for need_insert_id in [src, tgt]:
+            await graph.has_node(need_insert_id)
+        await graph.upsert_edge(src, tgt, dict(weight=1.0, description="d", keywords="k", source_id="s"))
+
+    await asyncio.gather(*[merge_node(k, v) for k, v in maybe_nodes.items()])
+    await asyncio.gather(*[merge_edge(k[0], k[1], v) for k, v in maybe_edges.items()])
+    for name in maybe_nodes:
+        node = await graph.get_node(name)
+        await graph.upsert_node(name, {**node, "entity_id": compute_mdhash_id(name, prefix="ent-")})
+    for src, tgt in maybe_edges:
+        edge = await graph.get_edge(src, tgt) or {}
+        await graph.upsert_edge(src, tgt, {**edge, "relation_id": compute_mdhash_id(src + tgt, prefix="rel-")})
+
+
+async def clear(graph: Neo4JStorage):
+    async with graph.driver.session() as session:
+        await session.run("MATCH (n) WHERE any(l IN labels(n) WHERE l STARTS WITH 'bench_') DETACH DELETE n")
+
+
+async def measure(graph, func, *args):
+    await clear(graph)
+    COUNTS.clear()
+    start = time.perf_counter()
+    await func(*args)
+    return time.perf_counter() - start, dict(COUNTS)
+
+
+async def main(args):
+    instrument_session()
+    graph = Neo4JStorage(namespace="bench", global_config=GLOBAL_CONFIG, embedding_func=None)
+    try:
+        print(f"{'chunks':>6} {'chemin':<8} {'requêtes':>9} {'tx écriture':>12} {'durée':>9}")
+        for chunk_count in args.chunks:
+            maybe_nodes, maybe_edges = synthetic_extraction(chunk_count)
+            for name, func, func_args in [
+                ("unitaire", legacy_upsert, (graph, maybe_nodes, maybe_edges)),
+                ("groupé", _merge_then_upsert_graph, (maybe_nodes, maybe_edges, graph, GLOBAL_CONFIG, "activity")),
+            ]:
+                wall, counts = await measure(graph, func, *func_args)
+                print(
+                    f"{chunk_count:>6} {name:<8} {counts.get('queries', 0):>9} "
+                    f"{counts.get('write_transactions', 0):>12} {wall:>8.2f}s"
+                )
+        await clear(graph)
+    finally:
+        await graph.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1, 5, 20, 50])
+    asyncio.run(main(parser.parse_args()))
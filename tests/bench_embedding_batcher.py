@@ -0,0 +1,161 @@
+"""
+Benchmark : débit d'embedding d'un corpus de longueurs mélangées (mots-clés
+courts, descriptions fusionnées longues) contre un serveur d'embedding simulé,
+lots fixes de embedding_batch_num textes contre EmbeddingBatcher.
+
+Le serveur (aiohttp, local) applique des limites de type OpenAI :
+- 400 si un texte dépasse --max-input-tokens ou la requête --max-request-tokens
+- 429 au-delà de --rps requêtes par seconde
+- latence 20 ms + 2 µs par token
+Les tokens sont comptés en mots (pas de fichiers tiktoken hors ligne) ;
+textes/s ne compte que les textes effectivement embarqués.
+
+    python tests/bench_embedding_batcher.py --texts 5000
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.utils import EmbeddingBatcher
+
+DIM = 8
+
+
+class MockRateLimitError(Exception):
+    status_code = 429
+
+
+def make_app(args):
+    window = {"start": time.monotonic(), "count": 0}
+
+    async def embeddings(request):
+        now = time.monotonic()
+        if now - window["start"] >= 1:
+            window.update(start=now, count=0)
+        window["count"] += 1
+        if window["count"] > args.rps:
+            return web.json_response({"error": "rate limit"}, status=429)
+        texts = (await request.json())["input"]
+        counts = [len(t.split()) for t in texts]
+        if max(counts) > args.max_input_tokens or sum(counts) > args.max_request_tokens:
+            return web.json_response({"error": "too many tokens"}, status=400)
+        await asyncio.sleep(0.02 + 2e-6 * sum(counts))
+        return web.json_response({"data": [{"embedding": [float(c)] * DIM} for c in counts]})
+
+    app = web.Application(client_max_size=64 * 1024**2)
+    app.router.add_post("/v1/embeddings", embeddings)
+    return app
+
+
+def make_provider(session, url):
+    async def embed(texts):
+        async with session.post(url, json={"input": texts}) as response:
+            if response.status == 429:
+                raise MockRateLimitError()
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status}")
+            payload = await response.json()
+        return np.array([d["embedding"] for d in payload["data"]])
+
+    return embed
+
+
+def synthetic_texts(n, seed=0):
+    rng = random.Random(seed)
+    texts = []
+    for i in range(n):
+        roll = rng.random()
+        length = (
+            rng.randint(2, 12) if roll < 0.6
+            else rng.randint(100, 1500) if roll < 0.98
+            else rng.randint(9000, 12000)
+        )
+        texts.append(" ".join(f"w{i}" for _ in range(length)))
+    return texts
+
+
+async def fixed_batches(provider, texts, batch_size, max_async):
+    """Chemin actuel : lots fixes, 429 réessayés (tenacity), 400 = lot perdu.
+    Sémaphore plutôt que limit_async_func_call, qui ne libère pas sa place
+    quand l'appel lève et bloquerait le benchmark après max_async erreurs."""
+    semaphore = asyncio.Semaphore(max_async)
+    failed = 0
+
+    async def run(batch):
+        nonlocal failed
+        for attempt in range(3):
+            try:
+                async with semaphore:
+                    return await provider(batch)
+            except MockRateLimitError:
+                await asyncio.sleep(min(4 * 2**attempt, 60) / 10)
+            except ValueError:
+                break
+        failed += len(batch)
+
+    await asyncio.gather(*[run(texts[i : i + batch_size]) for i in range(0, len(texts), batch_size)])
+    return failed
+
+
+async def main(args):
+    runner = web.AppRunner(make_app(args))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    url = f"http://127.0.0.1:{args.port}/v1/embeddings"
+    texts = synthetic_texts(args.texts)
+    total_tokens = sum(len(t.split()) for t in texts)
+    print(f"{len(texts)} textes, {total_tokens} tokens")
+    print(f"{'chemin':<20} {'durée':>8} {'textes/s':>10} {'perdus':>7} {'requêtes':>9} {'429':>5}")
+    try:
+        async with aiohttp.ClientSession() as session:
+            provider = make_provider(session, url)
+
+            start = time.perf_counter()
+            failed = await fixed_batches(provider, texts, args.batch_size, args.max_async)
+            duration = time.perf_counter() - start
+            print(
+                f"{f'lots fixes ({args.batch_size})':<20} {duration:>7.2f}s "
+                f"{(len(texts) - failed) / duration:>10.0f} {failed:>7} {'-':>9} {'-':>5}"
+            )
+
+            batcher = EmbeddingBatcher(
+                provider,
+                max_token_size=args.max_input_tokens,
+                max_tokens_per_request=args.max_request_tokens,
+                max_concurrency=args.max_async,
+                backoff=0.1,
+                encode=str.split,
+                decode=" ".join,
+            )
+            start = time.perf_counter()
+            await batcher.embed(texts)
+            duration = time.perf_counter() - start
+            stats = batcher.stats
+            print(
+                f"{'EmbeddingBatcher':<20} {duration:>7.2f}s {len(texts) / duration:>10.0f} "
+                f"{0:>7} {stats['requests']:>9} {stats['rate_limited']:>5}"
+            )
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-async", type=int, default=16)
+    parser.add_argument("--max-input-tokens", type=int, default=8192)
+    parser.add_argument("--max-request-tokens", type=int, default=300_000)
+    parser.add_argument("--rps", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""
+Benchmark : débit d'ingestion RabbitMQ, ancien consommateur (prefetch=1, un
+sous-processus Python par message) contre le worker aio_pika en processus
+(rabbitMQ/ingestion_worker.py) à différentes concurrences.
+
+Le broker est remplacé par une file en mémoire qui respecte le prefetch
+(au plus N messages non acquittés) et l'insertion LightRAG par une attente
+de --latency secondes (coût dominé par les appels LLM). Le coût d'un
+sous-processus est mesuré réellement (interpréteur + import de lightrag).
+
+Usage :
+    python tests/bench_ingestion_worker.py --messages 40 --latency 0.5 --concurrency 1 4 16
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "rabbitMQ"))
+
+from ingestion_worker import IngestionWorker
+
+
+class InMemoryMessage:
+    def __init__(self, body: bytes, on_ack):
+        self.body = body
+        self.headers = {}
+        self._on_ack = on_ack
+
+    async def ack(self):
+        self._on_ack()
+
+
+class SimulatedProcessor:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def process_message(self, payload):
+        await asyncio.sleep(self.latency)
+
+
+async def run_worker(messages: int, latency: float, concurrency: int) -> float:
+    worker = IngestionWorker(
+        SimulatedProcessor(latency), {"prefetch": concurrency, "concurrency": concurrency}
+    )
+    unacked = asyncio.Semaphore(concurrency)  # prefetch côté broker
+    tasks = []
+    start = time.perf_counter()
+    for i in range(messages):
+        await unacked.acquire()
+        body = json.dumps({"type": "activity", "cid": i}).encode()
+        tasks.append(asyncio.create_task(worker.on_message(InMemoryMessage(body, unacked.release))))
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start
+
+
+def run_legacy(messages: int, latency: float) -> float:
+    start = time.perf_counter()
+    for _ in range(messages):
+        subprocess.run(
+            [sys.executable, "-c", f"import lightrag.lightrag, time; time.sleep({latency})"],
+            cwd=Path(__file__).parent.parent,
+            check=True,
+        )
+    return time.perf_counter() - start
+
+
+def main(args):
+    wall = run_legacy(args.legacy_messages, args.latency)
+    print(f"{'sous-processus':<18} {args.legacy_messages / wall:7.2f} msg/s")
+    for concurrency in args.concurrency:
+        wall = asyncio.run(run_worker(args.messages, args.latency, concurrency))
+        print(f"{'worker c=' + str(concurrency):<18} {args.messages / wall:7.2f} msg/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--legacy-messages", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    main(parser.parse_args())
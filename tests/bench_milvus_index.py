@@ -0,0 +1,141 @@
+"""
+Benchmark : rappel@k et latence de recherche selon le type d'index Milvus
+(HNSW, IVF_FLAT, IVF_SQ8, DISKANN), ses paramètres de construction et de
+recherche (ef / nprobe / search_list), sur un corpus synthétique de vecteurs
+groupés en clusters. La vérité terrain est calculée par force brute (numpy).
+
+Par défaut contre Milvus Lite (fichier local, pip install milvus-lite) :
+    python tests/bench_milvus_index.py --vectors 20000 --queries 200
+
+Milvus Lite ne construit que des index FLAT / IVF_FLAT (les autres types
+sont remplacés ou refusés) : pour des chiffres représentatifs de la prod,
+pointer MILVUS_URI vers un serveur (milvus_docker/docker-compose.yml).
+
+ATTENTION : la collection bench_index est supprimée entre chaque mesure.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.kg.milvus_impl import MilvusVectorDBStorage
+from lightrag.utils import EmbeddingFunc
+
+NAMESPACE = "bench_index"
+DIM = 128
+
+# (type d'index, paramètres de construction, balayage des paramètres de recherche)
+SWEEP = [
+    ("HNSW", {"M": 8, "efConstruction": 200}, [{"ef": 16}, {"ef": 64}, {"ef": 256}]),
+    ("HNSW", {"M": 16, "efConstruction": 200}, [{"ef": 16}, {"ef": 64}, {"ef": 256}]),
+    ("HNSW", {"M": 32, "efConstruction": 400}, [{"ef": 16}, {"ef": 64}, {"ef": 256}]),
+    ("IVF_FLAT", {"nlist": 256}, [{"nprobe": 1}, {"nprobe": 8}, {"nprobe": 32}]),
+    ("IVF_SQ8", {"nlist": 256}, [{"nprobe": 1}, {"nprobe": 8}, {"nprobe": 32}]),
+    ("DISKANN", {}, [{"search_list": 20}, {"search_list": 100}]),
+]
+
+
+def synthetic_corpus(vectors: int, queries: int, clusters: int = 64, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIM))
+    corpus = centers[rng.integers(clusters, size=vectors)] + 0.3 * rng.normal(size=(vectors, DIM))
+    probes = centers[rng.integers(clusters, size=queries)] + 0.3 * rng.normal(size=(queries, DIM))
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+    return corpus.astype(np.float32), probes.astype(np.float32)
+
+
+def ground_truth(corpus, probes, top_k):
+    scores = probes @ corpus.T
+    return [set(f"doc-{j}" for j in np.argsort(-row)[:top_k]) for row in scores]
+
+
+def make_storage(working_dir, lookup, index_type, params):
+    async def embed(texts):
+        return np.stack([lookup[t] for t in texts])
+
+    return MilvusVectorDBStorage(
+        namespace=NAMESPACE,
+        global_config={
+            "working_dir": working_dir,
+            "embedding_batch_num": 1000,
+            "vector_db_storage_cls_kwargs": {
+                # radius désactivé : on mesure le rappel du top-k brut
+                "index": {NAMESPACE: {"index_type": index_type, "params": params, "radius": None}}
+            },
+        },
+        embedding_func=EmbeddingFunc(embedding_dim=DIM, max_token_size=8192, func=embed),
+    )
+
+
+async def measure(storage, probes, truth, top_k):
+    recalls, timings = [], []
+    for i in range(len(probes)):
+        start = time.perf_counter()
+        hits = await storage.query(f"q-{i}", top_k=top_k)
+        timings.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(truth[i] & {hit["id"] for hit in hits}) / top_k)
+    timings.sort()
+    return statistics.mean(recalls), statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+async def run_config(working_dir, lookup, corpus, probes, truth, args, index_type, params, sweep):
+    storage = make_storage(working_dir, lookup, index_type, params)
+    try:
+        if storage._client.has_collection(NAMESPACE):
+            storage._client.drop_collection(NAMESPACE)
+        start = time.perf_counter()
+        for i in range(0, len(corpus), 5000):
+            await storage.upsert(
+                {f"doc-{j}": {"content": f"doc-{j}"} for j in range(i, min(i + 5000, len(corpus)))}
+            )
+        storage._client.flush(NAMESPACE)
+        build = time.perf_counter() - start
+        for search_params in sweep:
+            storage.index_config.search_params = search_params
+            recall, p50, p95 = await measure(storage, probes, truth, args.top_k)
+            print(
+                f"{index_type:<9} {str(params):<32} {str(search_params):<20} "
+                f"{build:>7.1f}s {recall:>8.3f} {p50:>7.2f}/{p95:<7.2f}ms"
+            )
+    except Exception as e:
+        print(f"{index_type:<9} {str(params):<32} non supporté ici : {e}")
+    finally:
+        if storage._client is not None and storage._client.has_collection(NAMESPACE):
+            storage._client.drop_collection(NAMESPACE)
+        await storage.close()
+
+
+async def main(args):
+    corpus, probes = synthetic_corpus(args.vectors, args.queries)
+    truth = ground_truth(corpus, probes, args.top_k)
+    lookup = {f"doc-{i}": v for i, v in enumerate(corpus)}
+    lookup.update({f"q-{i}": v for i, v in enumerate(probes)})
+    working_dir = tempfile.mkdtemp(prefix="bench_milvus_")
+    if "MILVUS_URI" not in os.environ:
+        print(f"Milvus Lite : {working_dir}/milvus_lite.db")
+    print(
+        f"{'index':<9} {'construction':<32} {'recherche':<20} {'insert':>8} "
+        f"{f'rappel@{args.top_k}':>8} {'p50/p95':>15}"
+    )
+    for index_type, params, sweep in SWEEP:
+        if args.index_types and index_type not in args.index_types:
+            continue
+        await run_config(working_dir, lookup, corpus, probes, truth, args, index_type, params, sweep)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--index-types", nargs="*", default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""
+Benchmark : recherche « catalogue partagé + données de l'utilisateur » avec
+10 000 utilisateurs synthétiques, collection unique filtrée sur le champ
+scalaire user_id contre collection à clé de partition user_id
+(LightRAG(user_tenancy=True)).
+
+Les deux collections reçoivent le même corpus : un catalogue partagé
+(user_id "") et --per-user vecteurs par utilisateur. Les requêtes tirent un
+utilisateur au hasard et filtrent user_id in ["", <utilisateur>].
+
+La clé de partition demande un serveur Milvus (milvus_docker/docker-compose.yml) :
+    MILVUS_URI=http://localhost:19530 python tests/bench_milvus_tenancy.py --users 10000
+
+ATTENTION : les collections bench_tenancy_* sont supprimées en fin de mesure.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.kg import milvus_impl
+from lightrag.kg.milvus_impl import MilvusVectorDBStorage
+from lightrag.utils import EmbeddingFunc
+
+DIM = 64
+
+
+class BenchStorage(MilvusVectorDBStorage):
+    """Stockage entities sous un autre nom de collection"""
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.scalar_fields = milvus_impl.SCALAR_FIELDS["entities"]
+        self.tenancy = bool(self.global_config.get("user_tenancy"))
+
+
+def make_storage(namespace, working_dir, lookup, user_tenancy):
+    async def embed(texts):
+        return np.stack([lookup[t] for t in texts])
+
+    return BenchStorage(
+        namespace=namespace,
+        global_config={
+            "working_dir": working_dir,
+            "embedding_batch_num": 1000,
+            "user_tenancy": user_tenancy,
+            "vector_db_storage_cls_kwargs": {"index": {"default": {"radius": None}}},
+        },
+        embedding_func=EmbeddingFunc(embedding_dim=DIM, max_token_size=8192, func=embed),
+        meta_fields={"entity_name"},
+    )
+
+
+def synthetic_corpus(catalog: int, users: int, per_user: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    rows = [(f"cat-{i}", "") for i in range(catalog)]
+    rows += [(f"u{u}-{j}", f"user_{u}") for u in range(users) for j in range(per_user)]
+    vectors = rng.normal(size=(len(rows), DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return rows, {key: vectors[i] for i, (key, _) in enumerate(rows)}
+
+
+async def load(storage, rows, batch=5000):
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        await storage.upsert(
+            {key: {"content": key, "entity_name": key, "user_id": owner} for key, owner in rows[i : i + batch]}
+        )
+    storage._client.flush(storage.namespace)
+    return time.perf_counter() - start
+
+
+async def measure(storage, users: int, queries: int, lookup):
+    probes = random.sample(list(lookup), queries)
+    timings, leaks = [], 0
+    for probe in probes:
+        user = random.randrange(users)
+        start = time.perf_counter()
+        # Même filtre des deux côtés : ajouté par le stockage en mode tenancy
+        hits = await storage.query(
+            probe,
+            top_k=10,
+            vdb_filter=None if storage.tenancy else {"user_id": ["", f"user_{user}"]},
+            user_id=f"user_{user}",
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+        # Résultats appartenant à un autre utilisateur (doit rester à 0)
+        leaks += sum(
+            1 for hit in hits
+            if not hit["id"].startswith("cat-") and not hit["id"].startswith(f"u{user}-")
+        )
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], leaks
+
+
+async def main(args):
+    rows, lookup = synthetic_corpus(args.catalog, args.users, args.per_user)
+    working_dir = tempfile.mkdtemp(prefix="bench_milvus_")
+    print(f"{len(rows)} vecteurs : catalogue {args.catalog}, {args.users} utilisateurs x {args.per_user}")
+    print(f"{'disposition':<22} {'insert':>8} {'p50/p95':>17} {'fuites':>7}")
+    for label, namespace, user_tenancy in [
+        ("filtre scalaire", "bench_tenancy_scalar", False),
+        ("clé de partition", "bench_tenancy_partition", True),
+    ]:
+        storage = make_storage(namespace, working_dir, lookup, user_tenancy)
+        try:
+            if storage._client.has_collection(namespace):
+                storage._client.drop_collection(namespace)
+            insert = await load(storage, rows)
+            p50, p95, leaks = await measure(storage, args.users, args.queries, lookup)
+            print(f"{label:<22} {insert:>7.1f}s {p50:>7.2f}/{p95:<7.2f}ms {leaks:>7}")
+        finally:
+            storage._client.drop_collection(namespace)
+            await storage.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalog", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--per-user", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,101 @@
+"""
+Benchmark : latence des lookups de nœuds selon la taille du graphe, identité
+par label dynamique (NEO4J_NODE_IDENTITY=label) contre label commun +
+entity_name indexé (NEO4J_NODE_IDENTITY=property).
+
+Mesure get_node / has_node unitaires (p50, p95) et get_nodes_batch sur
+200 noms tirés au hasard, pour chaque taille de graphe, ainsi que le taux de
+hit estimé du cache de plans (textes de requête répétés à l'identique).
+
+À lancer contre un Neo4j local (neo4j_microk8s/docker-compose.yml) :
+    NEO4J_URI=bolt://localhost:7687 NEO4J_USERNAME=neo4j NEO4J_PASSWORD=... \\
+    NEO4J_RESOLVER= python tests/bench_neo4j_lookup.py --sizes 1000 10000 50000
+
+ATTENTION : les nœuds bench_* sont supprimés entre chaque mesure.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.kg.neo4j_impl import Neo4JStorage
+
+LOOKUPS = 200
+
+
+async def clear(graph: Neo4JStorage):
+    async with graph.driver.session() as session:
+        await session.run(
+            "MATCH (n) WHERE n.entity_name STARTS WITH 'bench_' "
+            "OR any(l IN labels(n) WHERE l STARTS WITH 'bench_') "
+            "CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS"
+        )
+
+
+async def populate(graph: Neo4JStorage, size: int):
+    names = [f"bench_entity_{i}" for i in range(size)]
+    for i in range(0, size, 5000):
+        await graph.upsert_nodes_batch(
+            {name: {"entity_type": "activity", "description": name} for name in names[i : i + 5000]}
+        )
+    return names
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+async def measure(graph: Neo4JStorage, names):
+    sample = random.sample(names, min(LOOKUPS, len(names)))
+    graph.reset_query_stats()
+    results = {}
+    for label, func in [("get_node", graph.get_node), ("has_node", graph.has_node)]:
+        timings = []
+        for name in sample:
+            start = time.perf_counter()
+            await func(name)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[label] = percentiles(timings)
+    start = time.perf_counter()
+    await graph.get_nodes_batch(sample)
+    results["batch"] = (time.perf_counter() - start) * 1000
+    results["repeats"] = graph.get_query_stats()["repeat_rate"]
+    return results
+
+
+async def main(args):
+    graph = Neo4JStorage(namespace="bench", global_config={}, embedding_func=None)
+    try:
+        print(
+            f"{'nœuds':>7} {'identité':<9} {'get_node p50/p95':>18} "
+            f"{'has_node p50/p95':>18} {f'batch({LOOKUPS})':>11} {'répétés':>9}"
+        )
+        for size in args.sizes:
+            for identity in ("label", "property"):
+                graph.node_identity = identity
+                if identity == "property":
+                    await graph.ensure_schema()
+                await clear(graph)
+                names = await populate(graph, size)
+                results = await measure(graph, names)
+                print(
+                    f"{size:>7} {identity:<9} "
+                    f"{results['get_node'][0]:>7.2f}/{results['get_node'][1]:<7.2f}ms "
+                    f"{results['has_node'][0]:>7.2f}/{results['has_node'][1]:<7.2f}ms "
+                    f"{results['batch']:>9.1f}ms {results['repeats']:>9.0%}"
+                )
+        await clear(graph)
+    finally:
+        await graph.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,122 @@
+"""
+Microbenchmark : surcoût par appel OpenAI avec un AsyncOpenAI neuf à chaque
+appel (ancien comportement) contre le client partagé du registre de llm.py.
+
+Un serveur local compatible OpenAI (aiohttp) répond immédiatement aux
+routes /v1/chat/completions et /v1/embeddings : seul le coût client
+(construction, connexion, pool HTTP) est mesuré.
+
+Usage :
+    python tests/bench_openai_client.py --calls 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import web
+from openai import AsyncOpenAI
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.llm import aclose_openai_clients, get_openai_async_client
+
+API_KEY = "sk-bench"
+
+
+async def chat_completions(request):
+    return web.json_response(
+        {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+    )
+
+
+async def embeddings(request):
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    return web.json_response(
+        {
+            "object": "list",
+            "model": "text-embedding-3-small",
+            "data": [{"object": "embedding", "index": i, "embedding": [0.0] * 8} for i in range(len(inputs))],
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        }
+    )
+
+
+async def start_mock_server(port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/embeddings", embeddings)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def call_fresh_client(base_url: str):
+    client = AsyncOpenAI(base_url=base_url, api_key=API_KEY)
+    try:
+        await client.chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "ping"}]
+        )
+    finally:
+        await client.close()
+
+
+async def call_shared_client(base_url: str):
+    client = get_openai_async_client(base_url, API_KEY)
+    await client.chat.completions.create(
+        model="gpt-4o-mini", messages=[{"role": "user", "content": "ping"}]
+    )
+
+
+async def run(call, base_url: str, calls: int, concurrency: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call(base_url)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[one() for _ in range(calls)])
+    return latencies
+
+
+async def main(args):
+    runner = await start_mock_server(args.port)
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+    try:
+        for name, call in [("client neuf", call_fresh_client), ("client partagé", call_shared_client)]:
+            await run(call, base_url, 10, 1)  # échauffement
+            start = time.perf_counter()
+            latencies = sorted(await run(call, base_url, args.calls, args.concurrency))
+            wall = time.perf_counter() - start
+            print(
+                f"{name:<15} p50={statistics.median(latencies) * 1000:7.2f}ms "
+                f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:7.2f}ms "
+                f"débit={args.calls / wall:7.1f} appels/s"
+            )
+    finally:
+        await aclose_openai_clients()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
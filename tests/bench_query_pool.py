@@ -0,0 +1,120 @@
+"""
+Benchmark : latence de /query avec construction de LightRAG à chaque requête
+(froid) contre le pool d'instances partagé (chaud).
+
+Les stockages sont ceux de l'environnement (NEO4J_URI, MILVUS_URI, MONGO_URI...),
+à pointer vers des conteneurs locaux (voir neo4j_microk8s/, milvus_docker/,
+mongodb_docker/). Le LLM et les embeddings sont remplacés par des fonctions
+locales déterministes pour ne mesurer que l'initialisation et la récupération.
+
+Usage :
+    NEO4J_RESOLVER= python tests/bench_query_pool.py --requests 50 --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.lightrag import LightRAG, QueryParam
+from lightrag.utils import EmbeddingFunc
+from api.lightrag_pool import LightRAGPool
+
+WORKING_DIR = tempfile.mkdtemp(prefix="bench_query_pool_")
+
+
+async def stub_llm(prompt, system_prompt=None, history_messages=[], **kwargs):
+    kwargs.pop("hashing_kv", None)
+    if kwargs.get("keyword_extraction"):
+        return '{"high_level_keywords": ["restaurant", "ambiance"], "low_level_keywords": ["lyon", "burger"]}'
+    return "ok"
+
+
+async def stub_embedding(texts: list[str]) -> np.ndarray:
+    rng = np.random.default_rng(abs(hash(tuple(texts))) % (2**32))
+    return rng.random((len(texts), 1536), dtype=np.float32)
+
+
+def bench_factory() -> LightRAG:
+    return LightRAG(
+        working_dir=WORKING_DIR,
+        llm_model_func=stub_llm,
+        embedding_func=EmbeddingFunc(embedding_dim=1536, max_token_size=8192, func=stub_embedding),
+        kv_storage="MongoKVStorage",
+        vector_storage="MilvusVectorDBStorage",
+        graph_storage="Neo4JStorage",
+        log_level=logging.WARNING,
+        enable_llm_cache=False,
+    )
+
+
+QUESTION = "trouver moi un restaurant qui dispose d'une ambiance chaleureuse"
+
+
+async def cold_request():
+    rag = bench_factory()
+    try:
+        await rag.aquery(QUESTION, param=QueryParam(mode="hybrid", only_need_context=True))
+    finally:
+        await rag.aclose()
+
+
+def make_warm_request(pool: LightRAGPool):
+    async def warm_request():
+        async with pool.acquire() as rag:
+            await rag.aquery(QUESTION, param=QueryParam(mode="hybrid", only_need_context=True))
+    return warm_request
+
+
+async def run(request_func, total: int, concurrency: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await request_func()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[one() for _ in range(total)])
+    return latencies
+
+
+def report(name: str, latencies: list[float], wall: float):
+    latencies = sorted(latencies)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(
+        f"{name:<6} n={len(latencies):<4} p50={statistics.median(latencies) * 1000:8.1f}ms "
+        f"p95={p95 * 1000:8.1f}ms  débit={len(latencies) / wall:6.1f} req/s"
+    )
+
+
+async def main(args):
+    start = time.perf_counter()
+    cold = await run(cold_request, args.requests, args.concurrency)
+    report("froid", cold, time.perf_counter() - start)
+
+    pool = LightRAGPool(bench_factory, size=args.pool_size)
+    await pool.start()
+    try:
+        start = time.perf_counter()
+        warm = await run(make_warm_request(pool), args.requests, args.concurrency)
+        report("chaud", warm, time.perf_counter() - start)
+        print(f"pool : {pool.get_stats()}")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
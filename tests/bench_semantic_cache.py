@@ -0,0 +1,106 @@
+"""
+Benchmark : recherche dans le cache sémantique des requêtes avec 100k prompts
+en cache. Ancien parcours Python de get_best_cached_response (hex ->
+déquantification -> cosinus scalaire par entrée) contre l'index matriciel
+SemanticCacheIndex (un produit matrice-vecteur + argmax).
+
+Usage :
+    python tests/bench_semantic_cache.py --entries 100000 --dim 1536
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lightrag.utils import (
+    SemanticCacheIndex,
+    cosine_similarity,
+    dequantize_embedding,
+    quantize_embedding,
+)
+
+
+def legacy_lookup(mode_cache: dict, current_embedding: np.ndarray):
+    """Boucle de l'ancien get_best_cached_response, sans le stockage KV"""
+    best_similarity, best_cache_id = -1, None
+    for cache_id, cache_data in mode_cache.items():
+        cached_quantized = np.frombuffer(
+            bytes.fromhex(cache_data["embedding"]), dtype=np.uint8
+        ).reshape(cache_data["embedding_shape"])
+        cached_embedding = dequantize_embedding(
+            cached_quantized, cache_data["embedding_min"], cache_data["embedding_max"]
+        )
+        similarity = cosine_similarity(current_embedding, cached_embedding)
+        if similarity > best_similarity:
+            best_similarity, best_cache_id = similarity, cache_id
+    return best_cache_id, best_similarity
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.95) - 1] * 1000
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.entries, args.dim)).astype(np.float32)
+    queries = embeddings[rng.integers(0, args.entries, args.queries)] + 0.01
+
+    mode_cache = {}
+    for i, embedding in enumerate(embeddings):
+        quantized, min_val, max_val = quantize_embedding(embedding)
+        mode_cache[f"id-{i}"] = {
+            "embedding": quantized.tobytes().hex(),
+            "embedding_shape": quantized.shape,
+            "embedding_min": min_val,
+            "embedding_max": max_val,
+        }
+    legacy = []
+    for query in queries[: args.legacy_queries]:
+        start = time.perf_counter()
+        legacy_lookup(mode_cache, query)
+        legacy.append(time.perf_counter() - start)
+    print(f"{'boucle Python':<22} p50={percentiles(legacy)[0]:9.2f}ms ({len(legacy)} requêtes)")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for search_dtype in ["float32", "float16"]:
+            index = SemanticCacheIndex(
+                str(Path(tmp_dir) / f"bench_{search_dtype}"),
+                args.dim,
+                max_entries=args.entries,
+                search_dtype=search_dtype,
+            )
+            start = time.perf_counter()
+            for i, embedding in enumerate(embeddings):
+                index.add(f"id-{i}", embedding)
+            insert_rate = args.entries / (time.perf_counter() - start)
+            start = time.perf_counter()
+            index.flush()
+            flush = time.perf_counter() - start
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query)
+                latencies.append(time.perf_counter() - start)
+            p50, p95 = percentiles(latencies)
+            print(
+                f"{'index ' + search_dtype:<22} p50={p50:9.2f}ms p95={p95:9.2f}ms "
+                f"insertion={insert_rate:8.0f}/s flush={flush * 1000:6.0f}ms "
+                f"mémoire={index._matrix.nbytes / 2**20:6.0f}Mo"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--legacy-queries", type=int, default=3)
+    main(parser.parse_args())
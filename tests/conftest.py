@@ -1,5 +1,11 @@
+import os
 import sys
+import tempfile
 from pathlib import Path
 
 # Ajouter le répertoire parent au chemin de recherche des modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Les modules api/ construisent LightRAG à l'import : leurs fichiers locaux
+# (cache d'embeddings SQLite) vont dans un répertoire temporaire, pas dans api/
+os.environ.setdefault("LIGHTRAG_WORKING_DIR", tempfile.mkdtemp(prefix="lightrag-tests-"))
@@ -0,0 +1,31 @@
+import asyncio
+
+from lightrag.config.activity_categories import ActivityCategoriesManager
+
+
+def test_keyword_matcher_keeps_category_priority():
+    manager = ActivityCategoriesManager()
+
+    assert manager.get_category("Un RESTAURANT avec concert le soir") == "Restauration"
+    assert manager.get_category("Cours de yoga en plein air") == "Formation et Éducation"
+    assert manager.get_category("Balade en bateau") == "Unknown"
+
+    manager.add_category("Nautisme", ["bateau"])
+    assert manager.get_category("Balade en bateau") == "Nautisme"
+
+
+def test_llm_classification_is_batched_cached_and_validated():
+    manager = ActivityCategoriesManager()
+    prompts = []
+
+    async def fake_llm(prompt):
+        prompts.append(prompt)
+        return '```json\n{"1": "Sport et Fitness", "2": "Catégorie inventée"}\n```'
+
+    descriptions = ["Salle d'escalade", "Petit bistro du port"]
+    first = asyncio.run(manager.get_categories_with_llm(descriptions, fake_llm))
+    again = asyncio.run(manager.get_categories_with_llm(descriptions, fake_llm))
+
+    # catégorie hors liste : repli sur les mots-clés
+    assert first == again == ["Sport et Fitness", "Restauration"]
+    assert len(prompts) == 1
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from lightrag.utils import (
+    PRIORITY_INTERACTIVE,
+    PriorityLimiter,
+    call_priority,
+    limit_async_func_call,
+)
+
+
+def test_failed_calls_release_their_slot():
+    calls = 0
+
+    @limit_async_func_call(2)
+    async def flaky(fail):
+        nonlocal calls
+        calls += 1
+        if fail:
+            raise ValueError("boom")
+        return "ok"
+
+    async def scenario():
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                await flaky(True)
+        return await asyncio.wait_for(flaky(False), timeout=1)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert calls == 6
+
+
+def test_interactive_calls_overtake_queued_bulk_calls():
+    limiter = PriorityLimiter(1)
+    order = []
+
+    async def call(name):
+        async with limiter.slot():
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def interactive(name):
+        with call_priority(PRIORITY_INTERACTIVE):
+            await call(name)
+
+    async def scenario():
+        await limiter.acquire()
+        tasks = [asyncio.create_task(call(f"bulk-{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(interactive("query")))
+        await asyncio.sleep(0)
+        depth = limiter.queue_depth()
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return depth
+
+    depth = asyncio.run(scenario())
+
+    assert depth == {"interactive": 1, "bulk": 3}
+    assert order == ["query", "bulk-0", "bulk-1", "bulk-2"]
+    assert limiter.get_stats()["running"] == 0
+
+
+def test_token_budget_delays_admission():
+    # 6000 tokens/min = 100 tokens/s, bucket full at start
+    limiter = PriorityLimiter(4, tokens_per_minute=6000)
+
+    async def scenario():
+        await limiter.acquire(cost=6000)
+        limiter.release()
+        start = time.perf_counter()
+        async with limiter.slot(cost=10):
+            pass
+        return time.perf_counter() - start
+
+    waited = asyncio.run(scenario())
+
+    assert 0.08 <= waited < 1
+    assert limiter.get_stats()["tokens"] == 6010
+
+
+def test_cancelled_waiters_leave_the_queue():
+    limiter = PriorityLimiter(1)
+
+    async def scenario():
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire(), timeout=1)
+        limiter.release()
+
+    asyncio.run(scenario())
+
+    assert limiter.get_stats()["running"] == 0
+    assert limiter.queue_depth() == {"interactive": 0, "bulk": 0}
@@ -0,0 +1,156 @@
+import asyncio
+from functools import partial
+
+from lightrag.storage import JsonKVStorage
+from lightrag.utils import CompletionCache, cache_completions, llm_func_identity
+
+
+def make_cache(tmp_path, **kwargs):
+    kv = JsonKVStorage(
+        namespace="llm_completion_cache",
+        global_config={"working_dir": str(tmp_path)},
+        embedding_func=None,
+    )
+    return CompletionCache(kv, model_name="gpt-4o-mini", **kwargs)
+
+
+def make_llm(calls):
+    async def fake_complete(prompt, system_prompt=None, history_messages=[], **kwargs):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return f"réponse {prompt}"
+
+    return fake_complete
+
+
+def test_repeated_calls_hit_the_cache(tmp_path):
+    calls = []
+    cache = make_cache(tmp_path)
+    llm = cache.wrap(make_llm(calls))
+
+    async def scenario():
+        first = await llm("extraire", history_messages=[{"role": "user", "content": "a"}])
+        again = await llm("extraire", history_messages=[{"role": "user", "content": "a"}])
+        other_history = await llm("extraire")
+        concurrent = await asyncio.gather(*[llm("glaner") for _ in range(5)])
+        return first, again, other_history, concurrent
+
+    with cache_completions():
+        first, again, other_history, concurrent = asyncio.run(scenario())
+
+    assert first == again == other_history == "réponse extraire"
+    assert concurrent == ["réponse glaner"] * 5
+    assert calls == ["extraire", "extraire", "glaner"]
+    stats = cache.get_stats()
+    assert stats["writes"] == 3
+    assert stats["hot_hits"] == 1
+
+
+def test_kv_tier_survives_a_new_process_and_ttl_expires(tmp_path):
+    calls = []
+    cache = make_cache(tmp_path, ttl=60)
+    with cache_completions():
+        asyncio.run(cache.wrap(make_llm(calls))("résumer"))
+
+        # nouveau cache sur le même stockage : hot tier vide, lecture depuis le KV
+        restarted = make_cache(tmp_path, ttl=60)
+        restarted.kv._data = cache.kv._data
+        asyncio.run(restarted.wrap(make_llm(calls))("résumer"))
+        assert calls == ["résumer"]
+        assert restarted.get_stats()["kv_hits"] == 1
+
+        for entry in restarted.kv._data.values():
+            entry["expires_at"] = 0
+        restarted._hot.clear()
+        asyncio.run(restarted.wrap(make_llm(calls))("résumer"))
+    assert calls == ["résumer", "résumer"]
+    assert restarted.get_stats()["expired"] == 1
+
+
+def test_streamed_calls_bypass_the_cache(tmp_path):
+    calls = []
+    cache = make_cache(tmp_path)
+    llm = cache.wrap(make_llm(calls))
+
+    async def scenario():
+        await llm("question", stream=True)
+        await llm("question", stream=True)
+
+    with cache_completions():
+        asyncio.run(scenario())
+    assert calls == ["question", "question"]
+    assert cache.get_stats()["writes"] == 0
+
+
+def test_waiters_retry_when_the_owner_is_cancelled(tmp_path):
+    calls = []
+    cache = make_cache(tmp_path)
+    llm = cache.wrap(make_llm(calls))
+
+    async def scenario():
+        owner = asyncio.create_task(llm("annuler"))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(llm("annuler")) for _ in range(3)]
+        await asyncio.sleep(0)
+        owner.cancel()
+        results = await asyncio.gather(*waiters)
+        return owner, results
+
+    with cache_completions():
+        owner, results = asyncio.run(scenario())
+
+    assert owner.cancelled()
+    assert results == ["réponse annuler"] * 3
+    # un seul des appelants en attente relance l'appel
+    assert calls == ["annuler", "annuler"]
+    assert cache._inflight == {}
+
+
+def test_calls_outside_extraction_bypass_the_cache(tmp_path):
+    calls = []
+    cache = make_cache(tmp_path)
+    llm = cache.wrap(make_llm(calls))
+
+    async def scenario():
+        await llm("question")
+        await llm("question")
+        with cache_completions():
+            await llm("extraire")
+            await llm("extraire")
+
+    asyncio.run(scenario())
+
+    assert calls == ["question", "question", "extraire"]
+    assert cache.get_stats()["bypassed"] == 2 and cache.get_stats()["writes"] == 1
+
+
+def test_identity_follows_the_called_model():
+    async def openai_complete(prompt, model=None, **kwargs):
+        return prompt
+
+    mini = llm_func_identity(partial(openai_complete, model="gpt-4o-mini"), {"api_key": "sk-1"})
+
+    assert mini == llm_func_identity(partial(openai_complete, model="gpt-4o-mini"), {"api_key": "sk-2"})
+    assert mini != llm_func_identity(partial(openai_complete, model="gpt-4o"))
+    assert mini != llm_func_identity(openai_complete, {"model": "gpt-4o-mini", "base_url": "http://x/v1"})
+    assert "sk-1" not in mini
+
+
+def test_prune_drops_expired_then_oldest_entries(tmp_path):
+    cache = make_cache(tmp_path, ttl=60, max_entries=2)
+
+    async def scenario():
+        for i in range(4):
+            await cache.set(f"llm-{i}", f"réponse {i}")
+            cache.kv._data[f"llm-{i}"]["created_at"] = i
+        cache.kv._data["llm-3"]["expires_at"] = 0
+        pruned = await cache.prune()
+        # prune_interval pas encore écoulé
+        await cache.set("llm-4", "réponse 4")
+        return pruned, await cache.prune()
+
+    pruned, throttled = asyncio.run(scenario())
+
+    assert pruned == 2 and throttled == 0
+    assert set(cache.kv._data) == {"llm-1", "llm-2", "llm-4"}
+    assert "llm-3" not in cache._hot and "llm-0" not in cache._hot
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from collections import OrderedDict
+
+import pytest
+
+from lightrag import operate
+from lightrag.operate import DescriptionSummarizer
+from lightrag.prompt import GRAPH_FIELD_SEP
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    monkeypatch.setattr(operate, "encode_string_by_tiktoken", lambda text, model_name=None: text.split())
+    monkeypatch.setattr(operate, "decode_tokens_by_tiktoken", lambda tokens, model_name=None: " ".join(tokens))
+    monkeypatch.setattr(operate, "_description_summaries", OrderedDict())
+    return []
+
+
+def make_summarizer(calls, answer=None, **batch_config):
+    async def llm(prompt, max_tokens=None, **kwargs):
+        calls.append(prompt)
+        if answer is not None:
+            return answer
+        if "Return only a JSON object" in prompt:
+            count = prompt.count("\nEntities: ")
+            return json.dumps({"summaries": [{"id": i, "summary": f"résumé {i}"} for i in range(1, count + 1)]})
+        return "résumé seul"
+
+    return DescriptionSummarizer(
+        {
+            "llm_model_func": llm,
+            "tiktoken_model_name": "gpt-4o-mini",
+            "llm_model_max_token_size": 1000,
+            "entity_summary_to_max_tokens": 5,
+            "addon_params": {},
+            "entity_summary_batch_config": batch_config,
+        }
+    )
+
+
+def long_description(word):
+    return GRAPH_FIELD_SEP.join([f"{word} est un restaurant", f"{word} sert du homard"])
+
+
+def test_short_descriptions_are_kept_without_llm_calls(calls):
+    summarizer = make_summarizer(calls)
+
+    results = asyncio.run(summarizer.summarize_many([("a", "court"), ("b", "deux mots")]))
+
+    assert results == ["court", "deux mots"]
+    assert calls == []
+
+
+def test_duplicates_share_one_batched_request_and_the_cache(calls):
+    summarizer = make_summarizer(calls)
+    items = [("a", long_description("Chez Jo")), ("b", long_description("Le Port")), ("a", long_description("Chez Jo"))]
+
+    first = asyncio.run(summarizer.summarize_many(items))
+    second = asyncio.run(make_summarizer(calls).summarize_many([("b", long_description("Le Port"))]))
+
+    assert len(calls) == 1 and calls[0].count("\nEntities: ") == 2
+    assert first == ["résumé 1", "résumé 2", "résumé 1"]
+    assert second == ["résumé 2"]
+    assert summarizer.stats["batch_requests"] == 1
+
+
+def test_same_description_under_another_name_or_language_is_summarized_again(calls):
+    description = long_description("Chez Jo")
+
+    first = asyncio.run(make_summarizer(calls).summarize_many([("a", description), ("b", description)]))
+    english = make_summarizer(calls)
+    english.language = "English"
+    asyncio.run(english.summarize_many([("a", description)]))
+
+    assert first == ["résumé 1", "résumé 2"]
+    assert calls[0].count("\nEntities: ") == 2
+    assert len(calls) == 2
+
+
+def test_requests_are_packed_by_item_count(calls):
+    summarizer = make_summarizer(calls, max_items_per_request=2)
+    items = [(str(i), long_description(f"Lieu {i}")) for i in range(3)]
+
+    results = asyncio.run(summarizer.summarize_many(items))
+
+    assert results == ["résumé 1", "résumé 2", "résumé seul"]
+    assert summarizer.stats["batch_requests"] == 1 and summarizer.stats["single_requests"] == 1
+
+
+def test_unreadable_batch_answer_falls_back_to_single_summaries(calls):
+    summarizer = make_summarizer(calls, answer="pas du JSON")
+    items = [("a", long_description("Chez Jo")), ("b", long_description("Le Port"))]
+
+    results = asyncio.run(summarizer.summarize_many(items))
+
+    assert results == ["pas du JSON", "pas du JSON"]
+    assert len(calls) == 3
+    assert summarizer.stats["fallbacks"] == 2
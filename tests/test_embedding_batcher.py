@@ -0,0 +1,152 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from lightrag.utils import EmbeddingBatcher, EmbeddingCache, EmbeddingFunc
+
+
+class RateLimitError(Exception):
+    pass
+
+
+def words(text):
+    return text.split()
+
+
+def unwords(tokens):
+    return " ".join(tokens)
+
+
+def make_batcher(func, **kwargs):
+    return EmbeddingBatcher(func, encode=words, decode=unwords, backoff=0, **kwargs)
+
+
+def test_packs_by_tokens_and_items_and_truncates():
+    requests = []
+
+    async def provider(texts):
+        requests.append(list(texts))
+        return np.array([[float(len(t.split()))] for t in texts])
+
+    batcher = make_batcher(provider, max_token_size=4, max_tokens_per_request=6, max_items_per_request=3)
+    texts = ["a b c", "d", "e f", "g h i j k l", "m", "n", "o", "p"]
+
+    vectors = asyncio.run(batcher.embed(texts))
+
+    assert requests == [["a b c", "d", "e f"], ["g h i j", "m", "n"], ["o", "p"]]
+    assert vectors[:, 0].tolist() == [3, 1, 2, 4, 1, 1, 1, 1]
+    assert batcher.stats["truncated"] == 1
+
+
+def test_rate_limit_halves_batch_size_and_retries():
+    sizes = []
+
+    async def provider(texts):
+        sizes.append(len(texts))
+        if len(texts) > 2:
+            raise RateLimitError("429")
+        return np.array([[float(t)] for t in texts])
+
+    batcher = make_batcher(provider, max_items_per_request=8)
+
+    vectors = asyncio.run(batcher.embed([str(i) for i in range(8)]))
+
+    assert vectors[:, 0].tolist() == list(range(8))
+    assert sizes[:3] == [8, 4, 4]
+    assert batcher.stats["rate_limited"] >= 2
+    # Remonte d'un dixième (au moins 1) par requête réussie, sans revenir à 8
+    assert 2 < batcher.item_limit < 8
+
+
+def test_other_errors_are_not_retried():
+    async def provider(texts):
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        asyncio.run(make_batcher(provider).embed(["a"]))
+
+
+def test_concurrency_is_bounded():
+    running = 0
+    peak = 0
+
+    async def provider(texts):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return np.zeros((len(texts), 1))
+
+    batcher = make_batcher(provider, max_items_per_request=1, max_concurrency=3)
+    asyncio.run(batcher.embed([str(i) for i in range(10)]))
+
+    assert peak == 3
+
+
+def test_cache_wrap_keeps_packs_batches(tmp_path):
+    async def provider(texts):
+        return np.zeros((len(texts), 2))
+
+    base = EmbeddingFunc(embedding_dim=2, max_token_size=8, func=provider)
+    batched = make_batcher(provider).wrap(base)
+    cached = EmbeddingCache(str(tmp_path / "emb.sqlite"), "m").wrap(base, batched)
+
+    assert batched.packs_batches and cached.packs_batches
+    assert asyncio.run(cached(["a", "b"])).shape == (2, 2)
+
+
+class TooManyInputsError(Exception):
+    status_code = 400
+
+
+def test_too_many_inputs_splits_and_caps_the_batch_size():
+    sizes = []
+
+    async def provider(texts):
+        sizes.append(len(texts))
+        if len(texts) > 3:
+            raise TooManyInputsError("Error code: 400 - too many inputs, max 3")
+        return np.array([[float(t)] for t in texts])
+
+    batcher = make_batcher(provider, max_items_per_request=16)
+
+    vectors = asyncio.run(batcher.embed([str(i) for i in range(16)]))
+    refused = batcher.stats["too_many_inputs"]
+    later = asyncio.run(batcher.embed([str(i) for i in range(6)]))
+
+    assert vectors[:, 0].tolist() == list(range(16))
+    assert later[:, 0].tolist() == list(range(6))
+    assert sizes[:3] == [16, 8, 8]
+    assert batcher.max_items_per_request <= 3 and batcher.stats["rate_limited"] == 0
+    # la limite apprise n'est plus dépassée ensuite
+    assert batcher.stats["too_many_inputs"] == refused
+    assert max(sizes[-3:]) <= 3
+
+
+def test_bad_request_for_other_reasons_is_not_split():
+    async def provider(texts):
+        raise TooManyInputsError("Error code: 400 - invalid input")
+
+    with pytest.raises(TooManyInputsError):
+        asyncio.run(make_batcher(provider).embed(["a", "b"]))
+
+
+def test_tokens_are_counted_with_the_embedding_encoding(monkeypatch):
+    from lightrag import utils
+
+    requested = []
+
+    class Encoding:
+        def encode(self, text):
+            return text.split()
+
+    def get_encoding(name):
+        requested.append(name)
+        return Encoding()
+
+    monkeypatch.setattr(utils, "get_tiktoken_encoding", get_encoding)
+
+    assert EmbeddingBatcher(None).truncate("a b c") == ("a b c", 3)
+    assert requested == ["cl100k_base"]
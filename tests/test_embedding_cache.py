@@ -0,0 +1,79 @@
+import asyncio
+from functools import partial
+
+import numpy as np
+
+from lightrag import utils
+from lightrag.utils import EmbeddingCache, EmbeddingFunc, embedding_model_name
+
+
+def make_provider():
+    calls = []
+
+    async def provider(texts):
+        calls.append(list(texts))
+        return np.array([[len(t) + 0.1234567, 1.0, -2.0] for t in texts])
+
+    return provider, calls
+
+
+def test_only_unique_misses_reach_the_provider(tmp_path):
+    provider, calls = make_provider()
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"), model_name="m", hot_size=10)
+    embed = cache.wrap(EmbeddingFunc(embedding_dim=3, max_token_size=8192, func=provider))
+
+    async def scenario():
+        first = await embed(["homard", "burgers", "homard"])
+        second = await embed(["burgers", "ramen", "homard"])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert calls == [["homard", "burgers"], ["ramen"]]
+    assert first.dtype == np.float32 and first.shape == (3, 3)
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(second[2], first[0])
+    # Valeurs arrondies en float16, identiques qu'elles viennent du cache ou non
+    assert first[0][0] == np.float32(np.float16(6.1234567))
+    assert cache.get_stats()["misses"] == 3
+
+
+def test_vectors_persist_per_model_across_instances(tmp_path):
+    path = str(tmp_path / "emb.sqlite")
+    provider, calls = make_provider()
+    asyncio.run(EmbeddingCache(path, model_name="m").embed(["homard"], provider))
+
+    reopened = EmbeddingCache(path, model_name="m", hot_size=0)
+    other_model = EmbeddingCache(path, model_name="other")
+    asyncio.run(reopened.embed(["homard"], provider))
+    asyncio.run(other_model.embed(["homard"], provider))
+
+    assert calls == [["homard"], ["homard"]]
+    assert reopened.get_stats()["db_hits"] == 1
+
+
+def test_caches_on_one_file_share_a_connection_until_closed(tmp_path):
+    path = str(tmp_path / "emb.sqlite")
+    first = EmbeddingCache(path, model_name="m")
+    second = EmbeddingCache(path, model_name="m")
+
+    assert first._db is second._db
+    assert first._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    first.close()
+    first.close()
+    provider, calls = make_provider()
+    asyncio.run(second.embed(["homard"], provider))
+    second.close()
+
+    assert calls == [["homard"]]
+    assert str(tmp_path / "emb.sqlite") not in utils._sqlite_connections
+
+
+def test_model_name_includes_bound_model():
+    async def openai_embedding(texts, model="text-embedding-3-small"):
+        return np.zeros((len(texts), 3))
+
+    bound = EmbeddingFunc(3, 8192, partial(openai_embedding, model="text-embedding-3-large"))
+
+    assert embedding_model_name(bound) == "openai_embedding:text-embedding-3-large:3"
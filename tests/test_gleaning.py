@@ -0,0 +1,102 @@
+import asyncio
+
+from lightrag import operate
+from lightrag.operate import GleaningStrategy, extract_entities, get_gleaning_stats
+
+
+class Graph:
+    def __init__(self):
+        self.nodes, self.edges = {}, {}
+
+    async def get_nodes_batch(self, names):
+        return {}
+
+    async def get_edges_batch(self, pairs):
+        return {}
+
+    async def upsert_nodes_batch(self, nodes):
+        self.nodes.update(nodes)
+
+    async def upsert_edges_batch(self, edges):
+        self.edges.update(edges)
+
+
+class WordStrategy(GleaningStrategy):
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+def entity(name):
+    return f'("entity"<|>"{name}"<|>"event"<|>"{name} description")'
+
+
+def run_extraction(monkeypatch, first_answer, tokens, max_gleaning=1, domain="event"):
+    calls = []
+
+    async def llm(prompt, history_messages=None, **kwargs):
+        calls.append((prompt, history_messages))
+        return first_answer if len(calls) == 1 else entity("extra") + "<|COMPLETE|>"
+
+    async def summary(entity_name, description, global_config):
+        return description
+
+    monkeypatch.setattr(operate, "_handle_entity_relation_summary", summary)
+    monkeypatch.setattr(operate, "_gleaning_stats", operate.defaultdict(operate.Counter))
+    global_config = {
+        "llm_model_func": llm,
+        "entity_extract_max_gleaning": max_gleaning,
+        "entity_extract_gleaning_config": {"skip_density": 1.0, "history_max_tokens": 0},
+        "addon_params": {},
+    }
+    chunks = {"chunk-1": {"content": "Concert de jazz au port", "tokens": tokens, "full_doc_id": "doc-1"}}
+    graph = Graph()
+    asyncio.run(extract_entities(chunks, graph, None, None, global_config, None, prompt_domain=domain))
+    return calls, graph, get_gleaning_stats(domain)
+
+
+def test_dense_first_pass_skips_gleaning(monkeypatch):
+    answer = "##".join(entity(f"e{i}") for i in range(3)) + "<|COMPLETE|>"
+
+    calls, graph, stats = run_extraction(monkeypatch, answer, tokens=200)
+
+    assert len(calls) == 1
+    assert stats["skipped_dense"] == 1 and stats["glean_calls"] == 0
+    assert stats["records_first_pass"] == 3 and stats["llm_calls_per_chunk"] == 1
+
+
+def test_sparse_first_pass_gleans_once_without_if_loop(monkeypatch):
+    calls, graph, stats = run_extraction(monkeypatch, entity("e0") + "<|COMPLETE|>", tokens=1200)
+
+    assert len(calls) == 2
+    assert calls[1][0] == operate.PROMPTS["entiti_continue_extraction"]
+    assert stats["if_loop_calls"] == 0 and stats["records_gleaned"] == 1
+    assert {"e0", "extra"} <= set(graph.nodes)
+
+
+def test_history_is_trimmed_to_the_token_budget():
+    strategy = WordStrategy(max_gleaning=3, history_max_tokens=12)
+    history = [
+        {"role": "user", "content": "examples " * 20 + "texte"},
+        {"role": "assistant", "content": "a b c"},
+        {"role": "user", "content": "continue"},
+        {"role": "assistant", "content": "d e f g"},
+        {"role": "user", "content": "continue"},
+        {"role": "assistant", "content": "h i"},
+    ]
+
+    trimmed, changed = strategy.trim_history(history, lambda: "prompt sans exemples texte")
+
+    assert changed
+    assert trimmed[0]["content"] == "prompt sans exemples texte"
+    assert [m["content"] for m in trimmed[1:]] == ["a b c", "continue", "h i"]
+    assert strategy.trim_history(trimmed, None) == (trimmed, False)
+
+
+def test_strategy_decisions():
+    strategy = GleaningStrategy(max_gleaning=2, skip_density=1.0)
+
+    assert strategy.should_glean(record_count=5, content_tokens=1200)
+    assert not strategy.should_glean(record_count=12, content_tokens=1200)
+    assert strategy.needs_if_loop(0) and not strategy.needs_if_loop(1)
+    assert not GleaningStrategy(max_gleaning=0).should_glean(0, 100)
+    assert GleaningStrategy(skip_density=0).should_glean(100, 10)
@@ -0,0 +1,59 @@
+import asyncio
+from dataclasses import dataclass, field
+
+from lightrag.base import BaseGraphStorage
+
+
+@dataclass
+class DictGraph(BaseGraphStorage):
+    nodes: dict = field(default_factory=dict)
+    edges: dict = field(default_factory=dict)
+
+    async def get_node(self, node_id):
+        return self.nodes.get(node_id)
+
+    async def node_degree(self, node_id):
+        if node_id not in self.nodes:
+            return None
+        return sum(node_id in pair for pair in self.edges)
+
+    async def get_edge(self, source_node_id, target_node_id):
+        return self.edges.get((source_node_id, target_node_id))
+
+    async def get_node_edges(self, source_node_id):
+        return [pair for pair in self.edges if source_node_id in pair]
+
+
+def make_graph():
+    return DictGraph(
+        namespace="test",
+        global_config={},
+        nodes={
+            "A": {"description": "a", "entity_type": "activity"},
+            "B": {"description": "b", "entity_type": "city"},
+            "C": {"description": "c", "entity_type": "positive_point"},
+        },
+        edges={("A", "B"): {"weight": 1.0}, ("A", "C"): {"weight": 2.0}},
+    )
+
+
+def test_default_batch_fallbacks():
+    graph = make_graph()
+
+    async def scenario():
+        return await asyncio.gather(
+            graph.get_nodes_batch(["A", "Z", "A"]),
+            graph.node_degrees_batch(["A", "B", "Z"]),
+            graph.get_edges_batch([("A", "B"), ("B", "A")]),
+            graph.edge_degrees_batch([("A", "B")]),
+            graph.get_nodes_edges_batch(["C", "Z"]),
+        )
+
+    nodes, degrees, edges, edge_degrees, node_edges = asyncio.run(scenario())
+
+    assert nodes == {"A": graph.nodes["A"], "Z": None}
+    assert degrees == {"A": 2, "B": 1, "Z": 0}
+    assert edges == {("A", "B"): {"weight": 1.0}, ("B", "A"): None}
+    assert edge_degrees == {("A", "B"): 3}
+    assert node_edges == {"C": [("A", "C")], "Z": []}
+
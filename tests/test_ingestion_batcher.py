@@ -0,0 +1,139 @@
+import asyncio
+
+from api.ingestion_batcher import IngestionBatcher
+from lightrag.utils import compute_mdhash_id
+
+
+class FullDocs:
+    def __init__(self):
+        self.keys = set()
+
+    async def filter_keys(self, keys):
+        return {key for key in keys if key not in self.keys}
+
+
+class RecordingRAG:
+    def __init__(self, poison=None, landed=()):
+        self.poison = poison
+        self.landed = landed
+        self.calls = []
+        self.full_docs = FullDocs()
+
+    async def ainsert(self, texts, prompt_domain=None, metadata=None):
+        await asyncio.sleep(0.01)
+        if self.poison in texts:
+            # les documents déjà écrits avant l'échec restent enregistrés
+            self.full_docs.keys.update(
+                compute_mdhash_id(text, prefix="doc-") for text in texts if text in self.landed
+            )
+            raise ValueError(f"document invalide : {self.poison}")
+        self.calls.append((prompt_domain, texts, metadata))
+
+
+def test_documents_are_grouped_by_domain_and_user():
+    rag = RecordingRAG()
+    batcher = IngestionBatcher(rag, max_batch_size=3, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit("a1", "activity", {"cid": 1}),
+            batcher.submit("a2", "activity", {"cid": 2}),
+            batcher.submit("m1", "memo", {"custom_id": "m1", "user_id": "u1"}),
+            batcher.submit("a3", "activity", {"cid": 3}),
+            batcher.submit("a4", "activity", {"cid": 4}),
+            batcher.submit("m2", "memo", {"custom_id": "m2", "user_id": "u2"}),
+        )
+
+    doc_ids = asyncio.run(scenario())
+
+    assert len(set(doc_ids)) == 6 and all(d.startswith("doc-") for d in doc_ids)
+    batches = sorted((domain, texts) for domain, texts, _ in rag.calls)
+    assert batches == [
+        ("activity", ["a1", "a2", "a3"]),
+        ("activity", ["a4"]),
+        ("memo", ["m1"]),
+        ("memo", ["m2"]),
+    ]
+    activity_metadata = next(m for d, t, m in rag.calls if t == ["a1", "a2", "a3"])
+    assert activity_metadata == [{"cid": 1}, {"cid": 2}, {"cid": 3}]
+
+
+def test_a_failing_document_only_fails_its_own_caller():
+    rag = RecordingRAG(poison="bad")
+    batcher = IngestionBatcher(rag, max_batch_size=3, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit("ok1"),
+            batcher.submit("bad"),
+            batcher.submit("ok2"),
+            return_exceptions=True,
+        )
+
+    ok1, bad, ok2 = asyncio.run(scenario())
+
+    assert isinstance(bad, ValueError)
+    assert ok1.startswith("doc-") and ok2.startswith("doc-")
+    assert sorted(texts[0] for _, texts, _ in rag.calls) == ["ok1", "ok2"]
+
+
+def test_close_flushes_pending_batches():
+    rag = RecordingRAG()
+    batcher = IngestionBatcher(rag, max_batch_size=10, max_wait_ms=60_000)
+
+    async def scenario():
+        pending = asyncio.create_task(batcher.submit("seul"))
+        await asyncio.sleep(0)
+        await batcher.close()
+        return await pending
+
+    assert asyncio.run(scenario()).startswith("doc-")
+    assert rag.calls[0][1] == ["seul"]
+
+
+def test_documents_written_before_the_failure_are_not_replayed():
+    rag = RecordingRAG(poison="bad", landed={"ok1"})
+    batcher = IngestionBatcher(rag, max_batch_size=3, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit("ok1"),
+            batcher.submit("bad"),
+            batcher.submit("ok2"),
+            return_exceptions=True,
+        )
+
+    ok1, bad, ok2 = asyncio.run(scenario())
+
+    assert isinstance(bad, ValueError)
+    assert ok1 == compute_mdhash_id("ok1", prefix="doc-") and ok2.startswith("doc-")
+    assert [texts for _, texts, _ in rag.calls] == [["ok2"]]
+
+
+class HangingRAG(RecordingRAG):
+    def __init__(self):
+        super().__init__()
+        self.cancelled = False
+
+    async def ainsert(self, texts, prompt_domain=None, metadata=None):
+        self.full_docs.keys.add(compute_mdhash_id("ok", prefix="doc-"))
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def test_timed_out_insert_is_cancelled_before_its_callers_fail():
+    rag = HangingRAG()
+    batcher = IngestionBatcher(rag, max_batch_size=2, max_wait_ms=20, timeout=0.05)
+
+    async def scenario():
+        return await asyncio.gather(batcher.submit("ok"), batcher.submit("lent"), return_exceptions=True)
+
+    ok, slow = asyncio.run(scenario())
+
+    # l'insertion ne tourne plus quand le worker republie le message
+    assert rag.cancelled
+    assert isinstance(slow, asyncio.TimeoutError)
+    assert ok == compute_mdhash_id("ok", prefix="doc-")
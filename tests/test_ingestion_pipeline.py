@@ -0,0 +1,261 @@
+import asyncio
+import time
+
+import pytest
+
+from lightrag import operate
+from lightrag.prompt import GRAPH_FIELD_SEP
+
+
+class Graph:
+    def __init__(self):
+        self.nodes, self.edges = {}, {}
+        self.writes = []
+        self.node_reads = 0
+
+    async def get_nodes_batch(self, names):
+        self.node_reads += 1
+        return {name: dict(self.nodes[name]) for name in names if name in self.nodes}
+
+    async def get_edges_batch(self, pairs):
+        return {pair: dict(self.edges[pair]) for pair in pairs if pair in self.edges}
+
+    async def upsert_nodes_batch(self, nodes):
+        self.writes.append(time.perf_counter())
+        self.nodes.update(nodes)
+
+    async def upsert_edges_batch(self, edges):
+        self.edges.update(edges)
+
+
+class VectorStorage:
+    def __init__(self):
+        self.batches = []
+
+    async def upsert(self, data):
+        self.batches.append(data)
+
+
+def chunk_result(chunk_key):
+    node = lambda name: {"entity_name": name, "entity_type": "activity", "description": f"{name} ({chunk_key})", "source_id": chunk_key}
+    edge = {"src_id": "homard", "tgt_id": chunk_key, "description": "sert", "keywords": "sert", "weight": 1, "source_id": chunk_key}
+    return {"homard": [node("homard")], chunk_key: [node(chunk_key)]}, {("homard", chunk_key): [edge]}
+
+
+class ChunkStorage:
+    def __init__(self):
+        self.data = {}
+
+    async def upsert(self, data):
+        self.data.update(data)
+
+
+def run_pipeline(monkeypatch, process_chunk, chunks, text_chunks=None, graph=None, **config):
+    async def summary(entity_name, description, global_config):
+        return description
+
+    monkeypatch.setattr(operate, "_handle_entity_relation_summary", summary)
+    graph, entities, relationships = graph or Graph(), VectorStorage(), VectorStorage()
+    stats = {}
+    global_config = {"llm_model_max_async": 4, "ingestion_pipeline_config": {"enabled": True, **config}}
+    totals = asyncio.run(
+        asyncio.wait_for(
+            operate._run_ingestion_pipeline(
+                [(key, {"content": key}) for key in chunks],
+                process_chunk,
+                graph,
+                entities,
+                relationships,
+                text_chunks,
+                global_config,
+                "activity",
+                None,
+                stats,
+            ),
+            timeout=5,
+        )
+    )
+    return graph, entities, relationships, stats, totals
+
+
+def test_entities_seen_in_several_chunks_are_merged_once(monkeypatch):
+    async def process_chunk(chunk):
+        await asyncio.sleep(0.01)
+        return chunk_result(chunk[0])
+
+    chunks = [f"c{i}" for i in range(6)]
+    graph, entities, relationships, stats, totals = run_pipeline(
+        monkeypatch, process_chunk, chunks, extract_workers=2
+    )
+
+    assert sorted(graph.nodes["homard"]["source_id"].split(GRAPH_FIELD_SEP)) == chunks
+    assert set(graph.edges) == {("c%d" % i, "homard") for i in range(6)}
+    # une seule lecture / fusion du graphe et un seul upsert vectoriel pour le lot
+    assert graph.node_reads == 1 and len(graph.writes) == 1
+    assert stats["merge"]["batches"] == 1 and stats["extract"]["items"] == 6
+    assert len(entities.batches) == 1
+    assert sum(len(batch) for batch in relationships.batches) == 6
+    assert totals == (7, 6)
+
+
+def test_extractions_are_bounded_by_extract_workers(monkeypatch):
+    running = []
+
+    async def process_chunk(chunk):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return chunk_result(chunk[0])
+
+    peak = []
+    run_pipeline(monkeypatch, process_chunk, [f"c{i}" for i in range(8)], extract_workers=2)
+
+    assert max(peak) == 2
+
+
+def test_stage_errors_stop_the_pipeline(monkeypatch):
+    async def process_chunk(chunk):
+        if chunk[0] == "c3":
+            raise ValueError("LLM indisponible")
+        return chunk_result(chunk[0])
+
+    with pytest.raises(ValueError):
+        run_pipeline(monkeypatch, process_chunk, [f"c{i}" for i in range(8)], queue_size=2)
+
+
+def test_nothing_is_written_when_extraction_fails(monkeypatch):
+    graph = Graph()
+
+    async def process_chunk(chunk):
+        if chunk[0] == "c3":
+            await asyncio.sleep(0.05)
+            raise ValueError("LLM indisponible")
+        return chunk_result(chunk[0])
+
+    text_chunks = ChunkStorage()
+    with pytest.raises(ValueError):
+        run_pipeline(
+            monkeypatch, process_chunk, [f"c{i}" for i in range(4)], text_chunks=text_chunks,
+            graph=graph, extract_workers=1,
+        )
+
+    # le rejeu réextrait tout le lot (réponses LLM servies par le cache)
+    assert graph.nodes == {} and text_chunks.data == {}
+
+
+class FailingVectorStorage:
+    async def upsert(self, data):
+        raise ConnectionError("Milvus indisponible")
+
+
+def test_chunks_are_not_marked_when_the_vector_upsert_fails(monkeypatch):
+    async def summary(entity_name, description, global_config):
+        return description
+
+    async def process_chunk(chunk):
+        return chunk_result(chunk[0])
+
+    monkeypatch.setattr(operate, "_handle_entity_relation_summary", summary)
+    text_chunks = ChunkStorage()
+    global_config = {"llm_model_max_async": 4, "ingestion_pipeline_config": {"enabled": True}}
+    with pytest.raises(ConnectionError):
+        asyncio.run(
+            operate._run_ingestion_pipeline(
+                [(f"c{i}", {"content": f"c{i}"}) for i in range(3)],
+                process_chunk,
+                Graph(),
+                FailingVectorStorage(),
+                VectorStorage(),
+                text_chunks,
+                global_config,
+                "activity",
+                None,
+            )
+        )
+
+    # le rejeu réextrait les chunks au lieu de conclure à « déjà en base »
+    assert text_chunks.data == {}
+
+
+def test_legacy_path_marks_chunks_after_the_vector_upsert(monkeypatch):
+    async def summary(entity_name, description, global_config):
+        return description
+
+    async def llm(prompt, history_messages=None, **kwargs):
+        return '("entity"<|>"homard"<|>"activity"<|>"homard grillé")<|COMPLETE|>'
+
+    monkeypatch.setattr(operate, "_handle_entity_relation_summary", summary)
+    global_config = {
+        "llm_model_func": llm,
+        "entity_extract_max_gleaning": 0,
+        "addon_params": {},
+        "ingestion_pipeline_config": {"enabled": False},
+    }
+    chunks = {"c0": {"content": "homard", "tokens": 1, "full_doc_id": "doc-1"}}
+    text_chunks = ChunkStorage()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(
+            operate.extract_entities(
+                chunks, Graph(), FailingVectorStorage(), VectorStorage(), global_config, text_chunks,
+                prompt_domain="activity",
+            )
+        )
+
+    assert text_chunks.data == {}
+
+
+def test_pipeline_builds_the_same_graph_as_the_legacy_path(monkeypatch):
+    async def summary(entity_name, description, global_config):
+        return description
+
+    async def llm(prompt, history_messages=None, **kwargs):
+        place = "port" if "port" in prompt.split("Text:")[-1] else "halles"
+        return (
+            '("entity"<|>"homard"<|>"activity"<|>"homard grillé")##'
+            f'("entity"<|>"{place}"<|>"activity"<|>"marché du {place}")##'
+            f'("relationship"<|>"homard"<|>"{place}"<|>"vendu au {place}"<|>"vente"<|>2)<|COMPLETE|>'
+        )
+
+    monkeypatch.setattr(operate, "_handle_entity_relation_summary", summary)
+
+    def build(enabled):
+        graph = Graph()
+        global_config = {
+            "llm_model_func": llm,
+            "llm_model_max_async": 2,
+            "entity_extract_max_gleaning": 0,
+            "addon_params": {},
+            "ingestion_pipeline_config": {"enabled": enabled, "extract_workers": 2},
+        }
+        chunks = {
+            f"c{i}": {"content": f"homard du {'port' if i % 2 else 'halles'} {i}", "tokens": 5, "full_doc_id": "doc-1"}
+            for i in range(6)
+        }
+        text_chunks = ChunkStorage()
+        asyncio.run(
+            operate.extract_entities(
+                chunks, graph, VectorStorage(), VectorStorage(), global_config, text_chunks,
+                prompt_domain="activity",
+            )
+        )
+        return graph, text_chunks
+
+    def normalized(items):
+        # ordre des chunks différent selon le chemin : champs multi-valeurs triés
+        return {
+            key: {
+                field: sorted(value.split(GRAPH_FIELD_SEP)) if isinstance(value, str) else value
+                for field, value in data.items()
+            }
+            for key, data in items.items()
+        }
+
+    legacy_graph, legacy_chunks = build(False)
+    pipeline_graph, pipeline_chunks = build(True)
+
+    assert normalized(pipeline_graph.nodes) == normalized(legacy_graph.nodes)
+    assert normalized(pipeline_graph.edges) == normalized(legacy_graph.edges)
+    assert set(pipeline_chunks.data) == set(legacy_chunks.data)
+    assert pipeline_graph.edges[("homard", "port")]["weight"] == 6
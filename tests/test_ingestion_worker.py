@@ -0,0 +1,101 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "rabbitMQ"))
+
+from ingestion_worker import RETRY_HEADER, IngestionWorker
+
+
+class InMemoryMessage:
+    def __init__(self, body: bytes, headers=None):
+        self.body = body
+        self.headers = headers or {}
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+
+class RecordingWorker(IngestionWorker):
+    def __init__(self, processor, **config):
+        super().__init__(processor, {"queue": "ingestion", "max_retries": 2, **config})
+        self.published = []
+
+    async def publish(self, routing_key, body, headers):
+        self.published.append((routing_key, body, headers))
+
+
+class FlakyProcessor:
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.processed = []
+        self.running = self.max_running = 0
+
+    async def process_message(self, payload):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("Neo4j indisponible")
+            self.processed.append(payload)
+        finally:
+            self.running -= 1
+
+
+def test_messages_are_processed_concurrently_and_acked():
+    processor = FlakyProcessor(delay=0.02)
+    worker = RecordingWorker(processor, concurrency=4)
+    messages = [InMemoryMessage(json.dumps({"type": "activity", "cid": i}).encode()) for i in range(8)]
+
+    async def scenario():
+        await asyncio.gather(*[worker.on_message(m) for m in messages])
+
+    asyncio.run(scenario())
+
+    assert all(m.acked for m in messages)
+    assert len(processor.processed) == 8
+    assert processor.max_running == 4
+    assert worker.stats["acked"] == 8
+
+
+def test_failures_are_retried_then_dead_lettered():
+    worker = RecordingWorker(FlakyProcessor(failures=10))
+    message = InMemoryMessage(b'{"type": "memo"}')
+
+    asyncio.run(worker.on_message(message))
+    routing_key, body, headers = worker.published[-1]
+    assert message.acked
+    assert (routing_key, headers[RETRY_HEADER]) == ("ingestion", 1)
+
+    exhausted = InMemoryMessage(body, {RETRY_HEADER: 2})
+    asyncio.run(worker.on_message(exhausted))
+    routing_key, _, headers = worker.published[-1]
+    assert routing_key == "ingestion.dlq"
+    assert "Neo4j indisponible" in headers["x-death-reason"]
+    assert worker.stats == {"acked": 0, "retried": 1, "dead_lettered": 1}
+
+
+def test_invalid_json_goes_straight_to_the_dead_letter_queue():
+    processor = FlakyProcessor()
+    worker = RecordingWorker(processor)
+
+    asyncio.run(worker.on_message(InMemoryMessage(b"pas du json")))
+
+    assert worker.published[0][0] == "ingestion.dlq"
+    assert processor.processed == []
+
+
+def test_rabbitmq_credentials_are_required(monkeypatch):
+    for name in ("RABBITMQ_HOST", "RABBITMQ_USER", "RABBITMQ_PASSWORD"):
+        monkeypatch.delenv(name, raising=False)
+    worker = IngestionWorker(FlakyProcessor(), {"queue": "ingestion"})
+
+    with pytest.raises(RuntimeError, match="RABBITMQ_HOST"):
+        asyncio.run(worker.run())
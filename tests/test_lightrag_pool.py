@@ -0,0 +1,66 @@
+import asyncio
+
+from api.lightrag_pool import DEFAULT_POOL_SIZE, LightRAGPool
+
+
+class FakeRAG:
+    def __init__(self):
+        self.initialized = False
+        self.closed = False
+
+    async def ainitialize(self):
+        self.initialized = True
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_pool_reuses_instances_and_closes_them():
+    created = []
+
+    def factory():
+        rag = FakeRAG()
+        created.append(rag)
+        return rag
+
+    async def scenario():
+        pool = LightRAGPool(factory, size=2)
+
+        async def use():
+            async with pool.acquire() as rag:
+                await asyncio.sleep(0.01)
+                return rag
+
+        used = await asyncio.gather(*[use() for _ in range(6)])
+        stats = pool.get_stats()
+        await pool.close()
+        return used, stats
+
+    used, stats = asyncio.run(scenario())
+
+    assert len(created) == 2
+    assert all(rag.initialized for rag in created)
+    assert set(map(id, used)) == set(map(id, created))
+    assert stats["acquired"] == 6 and stats["released"] == 6
+    assert stats["in_use"] == 0
+    assert all(rag.closed for rag in created)
+
+
+def test_pool_size_defaults_to_a_small_fixed_pool(monkeypatch):
+    monkeypatch.delenv("LIGHTRAG_POOL_SIZE", raising=False)
+
+    def factory():
+        rag = FakeRAG()
+        rag.llm_model_max_async = 16
+        return rag
+
+    async def scenario():
+        pool = LightRAGPool(factory)
+        await pool.start()
+        stats = pool.get_stats()
+        await pool.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+
+    assert stats["size"] == DEFAULT_POOL_SIZE and stats["created"] == DEFAULT_POOL_SIZE
@@ -0,0 +1,470 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from pymilvus import MilvusClient
+
+from lightrag import operate
+from lightrag.base import QueryParam
+from lightrag.kg import milvus_impl
+from lightrag.kg.milvus_impl import IndexConfig, MilvusVectorDBStorage
+from lightrag.utils import EmbeddingFunc
+
+
+class FakeMilvusClient:
+    """Enregistre les appels et le thread qui les exécute"""
+
+    def __init__(self, **kwargs):
+        self.calls = []
+
+    def _record(self, name, **kwargs):
+        self.calls.append((name, threading.current_thread().name, kwargs))
+
+    def has_collection(self, name):
+        self._record("has_collection")
+        return False
+
+    create_schema = staticmethod(MilvusClient.create_schema)
+    prepare_index_params = staticmethod(MilvusClient.prepare_index_params)
+
+    def create_collection(self, name, **kwargs):
+        self._record("create_collection", **kwargs)
+
+    def release_collection(self, name):
+        self._record("release_collection")
+
+    def list_indexes(self, name, field_name=""):
+        self._record("list_indexes")
+        return ["vector"]
+
+    def drop_index(self, name, index_name):
+        self._record("drop_index", index_name=index_name)
+
+    def create_index(self, name, index_params):
+        self._record("create_index", index_params=index_params)
+
+    def load_collection(self, name):
+        self._record("load_collection")
+
+    def upsert(self, collection_name, data):
+        self._record("upsert", data=data)
+        return {"upsert_count": len(data)}
+
+    def search(self, collection_name, data, limit, **kwargs):
+        self._record("search", vectors=len(data))
+        self.last_search_params = kwargs.get("search_params")
+        self.last_filter = kwargs.get("filter")
+        return [
+            [{"id": f"ent-{i}-{j}", "distance": 0.9, "entity": {"entity_name": f"E{i}{j}"}} for j in range(limit)]
+            for i in range(len(data))
+        ]
+
+    def describe_collection(self, name):
+        self._record("describe_collection")
+        return {"fields": [{"name": "id"}, {"name": "vector"}, {"name": "sparse"}]}
+
+    def hybrid_search(self, collection_name, reqs, ranker, limit, **kwargs):
+        self._record("hybrid_search", reqs=reqs, ranker=ranker)
+        return [[{"id": "ent-0", "distance": 0.03, "entity": {"entity_name": "Homard"}}]]
+
+    def close(self):
+        pass
+
+
+async def fake_embedding(texts):
+    fake_embedding.calls.append(list(texts))
+    return np.array([[float(len(t)), 1.0, 0.0] for t in texts])
+
+
+def make_storage(monkeypatch, storage_kwargs=None, namespace="entities", user_tenancy=False):
+    monkeypatch.setattr(milvus_impl, "MilvusClient", FakeMilvusClient)
+    fake_embedding.calls = []
+    return MilvusVectorDBStorage(
+        namespace=namespace,
+        global_config={
+            "working_dir": "/tmp",
+            "embedding_batch_num": 2,
+            "vector_db_storage_cls_kwargs": storage_kwargs or {},
+            "user_tenancy": user_tenancy,
+        },
+        embedding_func=EmbeddingFunc(embedding_dim=3, max_token_size=8192, func=fake_embedding),
+        meta_fields={"entity_name"},
+    )
+
+
+def test_calls_run_off_loop_and_collection_is_checked_once(monkeypatch):
+    storage = make_storage(monkeypatch)
+
+    async def scenario():
+        await storage.upsert({f"ent-{i}": {"content": "x" * i, "entity_name": f"E{i}"} for i in range(5)})
+        await storage.upsert({"ent-9": {"content": "y", "entity_name": "E9"}})
+        await storage.query("paris", top_k=2)
+
+    asyncio.run(scenario())
+
+    calls = storage._client.calls
+    assert [name for name, _, _ in calls].count("has_collection") == 1
+    assert all(thread.startswith("milvus") for _, thread, _ in calls)
+    # Vecteurs remis dans l'ordre des identifiants malgré les lots parallèles
+    upserted = calls[2][2]["data"]
+    assert [d["id"] for d in upserted] == [f"ent-{i}" for i in range(5)]
+    assert [d["vector"][0] for d in upserted] == [float(i) for i in range(5)]
+
+
+def test_query_many_embeds_and_searches_once(monkeypatch):
+    storage = make_storage(monkeypatch)
+
+    results = asyncio.run(storage.query_many(["homard", "burgers", "ramen"], top_k=2))
+
+    assert fake_embedding.calls == [["homard", "burgers", "ramen"]]
+    searches = [kwargs for name, _, kwargs in storage._client.calls if name == "search"]
+    assert searches == [{"vectors": 3}]
+    assert [r["id"] for r in results[1]] == ["ent-1-0", "ent-1-1"]
+
+
+def test_index_config_per_namespace_overrides_defaults():
+    kwargs = {
+        "index": {
+            "default": {"params": {"M": 32}},
+            "chunks": {"index_type": "ivf_sq8", "search_params": {"nprobe": 32}, "radius": None},
+        }
+    }
+
+    entities = IndexConfig.for_namespace("entities", kwargs)
+    chunks = IndexConfig.for_namespace("chunks", kwargs)
+
+    assert (entities.index_type, entities.params) == ("HNSW", {"M": 32, "efConstruction": 200})
+    assert entities.search_param() == {"metric_type": "COSINE", "params": {"ef": 64, "radius": 0.2}}
+    # Les paramètres HNSW de "default" ne sont pas transmis à l'index IVF
+    assert chunks.index_type == "IVF_SQ8"
+    assert chunks.params == {"nlist": 1024}
+    assert chunks.search_param() == {"metric_type": "COSINE", "params": {"nprobe": 32}}
+    with pytest.raises(ValueError):
+        IndexConfig.for_namespace("entities", {"index": {"entities": {"index_type": "ANNOY"}}})
+
+
+def test_collection_index_search_and_rebuild_follow_config(monkeypatch):
+    storage = make_storage(
+        monkeypatch,
+        {"index": {"entities": {"index_type": "IVF_FLAT", "params": {"nlist": 64}, "search_params": {"nprobe": 8}}}},
+    )
+
+    async def scenario():
+        await storage.initialize()
+        await storage.query("paris", top_k=2)
+        await storage.rebuild_index()
+
+    asyncio.run(scenario())
+
+    calls = storage._client.calls
+    created = next(kwargs for name, _, kwargs in calls if name == "create_collection")
+    index = list(created["index_params"])[0].to_dict()
+    assert (index["index_type"], index["nlist"], index["metric_type"]) == ("IVF_FLAT", 64, "COSINE")
+    assert storage._client.last_search_params == {
+        "metric_type": "COSINE",
+        "params": {"nprobe": 8, "radius": 0.2},
+    }
+    rebuild = [name for name, _, _ in calls[calls.index(next(c for c in calls if c[0] == "search")) + 1 :]]
+    assert rebuild == ["release_collection", "list_indexes", "drop_index", "create_index", "load_collection"]
+
+
+def test_scalar_fields_are_declared_indexed_and_filled(monkeypatch):
+    storage = make_storage(monkeypatch)
+
+    async def scenario():
+        await storage.upsert({"ent-1": {"content": "x", "entity_name": "E1", "custom_id": 42}})
+
+    asyncio.run(scenario())
+
+    created = next(kwargs for name, _, kwargs in storage._client.calls if name == "create_collection")
+    fields = {f.name for f in created["schema"].fields}
+    assert {"custom_id", "entity_type", "city", "user_id"} <= fields
+    indexed = {index.to_dict()["field_name"] for index in created["index_params"]}
+    assert indexed == {"vector", "custom_id", "entity_type", "city", "user_id"}
+    upserted = next(kwargs for name, _, kwargs in storage._client.calls if name == "upsert")["data"][0]
+    assert (upserted["custom_id"], upserted["city"], upserted["user_id"]) == ("42", "", "")
+
+
+def test_filter_expressions(monkeypatch):
+    entities = make_storage(monkeypatch)
+    relationships = make_storage(monkeypatch, namespace="relationships")
+
+    assert entities._filter_expr(None) == ""
+    assert entities._filter_expr([]) == ""
+    assert entities._filter_expr(["ent-1", "ent-2"]) == 'id in ["ent-1", "ent-2"]'
+    assert (
+        entities._filter_expr({"custom_id": ["1", 'a"b'], "city": "Lyon", "user_id": []})
+        == 'custom_id in ["1", "a\\"b"] and city == "Lyon"'
+    )
+    assert (
+        relationships._filter_expr({"custom_id": ["1"]})
+        == '(src_custom_id in ["1"] or tgt_custom_id in ["1"])'
+    )
+
+
+def test_scalar_filter_skips_graph_pre_pass(monkeypatch):
+    entities = make_storage(monkeypatch)
+    relationships = make_storage(monkeypatch, namespace="relationships")
+
+    class Graph:
+        async def get_filtered_ids(self, vdb_filter):
+            raise AssertionError("pré-passe Neo4j inattendue")
+
+    async def fake_node_data(query, graph, vdb, chunks, param, vdb_filter, filtered_ids, user_id=None):
+        assert filtered_ids is None
+        await vdb.query(query, top_k=1, vdb_filter=operate._scalar_vdb_filter(vdb_filter))
+        return ("ent", "rel", "txt", [])
+
+    async def fake_edge_data(keywords, graph, vdb, chunks, param, vdb_filter, filtered_ids, user_id=None):
+        assert filtered_ids is None
+        await vdb.query(keywords, top_k=1, vdb_filter=operate._scalar_vdb_filter(vdb_filter))
+        return ("ent", "rel", "txt")
+
+    monkeypatch.setattr(operate, "_get_node_data", fake_node_data)
+    monkeypatch.setattr(operate, "_get_edge_data", fake_edge_data)
+
+    asyncio.run(
+        operate._build_query_context(
+            ["homard", "gastronomie"], Graph(), entities, relationships, None,
+            QueryParam(mode="hybrid"), vdb_filter=["act-1"],
+        )
+    )
+
+    assert entities._client.last_filter == 'custom_id in ["act-1"]'
+    assert relationships._client.last_filter == '(src_custom_id in ["act-1"] or tgt_custom_id in ["act-1"])'
+
+
+def test_tenancy_uses_partition_key_and_restricts_searches(monkeypatch):
+    storage = make_storage(monkeypatch, {"num_partitions": 16}, user_tenancy=True)
+
+    async def scenario():
+        await storage.query("homard", user_id="alice")
+        alice = storage._client.last_filter
+        await storage.query("homard", vdb_filter={"custom_id": ["act-1"]})
+        return alice, storage._client.last_filter
+
+    alice, anonymous = asyncio.run(scenario())
+
+    created = next(kwargs for name, _, kwargs in storage._client.calls if name == "create_collection")
+    partition_keys = [f.name for f in created["schema"].fields if f.is_partition_key]
+    assert partition_keys == ["user_id"]
+    assert created["num_partitions"] == 16
+    assert alice == 'user_id in ["", "alice"]'
+    assert anonymous == 'custom_id in ["act-1"] and user_id in [""]'
+
+
+class TenantGraph:
+    """Graphe en mémoire : nœuds par nom, relations par paire triée"""
+
+    def __init__(self, nodes=None):
+        self.nodes, self.edges = dict(nodes or {}), {}
+
+    async def get_nodes_batch(self, names):
+        return {name: dict(self.nodes[name]) for name in names if name in self.nodes}
+
+    async def get_edges_batch(self, pairs):
+        return {pair: dict(self.edges[tuple(sorted(pair))]) for pair in pairs if tuple(sorted(pair)) in self.edges}
+
+    async def node_degrees_batch(self, names):
+        return {name: sum(name in pair for pair in self.edges) for name in names}
+
+    async def edge_degrees_batch(self, pairs):
+        return {pair: 1 for pair in pairs}
+
+    async def get_nodes_edges_batch(self, names):
+        return {name: [pair if pair[0] == name else pair[::-1] for pair in self.edges if name in pair] for name in names}
+
+    async def upsert_nodes_batch(self, nodes):
+        self.nodes.update(nodes)
+
+    async def upsert_edges_batch(self, edges):
+        self.edges.update({tuple(sorted(pair)): data for pair, data in edges.items()})
+
+
+def insert_memo(monkeypatch, graph, user_id, entities, relations):
+    async def summary(entity_name, description, global_config):
+        return description
+
+    node = lambda name, entity_type: {"entity_name": name, "entity_type": entity_type, "description": f"{name} de {user_id}", "source_id": f"memo-{user_id}"}
+    edge = lambda src, tgt: {"src_id": src, "tgt_id": tgt, "description": f"{src} -> {tgt}", "keywords": "memo", "weight": 1, "source_id": f"memo-{user_id}"}
+    maybe_nodes = {name: [node(name, entity_type)] for name, entity_type in entities}
+    maybe_edges = {tuple(sorted(pair)): [edge(*pair)] for pair in relations}
+    monkeypatch.setattr(operate, "_handle_entity_relation_summary", summary)
+    return asyncio.run(
+        operate._merge_then_upsert_graph(
+            maybe_nodes, maybe_edges, graph, {"user_tenancy": True}, "memo", user_id=user_id
+        )
+    )
+
+
+def test_user_scoped_nodes_are_keyed_by_their_owner(monkeypatch):
+    shared = {"entity_type": "city", "description": "Lyon", "source_id": "c0"}
+    graph = TenantGraph({
+        "lyon": shared,
+        "bob::bob": {"entity_type": "user", "description": "d", "source_id": "c0", "user_id": "bob"},
+    })
+
+    entities, relationships = insert_memo(
+        monkeypatch, graph, "alice",
+        [("alice", "user"), ("homard", "user_preference"), ("lyon", "city")],
+        [("alice", "homard"), ("homard", "lyon")],
+    )
+    insert_memo(monkeypatch, graph, "bob", [("homard", "user_preference")], [])
+
+    # une entité par (user_id, nom) : pas de fusion entre utilisateurs
+    assert graph.nodes["alice::homard"]["user_id"] == "alice"
+    assert graph.nodes["bob::homard"]["description"] == "homard de bob"
+    assert graph.nodes["bob::bob"]["user_id"] == "bob"
+    # le nœud partagé n'est ni modifié ni approprié, les relations s'y rattachent
+    assert graph.nodes["lyon"] == shared
+    assert graph.edges[("alice::homard", "lyon")]["user_id"] == "alice"
+    assert {e["entity_name"] for e in entities} == {"alice::alice", "alice::homard"}
+    assert all(e["user_id"] == "alice" for e in entities + relationships)
+
+
+def test_graph_expansion_hides_other_users_data(monkeypatch):
+    graph = TenantGraph({"lyon": {"entity_type": "city", "description": "Lyon", "source_id": "c0"}})
+    insert_memo(monkeypatch, graph, "alice", [("homard", "user_preference")], [("homard", "lyon")])
+    insert_memo(monkeypatch, graph, "bob", [("opera", "user_preference")], [("lyon", "opera")])
+
+    class Entities:
+        supports_scalar_filter = False
+
+        async def query(self, query, top_k=5, vdb_filter=None, user_id=None):
+            return [{"entity_name": "lyon"}, {"entity_name": "alice::homard"}]
+
+    class Relationships(Entities):
+        async def query(self, query, top_k=5, vdb_filter=None, user_id=None):
+            return [{"src_id": "alice::homard", "tgt_id": "lyon"}, {"src_id": "bob::opera", "tgt_id": "lyon"}]
+
+    class Chunks:
+        async def get_by_ids(self, ids):
+            return [{"content": f"texte {chunk_id}"} for chunk_id in ids]
+
+    param = QueryParam(top_k=5)
+    monkeypatch.setattr(operate, "truncate_list_by_token_size", lambda items, key, max_token_size: items)
+
+    async def scenario():
+        local = await operate._get_node_data("lyon", graph, Entities(), Chunks(), param, user_id="bob")
+        global_ = await operate._get_edge_data("lyon", graph, Relationships(), Chunks(), param, user_id="bob")
+        return local, global_
+
+    local, global_ = asyncio.run(scenario())
+
+    bob_context = "".join(local[:3]) + "".join(global_)
+    assert "alice" not in bob_context
+    assert "bob::opera" in bob_context
+
+
+def test_hybrid_mode_stores_text_and_runs_one_hybrid_search(monkeypatch):
+    storage = make_storage(
+        monkeypatch, {"hybrid": {"default": {"enabled": True}, "entities": {"ranker": "weighted"}}}
+    )
+
+    async def scenario():
+        await storage.upsert({"ent-0": {"content": "Homard breton grillé", "entity_name": "Homard"}})
+        return await storage.query("homard, burgers", top_k=3, vdb_filter={"city": "Brest"})
+
+    results = asyncio.run(scenario())
+
+    calls = {name: kwargs for name, _, kwargs in storage._client.calls}
+    fields = {f.name for f in calls["create_collection"]["schema"].fields}
+    assert {"text", "sparse"} <= fields
+    assert calls["upsert"]["data"][0]["text"] == "Homard breton grillé"
+    dense, sparse = calls["hybrid_search"]["reqs"]
+    assert (dense.anns_field, sparse.anns_field) == ("vector", "sparse")
+    assert sparse.data == ["homard, burgers"]
+    assert dense.expr == sparse.expr == 'city == "Brest"'
+    assert type(calls["hybrid_search"]["ranker"]).__name__ == "WeightedRanker"
+    assert "search" not in calls
+    assert results[0]["entity_name"] == "Homard"
+
+
+def test_hybrid_mode_falls_back_to_dense_without_sparse_field(monkeypatch):
+    storage = make_storage(monkeypatch, {"hybrid": {"default": {"enabled": True}}})
+    storage._client.describe_collection = lambda name: {"fields": [{"name": "id"}, {"name": "vector"}]}
+
+    asyncio.run(storage.query("homard"))
+
+    assert not storage.hybrid_config.enabled
+    assert "search" in [name for name, _, _ in storage._client.calls]
+
+
+def test_truncate_utf8_keeps_whole_characters():
+    assert milvus_impl.truncate_utf8("crème brûlée", 4) == "crè"
+    assert milvus_impl.truncate_utf8("crème", 3) == "cr"
+
+
+def test_hybrid_context_searches_concurrently_with_one_filter_pass(monkeypatch):
+    running = set()
+    overlap = []
+    filter_calls = []
+
+    class Graph:
+        async def get_filtered_ids(self, vdb_filter):
+            filter_calls.append(vdb_filter)
+            return {"node_ids": ["n"], "relation_ids": ["r"]}
+
+    async def fake_search(name, result, filtered_ids):
+        running.add(name)
+        await asyncio.sleep(0.01)
+        overlap.append(set(running))
+        running.discard(name)
+        assert filtered_ids == {"node_ids": ["n"], "relation_ids": ["r"]}
+        return result
+
+    async def fake_node_data(query, graph, vdb, chunks, param, vdb_filter, filtered_ids, user_id=None):
+        return await fake_search("node", ("ent", "rel", "txt", []), filtered_ids)
+
+    async def fake_edge_data(keywords, graph, vdb, chunks, param, vdb_filter, filtered_ids, user_id=None):
+        return await fake_search("edge", ("ent", "rel", "txt"), filtered_ids)
+
+    monkeypatch.setattr(operate, "_get_node_data", fake_node_data)
+    monkeypatch.setattr(operate, "_get_edge_data", fake_edge_data)
+
+    context = asyncio.run(
+        operate._build_query_context(
+            ["homard", "gastronomie"], Graph(), None, None, None,
+            QueryParam(mode="hybrid"), vdb_filter=["act-1"],
+        )
+    )
+
+    assert filter_calls == [["act-1"]]
+    assert {"node", "edge"} in overlap
+    assert "-----Entities-----" in context
+
+
+def test_collection_without_scalar_fields_falls_back_to_graph_ids(monkeypatch):
+    legacy = make_storage(monkeypatch)
+    legacy._client.has_collection = lambda name: True
+    # collection antérieure aux champs scalaires : custom_id n'est pas déclaré
+    legacy._client.describe_collection = lambda name: {"fields": [{"name": "id"}, {"name": "vector"}]}
+    relationships = make_storage(monkeypatch, namespace="relationships")
+    filtered = []
+
+    class Graph:
+        async def get_filtered_ids(self, vdb_filter):
+            filtered.append(vdb_filter)
+            return {"node_ids": ["ent-1"], "relation_ids": ["rel-1"]}
+
+    async def fake_node_data(query, graph, vdb, chunks, param, vdb_filter, filtered_ids, user_id=None):
+        await vdb.query(query, top_k=1, vdb_filter=filtered_ids["node_ids"])
+        return ("ent", "rel", "txt", [])
+
+    async def fake_edge_data(keywords, graph, vdb, chunks, param, vdb_filter, filtered_ids, user_id=None):
+        return ("ent", "rel", "txt")
+
+    monkeypatch.setattr(operate, "_get_node_data", fake_node_data)
+    monkeypatch.setattr(operate, "_get_edge_data", fake_edge_data)
+
+    asyncio.run(
+        operate._build_query_context(
+            ["homard", "gastronomie"], Graph(), legacy, relationships, None,
+            QueryParam(mode="hybrid"), vdb_filter=["act-1"],
+        )
+    )
+
+    assert not legacy.supports_scalar_filter and relationships.supports_scalar_filter
+    assert filtered == [["act-1"]]
+    assert legacy._client.last_filter == 'id in ["ent-1"]'
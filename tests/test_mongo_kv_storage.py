@@ -0,0 +1,85 @@
+import asyncio
+
+from lightrag.kg.mongo_impl import MongoKVStorage
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield doc
+
+
+class FakeCollection:
+    """Collection en mémoire enregistrant les appels au serveur"""
+
+    def __init__(self):
+        self.docs = {}
+        self.calls = []
+
+    def find(self, filter, projection=None):
+        ids = filter["_id"]["$in"]
+        self.calls.append(("find", len(ids), projection))
+        docs = [
+            {"_id": i, **({} if projection == {"_id": 1} else self.docs[i])}
+            for i in ids
+            if i in self.docs
+        ]
+        return FakeCursor(docs)
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append(("bulk_write", len(operations), ordered))
+        for operation in operations:
+            key = operation._filter["_id"]
+            self.docs.setdefault(key, {}).update(operation._doc["$set"])
+
+
+class MemoryMongoKVStorage(MongoKVStorage):
+    BULK_BATCH_SIZE = 4
+    IN_CHUNK_SIZE = 3
+
+    @property
+    def _data(self):
+        return self.collection
+
+
+def make_storage():
+    storage = MemoryMongoKVStorage(namespace="test", global_config={}, embedding_func=None)
+    storage.collection = FakeCollection()
+    return storage
+
+
+def test_upsert_uses_unordered_bulk_writes():
+    storage = make_storage()
+    data = {f"k{i}": {"value": i} for i in range(10)}
+
+    asyncio.run(storage.upsert(data))
+
+    bulk_calls = [call for call in storage.collection.calls if call[0] == "bulk_write"]
+    assert bulk_calls == [("bulk_write", 4, False), ("bulk_write", 4, False), ("bulk_write", 2, False)]
+    assert storage.collection.docs["k7"] == {"value": 7}
+    assert data["k7"]["_id"] == "k7"
+
+
+def test_reads_chunk_in_lists_and_keep_order():
+    storage = make_storage()
+    storage.collection.docs = {f"k{i}": {"value": i} for i in range(5)}
+
+    async def scenario():
+        return (
+            await storage.get_by_ids(["k4", "missing", "k0", "k2"], fields=["value"]),
+            await storage.filter_keys(["k1", "new", "k3", "other"]),
+        )
+
+    docs, new_keys = asyncio.run(scenario())
+
+    assert [doc and doc["value"] for doc in docs] == [4, None, 0, 2]
+    assert new_keys == {"new", "other"}
+    finds = [call for call in storage.collection.calls if call[0] == "find"]
+    assert all(size <= 3 for _, size, _ in finds)
+    assert ("find", 1, {"_id": 1}) in finds
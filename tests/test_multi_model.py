@@ -0,0 +1,170 @@
+import asyncio
+import time
+from functools import partial
+
+import httpx
+import pytest
+from tenacity import retry, retry_if_exception_type, stop_after_attempt
+
+from lightrag import llm
+from lightrag.llm import Model, MultiModel, get_openai_rate_limits, parse_rate_limit_headers
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def make_model(name, delays=None, fail=None):
+    calls = []
+
+    async def gen_func(prompt, system_prompt=None, history_messages=[], **kwargs):
+        calls.append(prompt)
+        if fail is not None and fail(len(calls)):
+            raise fail.error
+        delay = delays(len(calls)) if callable(delays) else (delays or 0)
+        await asyncio.sleep(delay)
+        return f"{name}:{prompt}"
+
+    return Model(gen_func=gen_func, kwargs={"model": name, "api_key": f"key-{name}"}), calls
+
+
+def test_rate_limit_headers_are_parsed_and_recorded():
+    limits = parse_rate_limit_headers(
+        {
+            "x-ratelimit-limit-requests": "500",
+            "x-ratelimit-remaining-requests": "12",
+            "x-ratelimit-reset-requests": "6m0.5s",
+            "x-ratelimit-reset-tokens": "20ms",
+        }
+    )
+    now = time.monotonic()
+    assert limits["limit_requests"] == 500 and limits["remaining_requests"] == 12
+    assert 359 < limits["reset_requests_at"] - now <= 360.5
+    assert 0 < limits["reset_tokens_at"] - now <= 0.02
+
+    response = httpx.Response(200, headers={"x-ratelimit-remaining-tokens": "7"})
+    asyncio.run(llm._record_rate_limits(("http://x/v1", "sk-test"), response))
+    assert get_openai_rate_limits("http://x/v1", "sk-test")["remaining_tokens"] == 7
+
+
+def test_slow_model_gets_less_traffic():
+    fast, fast_calls = make_model("fast", delays=0.001)
+    slow, slow_calls = make_model("slow", delays=0.03)
+    router = MultiModel([fast, slow], hedge_percentile=None)
+
+    async def scenario():
+        for i in range(20):
+            await router.llm_model_func(f"p{i}")
+
+    asyncio.run(scenario())
+
+    assert len(fast_calls) >= 15
+    assert router.get_stats()["models"][1]["latency_ewma"] > 0.02
+
+
+def test_rate_limited_model_cools_down_until_reset():
+    def always(n):
+        return True
+
+    always.error = RateLimitError("429")
+    limited, limited_calls = make_model("limited", fail=always)
+    healthy, healthy_calls = make_model("healthy")
+    router = MultiModel([limited, healthy], hedge_percentile=None)
+    llm._openai_rate_limits[(None, "key-limited")] = {"retry_after_at": time.monotonic() + 60}
+
+    async def scenario():
+        return [await router.llm_model_func(f"p{i}") for i in range(6)]
+
+    results = asyncio.run(scenario())
+
+    assert all(r.startswith("healthy:") for r in results)
+    assert len(limited_calls) == 1
+    stats = router.get_stats()
+    assert stats["failovers"] == 1
+    assert stats["models"][0]["rate_limited"] == 1
+    assert 55 < stats["models"][0]["cooldown_remaining"] <= 60
+
+
+def test_repeated_failures_open_the_circuit():
+    def always(n):
+        return True
+
+    always.error = StatusError(500)
+    broken, broken_calls = make_model("broken", fail=always)
+    router = MultiModel([broken], failure_threshold=2, cooldown=10)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(StatusError):
+                await router.llm_model_func("p")
+
+    asyncio.run(scenario())
+
+    assert router.get_stats()["models"][0]["cooldown_remaining"] > 9
+
+
+def test_slow_call_is_hedged_on_another_model():
+    primary, primary_calls = make_model("primary", delays=lambda n: 0.5 if n == 5 else 0.005)
+    backup, backup_calls = make_model("backup", delays=0.005)
+    router = MultiModel([primary, backup], hedge_min_samples=3)
+    # primary seen as the faster model: always picked first
+    router._health[0].latency_ewma = 0.001
+    router._health[0].latency_ewma, router._health[1].latency_ewma = 0.001, 1.0
+
+    async def scenario():
+        for i in range(4):
+            await router.llm_model_func(f"warm{i}")
+        start = time.perf_counter()
+        result = await router.llm_model_func("slow")
+        return result, time.perf_counter() - start
+
+    result, duration = asyncio.run(scenario())
+
+    assert result == "backup:slow"
+    assert duration < 0.3
+    stats = router.get_stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_bad_requests_are_raised_without_failover():
+    def always(n):
+        return True
+
+    always.error = StatusError(400)
+    invalid, invalid_calls = make_model("invalid", fail=always)
+    healthy, healthy_calls = make_model("healthy")
+    router = MultiModel([invalid, healthy], failure_threshold=1, hedge_percentile=None)
+    router._health[0].latency_ewma, router._health[1].latency_ewma = 0.001, 1.0
+
+    with pytest.raises(StatusError):
+        asyncio.run(router.llm_model_func("p"))
+
+    assert len(invalid_calls) == 1 and healthy_calls == []
+    stats = router.get_stats()
+    assert stats["failovers"] == 0
+    assert stats["models"][0]["errors"] == 0 and stats["models"][0]["cooldown_remaining"] == 0
+
+
+def test_gen_func_retries_are_replaced_by_failover():
+    calls = []
+
+    @retry(stop=stop_after_attempt(3), retry=retry_if_exception_type(RateLimitError))
+    async def gen_func(prompt, system_prompt=None, history_messages=[], model=None, **kwargs):
+        calls.append(model)
+        if model == "limited":
+            raise RateLimitError("429")
+        return f"{model}:{prompt}"
+
+    limited = Model(gen_func=gen_func, kwargs={"model": "limited", "api_key": "key-retry-limited"})
+    healthy = Model(gen_func=partial(gen_func), kwargs={"model": "healthy", "api_key": "key-retry-healthy"})
+    router = MultiModel([limited, healthy], hedge_percentile=None)
+    router._health[0].latency_ewma, router._health[1].latency_ewma = 0.001, 1.0
+
+    assert asyncio.run(router.llm_model_func("p")) == "healthy:p"
+    assert calls == ["limited", "healthy"]
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from lightrag.kg.neo4j_impl import Neo4JStorage
+
+
+class FakeResult:
+    def __init__(self, records):
+        self._records = records
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for record in self._records:
+            yield record
+
+    async def single(self):
+        return self._records[0] if self._records else None
+
+    async def consume(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def run(self, query, parameters=None, **kwargs):
+        params = {**(parameters or {}), **kwargs}
+        self.driver.queries.append((query, params))
+        return FakeResult(self.driver.respond(query, params))
+
+    async def execute_write(self, work, *args):
+        return await work(self, *args)
+
+
+class FakeDriver:
+    """Enregistre les requêtes ; les nœuds existants sont nommés dans `names`"""
+
+    def __init__(self, names=()):
+        self.names = set(names)
+        self.queries = []
+
+    def session(self):
+        return FakeSession(self)
+
+    def respond(self, query, params):
+        if "UNWIND $rows" in query:
+            return [
+                {"idx": row["idx"], "props": {"entity_name": row["name"]}}
+                for row in params["rows"]
+                if row["name"] in self.names
+            ]
+        if "node_exists" in query:
+            return [{"node_exists": params.get("name") in self.names}]
+        return []
+
+    async def close(self):
+        pass
+
+
+def make_storage(monkeypatch, identity, names=()):
+    monkeypatch.setenv("NEO4J_URI", "bolt://localhost:7687")
+    monkeypatch.setenv("NEO4J_USERNAME", "neo4j")
+    monkeypatch.setenv("NEO4J_PASSWORD", "test")
+    monkeypatch.setenv("NEO4J_RESOLVER", "")
+    monkeypatch.setenv("NEO4J_NODE_IDENTITY", identity)
+    storage = Neo4JStorage(namespace="test", global_config={}, embedding_func=None)
+    storage._driver = FakeDriver(names)
+    return storage
+
+
+def test_property_identity_uses_parameters(monkeypatch):
+    storage = make_storage(monkeypatch, "property")
+
+    assert storage._prepare("get_node", name='"Tour`Eiffel"') == (
+        "MATCH (n:Entity {entity_name: $name}) RETURN n",
+        {"name": "Tour`Eiffel"},
+    )
+    legacy = make_storage(monkeypatch, "label")
+    assert legacy._prepare("get_node", name='"Tour`Eiffel"') == (
+        "MATCH (n:`Tour``Eiffel`) RETURN n",
+        {},
+    )
+
+
+def test_templates_are_constant_in_property_mode(monkeypatch):
+    storage = make_storage(monkeypatch, "property")
+
+    async def scenario():
+        for name in ["A", "B", "C"]:
+            await storage.has_node(name)
+            await storage.get_edge(name, "D")
+        await storage.delete_nodes_by_type("UNKNOWN")
+        await storage.delete_relations_by_label("DIRECTED")
+        await storage.delete_relations_by_label("odd`type")
+
+    asyncio.run(scenario())
+
+    queries = [query for query, _ in storage.driver.queries]
+    assert len(set(queries)) == 5
+    assert "MATCH (n:Entity {entity_type: $entity_type}) DETACH DELETE n" in queries
+    assert "MATCH ()-[r:`odd``type`]->() DELETE r" in queries
+    stats = storage.get_query_stats()
+    assert stats["executions"] == 9
+    assert stats["repeated_query_texts"] == 4
+    assert stats["by_query"]["has_node"]["repeat_rate"] == 2 / 3
+
+    legacy = make_storage(monkeypatch, "label")
+    for name in ["A", "B", "A"]:
+        asyncio.run(legacy.has_node(name))
+    # en mode "label", seul le texte de la même entité se répète
+    assert legacy.get_query_stats()["repeated_query_texts"] == 1
+
+
+def test_property_identity_batches_reads_in_one_unwind(monkeypatch):
+    storage = make_storage(monkeypatch, "property", names={"A", "C"})
+    storage.BATCH_READ_SIZE = 2
+
+    nodes = asyncio.run(storage.get_nodes_batch(["A", "B", "C", "A"]))
+
+    assert nodes == {"A": {"entity_name": "A"}, "B": None, "C": {"entity_name": "C"}}
+    queries = storage.driver.queries
+    assert len(queries) == 2
+    assert all("UNWIND $rows" in query and "UNION" not in query for query, _ in queries)
+
+
+def test_property_identity_upserts_entity_name(monkeypatch):
+    storage = make_storage(monkeypatch, "property")
+
+    asyncio.run(storage.upsert_nodes_batch({'"A"': {"entity_type": "city", "weight": [1]}}))
+
+    query, params = storage.driver.queries[0]
+    assert "MERGE (n:Entity {entity_name: row.name})" in query
+    assert params["rows"] == [
+        {"name": "A", "properties": {"entity_type": "city", "weight": "[1]", "entity_name": "A"}}
+    ]
+
+
+def test_ensure_schema_runs_once(monkeypatch):
+    storage = make_storage(monkeypatch, "property")
+
+    async def scenario():
+        await storage.initialize()
+        await storage.ensure_schema()
+
+    asyncio.run(scenario())
+    statements = [query for query, _ in storage.driver.queries]
+    assert statements == Neo4JStorage.SCHEMA_STATEMENTS
+    assert any("REQUIRE n.entity_name IS UNIQUE" in s for s in statements)
+
+
+def test_unknown_identity_mode_is_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        make_storage(monkeypatch, "uuid")
@@ -0,0 +1,31 @@
+import asyncio
+
+from lightrag.llm import aclose_openai_clients, get_openai_async_client
+
+
+def test_clients_are_shared_per_base_url_and_key():
+    async def scenario():
+        first = get_openai_async_client("http://127.0.0.1:1/v1", "sk-a")
+        same = get_openai_async_client("http://127.0.0.1:1/v1", "sk-a")
+        other_key = get_openai_async_client("http://127.0.0.1:1/v1", "sk-b")
+        await aclose_openai_clients()
+        reopened = get_openai_async_client("http://127.0.0.1:1/v1", "sk-a")
+        await aclose_openai_clients()
+        return first, same, other_key, reopened
+
+    first, same, other_key, reopened = asyncio.run(scenario())
+
+    assert first is same
+    assert first is not other_key
+    assert first.is_closed() and other_key.is_closed()
+    assert reopened is not first
+
+
+def test_clients_are_not_reused_across_event_loops():
+    async def get_client():
+        return get_openai_async_client("http://127.0.0.1:1/v1", "sk-a")
+
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+
+    assert first is not second
@@ -0,0 +1,89 @@
+import asyncio
+
+from lightrag.rabbitmq_publisher import RabbitMQPublisher
+
+
+class FakeConnection:
+    async def close(self):
+        pass
+
+
+class RecordingPublisher(RabbitMQPublisher):
+    """Remplace les appels broker par un enregistrement en mémoire"""
+
+    def __init__(self, failures=0, **config):
+        super().__init__({"max_retries": 3, "retry_backoff": 0, **config})
+        self.failures = failures
+        self.sent = []
+
+    async def _connect(self):
+        self._connection = FakeConnection()
+
+    async def _publish_one(self, message):
+        await asyncio.sleep(0.001)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("broker indisponible")
+        self.sent.append(message)
+
+
+def test_messages_are_batched_and_drained_on_close():
+    publisher = RecordingPublisher(batch_size=10)
+
+    async def scenario():
+        for i in range(25):
+            assert publisher.publish_nowait({"i": i})
+        await publisher.close()
+
+    asyncio.run(scenario())
+
+    assert sorted(m["i"] for m in publisher.sent) == list(range(25))
+    stats = publisher.get_stats()
+    assert stats["published"] == 25 and stats["pending"] == 0
+    assert stats["batches"] <= 4
+
+
+def test_full_outbox_drops_instead_of_blocking():
+    publisher = RecordingPublisher(outbox_size=2)
+
+    async def scenario():
+        accepted = [publisher.publish_nowait({"i": i}) for i in range(4)]
+        await publisher.close()
+        return accepted
+
+    assert asyncio.run(scenario()) == [True, True, False, False]
+    assert publisher.get_stats()["dropped"] == 2
+
+
+def test_failed_publishes_are_retried():
+    publisher = RecordingPublisher(failures=2)
+
+    async def scenario():
+        publisher.publish_nowait({"i": 0})
+        await publisher.close()
+
+    asyncio.run(scenario())
+    assert publisher.sent == [{"i": 0}]
+
+
+def test_flush_publishes_between_run_until_complete_calls(monkeypatch):
+    from lightrag import rabbitmq_publisher
+
+    loop = asyncio.new_event_loop()
+    publisher = RecordingPublisher()
+    monkeypatch.setitem(rabbitmq_publisher._publishers, loop, publisher)
+
+    async def answer(i):
+        rabbitmq_publisher.get_query_publisher().publish_nowait({"i": i})
+
+    try:
+        for i in range(2):
+            # comme LightRAG.query() : la boucle s'arrête après chaque requête
+            loop.run_until_complete(answer(i))
+            loop.run_until_complete(rabbitmq_publisher.flush_query_publisher())
+            assert [m["i"] for m in publisher.sent] == list(range(i + 1))
+        loop.run_until_complete(rabbitmq_publisher.aclose_query_publisher())
+    finally:
+        loop.close()
+
+    assert loop not in rabbitmq_publisher._publishers
@@ -0,0 +1,120 @@
+import asyncio
+
+import numpy as np
+
+from lightrag import utils
+from lightrag.storage import JsonKVStorage
+from lightrag.utils import (
+    CacheData,
+    SemanticCacheIndex,
+    get_best_cached_response,
+    quantize_embedding,
+    save_to_cache,
+)
+
+
+def unit(seed, dim=16):
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def make_kv(tmp_path, **cache_config):
+    utils._semantic_cache_indexes.clear()
+    return JsonKVStorage(
+        namespace="llm_response_cache",
+        global_config={
+            "working_dir": str(tmp_path),
+            "embedding_cache_config": {"enabled": True, **cache_config},
+        },
+        embedding_func=None,
+    )
+
+
+def test_search_returns_the_closest_vector():
+    for search_dtype in ["float32", "float16"]:
+        index = SemanticCacheIndex(None, 16, search_dtype=search_dtype, initial_capacity=2)
+        for i in range(10):
+            index.add(f"id-{i}", unit(i))
+        entry_id, similarity = index.search(unit(7) + 0.01)
+        assert entry_id == "id-7"
+        assert similarity > 0.99
+
+
+def test_lru_eviction_and_remove_keep_the_matrix_contiguous():
+    index = SemanticCacheIndex(None, 16, max_entries=3)
+    for i in range(3):
+        index.add(f"id-{i}", unit(i))
+    index.search(unit(0))  # id-1 devient le moins récemment utilisé
+    assert index.add("id-3", unit(3)) == "id-1"
+    assert "id-1" not in index and len(index) == 3
+
+    index.remove("id-0")
+    assert sorted(index.ids) == ["id-2", "id-3"]
+    assert index.search(unit(3))[0] == "id-3"
+
+
+def test_index_is_persisted_and_reloaded(tmp_path):
+    path = str(tmp_path / "semantic_cache_test_default")
+    index = SemanticCacheIndex(path, 16, initial_capacity=2)
+    for i in range(5):
+        index.add(f"id-{i}", unit(i))
+    index.flush()
+
+    reloaded = SemanticCacheIndex(path, 16)
+    assert reloaded.ids == index.ids
+    assert reloaded.search(unit(4))[0] == "id-4"
+
+
+def test_save_and_lookup_through_the_kv(tmp_path):
+    kv = make_kv(tmp_path)
+    quantized, min_val, max_val = quantize_embedding(unit(1))
+
+    async def scenario():
+        await save_to_cache(
+            kv,
+            CacheData(
+                args_hash="abc",
+                content="réponse",
+                prompt="question",
+                quantized=quantized,
+                min_val=min_val,
+                max_val=max_val,
+                mode="local",
+            ),
+        )
+        hit = await get_best_cached_response(kv, unit(1), mode="local")
+        miss = await get_best_cached_response(kv, unit(2), mode="local")
+        return hit, miss
+
+    assert asyncio.run(scenario()) == ("réponse", None)
+    assert "sem-local-abc" in kv._data
+
+
+def test_legacy_hex_entries_are_migrated(tmp_path):
+    kv = make_kv(tmp_path)
+    quantized, min_val, max_val = quantize_embedding(unit(5))
+    kv._data["global"] = {
+        "old": {
+            "return": "ancienne réponse",
+            "embedding": quantized.tobytes().hex(),
+            "embedding_shape": quantized.shape,
+            "embedding_min": min_val,
+            "embedding_max": max_val,
+            "original_prompt": "ancienne question",
+        }
+    }
+
+    response = asyncio.run(get_best_cached_response(kv, unit(5), mode="global"))
+
+    assert response == "ancienne réponse"
+    assert kv._data["sem-global-old"]["original_prompt"] == "ancienne question"
+
+
+def test_misses_below_the_threshold_do_not_refresh_entries():
+    index = SemanticCacheIndex(None, 16, max_entries=2)
+    index.add("id-0", unit(0))
+    index.add("id-1", unit(1))
+    # id-0 est le plus proche mais sous le seuil : il reste le moins récent
+    entry_id, similarity = index.search(unit(0) + unit(2), min_similarity=0.95)
+    assert entry_id == "id-0" and similarity < 0.95
+    assert index.add("id-2", unit(2)) == "id-0"